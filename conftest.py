@@ -0,0 +1,33 @@
+import pytest
+
+VOCAB = [
+    "[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]",
+    "the", "quick", "brown", "fox", "jumps", "over", "lazy", "dog",
+    "hello", "world", "vector", "search", "embedding", "model", "query",
+    "a", "b", "c", "d", "e", "f", "g", "h", "i", "j", "k", "l", "m",
+    "n", "o", "p", "q", "r", "s", "t", "u", "v", "w", "x", "y", "z", ".", ","
+]
+
+@pytest.fixture(scope="session")
+def tiny_model_dir(tmp_path_factory):
+    """在本地生成一个随机初始化的小型BERT模型，避免测试依赖网络下载"""
+    torch = pytest.importorskip("torch")
+    transformers = pytest.importorskip("transformers")
+
+    model_dir = tmp_path_factory.mktemp("tiny_bert")
+    vocab_file = model_dir / "vocab.txt"
+    vocab_file.write_text("\n".join(VOCAB) + "\n")
+    tokenizer = transformers.BertTokenizerFast(vocab_file=str(vocab_file))
+    tokenizer.save_pretrained(str(model_dir))
+
+    torch.manual_seed(0)
+    config = transformers.BertConfig(
+        vocab_size=len(VOCAB),
+        hidden_size=32,
+        num_hidden_layers=2,
+        num_attention_heads=2,
+        intermediate_size=64,
+        max_position_embeddings=512
+    )
+    transformers.BertModel(config).save_pretrained(str(model_dir))
+    return model_dir
@@ -1,29 +1,95 @@
 from typing import List, Dict, Any, Optional
-from fastapi import APIRouter, HTTPException, Depends
-from pydantic import BaseModel
+from fastapi import APIRouter, HTTPException, Depends, Request
+from pydantic import BaseModel, Field, field_validator, model_validator
 
-from rag_service.app.core.llm.openai_service import OpenAIService
-from rag_service.app.core.llm.transformer_service import TransformerService
-from rag_service.app.core.vectordb.milvus_store import MilvusStore
 from rag_service.app.core.rag_service import RAGService
+from rag_service.app.core.services import ServiceContainer
+from rag_service.app.core.vectordb.filters import MetadataFilter
+from rag_service.app.core.vectordb.search_params import SearchParams, resolve_search_params
+from rag_service.config.settings import settings
 
 router = APIRouter()
 
 # 请求模型
-class QueryRequest(BaseModel):
-    question: str
+class QueryOptions(BaseModel):
+    """单个与批量查询共用的检索与生成参数"""
     prompt_template: Optional[str] = None
+    # 检索参数，未指定时使用配置的默认值
+    k: Optional[int] = Field(default=None, ge=1, le=1000)
+    preset: Optional[str] = None  # 检索预设: settings.SEARCH_PRESETS 中的名称，如 fast / balanced / accurate
+    nprobe: Optional[int] = Field(default=None, ge=1)
+    ef: Optional[int] = Field(default=None, ge=1)
+    latency_budget_ms: Optional[float] = Field(default=None, gt=0)
+    # 元数据过滤: {"source": "a.pdf", "lang": {"in": ["zh", "en"]}, "year": {"gte": 2020, "lt": 2024}}
+    filter: Optional[Dict[str, Any]] = None
+    # 命名空间（租户），只检索该命名空间的文档
+    namespace: Optional[str] = Field(default=None, min_length=1, max_length=255)
+
+    @field_validator("preset")
+    @classmethod
+    def check_preset(cls, preset: Optional[str]) -> Optional[str]:
+        if preset is not None and preset not in settings.SEARCH_PRESETS:
+            raise ValueError(f"未知的检索预设: {preset}")
+        return preset
+
+    @field_validator("filter")
+    @classmethod
+    def check_filter(cls, spec: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        if spec is not None:
+            MetadataFilter.from_dict(spec)
+        return spec
+
+    def search_params(self) -> SearchParams:
+        return resolve_search_params(
+            preset=self.preset,
+            nprobe=self.nprobe,
+            ef=self.ef,
+            latency_budget_ms=self.latency_budget_ms
+        )
+
+    def metadata_filter(self) -> Optional[MetadataFilter]:
+        return MetadataFilter.from_dict(self.filter) if self.filter else None
+
+class QueryRequest(QueryOptions):
+    question: str
+
+class BatchQueryRequest(QueryOptions):
+    # 多个问题一次嵌入、一次检索，再并发生成各自的回答
+    questions: List[str] = Field(min_length=1)
 
 class DocumentRequest(BaseModel):
     texts: List[str]
     metadatas: Optional[List[Dict[str, Any]]] = None
+    # 每个文本的文档ID，指定时按文档增量同步：重新提交只写入变化的块并删除消失的块
+    doc_ids: Optional[List[str]] = None
+    # 命名空间（租户），文档只写入该命名空间
+    namespace: Optional[str] = Field(default=None, min_length=1, max_length=255)
+
+    @model_validator(mode="after")
+    def check_lengths(self) -> "DocumentRequest":
+        for name in ("metadatas", "doc_ids"):
+            values = getattr(self, name)
+            if values is not None and len(values) != len(self.texts):
+                raise ValueError(f"{name} 与 texts 的数量必须一致")
+        return self
+
+    @model_validator(mode="after")
+    def check_namespace(self) -> "DocumentRequest":
+        # namespace 是保留的元数据键，只能通过 namespace 字段指定
+        for metadata in self.metadatas or []:
+            if metadata.get("namespace", self.namespace) != self.namespace:
+                raise ValueError("metadatas 中的 namespace 与 namespace 字段不一致")
+        return self
 
-# 依赖注入
-def get_rag_service():
-    llm_service = OpenAIService()
-    embedding_service = TransformerService()
-    vector_db = MilvusStore(embedding_service)
-    return RAGService(llm_service, vector_db)
+# 依赖注入：复用应用启动时构建的服务
+def get_services(request: Request) -> ServiceContainer:
+    services = getattr(request.app.state, "services", None)
+    if services is None:
+        raise HTTPException(status_code=503, detail="服务尚未就绪")
+    return services
+
+def get_rag_service(services: ServiceContainer = Depends(get_services)) -> RAGService:
+    return services.rag_service
 
 @router.post("/query")
 async def query(
@@ -34,23 +100,59 @@ async def query(
     try:
         result = await rag_service.query(
             question=request.question,
-            prompt_template=request.prompt_template
+            prompt_template=request.prompt_template,
+            k=request.k,
+            search_params=request.search_params(),
+            metadata_filter=request.metadata_filter(),
+            namespace=request.namespace
         )
         return result
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/query/batch")
+async def query_batch(
+    request: BatchQueryRequest,
+    rag_service: RAGService = Depends(get_rag_service)
+):
+    """批量查询RAG系统，回答与 questions 一一对应"""
+    try:
+        results = await rag_service.query_batch(
+            questions=request.questions,
+            prompt_template=request.prompt_template,
+            k=request.k,
+            search_params=request.search_params(),
+            metadata_filter=request.metadata_filter(),
+            namespace=request.namespace
+        )
+        return {"results": results}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @router.post("/documents")
 async def add_documents(
     request: DocumentRequest,
     rag_service: RAGService = Depends(get_rag_service)
 ):
-    """添加文档到RAG系统"""
+    """添加文档到RAG系统，指定 doc_ids 时返回新增、关联到已有记录、未变化、删除的块数"""
     try:
+        if request.doc_ids is not None:
+            return await rag_service.sync_documents(
+                texts=request.texts,
+                doc_ids=request.doc_ids,
+                metadatas=request.metadatas,
+                namespace=request.namespace
+            )
         result = await rag_service.add_documents(
             texts=request.texts,
-            metadatas=request.metadatas
+            metadatas=request.metadatas,
+            namespace=request.namespace
         )
         return {"ids": result}
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e)) 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/stats")
+async def stats(services: ServiceContainer = Depends(get_services)):
+    """获取服务运行指标（推理队列深度、忙碌工作者数等）"""
+    return services.get_stats()
\ No newline at end of file
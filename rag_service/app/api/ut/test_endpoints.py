@@ -0,0 +1,175 @@
+import pytest
+from typing import Any, Dict, List, Optional
+from fastapi.testclient import TestClient
+
+from rag_service.app import main
+from rag_service.app.core.llm.base import BaseLLMService
+from rag_service.app.core.vectordb.base import BaseVectorDB
+from rag_service.app.core.services import ServiceContainer
+
+class FakeLLMService(BaseLLMService):
+    """记录调用情况的假LLM服务"""
+
+    def __init__(self):
+        self.warmed_up = False
+        self.closed = False
+
+    async def generate(self, prompt: str, **kwargs) -> str:
+        return "answer"
+
+    async def generate_with_history(self, messages: List[Dict[str, str]], **kwargs) -> str:
+        return "answer"
+
+    async def get_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return [[1.0, 0.0] for _ in texts]
+
+    def get_model_info(self) -> Dict[str, Any]:
+        return {"provider": "fake", "model": "fake", "type": "chat"}
+
+    async def warmup(self) -> None:
+        self.warmed_up = True
+
+    async def close(self) -> None:
+        self.closed = True
+
+class FakeVectorDB(BaseVectorDB):
+    """内存中的假向量数据库"""
+
+    def __init__(self):
+        self.closed = False
+        self.search_kwargs: Dict[str, Any] = {}
+
+    async def add_vectors(
+        self,
+        texts: List[str],
+        vectors,
+        metadatas: Optional[List[Dict[str, Any]]] = None,
+        **kwargs
+    ) -> List[str]:
+        return [str(i) for i in range(len(texts))]
+
+    async def search_vectors(self, vectors, k: int = 4, **kwargs) -> List[List[Dict[str, Any]]]:
+        self.search_kwargs = dict(kwargs, k=k)
+        return [[{"text": "context", "metadata": {"source": "doc_0"}, "score": 0.0}] for _ in vectors]
+
+    async def delete(self, ids: List[str]) -> None:
+        pass
+
+    async def clear(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        self.closed = True
+
+@pytest.fixture
+def container(monkeypatch):
+    """替换服务构建过程，记录构建次数"""
+    embedding_service = FakeLLMService()
+    vector_db = FakeVectorDB()
+    vector_db.embeddings = embedding_service
+    services = ServiceContainer(FakeLLMService(), embedding_service, vector_db)
+    calls = []
+
+    def build():
+        calls.append(1)
+        return services
+
+    monkeypatch.setattr(main.ServiceContainer, "build", build)
+    services.build_calls = calls
+    return services
+
+def test_services_built_once_and_shared(container):
+    """测试服务只在启动时构建一次并被所有请求共享"""
+    with TestClient(main.app) as client:
+        for _ in range(3):
+            response = client.post("/api/v1/query", json={"question": "hi"})
+            assert response.status_code == 200
+            assert response.json()["answer"] == "answer"
+        assert len(container.build_calls) == 1
+        assert container.embedding_service.warmed_up
+
+def test_services_closed_on_shutdown(container):
+    """测试应用关闭时释放服务"""
+    with TestClient(main.app):
+        pass
+    assert container.vector_db.closed
+    assert container.embedding_service.closed
+    assert container.llm_service.closed
+
+def test_not_ready_without_lifespan():
+    """测试未经过启动流程时返回503"""
+    client = TestClient(main.app)
+    response = client.post("/api/v1/query", json={"question": "hi"})
+    assert response.status_code == 503
+
+def test_stats(container):
+    """测试运行指标接口"""
+    with TestClient(main.app) as client:
+        response = client.get("/api/v1/stats")
+    assert response.status_code == 200
+    assert set(response.json()) == {"llm", "embedding", "vector_db"}
+
+def test_query_search_params(container):
+    """测试查询请求中的检索参数传给向量数据库，未知预设返回422"""
+    from rag_service.app.core.vectordb.filters import MetadataFilter
+    from rag_service.app.core.vectordb.search_params import SearchParams
+    with TestClient(main.app) as client:
+        response = client.post("/api/v1/query", json={"question": "hi", "k": 2, "preset": "fast", "ef": 100})
+        assert response.status_code == 200
+        # 未指定命名空间时只检索默认命名空间（没有 namespace 元数据的记录）
+        assert container.vector_db.search_kwargs == {
+            "k": 2, "params": SearchParams(nprobe=4, ef=100),
+            "filter": MetadataFilter.from_dict({"namespace": {"exists": False}})
+        }
+        response = client.post("/api/v1/query", json={"question": "hi", "preset": "turbo"})
+        assert response.status_code == 422
+
+def test_query_metadata_filter(container):
+    """测试查询请求中的元数据过滤条件传给向量数据库，非法条件返回422"""
+    from rag_service.app.core.vectordb.filters import MetadataFilter
+    metadata_filter = {"source": "a.pdf", "year": {"gte": 2020}}
+    with TestClient(main.app) as client:
+        response = client.post("/api/v1/query", json={"question": "hi", "filter": metadata_filter})
+        assert response.status_code == 200
+        expected = MetadataFilter.from_dict(dict(metadata_filter, namespace={"exists": False}))
+        assert container.vector_db.search_kwargs["filter"] == expected
+        response = client.post("/api/v1/query", json={"question": "hi", "filter": {"year": {"like": 1}}})
+        assert response.status_code == 422
+
+def test_query_batch(container):
+    """测试批量查询一次检索所有问题，回答与问题一一对应，问题为空返回422"""
+    from rag_service.app.core.vectordb.filters import MetadataFilter
+    with TestClient(main.app) as client:
+        request = {"questions": ["a", "b"], "k": 3, "filter": {"source": "doc_0"}, "namespace": "tenant-a"}
+        response = client.post("/api/v1/query/batch", json=request)
+        assert response.status_code == 200
+        assert [result["answer"] for result in response.json()["results"]] == ["answer", "answer"]
+        assert container.vector_db.search_kwargs["k"] == 3
+        expected = MetadataFilter.from_dict({"source": "doc_0", "namespace": "tenant-a"})
+        assert container.vector_db.search_kwargs["filter"] == expected
+        response = client.post("/api/v1/query/batch", json={"questions": []})
+        assert response.status_code == 422
+
+def test_documents_sync_by_doc_id(container):
+    """测试指定 doc_ids 时按文档增量同步并返回各类块数，数量不一致返回422"""
+    with TestClient(main.app) as client:
+        request = {"texts": ["hello world"], "doc_ids": ["doc-1"]}
+        response = client.post("/api/v1/documents", json=request)
+        assert response.status_code == 200
+        assert response.json() == {"ids": ["0"], "added": 1, "linked": 0, "unchanged": 0, "deleted": 0}
+        response = client.post("/api/v1/documents", json=request)
+        assert response.json() == {"ids": ["0"], "added": 0, "linked": 0, "unchanged": 1, "deleted": 0}
+        response = client.post("/api/v1/documents", json={"texts": ["a", "b"], "doc_ids": ["doc-1"]})
+        assert response.status_code == 422
+
+def test_query_namespace(container):
+    """测试查询请求中的命名空间传给向量数据库，不原生支持命名空间时转为元数据过滤"""
+    from rag_service.app.core.vectordb.filters import MetadataFilter
+    with TestClient(main.app) as client:
+        response = client.post("/api/v1/query", json={"question": "hi", "namespace": "tenant-a"})
+        assert response.status_code == 200
+        assert container.vector_db.search_kwargs["filter"] == MetadataFilter.from_dict({"namespace": "tenant-a"})
+        response = client.post("/api/v1/query", json={"question": "hi", "namespace": ""})
+        assert response.status_code == 422
+        response = client.post("/api/v1/documents", json={"texts": ["a"], "metadatas": [{"namespace": "tenant-b"}]})
+        assert response.status_code == 422
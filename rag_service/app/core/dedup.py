@@ -0,0 +1,437 @@
+import hashlib
+import json
+import os
+import re
+import zlib
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Collection, Dict, Iterable, List, Optional, Sequence, Set, Tuple, Union
+
+import numpy as np
+from loguru import logger
+
+from rag_service.app.core.text_splitter import CHUNK_POSITION_KEYS
+
+# 大于 2^32 的素数，哈希排列 (a * x + b) mod p 在 uint64 内不会溢出
+_PRIME = np.uint64(4294967311)
+_SEED = 20240601
+_WHITESPACE = re.compile(r"\s+")
+
+def normalize_text(text: str) -> str:
+    """去重前的归一化：小写并合并空白"""
+    return _WHITESPACE.sub(" ", text).strip().lower()
+
+class MinHasher:
+    """
+    字符 n-gram 上的 MinHash
+
+    排列参数由固定种子生成，不同进程、重启前后的签名可以相互比较。
+    """
+
+    def __init__(self, num_perm: int = 128, shingle_size: int = 5):
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        rng = np.random.default_rng(_SEED)
+        self._a = rng.integers(1, 2 ** 31, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, 2 ** 32, size=num_perm, dtype=np.uint64)
+
+    def shingles(self, text: str) -> Set[int]:
+        n = self.shingle_size
+        if len(text) <= n:
+            return {zlib.crc32(text.encode("utf-8"))}
+        return {zlib.crc32(text[i:i + n].encode("utf-8")) for i in range(len(text) - n + 1)}
+
+    def signature(self, text: str) -> np.ndarray:
+        """归一化后文本的 MinHash 签名"""
+        hashes = np.fromiter(self.shingles(text), dtype=np.uint64)
+        return ((np.outer(hashes, self._a) + self._b) % _PRIME).min(axis=0)
+
+def estimate_similarity(left: np.ndarray, right: np.ndarray) -> float:
+    """由签名估计 Jaccard 相似度"""
+    return float(np.mean(left == right))
+
+class NearDuplicateIndex:
+    """
+    MinHash LSH 索引
+
+    签名分为 bands 段，任意一段完全相同即成为候选，再用整条签名估计的相似度确认。
+    完全相同的文本（归一化后）由内容摘要直接命中。
+    """
+
+    def __init__(self, num_perm: int = 128, bands: int = 16, threshold: float = 0.9):
+        if num_perm % bands:
+            raise ValueError("签名长度必须能被分段数整除")
+        self.rows = num_perm // bands
+        self.bands = bands
+        self.threshold = threshold
+        self._signatures: Dict[str, np.ndarray] = {}
+        self._digests: Dict[str, str] = {}
+        self._by_digest: Dict[str, Set[str]] = defaultdict(set)
+        self._buckets: Dict[bytes, Set[str]] = defaultdict(set)
+
+    def __len__(self) -> int:
+        return len(self._signatures)
+
+    def items(self) -> Iterable[Tuple[str, np.ndarray, str]]:
+        """(键, 签名, 摘要)"""
+        for key, signature in self._signatures.items():
+            yield key, signature, self._digests[key]
+
+    def _band_keys(self, signature: np.ndarray) -> Iterable[bytes]:
+        for band in range(self.bands):
+            yield band.to_bytes(2, "big") + signature[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    def add(self, key: str, signature: np.ndarray, digest: str) -> None:
+        self.remove(key)
+        self._signatures[key] = signature
+        self._digests[key] = digest
+        self._by_digest[digest].add(key)
+        for band_key in self._band_keys(signature):
+            self._buckets[band_key].add(key)
+
+    def remove(self, key: str) -> None:
+        signature = self._signatures.pop(key, None)
+        if signature is None:
+            return
+        digest = self._digests.pop(key)
+        self._by_digest[digest].discard(key)
+        if not self._by_digest[digest]:
+            del self._by_digest[digest]
+        for band_key in self._band_keys(signature):
+            bucket = self._buckets.get(band_key)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[band_key]
+
+    def clear(self) -> None:
+        self._signatures.clear()
+        self._digests.clear()
+        self._by_digest.clear()
+        self._buckets.clear()
+
+    def find(self, signature: np.ndarray, digest: str, exclude: Collection[str] = ()) -> Optional[str]:
+        """查找完全相同或近似相同的记录（exclude 中的除外），多个候选时取相似度最高的"""
+        for key in self._by_digest.get(digest, ()):
+            if key not in exclude:
+                return key
+        candidates: Set[str] = set()
+        for band_key in self._band_keys(signature):
+            candidates |= self._buckets.get(band_key, set())
+        candidates -= set(exclude)
+        best, best_similarity = None, self.threshold
+        for key in candidates:
+            similarity = estimate_similarity(signature, self._signatures[key])
+            if similarity >= best_similarity:
+                best, best_similarity = key, similarity
+        return best
+
+@dataclass
+class DedupResult:
+    """
+    一批文本块的去重结果
+
+    targets[i] 为 None 表示新块；为 str 表示与已存储的记录重复（值为记录ID）；
+    为 int 表示与本批次中更早的块重复（值为该块的下标）。scopes[i] 为块的去重范围。
+    """
+    targets: List[Optional[Union[str, int]]]
+    signatures: List[np.ndarray]
+    digests: List[str]
+    namespace: Optional[str] = None
+    scopes: List[str] = field(default_factory=list)
+
+    @property
+    def linked(self) -> int:
+        """关联到已有记录、不再写入的块数"""
+        return sum(target is not None for target in self.targets)
+
+    @property
+    def unique(self) -> List[int]:
+        """需要嵌入并写入的块的下标"""
+        return [i for i, target in enumerate(self.targets) if target is None]
+
+    def resolve_ids(self, new_ids: List[str]) -> List[Optional[str]]:
+        """
+        为每个块确定记录ID，重复块使用被重复记录的ID
+
+        Args:
+            new_ids: unique 中各块写入后得到的ID
+        """
+        ids: List[Optional[str]] = [None] * len(self.targets)
+        for i, record_id in zip(self.unique, new_ids):
+            ids[i] = record_id
+        for i, target in enumerate(self.targets):
+            if isinstance(target, int):
+                ids[i] = ids[target]
+            elif isinstance(target, str):
+                ids[i] = target
+        return ids
+
+class ChunkDeduplicator:
+    """
+    入库前的近似重复块检测
+
+    页眉、页脚、许可证等在大量文档中重复出现的块只嵌入和存储一次，
+    之后的重复块直接关联到已有的向量。同时检测本批次内部和已存储的数据。
+
+    重复块共用已有记录的元数据，因此只在同一去重范围内关联：命名空间相同，
+    且 scope_keys 指定的元数据相同（None 表示除块位置外的全部元数据），
+    按这些元数据过滤时关联的块与被关联的记录结果一致。
+
+    每条记录按引用计数（写入它的块和关联到它的块）管理，release 释放引用，
+    最后一个引用释放后才可以删除向量。签名和引用追加写入 index_path（JSON Lines），
+    重启后重放恢复；向量被直接删除或清空时应调用 forget / clear，否则新块可能被关联到已不存在的记录。
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.9,
+        num_perm: int = 128,
+        bands: int = 16,
+        shingle_size: int = 5,
+        index_path: Optional[str] = None,
+        scope_keys: Optional[Sequence[str]] = None
+    ):
+        """
+        Args:
+            threshold: 视为重复的最小 Jaccard 相似度（字符 n-gram）
+            num_perm: MinHash 签名长度
+            bands: LSH 分段数，每段 num_perm / bands 个值
+            shingle_size: n-gram 长度（字符）
+            index_path: 签名日志文件，None 表示只保存在内存中
+            scope_keys: 关联时必须相同的元数据字段，None 表示除块位置外的全部元数据
+        """
+        self.hasher = MinHasher(num_perm, shingle_size)
+        self.bands = bands
+        self.threshold = threshold
+        self.scope_keys = None if scope_keys is None else list(scope_keys)
+        # (命名空间, 去重范围) -> 索引，记录ID -> (命名空间, 去重范围)，以及记录的引用数
+        self.indexes: Dict[Tuple[Optional[str], str], NearDuplicateIndex] = {}
+        self._scopes: Dict[str, Tuple[Optional[str], str]] = {}
+        self._refs: Counter = Counter()
+        self._stats = {"checked": 0, "duplicates": 0}
+        self._log = None
+        self.index_path = Path(index_path) if index_path else None
+        if self.index_path is not None:
+            self._replay()
+            self._log = open(self.index_path, "a", encoding="utf-8")
+
+    def _replay(self) -> None:
+        """重放签名日志，末尾写了一半的行被截掉"""
+        self.index_path.parent.mkdir(parents=True, exist_ok=True)
+        if not self.index_path.exists():
+            return
+        valid = lines = 0
+        with open(self.index_path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break
+                valid += len(line)
+                lines += 1
+                if entry["op"] == "add":
+                    signature = np.array(entry["signature"], dtype=np.uint64)
+                    key = (entry.get("namespace"), entry.get("scope", ""))
+                    self._add(entry["id"], signature, entry["digest"], key, entry.get("refs", 1))
+                elif entry["op"] == "link":
+                    if entry["id"] in self._refs:
+                        self._refs[entry["id"]] += 1
+                elif entry["op"] == "unlink":
+                    self._unlink(entry["id"])
+                elif entry["op"] == "delete":
+                    self._remove(entry["id"])
+                elif entry["op"] == "clear":
+                    self._clear()
+        if valid != self.index_path.stat().st_size:
+            logger.warning(f"去重索引日志末尾不完整，已截断: {self.index_path}")
+            os.truncate(self.index_path, valid)
+        if lines > 2 * len(self._scopes) + 1024:
+            self._compact()
+        if self._scopes:
+            logger.info(f"去重索引已加载: {self.index_path} ({len(self._scopes)} 个块)")
+
+    def _compact(self) -> None:
+        """删除和清空的记录较多时，只保留当前的签名和引用数重写日志"""
+        tmp_path = self.index_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for scope, index in self.indexes.items():
+                for record_id, signature, digest in index.items():
+                    entry = self._add_entry(record_id, signature, digest, scope, self._refs[record_id])
+                    f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.index_path)
+
+    @staticmethod
+    def _add_entry(
+        record_id: str,
+        signature: np.ndarray,
+        digest: str,
+        scope: Tuple[Optional[str], str],
+        refs: int = 1
+    ) -> Dict:
+        entry = {"op": "add", "id": record_id, "digest": digest, "signature": signature.tolist()}
+        namespace, metadata_scope = scope
+        if namespace is not None:
+            entry["namespace"] = namespace
+        if metadata_scope:
+            entry["scope"] = metadata_scope
+        if refs != 1:
+            entry["refs"] = refs
+        return entry
+
+    def _scope(self, metadata: Optional[Dict[str, Any]]) -> str:
+        """元数据中决定能否共用记录的部分的摘要，没有这部分元数据时为空串"""
+        metadata = metadata or {}
+        if self.scope_keys is None:
+            scoped = {key: value for key, value in metadata.items() if key not in CHUNK_POSITION_KEYS}
+        else:
+            scoped = {key: metadata[key] for key in self.scope_keys if key in metadata}
+        if not scoped:
+            return ""
+        payload = json.dumps(scoped, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+    def _index(self, scope: Tuple[Optional[str], str]) -> NearDuplicateIndex:
+        index = self.indexes.get(scope)
+        if index is None:
+            index = self.indexes[scope] = NearDuplicateIndex(self.hasher.num_perm, self.bands, self.threshold)
+        return index
+
+    def _add(
+        self,
+        record_id: str,
+        signature: np.ndarray,
+        digest: str,
+        scope: Tuple[Optional[str], str],
+        refs: int = 1
+    ) -> None:
+        self._remove(record_id)
+        self._index(scope).add(record_id, signature, digest)
+        self._scopes[record_id] = scope
+        self._refs[record_id] = refs
+
+    def _remove(self, record_id: str) -> None:
+        if record_id in self._scopes:
+            scope = self._scopes.pop(record_id)
+            self.indexes[scope].remove(record_id)
+            if not len(self.indexes[scope]):
+                del self.indexes[scope]
+            del self._refs[record_id]
+
+    def _unlink(self, record_id: str) -> bool:
+        """释放记录的一个引用，返回记录是否已不再被引用（未登记的记录视为不再被引用）"""
+        if record_id not in self._refs:
+            return True
+        self._refs[record_id] -= 1
+        if self._refs[record_id] > 0:
+            return False
+        self._remove(record_id)
+        return True
+
+    def _clear(self) -> None:
+        self.indexes.clear()
+        self._scopes.clear()
+        self._refs.clear()
+
+    def _append_log(self, entries: List[Dict]) -> None:
+        if self._log is not None and entries:
+            self._log.write("".join(json.dumps(entry) + "\n" for entry in entries))
+            self._log.flush()
+
+    def check(
+        self,
+        texts: List[str],
+        exclude: Collection[str] = (),
+        namespace: Optional[str] = None,
+        metadatas: Optional[List[Dict[str, Any]]] = None
+    ) -> DedupResult:
+        """
+        检测每个块是否与已存储的块或本批次更早的块重复
+
+        Args:
+            exclude: 不参与匹配的已存储记录ID（如即将被替换的旧版本）
+            namespace: 命名空间，只与同一命名空间的记录比较
+            metadatas: 每个块的元数据，只与去重范围相同的块比较
+        """
+        batches: Dict[str, NearDuplicateIndex] = {}
+        targets: List[Optional[Union[str, int]]] = []
+        signatures, digests, scopes = [], [], []
+        for i, text in enumerate(texts):
+            scope = self._scope(metadatas[i] if metadatas else None)
+            normalized = normalize_text(text)
+            signature = self.hasher.signature(normalized)
+            digest = hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+            index = self.indexes.get((namespace, scope))
+            target = index.find(signature, digest, exclude) if index is not None else None
+            if target is None:
+                batch = batches.get(scope)
+                if batch is None:
+                    batch = batches[scope] = NearDuplicateIndex(self.hasher.num_perm, self.bands, self.threshold)
+                in_batch = batch.find(signature, digest)
+                if in_batch is not None:
+                    target = int(in_batch)
+                else:
+                    batch.add(str(i), signature, digest)
+            targets.append(target)
+            signatures.append(signature)
+            digests.append(digest)
+            scopes.append(scope)
+        duplicates = sum(target is not None for target in targets)
+        self._stats["checked"] += len(texts)
+        self._stats["duplicates"] += duplicates
+        if duplicates:
+            logger.info(f"去重: {len(texts)} 个块中有 {duplicates} 个重复块，关联到已有向量")
+        return DedupResult(targets, signatures, digests, namespace, scopes)
+
+    def register(self, result: DedupResult, new_ids: List[str]) -> None:
+        """
+        登记新写入的块，并给重复块关联到的记录各加一个引用
+
+        Args:
+            new_ids: 与 result.unique 一一对应的新记录ID
+        """
+        entries = []
+        for i, record_id in zip(result.unique, new_ids):
+            scope = (result.namespace, result.scopes[i])
+            self._add(record_id, result.signatures[i], result.digests[i], scope)
+            entries.append(self._add_entry(record_id, result.signatures[i], result.digests[i], scope))
+        ids = result.resolve_ids(new_ids)
+        for i, target in enumerate(result.targets):
+            if target is not None and ids[i] in self._refs:
+                self._refs[ids[i]] += 1
+                entries.append({"op": "link", "id": ids[i]})
+        self._append_log(entries)
+
+    def release(self, ids: List[str]) -> List[str]:
+        """
+        释放引用（每出现一次释放一个）
+
+        Returns:
+            不再被任何块引用、可以从向量数据库删除的记录ID
+        """
+        released = [record_id for record_id in ids if self._unlink(record_id)]
+        self._append_log([{"op": "unlink", "id": record_id} for record_id in ids])
+        return list(dict.fromkeys(released))
+
+    def forget(self, ids: List[str]) -> None:
+        """移除已删除的记录（不论引用数）"""
+        for record_id in ids:
+            self._remove(record_id)
+        self._append_log([{"op": "delete", "id": record_id} for record_id in ids])
+
+    def clear(self) -> None:
+        self._clear()
+        self._append_log([{"op": "clear"}])
+
+    def get_stats(self) -> Dict[str, int]:
+        return dict(self._stats, indexed=len(self._scopes), references=sum(self._refs.values()))
+
+    def close(self) -> None:
+        if self._log is not None:
+            self._log.close()
+            self._log = None
@@ -1,6 +1,8 @@
 from abc import ABC, abstractmethod
 from typing import Any, Dict, List, Optional
 
+import numpy as np
+
 class BaseLLMService(ABC):
     """LLM服务的基础接口"""
     
@@ -23,7 +25,33 @@ class BaseLLMService(ABC):
         """获取文本的嵌入向量"""
         pass
     
+    async def get_embeddings_array(self, texts: List[str]) -> np.ndarray:
+        """
+        获取文本的嵌入向量矩阵
+        
+        Returns:
+            np.ndarray: 形状为 (len(texts), dim) 的连续 float32 数组
+        
+        默认实现基于 get_embeddings 转换，原生产生数组的服务应重写此方法以避免转换开销。
+        """
+        embeddings = np.asarray(await self.get_embeddings(texts), dtype=np.float32)
+        if embeddings.ndim != 2:
+            embeddings = embeddings.reshape(len(texts), -1)
+        return np.ascontiguousarray(embeddings)
+    
     @abstractmethod
     def get_model_info(self) -> Dict[str, Any]:
         """获取模型信息"""
+        pass
+    
+    async def warmup(self) -> None:
+        """预热服务（默认无操作）"""
+        pass
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取运行指标（默认为空）"""
+        return {}
+    
+    async def close(self) -> None:
+        """释放服务持有的资源（默认无操作）"""
         pass 
\ No newline at end of file
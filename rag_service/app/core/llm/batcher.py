@@ -0,0 +1,166 @@
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import numpy as np
+from loguru import logger
+
+@dataclass
+class _PendingRequest:
+    """等待合批的单个嵌入请求"""
+    texts: List[str]
+    future: asyncio.Future = field(repr=False)
+
+class EmbeddingBatcher:
+    """
+    嵌入请求的动态微批处理器
+
+    并发到达的请求在队列中等待，直到凑满 max_batch_size 条文本或等待超过
+    max_wait_ms，然后合并为一个批次只做一次前向计算，再把结果按行拆回给各个调用方。
+    """
+
+    def __init__(
+        self,
+        embed_fn: Callable[[List[str]], Awaitable[np.ndarray]],
+        max_batch_size: int = 32,
+        max_wait_ms: float = 5.0
+    ):
+        """
+        初始化批处理器
+
+        Args:
+            embed_fn: 对一批文本计算嵌入的协程函数，返回形状为 (n, dim) 的数组
+            max_batch_size: 单个批次的最大文本数
+            max_wait_ms: 第一个请求到达后最多等待多久再发起计算
+        """
+        if max_batch_size < 1:
+            raise ValueError(f"max_batch_size 必须为正数: {max_batch_size}")
+        self.embed_fn = embed_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._carry: Optional[_PendingRequest] = None
+        self._inflight: List[_PendingRequest] = []
+        # 统计信息
+        self._batches = 0
+        self._requests = 0
+        self._texts = 0
+
+    def _ensure_worker(self) -> None:
+        """在当前事件循环中惰性启动后台合批任务"""
+        loop = asyncio.get_running_loop()
+        if self._worker is None or self._worker.done() or self._worker.get_loop() is not loop:
+            self._queue = asyncio.Queue()
+            self._carry = None
+            self._inflight = []
+            self._worker = loop.create_task(self._run())
+
+    async def submit(self, texts: List[str]) -> np.ndarray:
+        """
+        提交一组文本并等待其嵌入结果
+
+        Args:
+            texts: 文本列表，长度不应超过 max_batch_size
+
+        Returns:
+            np.ndarray: 与 texts 一一对应的嵌入向量
+        """
+        if len(texts) > self.max_batch_size:
+            raise ValueError(f"单次提交的文本数超过批次上限: {len(texts)} > {self.max_batch_size}")
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put(_PendingRequest(texts=texts, future=future))
+        return await future
+
+    async def _next_batch(self) -> List[_PendingRequest]:
+        """收集一个批次的请求"""
+        if self._carry is not None:
+            first, self._carry = self._carry, None
+        else:
+            first = await self._queue.get()
+        batch = [first]
+        size = len(first.texts)
+        deadline = time.monotonic() + self.max_wait
+
+        while size < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = await asyncio.wait_for(self._queue.get(), timeout=remaining)
+            except asyncio.TimeoutError:
+                break
+            if size + len(request.texts) > self.max_batch_size:
+                # 放不下的请求留到下一个批次
+                self._carry = request
+                break
+            batch.append(request)
+            size += len(request.texts)
+        return batch
+
+    async def _run(self) -> None:
+        """后台合批循环"""
+        while True:
+            batch = await self._next_batch()
+            batch = [request for request in batch if not request.future.cancelled()]
+            if not batch:
+                continue
+
+            texts = [text for request in batch for text in request.texts]
+            self._inflight = batch
+            try:
+                embeddings = await self.embed_fn(texts)
+            except Exception as e:
+                self._inflight = []
+                logger.error(f"批量嵌入计算失败: {e}")
+                for request in batch:
+                    if not request.future.done():
+                        request.future.set_exception(e)
+                continue
+
+            self._inflight = []
+            self._batches += 1
+            self._requests += len(batch)
+            self._texts += len(texts)
+
+            offset = 0
+            for request in batch:
+                rows = embeddings[offset:offset + len(request.texts)]
+                offset += len(request.texts)
+                if not request.future.done():
+                    request.future.set_result(rows)
+
+    async def close(self) -> None:
+        """停止后台任务，并让尚未处理的请求失败"""
+        if self._worker is None:
+            return
+        if self._worker.get_loop() is asyncio.get_running_loop():
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+        self._worker = None
+
+        pending = list(self._inflight)
+        if self._carry is not None:
+            pending.append(self._carry)
+        while self._queue is not None and not self._queue.empty():
+            pending.append(self._queue.get_nowait())
+        for request in pending:
+            if not request.future.done():
+                request.future.set_exception(RuntimeError("嵌入批处理器已关闭"))
+        self._inflight = []
+        self._carry = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取合批统计信息"""
+        return {
+            "batches": self._batches,
+            "requests": self._requests,
+            "texts": self._texts,
+            "avg_batch_size": self._texts / self._batches if self._batches else 0.0,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0
+        }
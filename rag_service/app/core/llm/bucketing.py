@@ -0,0 +1,71 @@
+from dataclasses import dataclass, field
+from typing import List, Optional, Sequence
+
+@dataclass
+class BucketPlan:
+    """按长度分桶的批次计划"""
+    buckets: List[List[int]] = field(default_factory=list)  # 每个桶内为原始输入的下标
+    real_tokens: int = 0            # 实际 token 数（不含填充）
+    padded_tokens: int = 0          # 分桶后参与计算的 token 数（含填充）
+    naive_padded_tokens: int = 0    # 整体填充到最长输入时参与计算的 token 数
+
+    @property
+    def saved_tokens(self) -> int:
+        """分桶相比整体填充少计算的 token 数"""
+        return self.naive_padded_tokens - self.padded_tokens
+
+    @property
+    def padding_saved_ratio(self) -> float:
+        """整体填充方案中被分桶省掉的填充比例"""
+        naive_padding = self.naive_padded_tokens - self.real_tokens
+        if naive_padding <= 0:
+            return 0.0
+        return self.saved_tokens / naive_padding
+
+def plan_length_buckets(
+    lengths: Sequence[int],
+    max_tokens_per_batch: int,
+    max_batch_size: Optional[int] = None
+) -> BucketPlan:
+    """
+    按 token 长度把输入分成若干桶，使每个桶的填充后大小不超过预算
+
+    输入按长度降序排列后贪心装桶，桶内第一条就是最长的，
+    因此桶的计算量为 桶大小 * 首条长度。
+
+    Args:
+        lengths: 每条输入的 token 长度
+        max_tokens_per_batch: 每个桶填充后的 token 预算
+        max_batch_size: 每个桶的最大条数，None 表示只受 token 预算限制
+
+    Returns:
+        BucketPlan: 分桶结果及填充统计
+    """
+    if max_tokens_per_batch < 1:
+        raise ValueError(f"max_tokens_per_batch 必须为正数: {max_tokens_per_batch}")
+
+    plan = BucketPlan()
+    if not lengths:
+        return plan
+
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True)
+    plan.real_tokens = sum(lengths)
+    plan.naive_padded_tokens = len(lengths) * lengths[order[0]]
+
+    bucket: List[int] = []
+    bucket_max = 0
+    for index in order:
+        if bucket:
+            too_many_tokens = (len(bucket) + 1) * bucket_max > max_tokens_per_batch
+            too_many_items = max_batch_size is not None and len(bucket) >= max_batch_size
+            if too_many_tokens or too_many_items:
+                plan.buckets.append(bucket)
+                plan.padded_tokens += len(bucket) * bucket_max
+                bucket = []
+        if not bucket:
+            # 超过预算的单条输入也要单独成桶
+            bucket_max = lengths[index]
+        bucket.append(index)
+    plan.buckets.append(bucket)
+    plan.padded_tokens += len(bucket) * bucket_max
+    return plan
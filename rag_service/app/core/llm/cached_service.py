@@ -0,0 +1,130 @@
+import asyncio
+import json
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import numpy as np
+
+from rag_service.app.core.llm.base import BaseLLMService
+from rag_service.app.core.llm.embedding_cache import EmbeddingCache
+
+class CachedEmbeddingService(BaseLLMService):
+    """在嵌入服务前加一层内容寻址缓存，命中的文本不再经过模型"""
+
+    def __init__(
+        self,
+        service: BaseLLMService,
+        cache_dir: Optional[str] = None,
+        memory_size: int = 10000,
+        max_disk_rows: int = 0
+    ):
+        """
+        初始化缓存服务
+
+        Args:
+            service: 被缓存的嵌入服务
+            cache_dir: 磁盘缓存目录，None 表示只使用内存
+            memory_size: 内存 LRU 的最大条数
+            max_disk_rows: 磁盘缓存的最大条数，0 表示不限制
+        """
+        self.service = service
+        model_info = service.get_model_info()
+        # 模型信息（模型名、池化方式、最大长度等）任一变化都会使旧缓存失效
+        fingerprint = json.dumps(model_info, sort_keys=True)
+        self.cache = EmbeddingCache(
+            fingerprint=fingerprint,
+            dimension=model_info["dimension"],
+            cache_dir=cache_dir,
+            memory_size=memory_size,
+            max_disk_rows=max_disk_rows
+        )
+        # 有磁盘层时缓存读写涉及 sqlite 与内存映射文件，放到线程中执行
+        self._disk = bool(cache_dir)
+
+    @property
+    def tokenizer(self):
+        """被缓存服务的分词器（没有时为 None）"""
+        return getattr(self.service, "tokenizer", None)
+
+    async def generate(self, prompt: str, **kwargs) -> str:
+        return await self.service.generate(prompt, **kwargs)
+
+    async def generate_with_history(
+        self,
+        messages: List[Dict[str, str]],
+        **kwargs
+    ) -> str:
+        return await self.service.generate_with_history(messages, **kwargs)
+
+    async def get_embeddings_array(self, texts: List[str]) -> np.ndarray:
+        """获取文本的嵌入向量矩阵，只对未命中的文本调用模型"""
+        return await self._get_cached(texts, lambda indices: self.service.get_embeddings_array(
+            [texts[i] for i in indices]
+        ))
+
+    async def get_embeddings_from_token_ids(
+        self,
+        token_ids: List[List[int]],
+        texts: List[str]
+    ) -> np.ndarray:
+        """
+        用已分好的 token id 计算嵌入，缓存仍以文本为键
+
+        Args:
+            token_ids: 每条输入的 token id
+            texts: 与 token_ids 对应的原文
+        """
+        return await self._get_cached(texts, lambda indices: self.service.get_embeddings_from_token_ids(
+            [token_ids[i] for i in indices]
+        ))
+
+    async def _get_cached(
+        self,
+        texts: List[str],
+        compute: Callable[[List[int]], Awaitable[np.ndarray]]
+    ) -> np.ndarray:
+        """查缓存，对未命中的下标调用 compute 计算并回填缓存"""
+        embeddings = np.empty((len(texts), self.cache.dimension), dtype=np.float32)
+        if not texts:
+            return embeddings
+        keys = [self.cache.make_key(text) for text in texts]
+        cached = await self._call_cache(self.cache.get_many, keys)
+
+        # 同一批次内重复的文本只计算一次
+        missing: Dict[str, List[int]] = {}
+        for i, (key, vector) in enumerate(zip(keys, cached)):
+            if vector is not None:
+                embeddings[i] = vector
+            else:
+                missing.setdefault(key, []).append(i)
+
+        if missing:
+            computed = await compute([rows[0] for rows in missing.values()])
+            await self._call_cache(self.cache.put_many, list(missing), computed)
+            for rows, vector in zip(missing.values(), computed):
+                embeddings[rows] = vector
+        return embeddings
+
+    async def _call_cache(self, method: Callable[..., Any], *args) -> Any:
+        """调用缓存方法，有磁盘层时在线程中执行"""
+        if self._disk:
+            return await asyncio.to_thread(method, *args)
+        return method(*args)
+
+    async def get_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """获取文本的嵌入向量"""
+        return (await self.get_embeddings_array(texts)).tolist()
+
+    def get_model_info(self) -> Dict[str, Any]:
+        return self.service.get_model_info()
+
+    async def warmup(self) -> None:
+        await self.service.warmup()
+
+    async def close(self) -> None:
+        await self.service.close()
+        await self._call_cache(self.cache.close)
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = dict(self.service.get_stats())
+        stats["cache"] = self.cache.get_stats()
+        return stats
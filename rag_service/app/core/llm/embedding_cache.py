@@ -0,0 +1,271 @@
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from loguru import logger
+
+class EmbeddingCache:
+    """
+    内容寻址的嵌入缓存
+
+    键为 (模型指纹, 文本) 的哈希。两级存储：
+    - 内存 LRU：最近使用的向量
+    - 磁盘：按行追加的 float32 内存映射文件，配合 sqlite 记录键到行号的映射
+
+    多个进程可以共用同一个磁盘缓存目录：新行号在 sqlite 写事务（BEGIN IMMEDIATE）中分配，
+    进程之间不会分到同一行；向量写入并落盘后才提交指向它的条目。
+
+    设置了 max_disk_rows 时磁盘层是环形的：行号写满后循环复用最早写入的行，
+    先删除并提交指向这些行的旧条目再覆盖向量。读取在读事务中查行号并复制向量，
+    删除要等读事务结束才能提交，不会读到被覆盖的行。
+
+    方法都是同步的，磁盘层的调用方应放到线程中执行，不阻塞事件循环。
+    """
+
+    _INITIAL_ROWS = 1024
+
+    def __init__(
+        self,
+        fingerprint: str,
+        dimension: int,
+        cache_dir: Optional[str] = None,
+        memory_size: int = 10000,
+        max_disk_rows: int = 0
+    ):
+        """
+        初始化缓存
+
+        Args:
+            fingerprint: 模型指纹（模型名、池化方式等），参与键的计算
+            dimension: 向量维度
+            cache_dir: 磁盘缓存目录，None 表示只使用内存
+            memory_size: 内存 LRU 的最大条数
+            max_disk_rows: 磁盘层的最大条数，写满后覆盖最早写入的向量，0 表示不限制
+        """
+        self.fingerprint = fingerprint
+        self.dimension = dimension
+        self.memory_size = memory_size
+        self.max_disk_rows = max_disk_rows
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0, "disk_evictions": 0}
+
+        self._db: Optional[sqlite3.Connection] = None
+        self._vectors: Optional[np.memmap] = None
+        self._rows = 0
+        if cache_dir:
+            # 不同模型的向量维度可能不同，各自使用独立的子目录
+            subdir = hashlib.sha256(fingerprint.encode("utf-8")).hexdigest()[:16]
+            self._open_disk(Path(cache_dir) / subdir)
+
+    def _open_disk(self, path: Path) -> None:
+        """打开磁盘存储"""
+        path.mkdir(parents=True, exist_ok=True)
+        self._vectors_path = path / "vectors.f32"
+        # 自动提交模式，写入时显式开启事务
+        self._db = sqlite3.connect(
+            str(path / "index.sqlite"), timeout=30.0, isolation_level=None, check_same_thread=False
+        )
+        self._db.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, row INTEGER NOT NULL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS entries_row ON entries (row)")
+        # 已分配的行数（只增不减），行号为它对 max_disk_rows 取模
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        self._db.execute(
+            "INSERT OR IGNORE INTO meta (name, value) SELECT 'allocated', COALESCE(MAX(row) + 1, 0) FROM entries"
+        )
+        if self.max_disk_rows:
+            # 上限调小后，超出范围的行不再使用（文件可能正被其他进程映射，不截断）
+            self._db.execute("DELETE FROM entries WHERE row >= ?", (self.max_disk_rows,))
+        self._rows = self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+        capacity = max(min(self._INITIAL_ROWS, self.max_disk_rows or self._INITIAL_ROWS), self._rows)
+        if self._vectors_path.exists():
+            capacity = max(capacity, self._vectors_path.stat().st_size // (4 * self.dimension))
+        self._map_vectors(capacity)
+        logger.info(f"嵌入缓存已加载 {self._rows} 条向量: {path}")
+
+    def _map_vectors(self, capacity: int) -> None:
+        """把向量文件扩展到 capacity 行并重新映射"""
+        if self._vectors is not None:
+            self._vectors.flush()
+            del self._vectors
+        size = capacity * self.dimension * 4
+        with open(self._vectors_path, "ab") as f:
+            if f.tell() < size:
+                f.truncate(size)
+        self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode="r+", shape=(capacity, self.dimension))
+
+    def _ensure_rows(self, rows: int) -> None:
+        """保证映射至少覆盖 rows 行，其他进程扩展过的文件按实际大小重新映射"""
+        capacity = self._vectors.shape[0]
+        if rows <= capacity:
+            return
+        file_rows = self._vectors_path.stat().st_size // (4 * self.dimension)
+        while capacity < rows:
+            capacity *= 2
+        if self.max_disk_rows:
+            capacity = max(min(capacity, self.max_disk_rows), rows)
+        self._map_vectors(max(capacity, file_rows))
+
+    def make_key(self, text: str) -> str:
+        """计算文本的缓存键"""
+        digest = hashlib.sha256()
+        digest.update(self.fingerprint.encode("utf-8"))
+        digest.update(b"\x00")
+        digest.update(text.encode("utf-8"))
+        return digest.hexdigest()
+
+    def _remember(self, key: str, vector: np.ndarray) -> None:
+        """放入内存 LRU，超出容量时淘汰最久未使用的条目"""
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def get_many(self, keys: Sequence[str]) -> List[Optional[np.ndarray]]:
+        """
+        批量查询缓存
+
+        Returns:
+            List[Optional[np.ndarray]]: 与 keys 对应，未命中的位置为 None
+        """
+        results: List[Optional[np.ndarray]] = [None] * len(keys)
+        with self._lock:
+            disk_lookup: Dict[str, List[int]] = {}
+            for i, key in enumerate(keys):
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    self._stats["memory_hits"] += 1
+                    results[i] = vector
+                else:
+                    disk_lookup.setdefault(key, []).append(i)
+
+            if disk_lookup and self._db is not None:
+                # 查行号与复制向量在同一个读事务中，其间其他进程不能提交对这些行的复用
+                self._db.execute("BEGIN")
+                try:
+                    found = self._select_rows(list(disk_lookup))
+                    if found:
+                        # 其他进程写入的行可能在当前映射之外
+                        self._ensure_rows(max(row for _, row in found) + 1)
+                    vectors = [(key, np.array(self._vectors[row])) for key, row in found]
+                finally:
+                    self._db.execute("COMMIT")
+                for key, vector in vectors:
+                    self._remember(key, vector)
+                    for i in disk_lookup.pop(key):
+                        results[i] = vector
+                        self._stats["disk_hits"] += 1
+
+            for indices in disk_lookup.values():
+                self._stats["misses"] += len(indices)
+        return results
+
+    def _select_rows(self, keys: List[str]) -> List[Tuple[str, int]]:
+        """从 sqlite 中查询键对应的行号"""
+        rows = []
+        # sqlite 对单条语句的参数个数有限制，分块查询
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            rows.extend(self._db.execute(
+                f"SELECT key, row FROM entries WHERE key IN ({placeholders})", chunk
+            ).fetchall())
+        return rows
+
+    def put_many(self, keys: Sequence[str], vectors: np.ndarray) -> None:
+        """批量写入缓存"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with self._lock:
+            new_keys = []
+            for key, vector in zip(keys, vectors):
+                if key not in self._memory:
+                    new_keys.append((key, vector))
+                self._remember(key, vector)
+
+            if self._db is None or not new_keys:
+                return
+            # 写事务在多个进程间串行：分配行号，删除指向将被复用的行的旧条目
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                existing = {key for key, _ in self._select_rows([key for key, _ in new_keys])}
+                pending = []
+                for key, vector in new_keys:
+                    if key not in existing:
+                        existing.add(key)
+                        pending.append((key, vector))
+                if self.max_disk_rows:
+                    pending = pending[-self.max_disk_rows:]
+                allocated = self._db.execute("SELECT value FROM meta WHERE name = 'allocated'").fetchone()[0]
+                rows = [self._slot(allocated + i) for i in range(len(pending))]
+                if pending:
+                    self._db.execute(
+                        "UPDATE meta SET value = ? WHERE name = 'allocated'", (allocated + len(pending),)
+                    )
+                    if self.max_disk_rows:
+                        self._stats["disk_evictions"] += self._delete_rows(rows)
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            if not pending:
+                return
+
+            # 旧条目删除并提交后才覆盖向量；先落盘向量，再提交条目，保证条目指向的行总是完整的
+            self._ensure_rows(max(rows) + 1)
+            for row, (_, vector) in zip(rows, pending):
+                self._vectors[row] = vector
+            self._vectors.flush()
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                # 其他进程可能在两个事务之间写入了相同的键，保留先提交的条目
+                self._db.executemany(
+                    "INSERT OR IGNORE INTO entries (key, row) VALUES (?, ?)",
+                    [(key, row) for row, (key, _) in zip(rows, pending)]
+                )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            allocated += len(pending)
+            self._rows = min(allocated, self.max_disk_rows) if self.max_disk_rows else allocated
+
+    def _slot(self, allocated: int) -> int:
+        """第 allocated 个分配的向量所在的行"""
+        return allocated % self.max_disk_rows if self.max_disk_rows else allocated
+
+    def _delete_rows(self, rows: List[int]) -> int:
+        """删除指向这些行的条目，返回删除的条数（调用方需在写事务中）"""
+        deleted = 0
+        for start in range(0, len(rows), 500):
+            chunk = rows[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            deleted += self._db.execute(f"DELETE FROM entries WHERE row IN ({placeholders})", chunk).rowcount
+        return deleted
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取命中、未命中与淘汰计数"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_entries"] = len(self._memory)
+            stats["disk_entries"] = self._rows
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        return stats
+
+    def close(self) -> None:
+        """落盘并关闭磁盘存储"""
+        with self._lock:
+            if self._vectors is not None:
+                self._vectors.flush()
+                del self._vectors
+                self._vectors = None
+            if self._db is not None:
+                self._db.close()
+                self._db = None
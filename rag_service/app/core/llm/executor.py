@@ -0,0 +1,119 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
+EXECUTOR_MODES = ("inline", "thread", "process")
+
+class InferenceExecutor:
+    """
+    推理执行器：把同步的分词和前向计算移出事件循环
+
+    支持三种模式：
+    - inline: 直接在事件循环中执行（调试用，会阻塞其他请求）
+    - thread: 在专用线程池中执行，torch 计算期间会释放 GIL
+    - process: 在进程池中执行，每个子进程由 initializer 各自加载模型
+    """
+
+    def __init__(
+        self,
+        mode: str = "thread",
+        max_workers: Optional[int] = None,
+        initializer: Optional[Callable] = None,
+        initargs: Tuple = ()
+    ):
+        """
+        初始化执行器
+
+        Args:
+            mode: 执行模式，inline / thread / process
+            max_workers: 工作线程或进程数，None 时为 CPU 核数
+            initializer: 进程模式下每个子进程启动时调用的初始化函数
+            initargs: initializer 的参数
+
+        Raises:
+            ValueError: 当执行模式未知时
+        """
+        if mode not in EXECUTOR_MODES:
+            raise ValueError(f"未知的执行模式: {mode}")
+        self.mode = mode
+        self.max_workers = 1 if mode == "inline" else (max_workers or os.cpu_count() or 1)
+        self._executor: Optional[Executor] = None
+        if mode == "thread":
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers,
+                thread_name_prefix="inference"
+            )
+        elif mode == "process":
+            # 使用 spawn 避免 fork 继承 torch 的线程池状态
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=initializer,
+                initargs=initargs
+            )
+        # 统计信息
+        self._lock = threading.Lock()
+        self._inflight = 0
+        self._completed = 0
+        self._failed = 0
+        self._total_latency = 0.0
+
+    async def run(self, fn: Callable, *args) -> Any:
+        """
+        在执行器中运行同步函数并等待结果
+
+        Args:
+            fn: 同步函数，进程模式下必须是可序列化的模块级函数
+            *args: 函数参数
+        """
+        with self._lock:
+            self._inflight += 1
+        start = time.perf_counter()
+        try:
+            if self._executor is None:
+                result = fn(*args)
+            else:
+                loop = asyncio.get_running_loop()
+                result = await loop.run_in_executor(self._executor, fn, *args)
+        except BaseException as e:
+            with self._lock:
+                self._inflight -= 1
+                # 取消不算失败
+                if isinstance(e, Exception):
+                    self._failed += 1
+            raise
+        with self._lock:
+            self._inflight -= 1
+            self._completed += 1
+            self._total_latency += time.perf_counter() - start
+        return result
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        获取执行器统计信息
+
+        任务按先进先出分配给空闲的工作者，因此在途任务中前 max_workers 个在执行，
+        其余在排队。completed 与平均耗时只统计成功的调用，失败的调用计入 failed。
+        """
+        with self._lock:
+            inflight = self._inflight
+            completed = self._completed
+            return {
+                "mode": self.mode,
+                "max_workers": self.max_workers,
+                "busy_workers": min(inflight, self.max_workers),
+                "queue_depth": max(inflight - self.max_workers, 0),
+                "completed": completed,
+                "failed": self._failed,
+                "avg_latency_ms": self._total_latency * 1000 / completed if completed else 0.0
+            }
+
+    def shutdown(self, wait: bool = True) -> None:
+        """关闭线程池或进程池"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,211 @@
+import hashlib
+import importlib
+import json
+import os
+import re
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+import numpy as np
+import torch
+from loguru import logger
+from transformers import AutoModel
+
+from rag_service.config.settings import settings
+from rag_service.app.core.llm.transformer_service import TransformerEncoder, TransformerService
+
+# 导出使用的 opset 版本，参与导出缓存的键
+_OPSET_VERSION = 17
+# 动态量化的权重类型，写在量化模型的文件名中
+_QUANT_WEIGHT_TYPE = "QInt8"
+
+def _require(module: str) -> Any:
+    """导入 ONNX 后端的可选依赖，缺失时提示安装 onnx extra"""
+    try:
+        return importlib.import_module(module)
+    except ImportError as e:
+        raise ImportError(
+            f"ONNX 嵌入后端需要 {module}，请安装可选依赖: uv sync --extra onnx（或 pip install 'rag-service[onnx]'）"
+        ) from e
+
+@contextmanager
+def _replace_on_success(path: Path) -> Iterator[Path]:
+    """
+    在同目录的唯一临时文件中生成 path，成功后用 os.replace 原子替换
+
+    多个进程同时导出时各自写自己的临时文件，不会互相截断；失败时删除临时文件。
+    """
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f"{path.name}.", suffix=".tmp")
+    os.close(fd)
+    try:
+        yield Path(tmp)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+
+class _LastHiddenState(torch.nn.Module):
+    """导出用的包装：按关键字参数调用模型，只输出最后一层隐状态"""
+
+    def __init__(self, model, input_names: List[str]):
+        super().__init__()
+        self.model = model
+        self.input_names = input_names
+
+    def forward(self, *inputs):
+        return self.model(**dict(zip(self.input_names, inputs)))[0]
+
+class ONNXEncoder(TransformerEncoder):
+    """
+    基于 ONNX Runtime 的编码器
+
+    首次使用时把模型导出为 ONNX，可选做动态 int8 量化，之后直接复用导出的文件。
+    导出目录按模型版本（配置、Hub 提交号或本地权重文件）与导出参数区分，模型更新后重新导出。
+    分词、分桶与池化的逻辑与 TransformerEncoder 一致，只替换前向计算。
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        max_length: int = 512,
+        onnx_dir: str = "data/onnx",
+        quantize: bool = True,
+        num_threads: Optional[int] = None
+    ):
+        """
+        初始化编码器
+
+        Args:
+            model_name: 模型名称或本地路径
+            max_length: 最大 token 数
+            onnx_dir: 导出的 ONNX 文件目录
+            quantize: 是否使用动态 int8 量化的模型
+            num_threads: ONNX Runtime 算子内线程数，None 表示使用默认值
+        """
+        super().__init__(model_name, max_length=max_length)
+        self.quantize = quantize
+        self.num_threads = num_threads
+        self.input_names = list(self.tokenizer.model_input_names)
+        model_dir = Path(onnx_dir) / re.sub(r"[^A-Za-z0-9_.-]", "_", model_name.strip("/")) / self._revision()
+        self.onnx_path = self._export(model_dir)
+        self._session = None
+
+    def _revision(self) -> str:
+        """导出缓存的键：模型配置、Hub 提交号（本地目录为权重文件的大小与修改时间）与导出参数的哈希"""
+        digest = hashlib.sha256()
+        digest.update(self.config.to_json_string(use_diff=False).encode("utf-8"))
+        digest.update(str(getattr(self.config, "_commit_hash", None)).encode("utf-8"))
+        local_dir = Path(self.model_name)
+        if local_dir.is_dir():
+            for path in sorted(local_dir.iterdir()):
+                if path.suffix in (".bin", ".safetensors"):
+                    stat = path.stat()
+                    digest.update(f"{path.name}:{stat.st_size}:{stat.st_mtime_ns}".encode("utf-8"))
+        digest.update(json.dumps({"opset": _OPSET_VERSION, "inputs": self.input_names}).encode("utf-8"))
+        return digest.hexdigest()[:16]
+
+    def _export(self, model_dir: Path) -> Path:
+        """导出（并量化）模型，已存在时直接返回路径"""
+        fp32_path = model_dir / "model.onnx"
+        int8_path = model_dir / f"model.{_QUANT_WEIGHT_TYPE.lower()}.onnx"
+        if not fp32_path.exists():
+            # torch.onnx.export 依赖 onnx 包
+            _require("onnx")
+            model_dir.mkdir(parents=True, exist_ok=True)
+            logger.info(f"导出 ONNX 模型: {self.model_name} -> {fp32_path}")
+            model = AutoModel.from_pretrained(self.model_name)
+            model.eval()
+            dummy = tuple(torch.ones((1, 8), dtype=torch.long) for _ in self.input_names)
+            dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in self.input_names + ["last_hidden_state"]}
+            with _replace_on_success(fp32_path) as tmp_path:
+                torch.onnx.export(
+                    _LastHiddenState(model, self.input_names),
+                    dummy,
+                    str(tmp_path),
+                    input_names=self.input_names,
+                    output_names=["last_hidden_state"],
+                    dynamic_axes=dynamic_axes,
+                    opset_version=_OPSET_VERSION,
+                    dynamo=False
+                )
+        if not self.quantize:
+            return fp32_path
+
+        if not int8_path.exists():
+            quantization = _require("onnxruntime.quantization")
+            logger.info(f"动态 int8 量化: {int8_path}")
+            with _replace_on_success(int8_path) as tmp_path:
+                quantization.quantize_dynamic(
+                    str(fp32_path), str(tmp_path), weight_type=getattr(quantization.QuantType, _QUANT_WEIGHT_TYPE)
+                )
+        return int8_path
+
+    def load_model(self) -> None:
+        """创建 ONNX Runtime 会话"""
+        ort = _require("onnxruntime")
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if self.num_threads:
+            options.intra_op_num_threads = self.num_threads
+            options.inter_op_num_threads = 1
+        self._session = ort.InferenceSession(
+            str(self.onnx_path),
+            sess_options=options,
+            providers=["CPUExecutionProvider"]
+        )
+
+    def share_memory(self) -> None:
+        """ONNX Runtime 会话无法跨进程共享，工作池的每个子进程各自创建会话"""
+
+    @property
+    def session(self):
+        """惰性创建会话：进程池模式下主进程不需要会话"""
+        if self._session is None:
+            self.load_model()
+        return self._session
+
+    def encode_ids(self, token_ids: List[List[int]]) -> np.ndarray:
+        """对一批已分词的输入做一次前向计算，返回归一化后的嵌入矩阵"""
+        encoded_input = self.tokenizer.pad(
+            {"input_ids": token_ids},
+            padding=True,
+            return_tensors='np'
+        )
+        input_ids = encoded_input["input_ids"]
+        feeds = {
+            # 只传了 input_ids 时分词器不会补 token_type_ids，用全零代替
+            name: (
+                encoded_input[name].astype(np.int64) if name in encoded_input
+                else np.zeros_like(input_ids, dtype=np.int64)
+            )
+            for name in self.input_names
+        }
+        token_embeddings = self.session.run(None, feeds)[0]
+
+        # 平均池化
+        mask = feeds["attention_mask"][..., None].astype(np.float32)
+        embeddings = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+
+        # 归一化
+        embeddings = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings.astype(np.float32)
+
+class ONNXEmbeddingService(TransformerService):
+    """使用 ONNX Runtime（可选 int8 量化）在 CPU 上计算嵌入的服务"""
+
+    encoder_class = ONNXEncoder
+    provider = "onnxruntime"
+
+    def _encoder_kwargs(self) -> Dict[str, Any]:
+        return {
+            "onnx_dir": settings.ONNX_MODEL_DIR,
+            "quantize": settings.ONNX_QUANTIZE,
+            "num_threads": settings.ONNX_INTRA_OP_THREADS
+        }
+
+    def get_model_info(self) -> Dict[str, Any]:
+        info = super().get_model_info()
+        info["quantized"] = self.encoder.quantize
+        return info
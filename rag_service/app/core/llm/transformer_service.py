@@ -1,44 +1,80 @@
-from typing import Any, Dict, List
-from transformers import AutoTokenizer, AutoModel
+import asyncio
+from typing import Any, Dict, List, Optional, Type
+from transformers import AutoConfig, AutoTokenizer, AutoModel
+from loguru import logger
 import torch
 import numpy as np
 
 from rag_service.config.settings import settings
 from rag_service.app.core.llm.base import BaseLLMService
+from rag_service.app.core.llm.batcher import EmbeddingBatcher
+from rag_service.app.core.llm.bucketing import BucketPlan, plan_length_buckets
+from rag_service.app.core.llm.executor import InferenceExecutor
+from rag_service.app.core.llm.worker_pool import EmbeddingWorkerPool
 
-class TransformerService(BaseLLMService):
-    def __init__(self):
-        self.model_name = settings.EMBEDDING_MODEL
-        self.tokenizer = AutoTokenizer.from_pretrained(self.model_name)
-        self.model = AutoModel.from_pretrained(self.model_name)
-        self.model.eval()  # 设置为评估模式
+def configure_torch_threads(
+    num_threads: Optional[int] = None,
+    num_interop_threads: Optional[int] = None
+) -> None:
+    """
+    设置 torch 的线程数
+    
+    Args:
+        num_threads: 算子内并行线程数，None 表示保持默认
+        num_interop_threads: 算子间并行线程数，None 表示保持默认
+    """
+    if num_threads:
+        torch.set_num_threads(num_threads)
+    if num_interop_threads and torch.get_num_interop_threads() != num_interop_threads:
+        try:
+            torch.set_num_interop_threads(num_interop_threads)
+        except RuntimeError as e:
+            # 已经执行过并行计算后不能再修改
+            logger.warning(f"无法设置 torch 算子间线程数: {e}")
+
+class TransformerEncoder:
+    """同步的分词与前向计算，可以在事件循环外的线程或子进程中运行"""
+    
+    def __init__(self, model_name: str, max_length: int = 512):
+        self.model_name = model_name
+        self.max_length = max_length
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.config = AutoConfig.from_pretrained(model_name)
+        self._model = None
+    
+    @property
+    def model(self):
+        """惰性加载模型：进程池模式下主进程只需要分词器和配置"""
+        if self._model is None:
+            self.load_model()
+        return self._model
+    
+    def load_model(self) -> None:
+        """加载模型权重"""
+        self._model = AutoModel.from_pretrained(self.model_name)
+        self._model.eval()  # 设置为评估模式
     
     def _mean_pooling(self, model_output, attention_mask):
-        """对模型输出进行平均池化"""
+        """对模型输出按序列维度进行平均池化，每个文本得到一个向量"""
         token_embeddings = model_output[0]
         input_mask_expanded = attention_mask.unsqueeze(-1).expand(token_embeddings.size()).float()
-        return torch.sum(token_embeddings * input_mask_expanded, 0) / torch.clamp(input_mask_expanded.sum(0), min=1e-9)
-    
-    async def generate(self, prompt: str, **kwargs) -> str:
-        """生成文本响应（这里仅作为示例，实际使用时需要实现）"""
-        raise NotImplementedError("TransformerService 目前仅支持嵌入功能")
-    
-    async def generate_with_history(
-        self, 
-        messages: List[Dict[str, str]], 
-        **kwargs
-    ) -> str:
-        """基于历史消息生成响应（这里仅作为示例，实际使用时需要实现）"""
-        raise NotImplementedError("TransformerService 目前仅支持嵌入功能")
+        return torch.sum(token_embeddings * input_mask_expanded, 1) / torch.clamp(input_mask_expanded.sum(1), min=1e-9)
     
-    async def get_embeddings(self, texts: List[str]) -> List[List[float]]:
-        """获取文本的嵌入向量"""
-        # 对文本进行编码
-        encoded_input = self.tokenizer(
+    def tokenize(self, texts: List[str]) -> List[List[int]]:
+        """分词但不填充，返回每条文本的 token id"""
+        encoded = self.tokenizer(
             texts,
-            padding=True,
             truncation=True,
-            max_length=512,
+            max_length=self.max_length
+        )
+        return encoded["input_ids"]
+    
+    def encode_ids(self, token_ids: List[List[int]]) -> np.ndarray:
+        """对一批已分词的输入做一次前向计算，返回归一化后的嵌入矩阵"""
+        # 填充到本批次内最长的输入
+        encoded_input = self.tokenizer.pad(
+            {"input_ids": token_ids},
+            padding=True,
             return_tensors='pt'
         )
         
@@ -53,12 +89,210 @@ class TransformerService(BaseLLMService):
         embeddings = embeddings.numpy()
         embeddings = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
         
-        return embeddings.tolist()
+        return embeddings
+    
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """对一批文本做一次前向计算，返回归一化后的嵌入矩阵"""
+        return self.encode_ids(self.tokenize(texts))
+    
+    def share_memory(self) -> None:
+        """把模型权重移到共享内存，供工作池的子进程只读共享"""
+        self.model.share_memory()
+
+# 进程池模式下每个子进程持有自己的编码器
+_process_encoder: Optional[TransformerEncoder] = None
+
+def _init_process_encoder(
+    encoder_class: Type[TransformerEncoder],
+    model_name: str,
+    encoder_kwargs: Dict[str, Any],
+    num_threads: Optional[int]
+) -> None:
+    """进程池子进程的初始化函数：加载模型"""
+    global _process_encoder
+    configure_torch_threads(num_threads)
+    _process_encoder = encoder_class(model_name, **encoder_kwargs)
+    _process_encoder.load_model()
+
+def _call_process_encoder(method: str, *args) -> Any:
+    """在进程池子进程中调用编码器方法"""
+    return getattr(_process_encoder, method)(*args)
+
+class TransformerService(BaseLLMService):
+    # 子类通过替换编码器实现其他推理后端
+    encoder_class: Type[TransformerEncoder] = TransformerEncoder
+    provider: str = "transformers"
+    
+    def __init__(self, model_name: Optional[str] = None):
+        configure_torch_threads(settings.TORCH_NUM_THREADS, settings.TORCH_NUM_INTEROP_THREADS)
+        self.model_name = model_name or settings.EMBEDDING_MODEL
+        encoder_kwargs = self._encoder_kwargs()
+        self.encoder = self.encoder_class(self.model_name, **encoder_kwargs)
+        self.tokenizer = self.encoder.tokenizer
+        
+        # 分词和推理在专用执行器中运行，不阻塞事件循环
+        if settings.EMBEDDING_EXECUTOR == "pool":
+            # 工作池的子进程共享父进程加载的模型权重
+            self.executor = EmbeddingWorkerPool(
+                self.encoder,
+                dimension=self.encoder.config.hidden_size,
+                max_workers=settings.EMBEDDING_EXECUTOR_WORKERS,
+                num_threads=settings.TORCH_NUM_THREADS,
+                start_method=settings.EMBEDDING_POOL_START_METHOD
+            )
+        else:
+            self.executor = InferenceExecutor(
+                mode=settings.EMBEDDING_EXECUTOR,
+                max_workers=settings.EMBEDDING_EXECUTOR_WORKERS,
+                initializer=_init_process_encoder,
+                initargs=(self.encoder_class, self.model_name, encoder_kwargs, settings.TORCH_NUM_THREADS)
+            )
+            if self.executor.mode != "process":
+                self.encoder.load_model()
+        
+        self._bucket_stats = {
+            "bulk_calls": 0,
+            "buckets": 0,
+            "real_tokens": 0,
+            "padded_tokens": 0,
+            "naive_padded_tokens": 0
+        }
+        
+        # 并发的小请求合并为一次前向计算
+        self.batcher: Optional[EmbeddingBatcher] = None
+        if settings.EMBEDDING_BATCHING_ENABLED:
+            self.batcher = EmbeddingBatcher(
+                self._encode_async,
+                max_batch_size=settings.EMBEDDING_MAX_BATCH_SIZE,
+                max_wait_ms=settings.EMBEDDING_MAX_WAIT_MS
+            )
+    
+    def _encoder_kwargs(self) -> Dict[str, Any]:
+        """创建编码器时的额外参数"""
+        return {}
+    
+    async def generate(self, prompt: str, **kwargs) -> str:
+        """生成文本响应（这里仅作为示例，实际使用时需要实现）"""
+        raise NotImplementedError("TransformerService 目前仅支持嵌入功能")
+    
+    async def generate_with_history(
+        self, 
+        messages: List[Dict[str, str]], 
+        **kwargs
+    ) -> str:
+        """基于历史消息生成响应（这里仅作为示例，实际使用时需要实现）"""
+        raise NotImplementedError("TransformerService 目前仅支持嵌入功能")
+    
+    async def _run_encoder(self, method: str, *args) -> Any:
+        """在执行器中调用编码器方法"""
+        if self.executor.mode == "pool":
+            return await self.executor.run(method, *args)
+        if self.executor.mode == "process":
+            return await self.executor.run(_call_process_encoder, method, *args)
+        return await self.executor.run(getattr(self.encoder, method), *args)
+    
+    async def _encode_async(self, texts: List[str]) -> np.ndarray:
+        """在执行器中编码文本，供批处理器调用"""
+        return await self._run_encoder("encode", texts)
+    
+    async def _encode_bulk(self, texts: List[str]) -> np.ndarray:
+        """批量编码：先分词（不填充），再按长度分桶计算"""
+        token_ids = await self._run_encoder("tokenize", texts)
+        return await self._encode_token_ids(token_ids)
+    
+    async def _encode_token_ids(self, token_ids: List[List[int]]) -> np.ndarray:
+        """
+        按 token 长度分桶，每个桶单独填充和计算，结果按原顺序返回
+        
+        长短文本混在一个批次里时，短文本都要填充到最长文本的长度，
+        注意力的计算量随序列长度平方增长，分桶可以避免在填充上浪费计算。
+        """
+        plan = plan_length_buckets(
+            [len(ids) for ids in token_ids],
+            max_tokens_per_batch=settings.EMBEDDING_BUCKET_MAX_TOKENS
+        )
+        self._record_bucket_plan(plan)
+        
+        bucket_embeddings = await asyncio.gather(*(
+            self._run_encoder("encode_ids", [token_ids[i] for i in bucket])
+            for bucket in plan.buckets
+        ))
+        
+        embeddings = np.empty((len(token_ids), self.encoder.config.hidden_size), dtype=np.float32)
+        for bucket, rows in zip(plan.buckets, bucket_embeddings):
+            embeddings[bucket] = rows
+        return embeddings
+    
+    def _record_bucket_plan(self, plan: BucketPlan) -> None:
+        """累计分桶的填充统计"""
+        self._bucket_stats["bulk_calls"] += 1
+        self._bucket_stats["buckets"] += len(plan.buckets)
+        self._bucket_stats["real_tokens"] += plan.real_tokens
+        self._bucket_stats["padded_tokens"] += plan.padded_tokens
+        self._bucket_stats["naive_padded_tokens"] += plan.naive_padded_tokens
+        logger.debug(
+            f"分桶编码 {len(plan.buckets)} 个桶, 少计算 {plan.saved_tokens} 个 token "
+            f"(省去 {plan.padding_saved_ratio:.1%} 的填充)"
+        )
+    
+    async def get_embeddings_array(self, texts: List[str]) -> np.ndarray:
+        """获取文本的嵌入向量矩阵（float32）"""
+        if not texts:
+            return np.empty((0, self.encoder.config.hidden_size), dtype=np.float32)
+        # 小请求进入批处理队列，与其他并发请求合并；大请求按长度分桶计算
+        if self.batcher is not None and len(texts) <= self.batcher.max_batch_size:
+            embeddings = await self.batcher.submit(texts)
+        else:
+            embeddings = await self._encode_bulk(texts)
+        return np.ascontiguousarray(embeddings, dtype=np.float32)
+    
+    async def get_embeddings_from_token_ids(
+        self,
+        token_ids: List[List[int]],
+        texts: Optional[List[str]] = None
+    ) -> np.ndarray:
+        """
+        用已分好的 token id 计算嵌入，跳过分词
+        
+        Args:
+            token_ids: 每条输入的 token id（含特殊 token），长度不超过模型最大长度
+            texts: 对应的原文，本服务不使用，供缓存等包装层作为键
+        """
+        if not token_ids:
+            return np.empty((0, self.encoder.config.hidden_size), dtype=np.float32)
+        return await self._encode_token_ids(token_ids)
+    
+    async def get_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """获取文本的嵌入向量"""
+        return (await self.get_embeddings_array(texts)).tolist()
+    
+    async def warmup(self) -> None:
+        """用一次空推理预热模型，避免首个请求承担初始化开销"""
+        await self.get_embeddings(["warmup"])
+    
+    async def close(self) -> None:
+        """停止批处理后台任务并关闭执行器"""
+        if self.batcher is not None:
+            await self.batcher.close()
+        self.executor.shutdown()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取执行器、合批与分桶的运行指标"""
+        bucketing = dict(self._bucket_stats)
+        bucketing["saved_tokens"] = bucketing["naive_padded_tokens"] - bucketing["padded_tokens"]
+        stats = {"executor": self.executor.get_stats(), "bucketing": bucketing}
+        if self.batcher is not None:
+            stats["batcher"] = self.batcher.get_stats()
+        return stats
     
     def get_model_info(self) -> Dict[str, Any]:
         """获取模型信息"""
         return {
-            "provider": "transformers",
+            "provider": self.provider,
             "model": self.model_name,
-            "type": "embedding"
-        } 
\ No newline at end of file
+            "type": "embedding",
+            "dimension": self.encoder.config.hidden_size,
+            "pooling": "mean",
+            "normalized": True,
+            "max_length": self.encoder.max_length
+        }
\ No newline at end of file
@@ -0,0 +1,11 @@
+import pytest
+
+def pytest_configure(config):
+    """注册自定义标记"""
+    config.addinivalue_line("markers", "batcher: 嵌入合批测试")
+    config.addinivalue_line("markers", "transformer: Transformer嵌入服务测试")
+    config.addinivalue_line("markers", "executor: 推理执行器测试")
+    config.addinivalue_line("markers", "bucketing: 长度分桶测试")
+    config.addinivalue_line("markers", "cache: 嵌入缓存测试")
+    config.addinivalue_line("markers", "onnx: ONNX Runtime嵌入后端测试")
+    config.addinivalue_line("markers", "pool: 多进程嵌入工作池测试")
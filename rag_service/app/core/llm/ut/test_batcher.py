@@ -0,0 +1,81 @@
+import asyncio
+import pytest
+import numpy as np
+
+from rag_service.app.core.llm.batcher import EmbeddingBatcher
+
+class CountingEmbedder:
+    """记录每次前向计算批次大小的假嵌入函数"""
+
+    def __init__(self, fail: bool = False):
+        self.calls = []
+        self.fail = fail
+
+    async def __call__(self, texts):
+        self.calls.append(len(texts))
+        if self.fail:
+            raise RuntimeError("boom")
+        # 每个文本的向量为 [len(text), 1]，便于校验行的对应关系
+        return np.array([[float(len(text)), 1.0] for text in texts], dtype=np.float32)
+
+@pytest.mark.batcher
+def test_concurrent_requests_merged():
+    """测试并发请求被合并为一次计算，且每个调用方拿回自己的行"""
+    embedder = CountingEmbedder()
+
+    async def run():
+        batcher = EmbeddingBatcher(embedder, max_batch_size=16, max_wait_ms=50)
+        texts = [["a" * (i + 1)] for i in range(8)]
+        results = await asyncio.gather(*(batcher.submit(t) for t in texts))
+        await batcher.close()
+        return texts, results, batcher.get_stats()
+
+    texts, results, stats = asyncio.run(run())
+    assert embedder.calls == [8]
+    for text, rows in zip(texts, results):
+        assert rows.shape == (1, 2)
+        assert rows[0, 0] == len(text[0])
+    assert stats["batches"] == 1
+    assert stats["avg_batch_size"] == 8
+
+@pytest.mark.batcher
+def test_max_batch_size_respected():
+    """测试单个批次不超过上限，放不下的请求进入下一批"""
+    embedder = CountingEmbedder()
+
+    async def run():
+        batcher = EmbeddingBatcher(embedder, max_batch_size=4, max_wait_ms=50)
+        results = await asyncio.gather(*(batcher.submit(["x", "yy", "zzz"]) for _ in range(3)))
+        await batcher.close()
+        return results
+
+    results = asyncio.run(run())
+    assert all(size <= 4 for size in embedder.calls)
+    assert sum(embedder.calls) == 9
+    for rows in results:
+        np.testing.assert_array_equal(rows[:, 0], [1, 2, 3])
+
+@pytest.mark.batcher
+def test_oversized_request_rejected():
+    """测试超过批次上限的单个请求被拒绝"""
+    async def run():
+        batcher = EmbeddingBatcher(CountingEmbedder(), max_batch_size=2)
+        with pytest.raises(ValueError):
+            await batcher.submit(["a", "b", "c"])
+
+    asyncio.run(run())
+
+@pytest.mark.batcher
+def test_errors_propagate_to_all_callers():
+    """测试计算失败时批次内所有调用方都收到异常"""
+    async def run():
+        batcher = EmbeddingBatcher(CountingEmbedder(fail=True), max_batch_size=8, max_wait_ms=20)
+        results = await asyncio.gather(
+            *(batcher.submit(["a"]) for _ in range(3)),
+            return_exceptions=True
+        )
+        await batcher.close()
+        return results
+
+    results = asyncio.run(run())
+    assert all(isinstance(r, RuntimeError) for r in results)
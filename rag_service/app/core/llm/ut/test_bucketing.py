@@ -0,0 +1,43 @@
+import pytest
+
+from rag_service.app.core.llm.bucketing import plan_length_buckets
+
+@pytest.mark.bucketing
+def test_buckets_respect_token_budget():
+    """测试每个桶填充后不超过token预算"""
+    lengths = [512, 10, 12, 300, 8, 9, 11, 290, 15]
+    plan = plan_length_buckets(lengths, max_tokens_per_batch=600)
+    for bucket in plan.buckets:
+        assert len(bucket) * max(lengths[i] for i in bucket) <= 600
+    # 所有输入恰好出现一次
+    assert sorted(i for bucket in plan.buckets for i in bucket) == list(range(len(lengths)))
+
+@pytest.mark.bucketing
+def test_padding_saved():
+    """测试分桶相比整体填充减少了计算量"""
+    lengths = [512] + [16] * 63
+    plan = plan_length_buckets(lengths, max_tokens_per_batch=600)
+    assert plan.naive_padded_tokens == 64 * 512
+    assert plan.padded_tokens == 512 + 63 * 16
+    assert plan.padded_tokens == plan.real_tokens
+    assert plan.padding_saved_ratio == 1.0
+
+@pytest.mark.bucketing
+def test_oversized_input_gets_own_bucket():
+    """测试超过预算的单条输入单独成桶"""
+    plan = plan_length_buckets([100, 5, 5], max_tokens_per_batch=50)
+    assert plan.buckets[0] == [0]
+    assert plan.buckets[1] == [1, 2]
+
+@pytest.mark.bucketing
+def test_max_batch_size():
+    """测试桶内条数上限"""
+    plan = plan_length_buckets([4] * 10, max_tokens_per_batch=1000, max_batch_size=3)
+    assert [len(bucket) for bucket in plan.buckets] == [3, 3, 3, 1]
+
+@pytest.mark.bucketing
+def test_empty_input():
+    """测试空输入"""
+    plan = plan_length_buckets([], max_tokens_per_batch=100)
+    assert plan.buckets == []
+    assert plan.padding_saved_ratio == 0.0
@@ -0,0 +1,157 @@
+import asyncio
+import threading
+import pytest
+import numpy as np
+from typing import Any, Dict, List
+
+from rag_service.app.core.llm.base import BaseLLMService
+from rag_service.app.core.llm.cached_service import CachedEmbeddingService
+from rag_service.app.core.llm.embedding_cache import EmbeddingCache
+
+class CountingEmbeddingService(BaseLLMService):
+    """记录实际计算过哪些文本的假嵌入服务"""
+
+    def __init__(self, model: str = "fake"):
+        self.model = model
+        self.embedded: List[str] = []
+
+    async def generate(self, prompt: str, **kwargs) -> str:
+        raise NotImplementedError
+
+    async def generate_with_history(self, messages: List[Dict[str, str]], **kwargs) -> str:
+        raise NotImplementedError
+
+    async def get_embeddings(self, texts: List[str]) -> List[List[float]]:
+        self.embedded.extend(texts)
+        return [[float(len(text)), 1.0, 0.0] for text in texts]
+
+    def get_model_info(self) -> Dict[str, Any]:
+        return {"provider": "fake", "model": self.model, "dimension": 3}
+
+@pytest.mark.cache
+def test_memory_hits_and_evictions():
+    """测试内存LRU的命中与淘汰计数"""
+    cache = EmbeddingCache("fp", dimension=2, memory_size=2)
+    keys = [cache.make_key(text) for text in ["a", "b", "c"]]
+    cache.put_many(keys, np.eye(3, 2, dtype=np.float32))
+
+    results = cache.get_many(keys)
+    assert results[0] is None  # "a" 已被淘汰
+    np.testing.assert_array_equal(results[2], [0, 0])
+    stats = cache.get_stats()
+    assert stats["evictions"] == 1
+    assert stats["memory_hits"] == 2
+    assert stats["misses"] == 1
+
+@pytest.mark.cache
+def test_disk_tier_persists(tmp_path):
+    """测试磁盘缓存在重新打开后仍可命中，且能超出初始容量"""
+    rows = EmbeddingCache._INITIAL_ROWS + 10
+    vectors = np.random.default_rng(0).random((rows, 4), dtype=np.float32)
+    cache = EmbeddingCache("fp", dimension=4, cache_dir=str(tmp_path), memory_size=8)
+    keys = [cache.make_key(str(i)) for i in range(rows)]
+    cache.put_many(keys, vectors)
+    cache.close()
+
+    reopened = EmbeddingCache("fp", dimension=4, cache_dir=str(tmp_path), memory_size=8)
+    results = reopened.get_many(keys)
+    np.testing.assert_array_equal(np.vstack(results), vectors)
+    stats = reopened.get_stats()
+    assert stats["disk_hits"] == rows
+    assert stats["disk_entries"] == rows
+    reopened.close()
+
+@pytest.mark.cache
+def test_disk_rows_allocated_across_processes(tmp_path):
+    """测试共用磁盘目录的多个缓存实例（模拟多个进程）分到不同的行，互不覆盖"""
+    first = EmbeddingCache("fp", dimension=4, cache_dir=str(tmp_path), memory_size=1)
+    second = EmbeddingCache("fp", dimension=4, cache_dir=str(tmp_path), memory_size=1)
+    vectors = np.arange(40, dtype=np.float32).reshape(10, 4)
+    keys = [first.make_key(str(i)) for i in range(10)]
+    for i in range(0, 10, 2):
+        first.put_many(keys[i:i + 1], vectors[i:i + 1])
+        second.put_many(keys[i + 1:i + 2], vectors[i + 1:i + 2])
+    # 另一个实例写入的键不会重复分配
+    second.put_many(keys[:1], vectors[:1])
+    first.close()
+
+    np.testing.assert_array_equal(np.vstack(second.get_many(keys)), vectors)
+    second.close()
+    reopened = EmbeddingCache("fp", dimension=4, cache_dir=str(tmp_path))
+    np.testing.assert_array_equal(np.vstack(reopened.get_many(keys)), vectors)
+    assert reopened.get_stats()["disk_entries"] == 10
+    reopened.close()
+
+@pytest.mark.cache
+def test_disk_tier_capped(tmp_path):
+    """测试磁盘层达到上限后覆盖最早写入的行，调小上限后超出的行不再命中"""
+    cache = EmbeddingCache("fp", dimension=4, cache_dir=str(tmp_path), memory_size=1, max_disk_rows=4)
+    vectors = np.arange(24, dtype=np.float32).reshape(6, 4)
+    keys = [cache.make_key(str(i)) for i in range(6)]
+    for i in range(6):
+        cache.put_many(keys[i:i + 1], vectors[i:i + 1])
+    assert cache.get_stats()["disk_evictions"] == 2
+    assert cache.get_stats()["disk_entries"] == 4
+    cache.close()
+
+    reopened = EmbeddingCache("fp", dimension=4, cache_dir=str(tmp_path), max_disk_rows=4)
+    results = reopened.get_many(keys)
+    assert results[:2] == [None, None]
+    np.testing.assert_array_equal(np.vstack(results[2:]), vectors[2:])
+    assert (tmp_path / next(tmp_path.iterdir()).name / "vectors.f32").stat().st_size == 4 * 4 * 4
+    reopened.close()
+
+    shrunk = EmbeddingCache("fp", dimension=4, cache_dir=str(tmp_path), max_disk_rows=2)
+    assert shrunk.get_stats()["disk_entries"] == 2
+    assert sum(vector is not None for vector in shrunk.get_many(keys)) == 2
+    shrunk.put_many(keys[:1], vectors[:1])
+    np.testing.assert_array_equal(shrunk.get_many(keys[:1])[0], vectors[0])
+    shrunk.close()
+
+@pytest.mark.cache
+def test_fingerprint_changes_key():
+    """测试不同模型指纹下相同文本的键不同"""
+    assert EmbeddingCache("model-a", 2).make_key("x") != EmbeddingCache("model-b", 2).make_key("x")
+
+@pytest.mark.cache
+def test_cached_service_skips_model_on_hit(tmp_path):
+    """测试命中缓存的文本不再经过模型"""
+    inner = CountingEmbeddingService()
+    service = CachedEmbeddingService(inner, cache_dir=str(tmp_path))
+
+    first = asyncio.run(service.get_embeddings(["a", "bb", "a"]))
+    second = asyncio.run(service.get_embeddings(["bb", "ccc"]))
+    asyncio.run(service.close())
+
+    assert inner.embedded == ["a", "bb", "ccc"]
+    assert first == [[1.0, 1.0, 0.0], [2.0, 1.0, 0.0], [1.0, 1.0, 0.0]]
+    assert second == [[2.0, 1.0, 0.0], [3.0, 1.0, 0.0]]
+
+    # 重启后从磁盘命中
+    inner = CountingEmbeddingService()
+    service = CachedEmbeddingService(inner, cache_dir=str(tmp_path))
+    asyncio.run(service.get_embeddings(["a", "ccc"]))
+    assert inner.embedded == []
+    assert service.get_stats()["cache"]["disk_hits"] == 2
+
+    # 换模型后缓存不再命中
+    other = CountingEmbeddingService(model="other")
+    asyncio.run(CachedEmbeddingService(other, cache_dir=str(tmp_path)).get_embeddings(["a"]))
+    assert other.embedded == ["a"]
+
+@pytest.mark.cache
+def test_cached_service_disk_io_off_event_loop(tmp_path, monkeypatch):
+    """测试有磁盘层时缓存读写在线程中执行，不阻塞事件循环"""
+    service = CachedEmbeddingService(CountingEmbeddingService(), cache_dir=str(tmp_path))
+    threads = []
+    for name in ("get_many", "put_many"):
+        method = getattr(service.cache, name)
+
+        def record(*args, method=method):
+            threads.append(threading.current_thread())
+            return method(*args)
+
+        monkeypatch.setattr(service.cache, name, record)
+    asyncio.run(service.get_embeddings(["a"]))
+    asyncio.run(service.close())
+    assert len(threads) == 2 and threading.main_thread() not in threads
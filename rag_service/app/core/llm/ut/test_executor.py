@@ -0,0 +1,87 @@
+import asyncio
+import threading
+import time
+import pytest
+
+from rag_service.app.core.llm.executor import InferenceExecutor
+
+def _thread_name(_):
+    return threading.current_thread().name
+
+def _sleep(seconds):
+    time.sleep(seconds)
+    return seconds
+
+def _fail(_):
+    raise ValueError("boom")
+
+@pytest.mark.executor
+def test_thread_mode_runs_off_event_loop():
+    """测试线程模式下任务不在事件循环线程中执行"""
+    executor = InferenceExecutor(mode="thread", max_workers=1)
+    name = asyncio.run(executor.run(_thread_name, None))
+    executor.shutdown()
+    assert name.startswith("inference")
+
+@pytest.mark.executor
+def test_inline_mode_runs_in_place():
+    """测试inline模式直接在当前线程执行"""
+    executor = InferenceExecutor(mode="inline")
+    assert asyncio.run(executor.run(_thread_name, None)) == threading.current_thread().name
+
+@pytest.mark.executor
+def test_unknown_mode():
+    """测试未知执行模式"""
+    with pytest.raises(ValueError):
+        InferenceExecutor(mode="gpu")
+
+@pytest.mark.executor
+def test_queue_depth_and_busy_workers():
+    """测试排队深度与忙碌工作者统计"""
+    executor = InferenceExecutor(mode="thread", max_workers=2)
+
+    async def run():
+        tasks = [asyncio.ensure_future(executor.run(_sleep, 0.2)) for _ in range(5)]
+        await asyncio.sleep(0.05)
+        during = executor.get_stats()
+        await asyncio.gather(*tasks)
+        return during, executor.get_stats()
+
+    during, after = asyncio.run(run())
+    executor.shutdown()
+    assert during["busy_workers"] == 2
+    assert during["queue_depth"] == 3
+    assert after["busy_workers"] == 0
+    assert after["queue_depth"] == 0
+    assert after["completed"] == 5
+
+@pytest.mark.executor
+def test_event_loop_not_blocked():
+    """测试长任务执行期间事件循环仍能处理其他协程"""
+    executor = InferenceExecutor(mode="thread", max_workers=1)
+
+    async def run():
+        ticks = 0
+        task = asyncio.ensure_future(executor.run(_sleep, 0.2))
+        while not task.done():
+            ticks += 1
+            await asyncio.sleep(0.01)
+        return ticks
+
+    ticks = asyncio.run(run())
+    executor.shutdown()
+    assert ticks > 5
+
+@pytest.mark.executor
+def test_failed_calls_not_counted_as_completed():
+    """测试失败的调用只计入 failed，不计入 completed 与平均耗时"""
+    executor = InferenceExecutor(mode="thread", max_workers=1)
+    with pytest.raises(ValueError):
+        asyncio.run(executor.run(_fail, None))
+    asyncio.run(executor.run(_sleep, 0.01))
+    stats = executor.get_stats()
+    executor.shutdown()
+    assert stats["completed"] == 1
+    assert stats["failed"] == 1
+    assert stats["busy_workers"] == 0
+    assert stats["avg_latency_ms"] >= 10
@@ -0,0 +1,79 @@
+import asyncio
+import os
+import sys
+import pytest
+import numpy as np
+
+from rag_service.config.settings import settings
+
+pytest.importorskip("onnxruntime")
+
+TEXTS = [
+    "hello world",
+    "the quick brown fox jumps over the lazy dog",
+    "vector search",
+    "embedding model query"
+]
+
+@pytest.fixture
+def torch_embeddings(tiny_model_dir):
+    """PyTorch 后端的参考结果"""
+    from rag_service.app.core.llm.transformer_service import TransformerEncoder
+    return TransformerEncoder(str(tiny_model_dir)).encode(TEXTS)
+
+def _onnx_service(tiny_model_dir, tmp_path, monkeypatch, quantize):
+    from rag_service.app.core.llm.onnx_service import ONNXEmbeddingService
+    monkeypatch.setattr(settings, "ONNX_MODEL_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "ONNX_QUANTIZE", quantize)
+    monkeypatch.setattr(settings, "ONNX_INTRA_OP_THREADS", 1)
+    return ONNXEmbeddingService(model_name=str(tiny_model_dir))
+
+@pytest.mark.onnx
+def test_fp32_parity(tiny_model_dir, tmp_path, monkeypatch, torch_embeddings):
+    """测试fp32 ONNX模型与PyTorch输出一致"""
+    service = _onnx_service(tiny_model_dir, tmp_path, monkeypatch, quantize=False)
+    embeddings = np.array(asyncio.run(service.get_embeddings(TEXTS)))
+    asyncio.run(service.close())
+    np.testing.assert_allclose(embeddings, torch_embeddings, atol=1e-4)
+    assert service.get_model_info()["quantized"] is False
+
+@pytest.mark.onnx
+def test_int8_parity(tiny_model_dir, tmp_path, monkeypatch, torch_embeddings):
+    """测试int8量化模型与PyTorch输出方向基本一致"""
+    service = _onnx_service(tiny_model_dir, tmp_path, monkeypatch, quantize=True)
+    embeddings = np.array(asyncio.run(service.get_embeddings(TEXTS)))
+    asyncio.run(service.close())
+    assert service.encoder.onnx_path.name == "model.qint8.onnx"
+    cosine = np.sum(embeddings * torch_embeddings, axis=1)
+    assert np.all(cosine > 0.95)
+
+@pytest.mark.onnx
+def test_export_reused(tiny_model_dir, tmp_path, monkeypatch):
+    """测试已导出的模型被直接复用"""
+    first = _onnx_service(tiny_model_dir, tmp_path, monkeypatch, quantize=False)
+    mtime = first.encoder.onnx_path.stat().st_mtime_ns
+    second = _onnx_service(tiny_model_dir, tmp_path, monkeypatch, quantize=False)
+    assert second.encoder.onnx_path == first.encoder.onnx_path
+    assert second.encoder.onnx_path.stat().st_mtime_ns == mtime
+    assert not list(tmp_path.rglob("*.tmp"))
+
+@pytest.mark.onnx
+def test_export_keyed_by_model_revision(tiny_model_dir, tmp_path, monkeypatch):
+    """测试模型权重更新后重新导出到新的目录"""
+    first = _onnx_service(tiny_model_dir, tmp_path, monkeypatch, quantize=False)
+    for weights in tiny_model_dir.iterdir():
+        if weights.suffix in (".bin", ".safetensors"):
+            stat = weights.stat()
+            os.utime(weights, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    second = _onnx_service(tiny_model_dir, tmp_path, monkeypatch, quantize=False)
+    assert second.encoder.onnx_path != first.encoder.onnx_path
+    assert second.encoder.onnx_path.parent.parent == first.encoder.onnx_path.parent.parent
+    assert second.encoder.onnx_path.exists()
+
+@pytest.mark.onnx
+def test_missing_runtime_points_to_extra(monkeypatch):
+    """测试缺少 onnxruntime 时的报错提示安装 onnx extra"""
+    from rag_service.app.core.llm import onnx_service
+    monkeypatch.setitem(sys.modules, "onnxruntime", None)
+    with pytest.raises(ImportError, match=r"rag-service\[onnx\]"):
+        onnx_service._require("onnxruntime")
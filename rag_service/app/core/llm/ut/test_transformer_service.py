@@ -0,0 +1,86 @@
+import asyncio
+import pytest
+import numpy as np
+
+from rag_service.config.settings import settings
+
+@pytest.fixture
+def service(tiny_model_dir):
+    """基于本地小模型的嵌入服务"""
+    from rag_service.app.core.llm.transformer_service import TransformerService
+    service = TransformerService(model_name=str(tiny_model_dir))
+    yield service
+    asyncio.run(service.close())
+
+@pytest.mark.transformer
+def test_one_vector_per_text(service):
+    """测试每个文本得到一个归一化向量"""
+    embeddings = np.array(asyncio.run(service.get_embeddings(["hello world", "the quick brown fox"])))
+    assert embeddings.shape == (2, 32)
+    np.testing.assert_allclose(np.linalg.norm(embeddings, axis=1), 1.0, rtol=1e-5)
+
+@pytest.mark.transformer
+def test_batched_matches_individual(service):
+    """测试合批计算与逐条计算结果一致"""
+    texts = ["hello", "the lazy dog jumps over the fox", "vector search", "query"]
+    expected = np.vstack([service.encoder.encode([text]) for text in texts])
+
+    async def run():
+        return await asyncio.gather(*(service.get_embeddings([text]) for text in texts))
+
+    results = np.vstack([np.array(rows) for rows in asyncio.run(run())])
+    np.testing.assert_allclose(results, expected, atol=1e-5)
+    assert service.batcher.get_stats()["batches"] < len(texts)
+
+@pytest.mark.transformer
+def test_large_request_bypasses_batcher(service):
+    """测试超过批次上限的请求直接计算"""
+    texts = ["hello"] * (settings.EMBEDDING_MAX_BATCH_SIZE + 1)
+    embeddings = asyncio.run(service.get_embeddings(texts))
+    assert len(embeddings) == len(texts)
+    assert service.batcher.get_stats()["batches"] == 0
+
+@pytest.mark.transformer
+def test_process_executor_matches_thread(tiny_model_dir, service, monkeypatch):
+    """测试进程池模式与线程模式结果一致"""
+    from rag_service.app.core.llm.transformer_service import TransformerService
+    monkeypatch.setattr(settings, "EMBEDDING_EXECUTOR", "process")
+    monkeypatch.setattr(settings, "EMBEDDING_EXECUTOR_WORKERS", 1)
+    process_service = TransformerService(model_name=str(tiny_model_dir))
+    texts = ["hello world", "vector search"]
+    try:
+        expected = asyncio.run(service.get_embeddings(texts))
+        result = asyncio.run(process_service.get_embeddings(texts))
+        stats = process_service.get_stats()["executor"]
+    finally:
+        asyncio.run(process_service.close())
+    np.testing.assert_allclose(result, expected, atol=1e-5)
+    assert stats["mode"] == "process"
+    assert stats["completed"] == 1
+
+@pytest.mark.transformer
+def test_bulk_bucketing_preserves_order(service, monkeypatch):
+    """测试分桶批量编码结果按原顺序返回并与逐条计算一致"""
+    monkeypatch.setattr(settings, "EMBEDDING_BUCKET_MAX_TOKENS", 64)
+    long_text = " ".join(["the quick brown fox jumps over the lazy dog"] * 5)
+    texts = ["hello", long_text, "query", "vector search"] * 10
+    expected = np.vstack([service.encoder.encode([text]) for text in texts])
+
+    embeddings = np.array(asyncio.run(service.get_embeddings(texts)))
+    np.testing.assert_allclose(embeddings, expected, atol=1e-5)
+
+    bucketing = service.get_stats()["bucketing"]
+    assert bucketing["buckets"] > 1
+    assert bucketing["saved_tokens"] > 0
+    assert bucketing["padded_tokens"] < bucketing["naive_padded_tokens"]
+
+@pytest.mark.transformer
+def test_embeddings_array(service):
+    """测试数组接口返回连续的float32矩阵，列表接口只是其包装"""
+    texts = ["hello world", "vector search"]
+    array = asyncio.run(service.get_embeddings_array(texts))
+    assert array.dtype == np.float32
+    assert array.flags["C_CONTIGUOUS"]
+    assert array.shape == (2, 32)
+    np.testing.assert_allclose(asyncio.run(service.get_embeddings(texts)), array, atol=1e-6)
+    assert asyncio.run(service.get_embeddings_array([])).shape == (0, 32)
@@ -0,0 +1,88 @@
+import asyncio
+import pytest
+import numpy as np
+
+from rag_service.config.settings import settings
+
+@pytest.fixture(scope="module")
+def encoder(tiny_model_dir):
+    """在本进程中计算参考结果的编码器"""
+    from rag_service.app.core.llm.transformer_service import TransformerEncoder
+    return TransformerEncoder(str(tiny_model_dir))
+
+@pytest.fixture(scope="module")
+def pool_service(tiny_model_dir):
+    """两个工作进程的嵌入服务（启动子进程较慢，模块内共享）"""
+    from rag_service.app.core.llm.transformer_service import TransformerService
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(settings, "EMBEDDING_EXECUTOR", "pool")
+        mp.setattr(settings, "EMBEDDING_EXECUTOR_WORKERS", 2)
+        service = TransformerService(model_name=str(tiny_model_dir))
+    yield service
+    asyncio.run(service.close())
+
+@pytest.mark.pool
+def test_weights_in_shared_memory(pool_service):
+    """测试父进程的模型权重已移到共享内存，工作进程不再复制"""
+    assert all(param.is_shared() for param in pool_service.encoder.model.parameters())
+    assert pool_service.get_stats()["executor"]["alive_workers"] == 2
+
+@pytest.mark.pool
+def test_pool_matches_encoder(pool_service, encoder):
+    """测试合批与分桶两条路径的结果都与本进程计算一致"""
+    texts = ["hello", "the lazy dog jumps over the fox", "vector search", "query"]
+    expected = encoder.encode(texts)
+
+    async def run():
+        singles = await asyncio.gather(*(pool_service.get_embeddings_array([text]) for text in texts))
+        bulk = await pool_service._encode_bulk(texts * 10)
+        return np.vstack(singles), bulk
+
+    singles, bulk = asyncio.run(run())
+    np.testing.assert_allclose(singles, expected, atol=1e-5)
+    np.testing.assert_allclose(bulk, np.vstack([expected] * 10), atol=1e-5)
+    assert bulk.dtype == np.float32
+
+    stats = pool_service.get_stats()["executor"]
+    assert stats["mode"] == "pool"
+    assert stats["completed"] >= 2
+    assert stats["queue_depth"] == 0
+
+@pytest.mark.pool
+def test_worker_error_propagates(pool_service):
+    """测试工作进程中的异常返回给调用方，工作进程继续可用"""
+    with pytest.raises(RuntimeError, match="嵌入工作进程执行失败"):
+        asyncio.run(pool_service.executor.run("encode_ids", [[10 ** 6]]))
+    embeddings = asyncio.run(pool_service.get_embeddings_array(["hello"]))
+    assert embeddings.shape == (1, 32)
+    assert pool_service.get_stats()["executor"]["failed"] == 1
+
+@pytest.mark.pool
+def test_dead_worker_respawned(pool_service):
+    """测试工作进程被杀死时只有它正在执行的任务失败，其余任务照常完成，并启动新进程补上"""
+    executor = pool_service.executor
+    victim_id, victim = next(iter(executor._workers.items()))
+    texts = ["hello", "the lazy dog jumps over the fox", "vector search", "query"]
+
+    async def run():
+        tasks = [asyncio.ensure_future(executor.run("encode", texts)) for _ in range(20)]
+        await asyncio.sleep(0)
+        victim.process.kill()
+        return await asyncio.gather(*tasks, return_exceptions=True)
+
+    results = asyncio.run(run())
+    for result in results:
+        if isinstance(result, Exception):
+            assert "嵌入工作进程意外退出" in str(result)
+        else:
+            assert result.shape == (4, 32)
+    assert sum(not isinstance(result, Exception) for result in results) >= 19
+
+    # 新进程补上后继续可用
+    embeddings = asyncio.run(pool_service.get_embeddings_array(["hello", "world"]))
+    assert embeddings.shape == (2, 32)
+    assert victim_id not in executor._workers
+    stats = executor.get_stats()
+    assert stats["alive_workers"] == 2
+    assert stats["busy_workers"] == stats["queue_depth"] == 0
+    assert not executor._pending
@@ -0,0 +1,392 @@
+import asyncio
+import itertools
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from multiprocessing import shared_memory
+from multiprocessing.connection import Connection, wait
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+import numpy as np
+import torch.multiprocessing as torch_mp
+from loguru import logger
+
+# 结果通过共享内存返回的编码器方法
+ARRAY_METHODS = ("encode", "encode_ids")
+
+# 监听线程等待消息的超时（秒），关闭时据此及时退出
+_POLL_INTERVAL = 1.0
+
+# 工作进程最多保持打开的缓冲区数，父进程释放的缓冲区会被逐步关闭
+_MAX_ATTACHED_BUFFERS = 16
+
+def _worker_main(encoder, conn, num_threads: Optional[int]) -> None:
+    """
+    工作进程主循环：从自己的任务管道取批次，结果写入父进程分配的共享内存
+
+    任务格式为 (task_id, method, args, buffer_name)，buffer_name 为 None 时结果直接经管道返回。
+    每个进程独占一对管道，进程被杀死时不会留下其他进程需要的锁。
+    """
+    from rag_service.app.core.llm.transformer_service import configure_torch_threads
+    configure_torch_threads(num_threads, 1)
+
+    buffers: Dict[str, shared_memory.SharedMemory] = {}
+    try:
+        while True:
+            try:
+                task = conn.recv()
+            except EOFError:
+                break
+            if task is None:
+                break
+            task_id, method, args, buffer_name = task
+            try:
+                result = getattr(encoder, method)(*args)
+                if buffer_name is None:
+                    conn.send((task_id, "value", result))
+                    continue
+                result = np.asarray(result, dtype=np.float32)
+                # 父进程会复用缓冲区，同一块共享内存只打开一次
+                shm = buffers.get(buffer_name)
+                if shm is None:
+                    if len(buffers) >= _MAX_ATTACHED_BUFFERS:
+                        buffers.pop(next(iter(buffers))).close()
+                    shm = buffers[buffer_name] = shared_memory.SharedMemory(name=buffer_name)
+                np.ndarray(result.shape, dtype=np.float32, buffer=shm.buf)[...] = result
+                conn.send((task_id, "buffer", result.shape))
+            except Exception as e:
+                conn.send((task_id, "error", f"{e.__class__.__name__}: {e}"))
+    finally:
+        for shm in buffers.values():
+            shm.close()
+        conn.close()
+
+class _SharedBufferPool:
+    """父进程持有的共享内存缓冲区，按容量复用，避免每个批次都创建新的共享内存"""
+
+    def __init__(self, max_free: int):
+        self.max_free = max_free
+        self._free: List[shared_memory.SharedMemory] = []
+        self._lock = threading.Lock()
+
+    def acquire(self, nbytes: int) -> shared_memory.SharedMemory:
+        """取一块不小于 nbytes 的缓冲区"""
+        with self._lock:
+            for i, shm in enumerate(self._free):
+                if shm.size >= nbytes:
+                    return self._free.pop(i)
+        # 按 2 的幂向上取整，便于复用
+        size = 1 << max(nbytes - 1, 4095).bit_length()
+        return shared_memory.SharedMemory(create=True, size=size)
+
+    def release(self, shm: shared_memory.SharedMemory) -> None:
+        """归还缓冲区，空闲过多时释放最小的一块"""
+        with self._lock:
+            self._free.append(shm)
+            self._free.sort(key=lambda item: item.size)
+            if len(self._free) <= self.max_free:
+                return
+            shm = self._free.pop(0)
+        self._destroy(shm)
+
+    @staticmethod
+    def _destroy(shm: shared_memory.SharedMemory) -> None:
+        shm.close()
+        shm.unlink()
+
+    def close(self) -> None:
+        """释放所有空闲缓冲区"""
+        with self._lock:
+            free, self._free = self._free, []
+        for shm in free:
+            self._destroy(shm)
+
+@dataclass
+class _Worker:
+    """工作进程、父进程一端的管道以及它正在执行的任务"""
+    process: Any
+    conn: Connection
+    task_id: Optional[int] = None
+
+class EmbeddingWorkerPool:
+    """
+    多进程嵌入工作池
+
+    父进程加载一次模型，并把权重移到共享内存（torch share_memory），
+    N 个工作进程映射同一份只读权重，不会各自复制模型。
+    每个工作进程有自己的任务管道，监听线程把排队的批次分派给空闲的进程，
+    因此始终知道任务由哪个进程执行；float32 结果写入父进程分配的共享内存缓冲区，只有形状经管道返回。
+    工作进程意外退出时只让它正在执行的任务失败并归还其缓冲区，然后启动新进程补上。
+
+    对外接口与 InferenceExecutor 一致（mode / get_stats / shutdown），
+    run 接收编码器的方法名而不是函数。
+    """
+
+    mode = "pool"
+
+    def __init__(
+        self,
+        encoder,
+        dimension: int,
+        max_workers: Optional[int] = None,
+        num_threads: Optional[int] = None,
+        start_method: str = "spawn"
+    ):
+        """
+        初始化工作池并启动工作进程
+
+        Args:
+            encoder: 已创建的编码器，其 torch 模型会被移到共享内存
+            dimension: 嵌入维度，用于分配结果缓冲区
+            max_workers: 工作进程数，None 时为 CPU 核数
+            num_threads: 每个工作进程的 torch 线程数，None 时平分 CPU 核
+            start_method: 进程启动方式，spawn 或 fork
+        """
+        cpu_count = os.cpu_count() or 1
+        self.max_workers = max_workers or cpu_count
+        self.dimension = dimension
+        num_threads = num_threads or max(1, cpu_count // self.max_workers)
+
+        share_memory = getattr(encoder, "share_memory", None)
+        if share_memory is not None:
+            share_memory()
+
+        self._encoder = encoder
+        self._num_threads = num_threads
+        self._context = torch_mp.get_context(start_method)
+        self._buffers = _SharedBufferPool(max_free=2 * self.max_workers)
+
+        # 在途任务: task_id -> (事件循环, future, 缓冲区)
+        self._pending: Dict[
+            int, Tuple[asyncio.AbstractEventLoop, asyncio.Future, Optional[shared_memory.SharedMemory]]
+        ] = {}
+        # 尚未分派给工作进程的任务
+        self._queue: Deque[Tuple[int, str, tuple, Optional[str]]] = deque()
+        self._task_ids = itertools.count()
+        self._lock = threading.Lock()
+        self._closed = False
+        # 关闭时是否先执行完排队的任务
+        self._drain = True
+        self._completed = 0
+        self._failed = 0
+        self._total_latency = 0.0
+        # 有新任务或关闭时唤醒监听线程
+        self._wakeup_recv, self._wakeup_send = self._context.Pipe(duplex=False)
+
+        # 工作进程: worker_id -> _Worker，重启的进程使用新的 worker_id，只由监听线程修改
+        self._workers: Dict[int, _Worker] = {}
+        self._worker_ids = itertools.count()
+        for _ in range(self.max_workers):
+            self._start_worker()
+
+        self._listener = threading.Thread(target=self._listen, name="embedding-pool-results", daemon=True)
+        self._listener.start()
+        logger.info(f"嵌入工作池已启动: {self.max_workers} 个进程, 每个 {num_threads} 个线程")
+
+    def _start_worker(self) -> None:
+        """启动一个工作进程"""
+        worker_id = next(self._worker_ids)
+        parent_conn, child_conn = self._context.Pipe()
+        process = self._context.Process(
+            target=_worker_main,
+            args=(self._encoder, child_conn, self._num_threads),
+            name=f"embedding-worker-{worker_id}",
+            daemon=True
+        )
+        process.start()
+        child_conn.close()
+        self._workers[worker_id] = _Worker(process, parent_conn)
+
+    async def run(self, method: str, *args) -> Any:
+        """
+        在工作进程中调用编码器方法并等待结果
+
+        Args:
+            method: 编码器方法名，encode / encode_ids 的结果经共享内存返回
+            *args: 方法参数
+        """
+        if self._closed:
+            raise RuntimeError("嵌入工作池已关闭")
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        shm = None
+        if method in ARRAY_METHODS:
+            shm = self._buffers.acquire(max(len(args[0]), 1) * self.dimension * 4)
+        task_id = next(self._task_ids)
+        start = time.perf_counter()
+        with self._lock:
+            self._pending[task_id] = (loop, future, shm)
+            self._queue.append((task_id, method, args, shm.name if shm is not None else None))
+            self._wakeup_send.send_bytes(b"")
+        result = await future
+        with self._lock:
+            self._total_latency += time.perf_counter() - start
+        return result
+
+    def _listen(self) -> None:
+        """后台线程：分派任务、接收结果并唤醒对应的 future，处理意外退出的工作进程"""
+        while True:
+            workers = list(self._workers.items())
+            busy = any(worker.task_id is not None for _, worker in workers)
+            with self._lock:
+                if self._closed and not busy and (not self._drain or not self._queue or not workers):
+                    return
+            waitables = [self._wakeup_recv]
+            for _, worker in workers:
+                waitables += [worker.conn, worker.process.sentinel]
+            ready = set(wait(waitables, timeout=_POLL_INTERVAL))
+            while self._wakeup_recv.poll():
+                self._wakeup_recv.recv_bytes()
+            for worker_id, worker in workers:
+                if worker.conn in ready:
+                    self._receive(worker)
+                if worker.process.sentinel in ready:
+                    self._replace_worker(worker_id)
+            self._dispatch()
+
+    def _receive(self, worker: _Worker) -> None:
+        """读取工作进程已发回的结果"""
+        try:
+            while worker.conn.poll():
+                task_id, kind, payload = worker.conn.recv()
+                worker.task_id = None
+                self._handle(task_id, kind, payload)
+        except (EOFError, OSError):
+            # 进程已退出，由 _replace_worker 处理
+            pass
+
+    def _dispatch(self) -> None:
+        """把排队的任务分派给空闲的工作进程"""
+        for worker in list(self._workers.values()):
+            if worker.task_id is not None:
+                continue
+            with self._lock:
+                if not self._queue or (self._closed and not self._drain):
+                    return
+                task = self._queue.popleft()
+            worker.task_id = task[0]
+            try:
+                worker.conn.send(task)
+            except OSError:
+                # 进程刚退出，任务随它失败
+                pass
+
+    def _handle(self, task_id: int, kind: str, payload: Any) -> None:
+        """处理一条结果"""
+        with self._lock:
+            entry = self._pending.pop(task_id, None)
+        if entry is None:
+            return
+        loop, future, shm = entry
+        if kind == "buffer":
+            # 从共享内存复制出结果后立即归还缓冲区
+            result = np.ndarray(payload, dtype=np.float32, buffer=shm.buf).copy()
+            self._finish(loop, future, result=result)
+        elif kind == "value":
+            self._finish(loop, future, result=payload)
+        else:
+            self._finish(loop, future, error=RuntimeError(f"嵌入工作进程执行失败: {payload}"))
+        if shm is not None:
+            self._buffers.release(shm)
+
+    def _replace_worker(self, worker_id: int) -> None:
+        """
+        处理意外退出的工作进程：它正在执行的任务失败，未关闭时启动新进程补上
+
+        退出的进程不会再写该任务的缓冲区，可以归还；排队的任务由其他进程继续执行。
+        """
+        worker = self._workers.pop(worker_id)
+        self._receive(worker)
+        worker.conn.close()
+        lost = None
+        if worker.task_id is not None:
+            with self._lock:
+                lost = self._pending.pop(worker.task_id, None)
+        if lost is not None:
+            loop, future, shm = lost
+            self._finish(loop, future, error=RuntimeError("嵌入工作进程意外退出"))
+            if shm is not None:
+                self._buffers.release(shm)
+        if self._closed:
+            return
+        logger.error(
+            f"嵌入工作进程意外退出: {worker.process.name} (exitcode={worker.process.exitcode})，"
+            f"{int(lost is not None)} 个任务失败，重新启动工作进程"
+        )
+        self._start_worker()
+
+    def _finish(self, loop, future, result: Any = None, error: Optional[Exception] = None) -> None:
+        """在 future 所属的事件循环中设置结果"""
+        with self._lock:
+            if error is not None:
+                self._failed += 1
+            else:
+                self._completed += 1
+
+        def resolve():
+            if future.done():
+                return
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+        if not loop.is_closed():
+            loop.call_soon_threadsafe(resolve)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取工作池统计信息，字段与 InferenceExecutor 一致，completed 只计成功的调用"""
+        workers = list(self._workers.values())
+        with self._lock:
+            completed = self._completed
+            return {
+                "mode": self.mode,
+                "max_workers": self.max_workers,
+                "alive_workers": sum(worker.process.is_alive() for worker in workers),
+                "busy_workers": sum(worker.task_id is not None for worker in workers),
+                "queue_depth": len(self._queue),
+                "completed": completed,
+                "failed": self._failed,
+                "avg_latency_ms": self._total_latency * 1000 / completed if completed else 0.0
+            }
+
+    def shutdown(self, wait: bool = True) -> None:
+        """
+        通知工作进程退出并释放共享内存
+
+        Args:
+            wait: 是否先执行完排队与在途的任务，否则直接结束工作进程，未完成的任务失败
+        """
+        if self._closed:
+            return
+        with self._lock:
+            self._closed = True
+            self._drain = wait
+            self._wakeup_send.send_bytes(b"")
+        self._listener.join()
+
+        workers = list(self._workers.values())
+        for worker in workers:
+            try:
+                worker.conn.send(None)
+            except OSError:
+                pass
+        for worker in workers:
+            worker.process.join(timeout=10 if wait else 0.1)
+            if worker.process.is_alive():
+                worker.process.terminate()
+                worker.process.join()
+            worker.conn.close()
+
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._queue.clear()
+        for loop, future, shm in pending.values():
+            self._finish(loop, future, error=RuntimeError("嵌入工作池已关闭"))
+            if shm is not None:
+                self._buffers.release(shm)
+        self._buffers.close()
+        self._wakeup_send.close()
+        self._wakeup_recv.close()
@@ -0,0 +1,122 @@
+import hashlib
+import json
+import os
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+def chunk_hash(text: str, metadata: Optional[Dict[str, Any]] = None) -> str:
+    """文本块的内容哈希，元数据变化也视为内容变化"""
+    payload = json.dumps([text, metadata or {}], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class DocumentManifest:
+    """
+    文档清单：(命名空间, doc_id) -> 各文本块的 (内容哈希, 记录ID)
+
+    用于按文档增量同步：重新提交的文档只写入新增或变化的块，删除消失的块。
+    去重后不同文档的块可能共用同一条记录，清单按引用计数判断记录是否还被使用。
+
+    清单追加写入 path（JSON Lines，每行是一个文档的最新状态），重启后重放恢复。
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        """
+        Args:
+            path: 清单日志文件，None 表示只保存在内存中
+        """
+        self._documents: Dict[Tuple[Optional[str], str], List[Tuple[str, str]]] = {}
+        self._refs: Counter = Counter()
+        self._log = None
+        self.path = Path(path) if path else None
+        if self.path is not None:
+            self._replay()
+            self._log = open(self.path, "a", encoding="utf-8")
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    def _replay(self) -> None:
+        """重放清单日志，末尾写了一半的行被截掉，过期的行较多时重写"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if not self.path.exists():
+            return
+        valid = lines = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break
+                valid += len(line)
+                lines += 1
+                key = (entry.get("namespace"), entry["doc_id"])
+                self._apply(key, [tuple(chunk) for chunk in entry["chunks"]])
+        if valid != self.path.stat().st_size:
+            logger.warning(f"文档清单日志末尾不完整，已截断: {self.path}")
+            os.truncate(self.path, valid)
+        if lines > 2 * len(self._documents) + 1024:
+            self._compact()
+        if self._documents:
+            logger.info(f"文档清单已加载: {self.path} ({len(self._documents)} 个文档)")
+
+    def _compact(self) -> None:
+        """只保留每个文档的最新状态重写日志"""
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for (namespace, doc_id), chunks in self._documents.items():
+                f.write(self._entry(namespace, doc_id, chunks) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    @staticmethod
+    def _entry(namespace: Optional[str], doc_id: str, chunks: List[Tuple[str, str]]) -> str:
+        entry = {"doc_id": doc_id, "chunks": chunks}
+        if namespace is not None:
+            entry["namespace"] = namespace
+        return json.dumps(entry, ensure_ascii=False)
+
+    def _apply(self, key: Tuple[Optional[str], str], chunks: List[Tuple[str, str]]) -> List[str]:
+        """更新文档的块，返回不再被任何文档引用的记录ID"""
+        old = self._documents.pop(key, [])
+        self._refs.update(record_id for _, record_id in chunks)
+        if chunks:
+            self._documents[key] = chunks
+        released = []
+        for _, record_id in old:
+            self._refs[record_id] -= 1
+            if self._refs[record_id] <= 0:
+                del self._refs[record_id]
+                released.append(record_id)
+        return list(dict.fromkeys(released))
+
+    def get(self, doc_id: str, namespace: Optional[str] = None) -> List[Tuple[str, str]]:
+        """文档当前的 (内容哈希, 记录ID)，未知文档返回空列表"""
+        return list(self._documents.get((namespace, doc_id), []))
+
+    def set(self, doc_id: str, chunks: List[Tuple[str, str]], namespace: Optional[str] = None) -> List[str]:
+        """
+        记录文档的最新状态，chunks 为空表示删除文档，不同命名空间的 doc_id 互不相关
+
+        Returns:
+            不再被任何文档引用、可以从向量数据库删除的记录ID
+        """
+        chunks = [(content_hash, record_id) for content_hash, record_id in chunks]
+        released = self._apply((namespace, doc_id), chunks)
+        if self._log is not None:
+            self._log.write(self._entry(namespace, doc_id, chunks) + "\n")
+            self._log.flush()
+        return released
+
+    def get_stats(self) -> Dict[str, int]:
+        return {"documents": len(self._documents), "records": len(self._refs)}
+
+    def close(self) -> None:
+        if self._log is not None:
+            self._log.close()
+            self._log = None
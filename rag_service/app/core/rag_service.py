@@ -1,25 +1,47 @@
-from typing import List, Dict, Any, Optional
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.prompts import PromptTemplate
-from langchain.chains import LLMChain
+import asyncio
+import weakref
+from typing import TYPE_CHECKING, Collection, List, Dict, Any, Optional, Tuple
+from loguru import logger
 from tenacity import retry, stop_after_attempt, wait_exponential
 
+from rag_service.app.core.dedup import ChunkDeduplicator
 from rag_service.app.core.llm.base import BaseLLMService
+from rag_service.app.core.manifest import DocumentManifest, chunk_hash
+from rag_service.app.core.text_splitter import TextChunk, TokenTextSplitter
 from rag_service.app.core.vectordb.base import BaseVectorDB
+from rag_service.app.core.vectordb.filters import MetadataFilter
+from rag_service.app.core.vectordb.search_params import SearchParams
 from rag_service.config.settings import settings
 
+if TYPE_CHECKING:
+    from langchain.prompts import PromptTemplate
+
 class RAGService:
     def __init__(
         self,
         llm_service: BaseLLMService,
-        vector_db: BaseVectorDB
+        vector_db: BaseVectorDB,
+        deduplicator: Optional[ChunkDeduplicator] = None,
+        manifest: Optional[DocumentManifest] = None
     ):
+        """
+        Args:
+            llm_service: LLM服务
+            vector_db: 向量数据库
+            deduplicator: 入库前的重复块检测，None 表示不去重
+            manifest: 按文档增量同步使用的文档清单，None 时使用只保存在内存中的清单
+        """
         self.llm_service = llm_service
         self.vector_db = vector_db
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=settings.CHUNK_SIZE,
-            chunk_overlap=settings.CHUNK_OVERLAP
-        )
+        self.deduplicator = deduplicator
+        self.manifest = manifest if manifest is not None else DocumentManifest()
+        # 同一文档的同步串行执行
+        self._document_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+        self.embedding_service = vector_db.embeddings
+        self.text_splitter = self._create_text_splitter()
+        
+        # langchain 导入较慢，只在创建服务时导入
+        from langchain.prompts import PromptTemplate
         
         # 默认的RAG提示模板
         self.default_prompt = PromptTemplate(
@@ -33,10 +55,214 @@ class RAGService:
 回答:"""
         )
     
-    async def add_documents(self, texts: List[str], metadatas: Optional[List[Dict[str, Any]]] = None):
-        """添加文档到向量数据库"""
-        chunks = self.text_splitter.split_texts(texts)
-        return await self.vector_db.add_texts(chunks, metadatas)
+    def _create_text_splitter(self):
+        """
+        创建文本切分器
+        
+        嵌入服务带有 fast 分词器时按 token 切分，切分结果直接用于嵌入；
+        否则退回按字符切分。
+        """
+        tokenizer = getattr(self.embedding_service, "tokenizer", None)
+        if tokenizer is not None and getattr(tokenizer, "is_fast", False):
+            max_length = self.embedding_service.get_model_info().get("max_length", 512)
+            return TokenTextSplitter(
+                tokenizer,
+                chunk_size=settings.CHUNK_SIZE,
+                chunk_overlap=settings.CHUNK_OVERLAP,
+                max_length=max_length
+            )
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
+        return RecursiveCharacterTextSplitter(
+            chunk_size=settings.CHUNK_SIZE,
+            chunk_overlap=settings.CHUNK_OVERLAP,
+            add_start_index=True
+        )
+    
+    def _split(self, texts: List[str], metadatas: Optional[List[Dict[str, Any]]] = None) -> List[TextChunk]:
+        """把文档切分为文本块，元数据随块复制"""
+        if isinstance(self.text_splitter, TokenTextSplitter):
+            return self.text_splitter.split_texts(texts, metadatas)
+        
+        chunks = []
+        for doc in self.text_splitter.create_documents(texts, metadatas):
+            start = doc.metadata.pop("start_index", 0)
+            chunks.append(TextChunk(
+                text=doc.page_content,
+                start=start,
+                end=start + len(doc.page_content),
+                metadata=doc.metadata
+            ))
+        return chunks
+    
+    @staticmethod
+    def _with_namespace(metadata: Optional[Dict[str, Any]], namespace: Optional[str]) -> Dict[str, Any]:
+        """
+        复制元数据并写入命名空间
+
+        "namespace" 是保留键，由 namespace 参数决定：没有该键的记录属于默认命名空间。
+        
+        Raises:
+            ValueError: 元数据中的 "namespace" 与 namespace 参数不一致时
+        """
+        metadata = dict(metadata or {})
+        if metadata.get("namespace", namespace) != namespace:
+            raise ValueError("元数据中的 namespace 是保留键，应通过 namespace 参数指定命名空间")
+        if namespace is not None:
+            metadata["namespace"] = namespace
+        return metadata
+    
+    async def add_documents(
+        self,
+        texts: List[str],
+        metadatas: Optional[List[Dict[str, Any]]] = None,
+        namespace: Optional[str] = None
+    ):
+        """
+        添加文档到向量数据库
+        
+        启用去重时，与已存储的块或本批次更早的块（近似）重复的块不再嵌入和写入，
+        返回的ID为被重复的记录的ID。
+        
+        Args:
+            texts: 文档文本
+            metadatas: 每个文档的元数据
+            namespace: 命名空间（租户），写入每个块的元数据，None 表示默认命名空间
+        
+        Returns:
+            每个文本块的记录ID
+        
+        Raises:
+            ValueError: 元数据中的 "namespace" 与 namespace 不一致时
+        """
+        metadatas = [self._with_namespace(metadatas[i] if metadatas else None, namespace) for i in range(len(texts))]
+        ids, _ = await self._add_chunks(self._split(texts, metadatas), namespace=namespace)
+        return ids
+    
+    async def sync_documents(
+        self,
+        texts: List[str],
+        doc_ids: List[str],
+        metadatas: Optional[List[Dict[str, Any]]] = None,
+        namespace: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        按文档增量同步
+        
+        每个文档按 doc_id 与上次提交的版本比较文本块的内容哈希：只嵌入和写入新增或变化的块，
+        删除消失的块，未变化的块沿用原来的记录。doc_id 写入每个块的元数据。
+        不同命名空间中相同的 doc_id 是不同的文档。
+        
+        Returns:
+            ids: 每个文本块的记录ID；added / linked: 新增或变化的块中写入新记录、去重后关联到已有记录的块数；
+            unchanged / deleted: 未变化、从文档中删除的块数（被删除的块的记录仍被其他块引用时保留）
+        
+        Raises:
+            ValueError: doc_ids 与 texts 数量不一致，或元数据中的 "namespace" 与 namespace 不一致时
+        """
+        if len(doc_ids) != len(texts):
+            raise ValueError("doc_ids 与 texts 的数量必须一致")
+        totals = {"ids": [], "added": 0, "linked": 0, "unchanged": 0, "deleted": 0}
+        for i, (text, doc_id) in enumerate(zip(texts, doc_ids)):
+            metadata = dict(self._with_namespace(metadatas[i] if metadatas else None, namespace), doc_id=doc_id)
+            result = await self._sync_document(doc_id, text, metadata, namespace)
+            totals["ids"] += result.pop("ids")
+            for name, count in result.items():
+                totals[name] += count
+        return totals
+    
+    async def _sync_document(
+        self,
+        doc_id: str,
+        text: str,
+        metadata: Dict[str, Any],
+        namespace: Optional[str]
+    ) -> Dict[str, Any]:
+        """同步单个文档：先写入新块，再删除不再引用的旧记录"""
+        lock = self._document_locks.setdefault((namespace, doc_id), asyncio.Lock())
+        async with lock:
+            chunks = self._split([text], [metadata]) if text else []
+            hashes = [chunk_hash(chunk.text, chunk.metadata) for chunk in chunks]
+            
+            # 同一内容可能出现多次，按出现顺序逐个沿用旧记录
+            previous: Dict[str, List[str]] = {}
+            for content_hash, record_id in self.manifest.get(doc_id, namespace):
+                previous.setdefault(content_hash, []).append(record_id)
+            ids: List[Optional[str]] = [None] * len(chunks)
+            changed = []
+            for i, content_hash in enumerate(hashes):
+                if previous.get(content_hash):
+                    ids[i] = previous[content_hash].pop(0)
+                else:
+                    changed.append(i)
+            
+            # 变化的块不能被去重关联回本文档的旧版本
+            superseded = {record_id for record_ids in previous.values() for record_id in record_ids}
+            new_ids, linked = await self._add_chunks([chunks[i] for i in changed], superseded, namespace)
+            for i, record_id in zip(changed, new_ids):
+                ids[i] = record_id
+            released = self.manifest.set(doc_id, list(zip(hashes, ids)), namespace)
+            if self.deduplicator is not None:
+                # 记录还可能被清单以外的块（如 add_documents 写入的）关联，以去重的引用计数为准
+                released = self.deduplicator.release(
+                    [record_id for record_ids in previous.values() for record_id in record_ids]
+                )
+            if released:
+                await self.vector_db.delete(released)
+            removed = sum(len(record_ids) for record_ids in previous.values())
+            logger.info(
+                f"文档同步 {doc_id}: 新增或变化 {len(changed)} 块（关联到已有记录 {linked} 块），"
+                f"未变化 {len(chunks) - len(changed)} 块，删除 {removed} 块（删除记录 {len(released)} 条）"
+            )
+            return {
+                "ids": ids,
+                "added": len(changed) - linked,
+                "linked": linked,
+                "unchanged": len(chunks) - len(changed),
+                "deleted": removed
+            }
+    
+    async def _add_chunks(
+        self,
+        chunks: List[TextChunk],
+        exclude: Collection[str] = (),
+        namespace: Optional[str] = None
+    ) -> Tuple[List[str], int]:
+        """
+        写入文本块，启用去重时重复块关联到去重范围（命名空间与元数据）相同的已有记录，
+        exclude 中的记录除外
+        
+        Returns:
+            每个块的记录ID，以及关联到已有记录（未写入）的块数
+        """
+        if not chunks or self.deduplicator is None:
+            return await self._embed_and_add(chunks, namespace), 0
+        
+        result = self.deduplicator.check(
+            [chunk.text for chunk in chunks],
+            exclude,
+            namespace,
+            [chunk.metadata for chunk in chunks]
+        )
+        new_ids = await self._embed_and_add([chunks[i] for i in result.unique], namespace)
+        self.deduplicator.register(result, new_ids)
+        return result.resolve_ids(new_ids), result.linked
+    
+    async def _embed_and_add(self, chunks: List[TextChunk], namespace: Optional[str] = None) -> List[str]:
+        """嵌入文本块并写入向量数据库"""
+        if not chunks:
+            return []
+        
+        chunk_texts = [chunk.text for chunk in chunks]
+        chunk_metadatas = [chunk.metadata for chunk in chunks]
+        if chunks[0].token_ids is not None:
+            # 直接使用切分时得到的 token id，不再重复分词
+            vectors = await self.embedding_service.get_embeddings_from_token_ids(
+                [chunk.token_ids for chunk in chunks],
+                texts=chunk_texts
+            )
+        else:
+            vectors = await self.embedding_service.get_embeddings_array(chunk_texts)
+        return await self.vector_db.add_vectors(chunk_texts, vectors, chunk_metadatas, namespace=namespace)
     
     @retry(
         stop=stop_after_attempt(settings.MAX_RETRIES),
@@ -45,16 +271,97 @@ class RAGService:
     async def query(
         self,
         question: str,
-        prompt_template: Optional[PromptTemplate] = None,
+        prompt_template: Optional["PromptTemplate"] = None,
+        k: Optional[int] = None,
+        search_params: Optional[SearchParams] = None,
+        metadata_filter: Optional[MetadataFilter] = None,
+        namespace: Optional[str] = None,
         **kwargs
     ) -> Dict[str, Any]:
-        """查询RAG系统"""
+        """
+        查询RAG系统
+        
+        Args:
+            question: 问题
+            prompt_template: 提示模板，None 时使用默认模板
+            k: 检索的文档数，None 时使用 settings.TOP_K_RESULTS
+            search_params: 近似搜索参数，None 时使用后端默认配置
+            metadata_filter: 只检索元数据满足条件的文档
+            namespace: 只检索该命名空间（租户）的文档
+        """
         # 检索相关文档
         docs = await self.vector_db.similarity_search(
             question,
-            k=settings.TOP_K_RESULTS
+            k=k or settings.TOP_K_RESULTS,
+            params=search_params,
+            filter=metadata_filter,
+            namespace=namespace
         )
         
+        return await self._answer(question, docs, prompt_template)
+    
+    async def query_batch(
+        self,
+        questions: List[str],
+        prompt_template: Optional["PromptTemplate"] = None,
+        k: Optional[int] = None,
+        search_params: Optional[SearchParams] = None,
+        metadata_filter: Optional[MetadataFilter] = None,
+        namespace: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        批量查询：所有问题一次检索，再并发生成各自的回答
+        
+        检索与每个回答分别重试，一个回答生成失败不会让整批重新检索和生成。
+        
+        Args:
+            questions: 问题列表
+            prompt_template: 提示模板，None 时使用默认模板
+            k: 每个问题检索的文档数，None 时使用 settings.TOP_K_RESULTS
+            search_params: 近似搜索参数，None 时使用后端默认配置
+            metadata_filter: 只检索元数据满足条件的文档
+            namespace: 只检索该命名空间（租户）的文档
+        """
+        docs_per_question = await self._search_batch(
+            questions,
+            k=k or settings.TOP_K_RESULTS,
+            params=search_params,
+            filter=metadata_filter,
+            namespace=namespace
+        )
+        return list(await asyncio.gather(*(
+            self._answer_with_retry(question, docs, prompt_template)
+            for question, docs in zip(questions, docs_per_question)
+        )))
+    
+    @retry(
+        stop=stop_after_attempt(settings.MAX_RETRIES),
+        wait=wait_exponential(multiplier=1, min=4, max=10)
+    )
+    async def _search_batch(self, questions: List[str], **kwargs) -> List[List[Dict[str, Any]]]:
+        """批量检索，失败时重试"""
+        return await self.vector_db.similarity_search_batch(questions, **kwargs)
+    
+    @retry(
+        stop=stop_after_attempt(settings.MAX_RETRIES),
+        wait=wait_exponential(multiplier=1, min=4, max=10)
+    )
+    async def _answer_with_retry(
+        self,
+        question: str,
+        docs: List[Dict[str, Any]],
+        prompt_template: Optional["PromptTemplate"] = None
+    ) -> Dict[str, Any]:
+        """生成单个问题的回答，失败时只重试该问题"""
+        return await self._answer(question, docs, prompt_template)
+    
+    async def _answer(
+        self,
+        question: str,
+        docs: List[Dict[str, Any]],
+        prompt_template: Optional["PromptTemplate"] = None
+    ) -> Dict[str, Any]:
+        """根据检索到的文档生成回答"""
         # 评估检索结果
         context = self._evaluate_retrieval(docs, question)
         
@@ -64,11 +371,15 @@ class RAGService:
             prompt.format(context=context, question=question)
         )
         
-        return {
+        result = {
             "answer": response,
             "context": context,
             "sources": [doc["metadata"] for doc in docs]
         }
+        # 分片存储有分片缺席时，提示调用方结果可能不完整
+        if getattr(docs, "partial", False):
+            result["partial"] = True
+        return result
     
     def _evaluate_retrieval(
         self,
@@ -0,0 +1,65 @@
+import importlib
+from typing import Dict, List
+
+class ProviderRegistry:
+    """
+    提供商注册表
+
+    按名称登记实现类的导入路径（"模块:类名"），只有被选中时才导入对应模块，
+    因此未使用的后端（torch、pymilvus、faiss 等）不会拖慢启动。
+    """
+
+    def __init__(self, kind: str):
+        """
+        初始化注册表
+
+        Args:
+            kind: 提供商类别，用于错误信息，如 "LLM提供商"
+        """
+        self.kind = kind
+        self._targets: Dict[str, str] = {}
+
+    def register(self, name: str, target: str) -> None:
+        """
+        登记一个实现
+
+        Args:
+            name: 配置中使用的名称
+            target: 实现类的导入路径，格式为 "模块:类名"
+        """
+        if ":" not in target:
+            raise ValueError(f"导入路径格式应为 '模块:类名': {target}")
+        self._targets[name] = target
+
+    def names(self) -> List[str]:
+        """已登记的名称"""
+        return list(self._targets)
+
+    def get(self, name: str) -> type:
+        """
+        导入并返回名称对应的实现类
+
+        Raises:
+            ValueError: 当名称未登记时
+        """
+        target = self._targets.get(name)
+        if target is None:
+            raise ValueError(f"未知的{self.kind}: {name}")
+        module_name, _, attr = target.partition(":")
+        return getattr(importlib.import_module(module_name), attr)
+
+    def create(self, name: str, *args, **kwargs):
+        """导入名称对应的实现类并实例化"""
+        return self.get(name)(*args, **kwargs)
+
+LLM_PROVIDERS = ProviderRegistry("LLM提供商")
+LLM_PROVIDERS.register("openai", "rag_service.app.core.llm.openai_service:OpenAIService")
+
+EMBEDDING_BACKENDS = ProviderRegistry("嵌入推理后端")
+EMBEDDING_BACKENDS.register("torch", "rag_service.app.core.llm.transformer_service:TransformerService")
+EMBEDDING_BACKENDS.register("onnx", "rag_service.app.core.llm.onnx_service:ONNXEmbeddingService")
+
+VECTOR_DBS = ProviderRegistry("向量数据库类型")
+VECTOR_DBS.register("faiss", "rag_service.app.core.vectordb.faiss_store:FAISSStore")
+VECTOR_DBS.register("milvus", "rag_service.app.core.vectordb.milvus_store:MilvusStore")
+VECTOR_DBS.register("numpy", "rag_service.app.core.vectordb.numpy_store:NumpyStore")
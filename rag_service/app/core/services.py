@@ -0,0 +1,153 @@
+from typing import Any, Dict, Optional
+from loguru import logger
+
+from rag_service.config.settings import settings
+from rag_service.app.core.dedup import ChunkDeduplicator
+from rag_service.app.core.llm.base import BaseLLMService
+from rag_service.app.core.manifest import DocumentManifest
+from rag_service.app.core.llm.cached_service import CachedEmbeddingService
+from rag_service.app.core.registry import EMBEDDING_BACKENDS, LLM_PROVIDERS, VECTOR_DBS
+from rag_service.app.core.vectordb.base import BaseVectorDB
+from rag_service.app.core.vectordb.cached_store import CachedVectorDB
+from rag_service.app.core.vectordb.sharded_store import ShardedStore
+from rag_service.app.core.rag_service import RAGService
+
+def create_llm_service(provider: Optional[str] = None) -> BaseLLMService:
+    """
+    按配置创建LLM服务
+
+    Args:
+        provider: LLM提供商，None 时使用 settings.LLM_PROVIDER
+
+    Raises:
+        ValueError: 当提供商未知时
+    """
+    return LLM_PROVIDERS.create(provider or settings.LLM_PROVIDER)
+
+def create_embedding_service(backend: Optional[str] = None) -> BaseLLMService:
+    """
+    按配置创建嵌入服务，并按需在前面加一层嵌入缓存
+
+    Args:
+        backend: 推理后端，None 时使用 settings.EMBEDDING_BACKEND
+
+    Raises:
+        ValueError: 当推理后端未知时
+    """
+    service = EMBEDDING_BACKENDS.create(backend or settings.EMBEDDING_BACKEND)
+    if settings.EMBEDDING_CACHE_ENABLED:
+        service = CachedEmbeddingService(
+            service,
+            cache_dir=settings.EMBEDDING_CACHE_DIR,
+            memory_size=settings.EMBEDDING_CACHE_MEMORY_SIZE,
+            max_disk_rows=settings.EMBEDDING_CACHE_MAX_DISK_ROWS
+        )
+    return service
+
+def create_vector_db(embedding_service: BaseLLMService, db_type: Optional[str] = None) -> BaseVectorDB:
+    """
+    按配置创建向量数据库，settings.VECTOR_DB_SHARDS 大于1时创建分片存储，并按需在前面加一层语义检索缓存
+
+    Args:
+        embedding_service: 嵌入服务
+        db_type: 向量数据库类型，None 时使用 settings.VECTOR_DB_TYPE
+
+    Raises:
+        ValueError: 当数据库类型未知时
+    """
+    db_type = db_type or settings.VECTOR_DB_TYPE
+    if settings.VECTOR_DB_SHARDS <= 1:
+        store = VECTOR_DBS.create(db_type, embedding_service)
+    else:
+        shards = [VECTOR_DBS.create(db_type, embedding_service, shard=i) for i in range(settings.VECTOR_DB_SHARDS)]
+        store = ShardedStore(embedding_service, shards)
+    if settings.QUERY_CACHE_ENABLED:
+        store = CachedVectorDB(
+            store,
+            max_distance=settings.QUERY_CACHE_MAX_DISTANCE,
+            ttl=settings.QUERY_CACHE_TTL,
+            size=settings.QUERY_CACHE_SIZE
+        )
+    return store
+
+def create_deduplicator() -> Optional[ChunkDeduplicator]:
+    """按配置创建入库去重，未启用时返回 None"""
+    if not settings.DEDUP_ENABLED:
+        return None
+    return ChunkDeduplicator(
+        threshold=settings.DEDUP_THRESHOLD,
+        index_path=settings.DEDUP_INDEX_PATH,
+        scope_keys=settings.DEDUP_SCOPE_KEYS
+    )
+
+class ServiceContainer:
+    """应用级服务容器：启动时构建一次，由所有请求共享"""
+
+    llm_service: BaseLLMService
+    embedding_service: BaseLLMService
+    vector_db: BaseVectorDB
+    deduplicator: Optional[ChunkDeduplicator]
+    manifest: DocumentManifest
+    rag_service: RAGService
+
+    def __init__(
+        self,
+        llm_service: BaseLLMService,
+        embedding_service: BaseLLMService,
+        vector_db: BaseVectorDB,
+        deduplicator: Optional[ChunkDeduplicator] = None,
+        manifest: Optional[DocumentManifest] = None
+    ):
+        self.llm_service = llm_service
+        self.embedding_service = embedding_service
+        self.vector_db = vector_db
+        self.deduplicator = deduplicator
+        self.rag_service = RAGService(llm_service, vector_db, deduplicator, manifest)
+        self.manifest = self.rag_service.manifest
+
+    @classmethod
+    def build(cls) -> "ServiceContainer":
+        """按当前配置构建所有服务"""
+        llm_service = create_llm_service()
+        embedding_service = create_embedding_service()
+        vector_db = create_vector_db(embedding_service)
+        logger.info(
+            f"服务已构建: llm={settings.LLM_PROVIDER}, "
+            f"embedding={embedding_service.get_model_info().get('model')}, "
+            f"vector_db={settings.VECTOR_DB_TYPE}"
+        )
+        return cls(
+            llm_service,
+            embedding_service,
+            vector_db,
+            create_deduplicator(),
+            DocumentManifest(settings.DOCUMENT_MANIFEST_PATH)
+        )
+
+    async def warmup(self) -> None:
+        """预热各服务，让首个请求只承担实际计算"""
+        await self.embedding_service.warmup()
+        await self.llm_service.warmup()
+        await self.vector_db.warmup()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """汇总各服务的运行指标"""
+        stats = {
+            "llm": self.llm_service.get_stats(),
+            "embedding": self.embedding_service.get_stats(),
+            "vector_db": self.vector_db.get_stats()
+        }
+        if self.deduplicator is not None:
+            stats["dedup"] = self.deduplicator.get_stats()
+        return stats
+
+    async def shutdown(self) -> None:
+        """按依赖的逆序关闭服务，单个服务失败不影响其余服务"""
+        for service in (self.vector_db, self.embedding_service, self.llm_service):
+            try:
+                await service.close()
+            except Exception as e:
+                logger.error(f"关闭服务失败 {service.__class__.__name__}: {e}")
+        if self.deduplicator is not None:
+            self.deduplicator.close()
+        self.manifest.close()
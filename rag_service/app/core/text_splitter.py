@@ -0,0 +1,115 @@
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+# TokenTextSplitter 附加到每个块元数据中的位置信息
+CHUNK_POSITION_KEYS = ("chunk_index", "start", "end")
+
+@dataclass
+class TextChunk:
+    """切分后的文本块"""
+    text: str
+    start: int                      # 在原文中的起始字符位置
+    end: int                        # 在原文中的结束字符位置（不含）
+    metadata: Dict[str, Any] = field(default_factory=dict)
+    token_ids: Optional[List[int]] = None   # 含特殊 token 的模型输入，可直接用于嵌入
+
+class TokenTextSplitter:
+    """
+    按 token 切分文本
+
+    使用嵌入模型自己的分词器，chunk_size 与 chunk_overlap 均以 token 计，
+    每个块都不超过模型的最大输入长度，因此嵌入时不会再被截断。
+    切分得到的 token id 随块一起返回，嵌入时无需再次分词。
+    """
+
+    def __init__(
+        self,
+        tokenizer,
+        chunk_size: int = 256,
+        chunk_overlap: int = 32,
+        max_length: int = 512
+    ):
+        """
+        初始化切分器
+
+        Args:
+            tokenizer: HuggingFace fast 分词器（需要支持 offset mapping）
+            chunk_size: 每块的 token 数（不含特殊 token）
+            chunk_overlap: 相邻块重叠的 token 数
+            max_length: 模型最大输入长度（含特殊 token）
+        """
+        if not getattr(tokenizer, "is_fast", False):
+            raise ValueError("TokenTextSplitter 需要 fast 分词器以获取字符偏移")
+        self.tokenizer = tokenizer
+        self._prefix, self._suffix = self._special_token_template()
+        self.chunk_size = min(chunk_size, max_length - len(self._prefix) - len(self._suffix))
+        if self.chunk_size < 1:
+            raise ValueError(f"chunk_size 必须为正数: {chunk_size}")
+        if not 0 <= chunk_overlap < self.chunk_size:
+            raise ValueError(f"chunk_overlap 必须在 [0, {self.chunk_size}) 范围内: {chunk_overlap}")
+        self.chunk_overlap = chunk_overlap
+
+    def _special_token_template(self):
+        """探测单句输入前后添加的特殊 token（如 [CLS] ... [SEP]）"""
+        content = self.tokenizer("a", add_special_tokens=False)["input_ids"]
+        full = self.tokenizer("a", add_special_tokens=True)["input_ids"]
+        for i in range(len(full) - len(content) + 1):
+            if full[i:i + len(content)] == content:
+                return full[:i], full[i + len(content):]
+        raise ValueError("无法确定分词器的特殊 token 模板")
+
+    def split_text(self, text: str, metadata: Optional[Dict[str, Any]] = None) -> List[TextChunk]:
+        """
+        切分单个文本
+
+        Args:
+            text: 原文
+            metadata: 原文的元数据，会复制到每个块并附加块序号与字符位置
+
+        Returns:
+            List[TextChunk]: 文本块列表
+        """
+        encoded = self.tokenizer(
+            text,
+            add_special_tokens=False,
+            return_offsets_mapping=True,
+            verbose=False
+        )
+        ids = encoded["input_ids"]
+        offsets = encoded["offset_mapping"]
+
+        chunks = []
+        step = self.chunk_size - self.chunk_overlap
+        for start in range(0, len(ids), step):
+            window = ids[start:start + self.chunk_size]
+            char_start = offsets[start][0]
+            char_end = offsets[start + len(window) - 1][1]
+            chunk_metadata = dict(metadata or {})
+            chunk_metadata.update({
+                "chunk_index": len(chunks),
+                "start": char_start,
+                "end": char_end
+            })
+            chunks.append(TextChunk(
+                text=text[char_start:char_end],
+                start=char_start,
+                end=char_end,
+                metadata=chunk_metadata,
+                token_ids=self._prefix + window + self._suffix
+            ))
+            if start + self.chunk_size >= len(ids):
+                break
+        return chunks
+
+    def split_texts(
+        self,
+        texts: List[str],
+        metadatas: Optional[List[Dict[str, Any]]] = None
+    ) -> List[TextChunk]:
+        """切分多个文本，块按原文顺序排列"""
+        metadatas = metadatas or [{} for _ in texts]
+        return [
+            chunk
+            for text, metadata in zip(texts, metadatas)
+            for chunk in self.split_text(text, metadata)
+        ]
@@ -0,0 +1,9 @@
+import pytest
+
+def pytest_configure(config):
+    """注册自定义标记"""
+    config.addinivalue_line("markers", "splitter: 文本切分测试")
+    config.addinivalue_line("markers", "rag: RAG服务测试")
+    config.addinivalue_line("markers", "registry: 提供商注册表测试")
+    config.addinivalue_line("markers", "dedup: 入库去重测试")
+    config.addinivalue_line("markers", "manifest: 文档清单测试")
@@ -0,0 +1,90 @@
+import pytest
+
+from rag_service.app.core.dedup import ChunkDeduplicator
+
+LICENSE = (
+    "Licensed under the Apache License, Version 2.0 (the \"License\"); you may not use this file "
+    "except in compliance with the License. You may obtain a copy of the License at "
+    "http://www.apache.org/licenses/LICENSE-2.0. Unless required by applicable law or agreed to in "
+    "writing, software distributed under the License is distributed on an \"AS IS\" BASIS."
+)
+
+@pytest.mark.dedup
+def test_detects_exact_and_near_duplicates():
+    """测试本批次内与已登记块的完全重复和近似重复"""
+    dedup = ChunkDeduplicator()
+    near = LICENSE.replace("Version 2.0", "Version 2.1").upper()
+    result = dedup.check([LICENSE, "完全不同的正文内容，讲的是另一件事情。", "  " + LICENSE + "\n", near])
+    assert result.targets == [None, None, 0, 0]
+    dedup.register(result, ["a", "b"])
+    assert result.resolve_ids(["a", "b"]) == ["a", "b", "a", "a"]
+
+    later = dedup.check([near, "another unrelated paragraph about vector search"])
+    assert later.targets == ["a", None]
+
+    dedup.forget(["a"])
+    assert dedup.check([LICENSE]).targets == [None]
+
+@pytest.mark.dedup
+def test_index_survives_restart(tmp_path):
+    """测试签名日志重放，末尾写了一半的行被截掉"""
+    path = tmp_path / "dedup" / "index.jsonl"
+    dedup = ChunkDeduplicator(index_path=str(path))
+    result = dedup.check([LICENSE, "first body", "second body"])
+    dedup.register(result, ["1", "2", "3"])
+    dedup.forget(["2"])
+    dedup.close()
+    with open(path, "a") as f:
+        f.write('{"op": "add", "id": "9"')
+
+    dedup = ChunkDeduplicator(index_path=str(path))
+    assert dedup.check([LICENSE, "first body", "second body"]).targets == ["1", None, "3"]
+    assert path.read_text().endswith("\n")
+    dedup.close()
+
+@pytest.mark.dedup
+def test_namespaces_deduplicated_separately():
+    """测试不同命名空间之间不去重"""
+    dedup = ChunkDeduplicator()
+    dedup.register(dedup.check([LICENSE], namespace="tenant-a"), ["1"])
+    assert dedup.check([LICENSE], namespace="tenant-a").targets == ["1"]
+    assert dedup.check([LICENSE], namespace="tenant-b").targets == [None]
+    assert dedup.check([LICENSE]).targets == [None]
+    dedup.forget(["1"])
+    assert dedup.check([LICENSE], namespace="tenant-a").targets == [None]
+
+@pytest.mark.dedup
+def test_dedup_scoped_by_metadata():
+    """测试只在去重范围（元数据）相同的块之间关联，块位置不影响去重范围"""
+    dedup = ChunkDeduplicator()
+    first = dedup.check([LICENSE], metadatas=[{"doc_id": "a", "chunk_index": 0, "start": 0, "end": 10}])
+    dedup.register(first, ["1"])
+    assert dedup.check([LICENSE], metadatas=[{"doc_id": "a", "chunk_index": 3}]).targets == ["1"]
+    assert dedup.check([LICENSE], metadatas=[{"doc_id": "b"}]).targets == [None]
+    assert dedup.check([LICENSE]).targets == [None]
+    batch = dedup.check([LICENSE, LICENSE], metadatas=[{"doc_id": "b"}, {"doc_id": "c"}])
+    assert batch.targets == [None, None]
+
+    scoped = ChunkDeduplicator(scope_keys=["lang"])
+    scoped.register(scoped.check([LICENSE], metadatas=[{"doc_id": "a", "lang": "en"}]), ["1"])
+    assert scoped.check([LICENSE], metadatas=[{"doc_id": "b", "lang": "en"}]).targets == ["1"]
+    assert scoped.check([LICENSE], metadatas=[{"doc_id": "b", "lang": "de"}]).targets == [None]
+
+@pytest.mark.dedup
+def test_records_released_with_last_reference(tmp_path):
+    """测试关联到记录的块各持有一个引用，最后一个引用释放后记录才被释放，重启后引用数不变"""
+    path = tmp_path / "index.jsonl"
+    dedup = ChunkDeduplicator(index_path=str(path))
+    dedup.register(dedup.check([LICENSE, LICENSE]), ["1"])
+    dedup.register(dedup.check([LICENSE]), [])
+    assert dedup.get_stats()["references"] == 3
+    assert dedup.release(["1"]) == []
+    dedup.close()
+
+    dedup = ChunkDeduplicator(index_path=str(path))
+    assert dedup.get_stats()["references"] == 2
+    assert dedup.release(["1"]) == []
+    assert dedup.check([LICENSE]).targets == ["1"]
+    assert dedup.release(["1", "unknown"]) == ["1", "unknown"]
+    assert dedup.check([LICENSE]).targets == [None]
+    dedup.close()
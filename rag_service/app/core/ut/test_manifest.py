@@ -0,0 +1,28 @@
+import pytest
+
+from rag_service.app.core.manifest import DocumentManifest, chunk_hash
+
+@pytest.mark.manifest
+def test_manifest_survives_restart(tmp_path):
+    """测试清单重放恢复最新状态和引用计数，末尾写了一半的行被截掉"""
+    path = tmp_path / "manifest" / "documents.jsonl"
+    manifest = DocumentManifest(str(path))
+    assert manifest.set("a", [("h1", "1"), ("h2", "2")]) == []
+    assert manifest.set("b", [("h2", "2")]) == []
+    assert manifest.set("a", [("h1", "1"), ("h3", "3")]) == []
+    manifest.close()
+    with open(path, "a") as f:
+        f.write('{"doc_id": "c"')
+
+    manifest = DocumentManifest(str(path))
+    assert manifest.get("a") == [("h1", "1"), ("h3", "3")]
+    assert manifest.get("c") == []
+    assert manifest.set("b", []) == ["2"]
+    assert manifest.get_stats() == {"documents": 1, "records": 2}
+    manifest.close()
+
+@pytest.mark.manifest
+def test_chunk_hash_covers_metadata():
+    """测试元数据变化也改变内容哈希"""
+    assert chunk_hash("text", {"a": 1, "b": 2}) == chunk_hash("text", {"b": 2, "a": 1})
+    assert chunk_hash("text", {"a": 1}) != chunk_hash("text", {"a": 2})
@@ -0,0 +1,246 @@
+import asyncio
+import pytest
+import numpy as np
+from typing import Any, Dict, List, Optional
+from tenacity import wait_none
+
+from rag_service.config.settings import settings
+from rag_service.app.core.dedup import ChunkDeduplicator
+from rag_service.app.core.llm.base import BaseLLMService
+from rag_service.app.core.rag_service import RAGService
+from rag_service.app.core.text_splitter import TokenTextSplitter
+from rag_service.app.core.vectordb.base import BaseVectorDB
+
+class RecordingVectorDB(BaseVectorDB):
+    """记录写入内容的假向量数据库"""
+
+    def __init__(self, embeddings: BaseLLMService):
+        self.embeddings = embeddings
+        self.texts: List[str] = []
+        self.vectors: Optional[np.ndarray] = None
+        self.metadatas: List[Dict[str, Any]] = []
+
+    async def add_vectors(self, texts, vectors, metadatas=None, **kwargs) -> List[str]:
+        self.texts, self.vectors, self.metadatas = texts, vectors, metadatas
+        return [str(i) for i in range(len(texts))]
+
+    async def search_vectors(self, vectors, k: int = 4, **kwargs) -> List[List[Dict[str, Any]]]:
+        return [[] for _ in vectors]
+
+    async def delete(self, ids: List[str]) -> None:
+        pass
+
+    async def clear(self) -> None:
+        pass
+
+class CharEmbeddingService(BaseLLMService):
+    """没有分词器的假嵌入服务"""
+
+    async def generate(self, prompt: str, **kwargs) -> str:
+        return ""
+
+    async def generate_with_history(self, messages: List[Dict[str, str]], **kwargs) -> str:
+        return ""
+
+    async def get_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return [[float(len(text)), 1.0] for text in texts]
+
+    def get_model_info(self) -> Dict[str, Any]:
+        return {"provider": "fake", "model": "fake", "dimension": 2}
+
+DOCUMENT = " ".join(["the quick brown fox jumps over the lazy dog."] * 20)
+
+@pytest.mark.rag
+def test_token_chunks_embedded_without_retokenizing(tiny_model_dir, monkeypatch):
+    """测试按token切分的块直接用token id嵌入，不再重复分词"""
+    from rag_service.app.core.llm.transformer_service import TransformerService
+    monkeypatch.setattr(settings, "CHUNK_SIZE", 16)
+    monkeypatch.setattr(settings, "CHUNK_OVERLAP", 4)
+    embedding_service = TransformerService(model_name=str(tiny_model_dir))
+    vector_db = RecordingVectorDB(embedding_service)
+    rag = RAGService(CharEmbeddingService(), vector_db)
+    assert isinstance(rag.text_splitter, TokenTextSplitter)
+
+    tokenize_calls = []
+    tokenize = embedding_service.encoder.tokenize
+
+    def counting_tokenize(texts):
+        tokenize_calls.append(texts)
+        return tokenize(texts)
+
+    monkeypatch.setattr(embedding_service.encoder, "tokenize", counting_tokenize)
+    ids = asyncio.run(rag.add_documents([DOCUMENT], [{"source": "doc"}]))
+    asyncio.run(embedding_service.close())
+    assert tokenize_calls == []
+
+    assert len(ids) == len(vector_db.texts) > 1
+    assert all(metadata["source"] == "doc" for metadata in vector_db.metadatas)
+    expected = np.vstack([embedding_service.encoder.encode([text]) for text in vector_db.texts])
+    np.testing.assert_allclose(vector_db.vectors, expected, atol=1e-5)
+
+@pytest.mark.rag
+def test_character_splitter_fallback():
+    """测试嵌入服务没有分词器时按字符切分"""
+    vector_db = RecordingVectorDB(CharEmbeddingService())
+    rag = RAGService(CharEmbeddingService(), vector_db)
+    assert not isinstance(rag.text_splitter, TokenTextSplitter)
+
+    asyncio.run(rag.add_documents([DOCUMENT, "short"], [{"source": "a"}, {"source": "b"}]))
+    assert vector_db.texts[-1] == "short"
+    assert vector_db.metadatas[-1]["source"] == "b"
+    assert vector_db.vectors.shape == (len(vector_db.texts), 2)
+
+@pytest.mark.rag
+def test_duplicate_chunks_linked_to_existing_vectors():
+    """测试重复块不再嵌入写入，返回已有记录的ID"""
+    footer = "Copyright (c) Example Corp. All rights reserved. Do not redistribute without permission."
+    vector_db = RecordingVectorDB(CharEmbeddingService())
+    rag = RAGService(CharEmbeddingService(), vector_db, ChunkDeduplicator())
+    ids = asyncio.run(rag.add_documents([footer, "body of the first document", footer.lower()]))
+    assert vector_db.texts == [footer, "body of the first document"]
+    assert ids == ["0", "1", "0"]
+
+    vector_db.texts = []
+    assert asyncio.run(rag.add_documents([footer])) == ["0"]
+    assert vector_db.texts == []
+
+@pytest.mark.rag
+def test_namespace_is_reserved_metadata_key():
+    """测试命名空间写入块的元数据，元数据中不一致的 namespace 不会被静默覆盖"""
+    vector_db = RecordingVectorDB(CharEmbeddingService())
+    rag = RAGService(CharEmbeddingService(), vector_db)
+    asyncio.run(rag.add_documents(["hello"], [{"source": "a"}], namespace="t1"))
+    assert vector_db.metadatas[0]["namespace"] == "t1" and vector_db.metadatas[0]["source"] == "a"
+    asyncio.run(rag.add_documents(["hello"], [{"namespace": "t1"}], namespace="t1"))
+    assert vector_db.metadatas[0]["namespace"] == "t1"
+    for namespace in ("t2", None):
+        with pytest.raises(ValueError):
+            asyncio.run(rag.add_documents(["hello"], [{"namespace": "t1"}], namespace=namespace))
+        with pytest.raises(ValueError):
+            asyncio.run(rag.sync_documents(["hello"], ["doc"], [{"namespace": "t1"}], namespace=namespace))
+
+class FlakyLLMService(CharEmbeddingService):
+    """对指定问题第一次生成失败的假LLM服务"""
+
+    def __init__(self, failing: str):
+        self.failing = failing
+        self.prompts: List[str] = []
+
+    async def generate(self, prompt: str, **kwargs) -> str:
+        self.prompts.append(prompt)
+        if self.failing in prompt and sum(self.failing in p for p in self.prompts) == 1:
+            raise RuntimeError("temporary failure")
+        return "answer"
+
+@pytest.mark.rag
+def test_query_batch_retries_each_answer(monkeypatch):
+    """测试批量查询只重试失败的回答，不重新检索"""
+    monkeypatch.setattr(RAGService._answer_with_retry.retry, "wait", wait_none())
+    searches = []
+    vector_db = RecordingVectorDB(CharEmbeddingService())
+    search_vectors = vector_db.search_vectors
+
+    async def counting_search(vectors, k: int = 4, **kwargs):
+        searches.append(len(vectors))
+        return await search_vectors(vectors, k, **kwargs)
+
+    vector_db.search_vectors = counting_search
+    llm = FlakyLLMService("second question")
+    rag = RAGService(llm, vector_db)
+    results = asyncio.run(rag.query_batch(["first question", "second question"]))
+    assert [result["answer"] for result in results] == ["answer", "answer"]
+    assert searches == [2]
+    assert sum("first question" in prompt for prompt in llm.prompts) == 1
+    assert sum("second question" in prompt for prompt in llm.prompts) == 2
+
+class CountingVectorDB(RecordingVectorDB):
+    """分配递增ID并记录删除的假向量数据库"""
+
+    def __init__(self, embeddings: BaseLLMService):
+        super().__init__(embeddings)
+        self.next_id = 0
+        self.deleted: List[str] = []
+
+    async def add_vectors(self, texts, vectors, metadatas=None, **kwargs) -> List[str]:
+        self.texts, self.vectors, self.metadatas = texts, vectors, metadatas
+        ids = [str(self.next_id + i) for i in range(len(texts))]
+        self.next_id += len(texts)
+        return ids
+
+    async def delete(self, ids: List[str]) -> None:
+        self.deleted += ids
+
+@pytest.mark.rag
+def test_sync_documents_incremental(monkeypatch):
+    """测试按文档增量同步：只写入变化的块，删除消失的块，未变化的块沿用原记录"""
+    monkeypatch.setattr(settings, "CHUNK_SIZE", 40)
+    monkeypatch.setattr(settings, "CHUNK_OVERLAP", 0)
+    paragraphs = [f"paragraph number {i} talks about topic {i}." for i in range(4)]
+    vector_db = CountingVectorDB(CharEmbeddingService())
+    rag = RAGService(CharEmbeddingService(), vector_db, ChunkDeduplicator())
+
+    first = asyncio.run(rag.sync_documents(["\n\n".join(paragraphs)], ["doc-1"], [{"source": "a"}]))
+    assert (first["added"], first["unchanged"], first["deleted"]) == (4, 0, 0)
+    assert all(metadata == {"source": "a", "doc_id": "doc-1"} for metadata in vector_db.metadatas)
+
+    vector_db.texts = []
+    again = asyncio.run(rag.sync_documents(["\n\n".join(paragraphs)], ["doc-1"], [{"source": "a"}]))
+    assert again == {"ids": first["ids"], "added": 0, "linked": 0, "unchanged": 4, "deleted": 0}
+    assert vector_db.texts == [] and vector_db.deleted == []
+
+    # 修改一段（与旧版本高度相似也要重新写入）、删除一段
+    updated = [paragraphs[0], paragraphs[1].replace("topic 1", "topic 9"), paragraphs[3]]
+    result = asyncio.run(rag.sync_documents(["\n\n".join(updated)], ["doc-1"], [{"source": "a"}]))
+    assert (result["added"], result["unchanged"], result["deleted"]) == (1, 2, 2)
+    assert vector_db.texts == [updated[1]]
+    assert sorted(vector_db.deleted) == sorted([first["ids"][1], first["ids"][2]])
+    assert result["ids"] == [first["ids"][0], "4", first["ids"][3]]
+
+@pytest.mark.rag
+def test_sync_keeps_records_shared_by_other_documents(monkeypatch):
+    """测试去重后被多个文档共用的记录，只在最后一个引用消失时删除"""
+    monkeypatch.setattr(settings, "CHUNK_SIZE", 1000)
+    footer = "Copyright (c) Example Corp. All rights reserved."
+    vector_db = CountingVectorDB(CharEmbeddingService())
+    # 不限制去重范围，不同文档的相同块共用记录
+    rag = RAGService(CharEmbeddingService(), vector_db, ChunkDeduplicator(scope_keys=[]))
+    asyncio.run(rag.sync_documents([footer, footer], ["doc-1", "doc-2"]))
+    assert vector_db.next_id == 1
+
+    result = asyncio.run(rag.sync_documents([""], ["doc-1"]))
+    assert (result["added"], result["deleted"]) == (0, 1)
+    assert vector_db.deleted == []
+
+    asyncio.run(rag.sync_documents([""], ["doc-2"]))
+    assert vector_db.deleted == ["0"]
+
+@pytest.mark.rag
+def test_dedup_keeps_filterable_metadata(monkeypatch):
+    """测试默认只在元数据相同的块之间去重，按 doc_id 过滤时每个文档都有自己的记录"""
+    monkeypatch.setattr(settings, "CHUNK_SIZE", 1000)
+    footer = "Copyright (c) Example Corp. All rights reserved."
+    vector_db = CountingVectorDB(CharEmbeddingService())
+    rag = RAGService(CharEmbeddingService(), vector_db, ChunkDeduplicator())
+    result = asyncio.run(rag.sync_documents([footer, footer], ["doc-1", "doc-2"]))
+    assert vector_db.next_id == 2
+    assert result["ids"] == ["0", "1"]
+
+    # 同一文档内的重复块仍然去重
+    assert asyncio.run(rag.add_documents([footer, footer], [{"source": "a"}, {"source": "a"}])) == ["2", "2"]
+
+@pytest.mark.rag
+def test_sync_never_deletes_records_linked_from_outside(monkeypatch):
+    """测试同步的文档关联到 add_documents 写入的记录时计为关联，重新同步不会删除该记录"""
+    monkeypatch.setattr(settings, "CHUNK_SIZE", 1000)
+    footer = "Copyright (c) Example Corp. All rights reserved."
+    vector_db = CountingVectorDB(CharEmbeddingService())
+    rag = RAGService(CharEmbeddingService(), vector_db, ChunkDeduplicator(scope_keys=[]))
+    assert asyncio.run(rag.add_documents([footer])) == ["0"]
+
+    result = asyncio.run(rag.sync_documents([footer], ["doc-y"]))
+    assert result == {"ids": ["0"], "added": 0, "linked": 1, "unchanged": 0, "deleted": 0}
+
+    result = asyncio.run(rag.sync_documents(["a different body for this document"], ["doc-y"]))
+    assert (result["added"], result["linked"], result["deleted"]) == (1, 0, 1)
+    assert vector_db.deleted == []
+    assert asyncio.run(rag.add_documents([footer])) == ["0"]
@@ -0,0 +1,62 @@
+import os
+import re
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from rag_service.app.core.registry import EMBEDDING_BACKENDS, LLM_PROVIDERS, VECTOR_DBS, ProviderRegistry
+
+PROJECT_ROOT = Path(__file__).resolve().parents[4]
+
+# 导入 API 时不应加载的重型依赖
+HEAVY_MODULES = ["torch", "transformers", "onnxruntime", "pymilvus", "faiss", "langchain", "langchain_core"]
+
+# 导入 rag_service.app.main 的累计耗时预算（秒），可通过环境变量放宽
+IMPORT_TIME_BUDGET = float(os.environ.get("RAG_IMPORT_TIME_BUDGET", "3.0"))
+
+@pytest.mark.registry
+def test_registry_imports_on_demand():
+    """登记时不导入模块，get 时才导入"""
+    registry = ProviderRegistry("测试后端")
+    registry.register("decimal", "decimal:Decimal")
+    assert registry.names() == ["decimal"]
+    assert registry.create("decimal", "1.5") * 2 == 3
+
+@pytest.mark.registry
+def test_registry_unknown_name():
+    """未登记的名称报出类别"""
+    with pytest.raises(ValueError, match="未知的向量数据库类型"):
+        VECTOR_DBS.get("annoy")
+    with pytest.raises(ValueError, match="模块:类名"):
+        ProviderRegistry("测试后端").register("bad", "decimal.Decimal")
+
+@pytest.mark.registry
+def test_builtin_providers_registered():
+    """内置后端均已登记"""
+    assert LLM_PROVIDERS.names() == ["openai"]
+    assert set(EMBEDDING_BACKENDS.names()) == {"torch", "onnx"}
+    assert set(VECTOR_DBS.names()) == {"faiss", "milvus", "numpy"}
+
+@pytest.mark.registry
+def test_app_import_is_light():
+    """导入应用不加载重型后端，且耗时在预算内"""
+    code = (
+        "import sys, rag_service.app.main; "
+        f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=PROJECT_ROOT,
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    assert result.stdout.strip() == "", f"启动时导入了重型依赖: {result.stdout.strip()}"
+
+    # -X importtime 输出格式: "import time: self [us] | cumulative | imported package"
+    match = re.search(r"^import time:\s*\d+\s*\|\s*(\d+)\s*\|\s*rag_service\.app\.main$", result.stderr, re.M)
+    assert match, result.stderr[-2000:]
+    cumulative = int(match.group(1)) / 1e6
+    assert cumulative < IMPORT_TIME_BUDGET, f"导入耗时 {cumulative:.2f}s 超出预算 {IMPORT_TIME_BUDGET}s"
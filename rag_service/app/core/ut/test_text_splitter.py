@@ -0,0 +1,59 @@
+import pytest
+
+from rag_service.app.core.text_splitter import TokenTextSplitter
+
+@pytest.fixture
+def tokenizer(tiny_model_dir):
+    transformers = pytest.importorskip("transformers")
+    return transformers.AutoTokenizer.from_pretrained(str(tiny_model_dir))
+
+TEXT = "the quick brown fox jumps over the lazy dog. hello world, vector search query."
+
+@pytest.mark.splitter
+def test_chunks_respect_token_budget(tokenizer):
+    """测试每块的token数不超过chunk_size，且token id含特殊token"""
+    splitter = TokenTextSplitter(tokenizer, chunk_size=5, chunk_overlap=2)
+    chunks = splitter.split_text(TEXT, {"source": "doc"})
+    assert len(chunks) > 1
+    for index, chunk in enumerate(chunks):
+        assert len(chunk.token_ids) <= 5 + 2
+        assert chunk.token_ids[0] == tokenizer.cls_token_id
+        assert chunk.token_ids[-1] == tokenizer.sep_token_id
+        assert chunk.metadata["source"] == "doc"
+        assert chunk.metadata["chunk_index"] == index
+
+@pytest.mark.splitter
+def test_offsets_and_token_ids_match_text(tokenizer):
+    """测试字符偏移指向原文，token id与重新分词结果一致"""
+    splitter = TokenTextSplitter(tokenizer, chunk_size=6, chunk_overlap=0)
+    chunks = splitter.split_text(TEXT)
+    for chunk in chunks:
+        assert TEXT[chunk.start:chunk.end] == chunk.text
+        assert chunk.token_ids == tokenizer(chunk.text)["input_ids"]
+    # 无重叠时各块的token拼起来就是整篇文本
+    content_ids = [i for chunk in chunks for i in chunk.token_ids[1:-1]]
+    assert content_ids == tokenizer(TEXT, add_special_tokens=False)["input_ids"]
+
+@pytest.mark.splitter
+def test_overlap(tokenizer):
+    """测试相邻块按token重叠"""
+    splitter = TokenTextSplitter(tokenizer, chunk_size=6, chunk_overlap=2)
+    first, second = splitter.split_text(TEXT)[:2]
+    assert first.token_ids[-3:-1] == second.token_ids[1:3]
+
+@pytest.mark.splitter
+def test_chunk_size_clamped_to_model_length(tokenizer):
+    """测试chunk_size不超过模型最大输入长度"""
+    splitter = TokenTextSplitter(tokenizer, chunk_size=1000, chunk_overlap=10, max_length=512)
+    assert splitter.chunk_size == 510
+
+@pytest.mark.splitter
+def test_invalid_overlap(tokenizer):
+    """测试非法的重叠参数"""
+    with pytest.raises(ValueError):
+        TokenTextSplitter(tokenizer, chunk_size=4, chunk_overlap=4)
+
+@pytest.mark.splitter
+def test_empty_text(tokenizer):
+    """测试空文本"""
+    assert TokenTextSplitter(tokenizer, chunk_size=4, chunk_overlap=1).split_text("") == []
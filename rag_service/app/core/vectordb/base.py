@@ -1,28 +1,143 @@
 from abc import ABC, abstractmethod
 from typing import List, Dict, Any, Optional
 
+import numpy as np
+
+from rag_service.app.core.llm.base import BaseLLMService
+from rag_service.app.core.vectordb.filters import Condition, MetadataFilter
+from rag_service.app.core.vectordb.search_params import SearchParams
+
+class SearchResults(list):
+    """
+    单个查询的结果列表
+
+    partial 为 True 表示有部分数据（如超时或失败的分片）没有参与检索，结果可能不完整。
+    """
+
+    def __init__(self, docs=(), partial: bool = False, missing_shards: Optional[List[int]] = None):
+        super().__init__(docs)
+        self.partial = partial
+        self.missing_shards = missing_shards or []
+
 class BaseVectorDB(ABC):
-    """向量数据库的基础接口"""
+    """
+    向量数据库的基础接口
+    
+    命名空间（租户）通过 kwargs 中的 namespace 传入。原生支持的存储（Milvus 分区）只写入、检索该命名空间，
+    未指定时使用默认命名空间；其他存储要求记录的元数据带有 "namespace"，检索时按元数据过滤，
+    未指定时只检索元数据中没有 "namespace" 的记录，即默认命名空间，两类存储的语义一致。
+    """
+    
+    # 计算文本嵌入的服务
+    embeddings: BaseLLMService
+    # 是否原生隔离命名空间
+    supports_namespaces: bool = False
     
     @abstractmethod
-    async def add_texts(
+    async def add_vectors(
         self,
         texts: List[str],
+        vectors: np.ndarray,
         metadatas: Optional[List[Dict[str, Any]]] = None,
         **kwargs
     ) -> List[str]:
-        """添加文本到向量数据库"""
+        """
+        添加已计算好嵌入的文本
+        
+        Args:
+            texts: 文本列表
+            vectors: 形状为 (len(texts), dim) 的连续 float32 数组
+            metadatas: 元数据列表
+            
+        Returns:
+            List[str]: 新增记录的ID
+        """
         pass
     
     @abstractmethod
+    async def search_vectors(
+        self,
+        vectors: np.ndarray,
+        k: int = 4,
+        **kwargs
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        按查询向量搜索
+        
+        Args:
+            vectors: 形状为 (n_queries, dim) 的连续 float32 数组
+            k: 每个查询返回的结果数
+            params: 可选的 SearchParams（通过 kwargs 传入），未指定的字段使用后端默认配置
+            filter: 可选的 MetadataFilter（通过 kwargs 传入），只返回元数据满足条件的记录
+            namespace: 可选的命名空间（通过 kwargs 传入），supports_namespaces 为 True 的存储才会处理
+            
+        Returns:
+            List[List[Dict[str, Any]]]: 每个查询各自的结果列表
+        """
+        pass
+    
+    async def add_texts(
+        self,
+        texts: List[str],
+        metadatas: Optional[List[Dict[str, Any]]] = None,
+        **kwargs
+    ) -> List[str]:
+        """添加文本到向量数据库"""
+        vectors = await self.embeddings.get_embeddings_array(texts)
+        return await self.add_vectors(texts, vectors, metadatas, **kwargs)
+    
     async def similarity_search(
         self,
         query: str,
         k: int = 4,
+        params: Optional[SearchParams] = None,
+        filter: Optional[MetadataFilter] = None,
         **kwargs
     ) -> List[Dict[str, Any]]:
-        """相似度搜索"""
-        pass
+        """
+        相似度搜索
+        
+        Args:
+            query: 查询文本
+            k: 返回的结果数
+            params: 近似搜索参数（nprobe / ef / 耗时预算），None 时使用后端默认配置
+            filter: 元数据过滤条件，在向量检索内部生效，而不是检索后再过滤
+        """
+        results = await self.similarity_search_batch([query], k=k, params=params, filter=filter, **kwargs)
+        return results[0]
+    
+    async def similarity_search_batch(
+        self,
+        queries: List[str],
+        k: int = 4,
+        params: Optional[SearchParams] = None,
+        filter: Optional[MetadataFilter] = None,
+        **kwargs
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        批量相似度搜索：一次嵌入全部查询，再用一次近似搜索调用检索
+        
+        Args:
+            queries: 查询文本列表
+            k: 每个查询返回的结果数
+            params: 近似搜索参数，None 时使用后端默认配置
+            filter: 元数据过滤条件，对所有查询生效
+            namespace: 命名空间（通过 kwargs 传入），不原生支持的存储转为元数据过滤条件
+            
+        Returns:
+            List[List[Dict[str, Any]]]: 与 queries 一一对应的结果列表
+        """
+        if not queries:
+            return []
+        if not self.supports_namespaces:
+            namespace = kwargs.pop("namespace", None)
+            namespace = (
+                Condition("namespace", "exists", False) if namespace is None
+                else Condition("namespace", "eq", namespace)
+            )
+            filter = MetadataFilter((filter.conditions if filter is not None else ()) + (namespace,))
+        vectors = await self.embeddings.get_embeddings_array(queries)
+        return await self.search_vectors(vectors, k=k, params=params, filter=filter, **kwargs)
     
     @abstractmethod
     async def delete(self, ids: List[str]) -> None:
@@ -32,4 +147,20 @@ class BaseVectorDB(ABC):
     @abstractmethod
     async def clear(self) -> None:
         """清空数据库"""
+        pass
+    
+    async def commit(self) -> None:
+        """把缓冲中的写入落盘（默认无操作）"""
+        pass
+    
+    async def warmup(self) -> None:
+        """预热数据库（默认无操作）"""
+        pass
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取运行指标（默认为空）"""
+        return {}
+    
+    async def close(self) -> None:
+        """关闭数据库连接（默认无操作）"""
         pass 
\ No newline at end of file
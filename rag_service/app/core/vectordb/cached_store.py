@@ -0,0 +1,106 @@
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from rag_service.app.core.vectordb.base import BaseVectorDB
+from rag_service.app.core.vectordb.query_cache import QueryCache
+
+# 不影响检索结果的参数，不参与缓存键
+_UNKEYED_KWARGS = ("timeout",)
+
+class CachedVectorDB(BaseVectorDB):
+    """
+    在向量数据库前加一层语义检索缓存
+
+    相近的查询（改写、同义问法）复用已缓存的检索结果，不再执行向量检索；
+    缓存作用在 search_vectors 上，similarity_search / similarity_search_batch 都会经过它。
+    写入、删除、清空都会使缓存失效；不完整的结果（有分片缺席）不缓存。
+    后台定时刷新的写缓冲（Milvus）不经过这一层，其可见性延迟由 ttl 兜底。
+
+    失效只发生在本进程内：多个 worker 进程、或其他服务写入同一个 Milvus 时，
+    其他写入者的写入和删除不会使这里的缓存失效，因此只适合单个写入进程的部署，默认关闭。
+    """
+
+    def __init__(
+        self,
+        store: BaseVectorDB,
+        max_distance: float = 0.05,
+        ttl: Optional[float] = 300.0,
+        size: int = 1024
+    ):
+        """
+        Args:
+            store: 被缓存的向量数据库
+            max_distance: 视为同一查询的最大余弦距离
+            ttl: 缓存有效期（秒），None 表示不过期
+            size: 最多缓存的查询数
+        """
+        self.store = store
+        self.embeddings = store.embeddings
+        self.supports_namespaces = store.supports_namespaces
+        dimension = self.embeddings.get_model_info().get("dimension", 1536)
+        self.cache = QueryCache(dimension, max_distance=max_distance, ttl=ttl, size=size)
+
+    @staticmethod
+    def _cache_key(kwargs: Dict[str, Any]) -> str:
+        return repr(sorted((name, value) for name, value in kwargs.items() if name not in _UNKEYED_KWARGS))
+
+    async def add_vectors(
+        self,
+        texts: List[str],
+        vectors: np.ndarray,
+        metadatas: Optional[List[Dict[str, Any]]] = None,
+        **kwargs
+    ) -> List[str]:
+        try:
+            return await self.store.add_vectors(texts, vectors, metadatas, **kwargs)
+        finally:
+            # 写入期间开始的检索也会因 generation 变化而不被缓存
+            self.cache.invalidate()
+
+    async def search_vectors(
+        self,
+        vectors: np.ndarray,
+        k: int = 4,
+        **kwargs
+    ) -> List[List[Dict[str, Any]]]:
+        """只对未命中缓存的查询执行检索"""
+        key = self._cache_key(kwargs)
+        generation = self.cache.generation
+        results: List[Optional[List[Dict[str, Any]]]] = [self.cache.get(vector, key, k) for vector in vectors]
+        misses = [i for i, docs in enumerate(results) if docs is None]
+        if misses:
+            fetched = await self.store.search_vectors(vectors[misses], k=k, **kwargs)
+            for i, docs in zip(misses, fetched):
+                results[i] = docs
+                if not getattr(docs, "partial", False):
+                    self.cache.put(vectors[i], key, k, docs, generation)
+        return results
+
+    async def delete(self, ids: List[str], **kwargs) -> None:
+        try:
+            await self.store.delete(ids, **kwargs)
+        finally:
+            self.cache.invalidate()
+
+    async def clear(self) -> None:
+        try:
+            await self.store.clear()
+        finally:
+            self.cache.invalidate()
+
+    async def commit(self) -> None:
+        # 写缓冲中的数据在提交后才可见
+        await self.store.commit()
+        self.cache.invalidate()
+
+    async def warmup(self) -> None:
+        await self.store.warmup()
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = dict(self.store.get_stats())
+        stats["query_cache"] = self.cache.get_stats()
+        return stats
+
+    async def close(self) -> None:
+        await self.store.close()
@@ -0,0 +1,204 @@
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List, Optional
+
+import faiss
+import numpy as np
+
+from rag_service.app.core.vectordb.maintenance import MIN_POINTS_PER_CENTROID, suggested_nlist
+
+INDEX_TYPES = ("flat", "hnsw", "ivf_flat", "ivf_pq", "auto")
+
+@dataclass(frozen=True)
+class IndexSpec:
+    """索引结构及其构建参数"""
+    kind: str                   # flat / hnsw / ivf_flat / ivf_pq
+    hnsw_m: int = 0             # HNSW 每个节点的邻居数
+    ef_construction: int = 0    # HNSW 构建时的候选集大小
+    nlist: int = 0              # IVF 聚类中心数
+    pq_m: int = 0               # PQ 子空间数
+    pq_nbits: int = 0           # 每个子空间的编码位数
+
+    @property
+    def needs_training(self) -> bool:
+        return self.kind in ("ivf_flat", "ivf_pq")
+
+    @property
+    def supports_remove(self) -> bool:
+        """HNSW 图不支持删除节点，只能标记删除后重建"""
+        return self.kind != "hnsw"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "IndexSpec":
+        return cls(**data)
+
+def default_pq_m(dimension: int, max_m: Optional[int] = None) -> int:
+    """选择能整除维度的 PQ 子空间数，默认每个子空间 8 维"""
+    max_m = max_m or max(1, dimension // 8)
+    return max(m for m in range(1, min(max_m, dimension) + 1) if dimension % m == 0)
+
+def min_training_vectors(spec: IndexSpec) -> int:
+    """训练该索引所需的最少向量数"""
+    if not spec.needs_training:
+        return 0
+    required = spec.nlist * MIN_POINTS_PER_CENTROID
+    if spec.kind == "ivf_pq":
+        # 每个 PQ 子空间有 2^nbits 个中心
+        required = max(required, (1 << spec.pq_nbits) * MIN_POINTS_PER_CENTROID)
+    return required
+
+def resolve_spec(
+    kind: str,
+    num_vectors: int,
+    dimension: int,
+    memory_budget: int,
+    hnsw_m: int = 32,
+    ef_construction: int = 200,
+    nlist: Optional[int] = None,
+    pq_m: Optional[int] = None,
+    pq_nbits: int = 8,
+    exact_max: int = 10000
+) -> IndexSpec:
+    """
+    按配置和当前语料规模确定要构建的索引
+
+    IVF 类索引在向量数不足以训练时先用 Flat 索引，等语料增长后再训练。
+    auto 模式：
+    - 向量数不超过 exact_max 时用精确的 Flat
+    - HNSW（原始向量 + 图）放得进内存预算时用 HNSW
+    - 原始向量放得进内存预算时用 IVF-Flat
+    - 否则用 IVF-PQ，按预算选择编码大小
+
+    Args:
+        kind: 索引类型，见 INDEX_TYPES
+        num_vectors: 当前向量数
+        dimension: 向量维度
+        memory_budget: 索引的内存预算（字节），仅 auto 模式使用
+        hnsw_m: HNSW 每个节点的邻居数
+        ef_construction: HNSW 构建时的候选集大小
+        nlist: IVF 聚类中心数，None 时按语料规模选择
+        pq_m: PQ 子空间数，None 时按维度选择
+        pq_nbits: 每个 PQ 子空间的编码位数
+        exact_max: auto 模式下使用 Flat 的最大向量数
+
+    Raises:
+        ValueError: 当索引类型未知时
+    """
+    if kind not in INDEX_TYPES:
+        raise ValueError(f"未知的FAISS索引类型: {kind}")
+
+    if kind == "auto":
+        raw_bytes = num_vectors * dimension * 4
+        if num_vectors <= exact_max:
+            kind = "flat"
+        elif raw_bytes + num_vectors * hnsw_m * 2 * 4 <= memory_budget:
+            kind = "hnsw"
+        elif raw_bytes <= memory_budget:
+            kind = "ivf_flat"
+        else:
+            kind = "ivf_pq"
+            if pq_m is None:
+                # 编码大小 pq_m * pq_nbits / 8 字节，取预算内最大的可整除子空间数
+                budget_m = memory_budget * 8 // max(num_vectors * pq_nbits, 1)
+                pq_m = default_pq_m(dimension, max_m=max(1, min(budget_m, dimension // 2)))
+
+    if kind == "flat":
+        return IndexSpec("flat")
+    if kind == "hnsw":
+        return IndexSpec("hnsw", hnsw_m=hnsw_m, ef_construction=ef_construction)
+
+    spec = IndexSpec(
+        kind,
+        nlist=nlist or suggested_nlist(num_vectors),
+        pq_m=(pq_m or default_pq_m(dimension)) if kind == "ivf_pq" else 0,
+        pq_nbits=pq_nbits if kind == "ivf_pq" else 0
+    )
+    if num_vectors < min_training_vectors(spec):
+        return IndexSpec("flat")
+    return spec
+
+def create_index(spec: IndexSpec, dimension: int) -> faiss.Index:
+    """
+    创建空索引，返回的索引都以记录ID作为标签
+
+    Flat 与 HNSW 由 IndexIDMap2 维护 ID；IVF 自带 ID，并用哈希表形式的 direct map 支持按 ID 删除和重建向量。
+    """
+    if spec.kind == "flat":
+        return faiss.IndexIDMap2(faiss.IndexFlatL2(dimension))
+    if spec.kind == "hnsw":
+        hnsw = faiss.IndexHNSWFlat(dimension, spec.hnsw_m)
+        hnsw.hnsw.efConstruction = spec.ef_construction
+        return faiss.IndexIDMap2(hnsw)
+    quantizer = faiss.IndexFlatL2(dimension)
+    if spec.kind == "ivf_flat":
+        return faiss.IndexIVFFlat(quantizer, dimension, spec.nlist)
+    if spec.kind == "ivf_pq":
+        return faiss.IndexIVFPQ(quantizer, dimension, spec.nlist, spec.pq_m, spec.pq_nbits)
+    raise ValueError(f"未知的FAISS索引类型: {spec.kind}")
+
+def build_index(
+    spec: IndexSpec,
+    dimension: int,
+    vectors: np.ndarray,
+    ids: np.ndarray,
+    train_sample_size: int = 100000,
+    seed: int = 0
+) -> faiss.Index:
+    """
+    构建索引：需要训练时先从向量中随机采样训练，再写入全部向量
+
+    Args:
+        spec: 索引结构
+        dimension: 向量维度
+        vectors: 全部向量
+        ids: 与向量对应的记录ID
+        train_sample_size: 训练样本数上限
+        seed: 采样的随机种子
+    """
+    index = create_index(spec, dimension)
+    if spec.needs_training:
+        sample = vectors
+        if len(vectors) > train_sample_size:
+            rows = np.random.default_rng(seed).choice(len(vectors), train_sample_size, replace=False)
+            sample = vectors[np.sort(rows)]
+        index.train(np.ascontiguousarray(sample, dtype=np.float32))
+        index.set_direct_map_type(faiss.DirectMap.Hashtable)
+    if len(ids):
+        index.add_with_ids(np.ascontiguousarray(vectors, dtype=np.float32), ids)
+    return index
+
+def describe_index(index: faiss.Index) -> IndexSpec:
+    """从已有索引（如加载的快照）推断其结构"""
+    if isinstance(index, faiss.IndexIDMap):
+        inner = faiss.downcast_index(index.index)
+        if isinstance(inner, faiss.IndexHNSW):
+            return IndexSpec("hnsw", hnsw_m=inner.hnsw.nb_neighbors(1), ef_construction=inner.hnsw.efConstruction)
+        return IndexSpec("flat")
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexIVFPQ):
+        return IndexSpec("ivf_pq", nlist=index.nlist, pq_m=index.pq.M, pq_nbits=index.pq.nbits)
+    if isinstance(index, faiss.IndexIVFFlat):
+        return IndexSpec("ivf_flat", nlist=index.nlist)
+    raise ValueError(f"不支持的FAISS索引: {type(index).__name__}")
+
+def search_parameters(
+    spec: IndexSpec,
+    ef_search: int,
+    nprobe: int,
+    selector: Optional[faiss.IDSelector] = None
+) -> Optional[faiss.SearchParameters]:
+    """构造检索参数：HNSW 的 efSearch、IVF 的 nprobe 以及可选的ID过滤"""
+    if spec.kind == "hnsw":
+        return faiss.SearchParametersHNSW(efSearch=ef_search, sel=selector)
+    if spec.needs_training:
+        return faiss.SearchParametersIVF(nprobe=min(nprobe, spec.nlist), sel=selector)
+    if selector is not None:
+        return faiss.SearchParameters(sel=selector)
+    return None
+
+def ivf_list_sizes(index: faiss.Index) -> List[int]:
+    """IVF 索引各倒排表的长度"""
+    index = faiss.extract_index_ivf(index)
+    return [index.invlists.list_size(i) for i in range(index.nlist)]
@@ -0,0 +1,147 @@
+import fcntl
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+
+import faiss
+import numpy as np
+from loguru import logger
+
+# 快照目录中指向当前快照的文件
+CURRENT_FILE = "CURRENT"
+INDEX_FILE = "index.faiss"
+DOCSTORE_FILE = "docstore.json"
+# 写入者锁文件，内容为持有锁的进程号
+LOCK_FILE = "LOCK"
+_SNAPSHOT_PREFIX = "snapshot-"
+
+def _write_file(path: Path, data: Union[bytes, memoryview]) -> None:
+    """写入并落盘"""
+    with open(path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+def _fsync_dir(path: Path) -> None:
+    """让目录项（重命名）落盘"""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def write_snapshot(directory: Path, index_bytes: np.ndarray, docstore: Dict[str, Any]) -> Path:
+    """
+    原子地写入一个快照
+
+    先在临时目录中写好索引和文档表，重命名为正式的快照目录，
+    最后用 os.replace 切换 CURRENT。任一步中断时 CURRENT 仍指向上一个完整快照。
+
+    Args:
+        directory: 快照根目录
+        index_bytes: faiss.serialize_index 的结果
+        docstore: 可 JSON 序列化的文档表
+
+    Returns:
+        Path: 新快照目录
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    # 时间戳在前保证按名称排序即按时间排序，进程号避免多个 worker 同时写入时冲突
+    name = f"{_SNAPSHOT_PREFIX}{time.time_ns():020d}-{os.getpid()}"
+    tmp_dir = directory / f"{name}.tmp"
+    tmp_dir.mkdir()
+    # 直接写出数组的缓冲区，不再复制一份索引
+    _write_file(tmp_dir / INDEX_FILE, memoryview(index_bytes))
+    _write_file(tmp_dir / DOCSTORE_FILE, json.dumps(docstore, ensure_ascii=False).encode("utf-8"))
+    snapshot_dir = directory / name
+    os.rename(tmp_dir, snapshot_dir)
+
+    pointer = directory / f"{CURRENT_FILE}.{os.getpid()}.tmp"
+    _write_file(pointer, name.encode("utf-8"))
+    os.replace(pointer, directory / CURRENT_FILE)
+    _fsync_dir(directory)
+    return snapshot_dir
+
+def acquire_writer_lock(directory: Path) -> Optional[int]:
+    """
+    尝试成为快照目录唯一的写入者
+
+    在 LOCK 文件上加非阻塞的排他 flock 并写入进程号。锁随文件描述符关闭（包括进程退出）释放，
+    进程崩溃不会留下过期的锁。同一进程内再次获取也会失败，每个目录同一时间只有一个写入者。
+
+    Returns:
+        Optional[int]: 持有锁的文件描述符，目录已有写入者时为 None
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    fd = os.open(directory / LOCK_FILE, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(fd)
+        return None
+    os.ftruncate(fd, 0)
+    os.write(fd, str(os.getpid()).encode("utf-8"))
+    return fd
+
+def release_writer_lock(fd: int) -> None:
+    """释放写入者锁"""
+    os.close(fd)
+
+def lock_owner(directory: Path) -> Optional[str]:
+    """持有写入者锁的进程号，读取失败时返回 None"""
+    try:
+        return (directory / LOCK_FILE).read_text(encoding="utf-8").strip() or None
+    except OSError:
+        return None
+
+def current_snapshot(directory: Path) -> Optional[Path]:
+    """当前快照目录，没有快照时返回 None"""
+    try:
+        name = (directory / CURRENT_FILE).read_text(encoding="utf-8").strip()
+    except FileNotFoundError:
+        return None
+    return directory / name
+
+def read_index(path: Path, mmap: bool) -> Any:
+    """
+    读取索引文件
+
+    mmap 时 Flat/HNSW 的向量（IO_FLAG_MMAP_IFC）与 IVF 的倒排表（IO_FLAG_MMAP）都直接映射文件，
+    打开几乎不花时间，多个进程映射同一文件时共享页面缓存。映射的索引是只读的。
+    """
+    if not mmap:
+        return faiss.read_index(str(path))
+    try:
+        return faiss.read_index(str(path), faiss.IO_FLAG_MMAP | faiss.IO_FLAG_MMAP_IFC)
+    except RuntimeError:
+        # IVF 的倒排表映射不支持与 IO_FLAG_MMAP_IFC 同时使用
+        return faiss.read_index(str(path), faiss.IO_FLAG_MMAP)
+
+def read_docstore(snapshot_dir: Path) -> Dict[str, Any]:
+    """读取快照中的文档表"""
+    return json.loads((snapshot_dir / DOCSTORE_FILE).read_text(encoding="utf-8"))
+
+def prune_snapshots(directory: Path, keep: int, protected: Optional[Path] = None) -> List[Path]:
+    """
+    删除较旧的快照，保留最新的 keep 个以及 CURRENT 和 protected 指向的快照
+
+    Returns:
+        List[Path]: 被删除的快照目录
+    """
+    snapshots = sorted(
+        path for path in directory.glob(f"{_SNAPSHOT_PREFIX}*")
+        if path.is_dir() and not path.name.endswith(".tmp")
+    )
+    retained = set(snapshots[-keep:]) if keep > 0 else set()
+    retained.update(path for path in (current_snapshot(directory), protected) if path is not None)
+    removed = []
+    for path in snapshots:
+        if path not in retained:
+            shutil.rmtree(path, ignore_errors=True)
+            removed.append(path)
+    if removed:
+        logger.debug(f"删除旧的 FAISS 快照: {[path.name for path in removed]}")
+    return removed
@@ -1,59 +1,659 @@
-from typing import List, Dict, Any, Optional
+import asyncio
+import threading
+import time
+from dataclasses import replace
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Sequence, Set, Tuple
 import faiss
 import numpy as np
-from langchain.vectorstores import FAISS
-from langchain.embeddings.base import Embeddings
+from loguru import logger
 
 from rag_service.config.settings import settings
+from rag_service.app.core.llm.base import BaseLLMService
+from rag_service.app.core.utils.rwlock import ReadWriteLock
+from rag_service.app.core.vectordb import faiss_snapshot
 from rag_service.app.core.vectordb.base import BaseVectorDB
+from rag_service.app.core.vectordb.faiss_index import (
+    IndexSpec,
+    build_index,
+    create_index,
+    describe_index,
+    ivf_list_sizes,
+    min_training_vectors,
+    resolve_spec,
+    search_parameters
+)
+from rag_service.app.core.vectordb.filters import MetadataFilter, MetadataIndex
+from rag_service.app.core.vectordb.maintenance import PeriodicTask, retrain_reason, suggested_nlist
+from rag_service.app.core.vectordb.search_params import SearchParams
+
+# 检索耗时滑动平均的权重
+_COST_SMOOTHING = 0.2
 
 class FAISSStore(BaseVectorDB):
-    def __init__(self, embeddings: Embeddings):
+    """
+    基于 faiss.IndexIDMap2 的向量存储
+
+    每条记录分配一个稳定的 64 位 ID，向量以该 ID 写入索引，
+    文本与元数据保存在以 ID 为键的文档表中。删除会真正从索引中移除向量，
+    用已有 ID 写入时先移除旧记录再写入（upsert）。
+
+    配置了 FAISS_INDEX_DIR 时，启动时加载最新快照（默认以内存映射方式打开），
+    后台按 FAISS_SNAPSHOT_INTERVAL 定期保存有变化的数据，关闭时再保存一次。
+    多个 worker 共用快照目录时只有持有写入者锁（目录中的 LOCK 文件）的进程保存快照，
+    其他进程只加载快照，各自的写入不落盘，避免互相覆盖。
+
+    索引类型由 FAISS_INDEX_TYPE 决定。IVF 类索引在向量足够训练之前先写入 Flat 索引，
+    达到训练所需的数量后采样训练并重建；auto 模式随语料增长逐级切换索引类型。
+    HNSW 不支持删除，删除的记录先在检索时过滤掉，比例过高时重建索引。
+    写入触发的重建在后台线程的影子索引上进行，期间继续使用当前索引，commit 等待重建完成。
+
+    IVF 索引随语料增长会变得不均衡，后台维护任务按 INDEX_MAINTENANCE_INTERVAL 检查
+    倒排表的不均衡程度与聚类中心数，需要时在影子索引上重新训练，
+    期间的写入记录下来，构建完成后补写并原子替换，不阻塞检索。
+    IVF-PQ 不保存原始向量，不做后台重训。
+    """
+
+    def __init__(self, embeddings: BaseLLMService, shard: Optional[int] = None):
+        """
+        Args:
+            embeddings: 嵌入服务
+            shard: 分片编号，作为 ShardedStore 的分片时快照保存在 FAISS_INDEX_DIR/shard-<编号>
+        """
         self.embeddings = embeddings
-        self.vector_store = None
+        # 向量维度以嵌入模型为准，未知时沿用 OpenAI embeddings 维度
+        self.dimension = embeddings.get_model_info().get("dimension", 1536)
+        # 下一个自动分配的 ID，只增不减，清空后也不会复用旧 ID
+        self._next_id = 0
+        # 写入与快照互斥；检索不持有该锁
+        self._lock = threading.RLock()
+        # faiss 索引不能在检索的同时原地增删向量：检索持读锁，add_with_ids / remove_ids 持写锁
+        self._index_lock = ReadWriteLock()
+        self._version = 0
+        self._saved_version = 0
+        # 以内存映射方式加载的索引文件，映射的索引只读，首次写入前载入内存
+        self._mapped_path: Optional[Path] = None
+        # 索引每次被整体替换时加一，后台重训据此判断影子索引是否已过期
+        self._generation = 0
+        # 后台重训期间的写入日志，重训结束后补写到影子索引
+        self._shadow_log: Optional[List[Tuple[str, np.ndarray, Optional[np.ndarray]]]] = None
+        # 同一时间只构建一个影子索引
+        self._shadow_lock = threading.Lock()
+        # 写入触发的后台重建线程，没有重建时为 None
+        self._rebuild_thread: Optional[threading.Thread] = None
+        # 各索引类型每个查询每单位 nprobe / ef 的平均检索耗时（毫秒），用于按耗时预算降低检索精度
+        self._search_cost: Dict[str, float] = {}
         self._initialize_store()
-    
+
+        self.index_dir = Path(settings.FAISS_INDEX_DIR) if settings.FAISS_INDEX_DIR else None
+        if self.index_dir is not None and shard is not None:
+            self.index_dir = self.index_dir / f"shard-{shard}"
+        self._tasks: List[PeriodicTask] = []
+        # 快照目录写入者锁的文件描述符，其他进程持有锁时为 None
+        self._writer_lock: Optional[int] = None
+        if self.index_dir is not None:
+            self.load(self.index_dir, mmap=settings.FAISS_MMAP)
+            self._writer_lock = faiss_snapshot.acquire_writer_lock(self.index_dir)
+            if self._writer_lock is None:
+                logger.warning(
+                    f"FAISS 快照目录 {self.index_dir} 已由进程 {faiss_snapshot.lock_owner(self.index_dir)} 写入，"
+                    f"本进程只加载快照，写入不会保存"
+                )
+            elif settings.FAISS_SNAPSHOT_INTERVAL > 0:
+                self._tasks.append(
+                    PeriodicTask("faiss-snapshot", settings.FAISS_SNAPSHOT_INTERVAL, self._snapshot_if_dirty)
+                )
+        if settings.INDEX_MAINTENANCE_INTERVAL > 0:
+            self._tasks.append(PeriodicTask("faiss-maintenance", settings.INDEX_MAINTENANCE_INTERVAL, self.maintain))
+        for task in self._tasks:
+            task.start()
+
     def _initialize_store(self):
-        """初始化FAISS存储"""
-        dimension = 1536  # OpenAI embeddings维度
-        self.vector_store = FAISS.from_texts(
-            [""], 
-            self.embeddings,
-            metadatas=[{"source": "init"}]
+        """初始化空的索引与文档表"""
+        self.spec = self._resolve_spec(0)
+        self.index = create_index(self.spec, self.dimension)
+        self.docstore: Dict[int, Tuple[str, Dict[str, Any]]] = {}
+        # 元数据倒排索引，过滤检索时据此得到候选记录ID
+        self._metadata_index = MetadataIndex()
+        # 上次构建索引时的记录数，auto 模式只在语料增长后切换索引类型
+        self._built_at = 0
+        # HNSW 中已删除但仍在图里的记录ID
+        self._tombstones: Set[int] = set()
+        self._tombstone_selector = None
+        self._mapped_path = None
+        self._generation += 1
+
+    def _resolve_spec(self, num_vectors: int) -> IndexSpec:
+        """按配置与记录数确定应使用的索引结构"""
+        return resolve_spec(
+            settings.FAISS_INDEX_TYPE,
+            num_vectors,
+            self.dimension,
+            memory_budget=settings.FAISS_MEMORY_BUDGET_MB * 1024 * 1024,
+            hnsw_m=settings.FAISS_HNSW_M,
+            ef_construction=settings.FAISS_HNSW_EF_CONSTRUCTION,
+            nlist=settings.FAISS_IVF_NLIST,
+            pq_m=settings.FAISS_PQ_M,
+            pq_nbits=settings.FAISS_PQ_NBITS,
+            exact_max=settings.FAISS_AUTO_EXACT_MAX
+        )
+
+    def _rebuild_plan(self) -> Optional[Tuple[IndexSpec, str]]:
+        """是否需要训练新的索引或清理 HNSW 中删除的记录，返回 (目标索引, 原因)（调用方需持有锁）"""
+        num_records = len(self.docstore)
+        target = self._resolve_spec(num_records)
+        if target.kind != self.spec.kind and num_records > self._built_at:
+            return target, f"{self.spec.kind} -> {target.kind}"
+        max_deleted = settings.FAISS_HNSW_MAX_DELETED_RATIO * self.index.ntotal
+        if self._tombstones and len(self._tombstones) > max_deleted:
+            return self.spec, f"清理 {len(self._tombstones)} 条已删除的记录"
+        return None
+
+    def _maybe_rebuild(self) -> None:
+        """写入或删除后需要重建时启动后台重建线程（调用方需持有锁）"""
+        if self._rebuild_thread is not None or self._rebuild_plan() is None:
+            return
+        self._rebuild_thread = threading.Thread(target=self._rebuild_in_background, name="faiss-rebuild", daemon=True)
+        self._rebuild_thread.start()
+
+    def _rebuild_in_background(self) -> None:
+        """后台重建线程：重建到不再需要为止，每轮都按当时的记录重新判断"""
+        try:
+            while True:
+                with self._lock:
+                    plan = self._rebuild_plan()
+                    if plan is None:
+                        self._rebuild_thread = None
+                        return
+                with self._shadow_lock:
+                    self._rebuild_in_shadow(*plan)
+        except Exception as e:
+            logger.error(f"后台重建 FAISS 索引失败: {e}")
+            with self._lock:
+                self._rebuild_thread = None
+
+    def wait_for_rebuild(self) -> None:
+        """等待后台重建结束"""
+        thread = self._rebuild_thread
+        while thread is not None:
+            thread.join()
+            thread = self._rebuild_thread
+
+    def _rebuild(self, spec: IndexSpec) -> None:
+        """用当前全部记录同步重建索引（调用方需持有锁），只用于加载快照和复用 HNSW 中已删除的 ID"""
+        ids = np.array(sorted(self.docstore), dtype=np.int64)
+        vectors = self._reconstruct(ids)
+        logger.info(f"重建 FAISS 索引: {self.spec.kind} -> {spec.kind}, {len(ids)} 条记录")
+        self.index = build_index(
+            spec,
+            self.dimension,
+            vectors,
+            ids,
+            train_sample_size=settings.FAISS_TRAIN_SAMPLE_SIZE
         )
-        self.vector_store.delete([self.vector_store.index_to_docstore_id[0]])
-    
-    async def add_texts(
+        self.spec = spec
+        self._built_at = len(ids)
+        self._set_tombstones(set())
+        self._mapped_path = None
+        self._generation += 1
+        self._version += 1
+
+    def _reconstruct(self, ids: np.ndarray) -> np.ndarray:
+        """按记录ID取回向量（IVF-PQ 为有损重建）"""
+        if not len(ids):
+            return np.empty((0, self.dimension), dtype=np.float32)
+        if self.spec.kind == "ivf_pq":
+            logger.warning(f"从 IVF-PQ 索引取回的是有损重建的向量（{len(ids)} 条），新索引的精度会下降")
+        return self.index.reconstruct_batch(ids)
+
+    def _set_tombstones(self, tombstones: Set[int]) -> None:
+        """更新 HNSW 删除标记及检索时使用的过滤器"""
+        self._tombstones = tombstones
+        self._tombstone_selector = None
+        if tombstones:
+            batch = faiss.IDSelectorBatch(np.array(sorted(tombstones), dtype=np.int64))
+            # 保留内层过滤器的引用，避免被回收
+            self._tombstone_selector = (faiss.IDSelectorNot(batch), batch)
+
+    def _ensure_writable(self) -> None:
+        """把内存映射的只读索引载入内存，之后才能增删向量"""
+        if self._mapped_path is None:
+            return
+        try:
+            self.index = faiss_snapshot.read_index(self._mapped_path, mmap=False)
+        except RuntimeError:
+            # 快照已被其他进程清理时，从映射中复制一份（Flat/HNSW 可行）
+            self.index = faiss.deserialize_index(faiss.serialize_index(self.index))
+        self._mapped_path = None
+
+    @property
+    def dirty(self) -> bool:
+        """是否有尚未保存到快照的变化"""
+        return self._version != self._saved_version
+
+    def save(self, directory: Optional[str] = None) -> Path:
+        """
+        把索引和文档表保存为一个新快照
+
+        Args:
+            directory: 快照根目录，None 时使用 FAISS_INDEX_DIR
+
+        Returns:
+            Path: 新快照目录
+
+        Raises:
+            ValueError: 当没有配置快照目录时
+            RuntimeError: 保存到 FAISS_INDEX_DIR 但本进程不是该目录的写入者时
+        """
+        directory = Path(directory) if directory else self.index_dir
+        if directory is None:
+            raise ValueError("未配置 FAISS 快照目录")
+        if directory == self.index_dir and self._writer_lock is None:
+            raise RuntimeError(f"FAISS 快照目录 {directory} 由其他进程写入，本进程不能保存")
+        # 持锁时只在内存中复制一份，落盘时不阻塞写入
+        with self._lock:
+            version = self._version
+            mapped_path = self._mapped_path
+            index_bytes = None if mapped_path is not None else faiss.serialize_index(self.index)
+            docstore = {
+                "dimension": self.dimension,
+                "next_id": self._next_id,
+                "index_spec": self.spec.to_dict(),
+                "built_at": self._built_at,
+                "tombstones": sorted(self._tombstones),
+                "records": [[i, text, metadata] for i, (text, metadata) in self.docstore.items()]
+            }
+        if index_bytes is None:
+            # 映射的索引自加载后没有变化，直接复用映射的文件
+            index_bytes = np.fromfile(mapped_path, dtype=np.uint8)
+        snapshot_dir = faiss_snapshot.write_snapshot(directory, index_bytes, docstore)
+        with self._lock:
+            if directory == self.index_dir:
+                self._saved_version = max(self._saved_version, version)
+            protected = self._mapped_path.parent if self._mapped_path is not None else None
+        faiss_snapshot.prune_snapshots(directory, settings.FAISS_SNAPSHOT_KEEP, protected=protected)
+        logger.info(f"FAISS 快照已保存: {snapshot_dir} ({len(docstore['records'])} 条记录)")
+        return snapshot_dir
+
+    def load(self, directory: Optional[str] = None, mmap: bool = True) -> bool:
+        """
+        加载目录中的当前快照
+
+        Args:
+            directory: 快照根目录，None 时使用 FAISS_INDEX_DIR
+            mmap: 是否以内存映射方式打开索引
+
+        Returns:
+            bool: 是否加载了快照（目录中没有快照时为 False）
+
+        Raises:
+            ValueError: 当快照的向量维度与嵌入模型不一致时
+        """
+        directory = Path(directory) if directory else self.index_dir
+        snapshot_dir = faiss_snapshot.current_snapshot(directory) if directory else None
+        if snapshot_dir is None:
+            return False
+        docstore = faiss_snapshot.read_docstore(snapshot_dir)
+        if docstore["dimension"] != self.dimension:
+            raise ValueError(
+                f"FAISS 快照维度 {docstore['dimension']} 与嵌入模型维度 {self.dimension} 不一致: {snapshot_dir}"
+            )
+        index_path = snapshot_dir / faiss_snapshot.INDEX_FILE
+        index = faiss_snapshot.read_index(index_path, mmap=mmap)
+        spec = docstore.get("index_spec")
+        with self._lock:
+            self.index = index
+            self.spec = IndexSpec.from_dict(spec) if spec else describe_index(index)
+            self.docstore = {int(i): (text, metadata) for i, text, metadata in docstore["records"]}
+            self._metadata_index.rebuild((i, metadata) for i, (_, metadata) in self.docstore.items())
+            self._next_id = max(self._next_id, docstore["next_id"])
+            self._built_at = docstore.get("built_at", len(self.docstore))
+            self._set_tombstones(set(docstore.get("tombstones", [])))
+            self._mapped_path = index_path if mmap else None
+            self._generation += 1
+            self._version += 1
+            self._saved_version = self._version
+            # 配置的索引类型变化时按新配置重建
+            target = self._resolve_spec(len(self.docstore))
+            if settings.FAISS_INDEX_TYPE != "auto" and target.kind != self.spec.kind:
+                self._rebuild(target)
+        logger.info(f"FAISS 快照已加载: {snapshot_dir} ({len(self.docstore)} 条记录, {self.spec.kind}, mmap={mmap})")
+        return True
+
+    def _snapshot_if_dirty(self) -> None:
+        """后台定期保存有变化的数据"""
+        if self.dirty:
+            self.save()
+
+    def maintain(self, force: bool = False) -> bool:
+        """
+        检查 IVF 索引是否需要重新训练，需要时在影子索引上重建并原子替换
+
+        训练和写入影子索引时不持有锁，检索与写入照常进行；
+        期间的写入记在日志里，替换前在锁内补写到影子索引。
+
+        Args:
+            force: 不检查直接重训
+
+        Returns:
+            bool: 是否替换了索引
+        """
+        if not self._shadow_lock.acquire(blocking=False):
+            return False
+        try:
+            with self._lock:
+                if not self.spec.needs_training:
+                    return False
+                num_records = len(self.docstore)
+                reason = "手动触发" if force else retrain_reason(
+                    self.spec.nlist,
+                    num_records,
+                    list_sizes=ivf_list_sizes(self.index),
+                    target_nlist=settings.FAISS_IVF_NLIST,
+                    max_imbalance=settings.IVF_MAX_IMBALANCE,
+                    max_nlist_drift=settings.IVF_MAX_NLIST_DRIFT
+                )
+                if reason is None:
+                    return False
+                if self.spec.kind == "ivf_pq":
+                    # 索引里只有 PQ 编码，用重建出的近似向量重训会让量化误差逐次累积
+                    logger.warning(f"IVF-PQ 索引需要重训（{reason}），但没有保存原始向量，跳过；重新导入数据后会重新训练")
+                    return False
+                spec = replace(self.spec, nlist=settings.FAISS_IVF_NLIST or suggested_nlist(num_records))
+                if num_records < min_training_vectors(spec):
+                    return False
+            return self._rebuild_in_shadow(spec, reason)
+        finally:
+            self._shadow_lock.release()
+
+    def _rebuild_in_shadow(self, spec: IndexSpec, reason: str) -> bool:
+        """
+        在影子索引上构建 spec 索引，补写期间的写入后原子替换（调用方需持有 _shadow_lock）
+
+        Returns:
+            bool: 是否替换了索引，期间索引被整体替换时放弃
+        """
+        with self._lock:
+            generation = self._generation
+            ids = np.array(sorted(self.docstore), dtype=np.int64)
+            vectors = self._reconstruct(ids)
+            self._shadow_log = []
+
+        logger.info(f"后台重建 FAISS 索引（{reason}）: {self.spec.kind} -> {spec.kind}, nlist={spec.nlist}, {len(ids)} 条记录")
+        try:
+            shadow = build_index(
+                spec,
+                self.dimension,
+                vectors,
+                ids,
+                train_sample_size=settings.FAISS_TRAIN_SAMPLE_SIZE
+            )
+        except Exception:
+            with self._lock:
+                self._shadow_log = None
+            raise
+
+        with self._lock:
+            log, self._shadow_log = self._shadow_log, None
+            if generation != self._generation:
+                # 重建期间索引被整体替换（清空、同步重建或重新加载），影子索引作废
+                logger.info("FAISS 索引在重建期间已被替换，放弃本次重建结果")
+                return False
+            tombstones: Set[int] = set()
+            for op, op_ids, op_vectors in log:
+                if op == "add":
+                    if tombstones.intersection(int(i) for i in op_ids):
+                        # HNSW 影子中已删除的 ID 又被写入，影子作废，下次再重建
+                        logger.info("FAISS 重建期间复用了已删除的 ID，放弃本次重建结果")
+                        return False
+                    shadow.add_with_ids(op_vectors, op_ids)
+                elif spec.supports_remove:
+                    shadow.remove_ids(op_ids)
+                else:
+                    tombstones.update(int(i) for i in op_ids)
+            self.index = shadow
+            self.spec = spec
+            self._built_at = len(self.docstore)
+            self._set_tombstones(tombstones)
+            self._mapped_path = None
+            self._generation += 1
+            self._version += 1
+        logger.info(f"FAISS 索引已替换为 {spec.kind}（nlist={spec.nlist}），补写了 {len(log)} 批期间的写入")
+        return True
+
+    @staticmethod
+    def _parse_ids(ids: Sequence[Any]) -> np.ndarray:
+        """把调用方传入的 ID 转为 int64 数组"""
+        try:
+            parsed = np.array([int(i) for i in ids], dtype=np.int64)
+        except (TypeError, ValueError, OverflowError):
+            raise ValueError(f"FAISS 记录ID必须是非负的64位整数: {list(ids)}")
+        if (parsed < 0).any():
+            raise ValueError(f"FAISS 记录ID必须是非负的64位整数: {list(ids)}")
+        return parsed
+
+    def _remove(self, ids: np.ndarray) -> int:
+        """从索引和文档表中移除记录，返回实际移除的条数（调用方需持有锁）"""
+        ids = np.array([i for i in ids if int(i) in self.docstore], dtype=np.int64)
+        if not len(ids):
+            return 0
+        if self.spec.supports_remove:
+            self._ensure_writable()
+            with self._index_lock.write():
+                self.index.remove_ids(ids)
+        else:
+            self._set_tombstones(self._tombstones | {int(i) for i in ids})
+        if self._shadow_log is not None:
+            self._shadow_log.append(("remove", ids, None))
+        for i in ids:
+            _, metadata = self.docstore.pop(int(i))
+            self._metadata_index.remove(int(i), metadata)
+        self._version += 1
+        return len(ids)
+
+    async def add_vectors(
         self,
         texts: List[str],
+        vectors: np.ndarray,
         metadatas: Optional[List[Dict[str, Any]]] = None,
+        ids: Optional[List[str]] = None,
         **kwargs
     ) -> List[str]:
+        """
+        添加已计算好嵌入的文本
+
+        Args:
+            texts: 文本列表
+            vectors: 形状为 (len(texts), dim) 的连续 float32 数组
+            metadatas: 元数据列表
+            ids: 记录ID，None 时自动分配；ID 已存在时覆盖旧记录
+
+        Returns:
+            List[str]: 记录ID（64位整数的字符串形式）
+        """
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if vectors.shape != (len(texts), self.dimension):
+            raise ValueError(f"向量形状 {vectors.shape} 与文本数 {len(texts)}、维度 {self.dimension} 不匹配")
+        if not texts:
+            return []
         if not metadatas:
             metadatas = [{"source": f"doc_{i}"} for i in range(len(texts))]
-        
-        self.vector_store.add_texts(texts=texts, metadatas=metadatas)
-        return [str(i) for i in range(len(texts))]
-    
-    async def similarity_search(
+
+        if ids is not None:
+            int_ids = self._parse_ids(ids)
+            if len(int_ids) != len(texts):
+                raise ValueError(f"ID 数 {len(int_ids)} 与文本数 {len(texts)} 不一致")
+            if len(np.unique(int_ids)) != len(int_ids):
+                raise ValueError("同一批写入中的ID不能重复")
+
+        with self._lock:
+            if ids is None:
+                int_ids = np.arange(self._next_id, self._next_id + len(texts), dtype=np.int64)
+            else:
+                self._remove(int_ids)
+                if self._tombstones.intersection(int(i) for i in int_ids):
+                    # HNSW 图中仍有这些ID的旧向量，先重建清理后再写入
+                    self._rebuild(self.spec)
+            self._next_id = max(self._next_id, int(int_ids.max()) + 1)
+
+            self._ensure_writable()
+            with self._index_lock.write():
+                self.index.add_with_ids(vectors, int_ids)
+            if self._shadow_log is not None:
+                self._shadow_log.append(("add", int_ids, vectors))
+            for i, text, metadata in zip(int_ids, texts, metadatas):
+                self.docstore[int(i)] = (text, metadata)
+                self._metadata_index.add(int(i), metadata)
+            self._version += 1
+            self._maybe_rebuild()
+        return [str(i) for i in int_ids]
+
+    def _search_effort(self, spec: IndexSpec, params: SearchParams, k: int, num_queries: int) -> Tuple[int, int]:
+        """
+        确定本次检索的 (ef_search, nprobe)
+
+        未指定时使用 FAISS_HNSW_EF_SEARCH / FAISS_IVF_NPROBE。指定了耗时预算时，
+        按历史上每单位 ef / nprobe 的耗时估算预算内能承受的最大值，ef 不低于 k。
+        """
+        ef_search = max(params.ef or settings.FAISS_HNSW_EF_SEARCH, k)
+        nprobe = params.nprobe or settings.FAISS_IVF_NPROBE
+        cost = self._search_cost.get(spec.kind)
+        if params.latency_budget_ms is not None and cost:
+            affordable = int(params.latency_budget_ms / (cost * num_queries))
+            ef_search = max(k, min(ef_search, affordable))
+            nprobe = max(1, min(nprobe, affordable))
+        return ef_search, nprobe
+
+    def _record_search_cost(self, spec: IndexSpec, effort: int, num_queries: int, seconds: float) -> None:
+        """更新该索引类型每单位 ef / nprobe 的平均检索耗时"""
+        sample = seconds * 1000 / (num_queries * max(effort, 1))
+        cost = self._search_cost.get(spec.kind)
+        self._search_cost[spec.kind] = sample if cost is None else cost + _COST_SMOOTHING * (sample - cost)
+
+    async def search_vectors(
         self,
-        query: str,
+        vectors: np.ndarray,
         k: int = 4,
         **kwargs
-    ) -> List[Dict[str, Any]]:
-        docs = self.vector_store.similarity_search(query, k=k)
-        return [
-            {
-                "text": doc.page_content,
-                "metadata": doc.metadata,
-                "score": doc.metadata.get("score", 0.0)
-            }
-            for doc in docs
-        ]
-    
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        按查询向量搜索
+
+        params（SearchParams）中的 ef 用于 HNSW、nprobe 用于 IVF，Flat 索引忽略两者；
+        耗时预算只能通过降低 ef / nprobe 来满足，不会中断检索。
+
+        filter（MetadataFilter）先在元数据倒排索引中得到候选ID：候选不超过 FAISS_FILTER_EXACT_MAX 条时
+        直接对候选向量精确计算距离，否则以候选ID构造 IDSelector 在索引内过滤。
+        已删除（HNSW 标记删除）的记录不在倒排索引中，候选集合已经排除了它们。
+        """
+        if self.index.ntotal == 0:
+            return [[] for _ in range(len(vectors))]
+
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        index, spec, tombstone_selector = self.index, self.spec, self._tombstone_selector
+        selector = tombstone_selector[0] if tombstone_selector else None
+        metadata_filter: Optional[MetadataFilter] = kwargs.get("filter")
+        if metadata_filter is not None and metadata_filter.conditions:
+            with self._lock:
+                matched = self._metadata_index.select(metadata_filter)
+                candidates = np.fromiter(matched, dtype=np.int64) if matched is not None else None
+                if candidates is not None and not len(candidates):
+                    return [[] for _ in range(len(vectors))]
+                if candidates is not None and len(candidates) <= settings.FAISS_FILTER_EXACT_MAX:
+                    # 持锁重建候选向量，避免与删除并发
+                    scores, labels = self._search_candidates(self.index, vectors, candidates, k)
+                    return self._format_results(scores, labels)
+            if candidates is not None:
+                selector = faiss.IDSelectorBatch(candidates)
+
+        # 一次搜索所有查询，索引返回的标签就是记录ID
+        ef_search, nprobe = self._search_effort(spec, kwargs.get("params") or SearchParams(), k, len(vectors))
+        params = search_parameters(spec, ef_search=ef_search, nprobe=nprobe, selector=selector)
+        start = time.perf_counter()
+        # faiss 检索时释放 GIL，放到线程中执行，不阻塞事件循环，多个分片可以并行检索
+        scores, labels = await asyncio.to_thread(self._search_index, index, vectors, k, params)
+        if spec.kind == "hnsw":
+            self._record_search_cost(spec, ef_search, len(vectors), time.perf_counter() - start)
+        elif spec.needs_training:
+            self._record_search_cost(spec, min(nprobe, spec.nlist), len(vectors), time.perf_counter() - start)
+        return self._format_results(scores, labels)
+
+    def _search_index(
+        self,
+        index: faiss.Index,
+        vectors: np.ndarray,
+        k: int,
+        params: Optional[faiss.SearchParameters]
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """持读锁检索，等待正在进行的原地写入完成"""
+        with self._index_lock.read():
+            return index.search(vectors, k, params=params)
+
+    @staticmethod
+    def _search_candidates(
+        index: faiss.Index,
+        vectors: np.ndarray,
+        candidates: np.ndarray,
+        k: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """在少量候选记录中精确检索，返回与 index.search 相同格式的 (距离, 标签)"""
+        candidate_vectors = index.reconstruct_batch(candidates)
+        distances = (
+            (vectors ** 2).sum(axis=1, keepdims=True)
+            - 2 * vectors @ candidate_vectors.T
+            + (candidate_vectors ** 2).sum(axis=1)
+        )
+        top = min(k, len(candidates))
+        rows = np.argpartition(distances, top - 1, axis=1)[:, :top]
+        order = np.take_along_axis(distances, rows, axis=1).argsort(axis=1)
+        rows = np.take_along_axis(rows, order, axis=1)
+        scores = np.maximum(np.take_along_axis(distances, rows, axis=1), 0)
+        return scores, candidates[rows]
+
+    def _format_results(self, scores: np.ndarray, labels: np.ndarray) -> List[List[Dict[str, Any]]]:
+        """把检索到的 (距离, 记录ID) 转为结果列表，跳过空位与检索期间被删除的记录"""
+        results = []
+        for row_scores, row_labels in zip(scores, labels):
+            docs = []
+            for score, label in zip(row_scores, row_labels):
+                record = self.docstore.get(int(label))
+                if label == -1 or record is None:
+                    continue
+                text, metadata = record
+                docs.append({
+                    "id": str(label),
+                    "text": text,
+                    "metadata": metadata,
+                    "score": float(score)
+                })
+            results.append(docs)
+        return results
+
     async def delete(self, ids: List[str]) -> None:
-        # FAISS不支持直接删除，需要重建索引
-        pass
-    
+        if not ids:
+            return
+        int_ids = self._parse_ids(ids)
+        with self._lock:
+            self._remove(int_ids)
+            self._maybe_rebuild()
+
     async def clear(self) -> None:
-        self._initialize_store() 
\ No newline at end of file
+        with self._lock:
+            self._initialize_store()
+            self._version += 1
+
+    async def commit(self) -> None:
+        """等待写入触发的后台重建完成，之后的检索使用新索引"""
+        await asyncio.to_thread(self.wait_for_rebuild)
+
+    async def close(self) -> None:
+        """停止后台任务，等待重建结束，保存尚未落盘的变化并释放写入者锁"""
+        for task in self._tasks:
+            task.stop()
+        self._tasks = []
+        await self.commit()
+        if self._writer_lock is not None:
+            if self.dirty:
+                self.save()
+            faiss_snapshot.release_writer_lock(self._writer_lock)
+            self._writer_lock = None
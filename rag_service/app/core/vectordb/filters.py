@@ -0,0 +1,192 @@
+import json
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, Optional, Set, Tuple
+
+# 比较运算符，区间条件由 gt / gte / lt / lte 组合而成；exists 判断键是否存在（值为标量）
+FILTER_OPS = ("eq", "in", "gt", "gte", "lt", "lte", "exists")
+_RANGE_OPS = {"gt": ">", "gte": ">=", "lt": "<", "lte": "<="}
+
+def _scalar_key(value: Any) -> Optional[Tuple[str, Any]]:
+    """
+    元数据值在倒排索引中的键，按类型分组，只有同组的值才能相互比较
+
+    bool 单独成组，避免 True 与 1 相等；整数与浮点数同为数值。非标量值返回 None。
+    """
+    if isinstance(value, bool):
+        return ("bool", value)
+    if isinstance(value, (int, float)):
+        return ("number", value)
+    if isinstance(value, str):
+        return ("str", value)
+    return None
+
+@dataclass(frozen=True)
+class Condition:
+    """单个元数据条件：metadata[key] <op> value"""
+    key: str
+    op: str
+    value: Any
+
+    def matches(self, metadata: Dict[str, Any]) -> bool:
+        if self.op == "exists":
+            return (_scalar_key(metadata.get(self.key)) is not None) == self.value
+        if self.key not in metadata:
+            return False
+        actual = _scalar_key(metadata[self.key])
+        if actual is None:
+            return False
+        if self.op == "eq":
+            return actual == _scalar_key(self.value)
+        if self.op == "in":
+            return actual in {_scalar_key(value) for value in self.value}
+        bound = _scalar_key(self.value)
+        if actual[0] != bound[0]:
+            return False
+        return {
+            "gt": actual[1] > bound[1],
+            "gte": actual[1] >= bound[1],
+            "lt": actual[1] < bound[1],
+            "lte": actual[1] <= bound[1]
+        }[self.op]
+
+    def to_milvus_expr(self, field: str) -> str:
+        """编译为 Milvus JSON 字段上的布尔表达式"""
+        target = f"{field}[{json.dumps(self.key, ensure_ascii=False)}]"
+        if self.op == "exists":
+            return f"exists {target}" if self.value else f"not (exists {target})"
+        if self.op == "eq":
+            return f"{target} == {_literal(self.value)}"
+        if self.op == "in":
+            return f"{target} in [{', '.join(_literal(value) for value in self.value)}]"
+        return f"{target} {_RANGE_OPS[self.op]} {_literal(self.value)}"
+
+def _literal(value: Any) -> str:
+    """Milvus 表达式中的字面量，字符串用 JSON 转义"""
+    return json.dumps(value, ensure_ascii=False)
+
+@dataclass(frozen=True)
+class MetadataFilter:
+    """
+    元数据过滤条件，各条件之间为 AND
+
+    用字典描述，值为标量时是相等条件，为字典时按运算符解释：
+        {"source": "a.pdf", "lang": {"in": ["zh", "en"]}, "year": {"gte": 2020, "lt": 2024}}
+    """
+    conditions: Tuple[Condition, ...] = ()
+
+    @classmethod
+    def from_dict(cls, spec: Dict[str, Any]) -> "MetadataFilter":
+        """
+        从字典构造过滤条件
+
+        Raises:
+            ValueError: 当运算符未知、值不是标量或 exists 的值不是布尔值时
+        """
+        conditions = []
+        for key, value in spec.items():
+            ops = value if isinstance(value, dict) else {"eq": value}
+            if not ops:
+                raise ValueError(f"元数据条件为空: {key}")
+            for op, operand in ops.items():
+                if op not in FILTER_OPS:
+                    raise ValueError(f"未知的过滤运算符: {op}")
+                if op == "exists" and not isinstance(operand, bool):
+                    raise ValueError(f"exists 条件的值必须是布尔值: {key}")
+                values = operand if op == "in" else [operand]
+                if op == "in" and not isinstance(operand, (list, tuple)):
+                    raise ValueError(f"in 条件的值必须是列表: {key}")
+                if any(_scalar_key(item) is None for item in values):
+                    raise ValueError(f"过滤值只能是字符串、数值或布尔值: {key}")
+                if op in _RANGE_OPS and isinstance(operand, bool):
+                    raise ValueError(f"区间条件不支持布尔值: {key}")
+                conditions.append(Condition(key, op, tuple(operand) if op == "in" else operand))
+        return cls(tuple(conditions))
+
+    def matches(self, metadata: Dict[str, Any]) -> bool:
+        """元数据是否满足全部条件"""
+        return all(condition.matches(metadata) for condition in self.conditions)
+
+    def to_milvus_expr(self, field: str = "metadata") -> str:
+        """编译为 Milvus 布尔表达式，没有条件时为空字符串"""
+        return " and ".join(f"({condition.to_milvus_expr(field)})" for condition in self.conditions)
+
+class MetadataIndex:
+    """
+    元数据倒排索引：键 -> 值 -> 记录ID 集合
+
+    只索引标量值。相等与 in 条件直接查表，区间条件遍历该键下同类型的不同取值，
+    exists 条件取该键下全部取值的并集（或其补集），多个条件的结果取交集，从小的集合开始。
+    """
+
+    def __init__(self):
+        self._postings: Dict[str, Dict[Tuple[str, Any], Set[int]]] = defaultdict(dict)
+        # 全部记录，exists 为 False 时取补集
+        self._ids: Set[int] = set()
+
+    def add(self, record_id: int, metadata: Dict[str, Any]) -> None:
+        self._ids.add(record_id)
+        for key, value in metadata.items():
+            scalar = _scalar_key(value)
+            if scalar is not None:
+                self._postings[key].setdefault(scalar, set()).add(record_id)
+
+    def remove(self, record_id: int, metadata: Dict[str, Any]) -> None:
+        self._ids.discard(record_id)
+        for key, value in metadata.items():
+            scalar = _scalar_key(value)
+            postings = self._postings.get(key)
+            if scalar is None or postings is None or scalar not in postings:
+                continue
+            ids = postings[scalar]
+            ids.discard(record_id)
+            if not ids:
+                del postings[scalar]
+                if not postings:
+                    del self._postings[key]
+
+    def rebuild(self, records: Iterable[Tuple[int, Dict[str, Any]]]) -> None:
+        """按 (记录ID, 元数据) 重建索引"""
+        self._postings = defaultdict(dict)
+        self._ids = set()
+        for record_id, metadata in records:
+            self.add(record_id, metadata)
+
+    def _lookup(self, condition: Condition) -> Set[int]:
+        postings = self._postings.get(condition.key, {})
+        if condition.op == "exists":
+            present = set().union(*postings.values())
+            return present if condition.value else self._ids - present
+        if condition.op == "eq":
+            return postings.get(_scalar_key(condition.value), set())
+        if condition.op == "in":
+            ids: Set[int] = set()
+            for value in condition.value:
+                ids |= postings.get(_scalar_key(value), set())
+            return ids
+        ids = set()
+        for scalar, value_ids in postings.items():
+            if condition.matches({condition.key: scalar[1]}):
+                ids |= value_ids
+        return ids
+
+    def _unrestricted(self, condition: Condition) -> bool:
+        """条件是否对所有记录成立：要求某个没有任何记录带有的键不存在"""
+        return condition.op == "exists" and not condition.value and condition.key not in self._postings
+
+    def select(self, metadata_filter: MetadataFilter) -> Optional[Set[int]]:
+        """
+        满足全部条件的记录ID
+
+        过滤不限制任何记录时（没有条件，或只要求索引中不存在的键不存在）返回 None，
+        调用方应按不过滤处理，避免把全部记录当作候选集。
+        """
+        conditions = [condition for condition in metadata_filter.conditions if not self._unrestricted(condition)]
+        if not conditions:
+            return None
+        matched: Optional[Set[int]] = None
+        for ids in sorted((self._lookup(condition) for condition in conditions), key=len):
+            matched = set(ids) if matched is None else matched & ids
+            if not matched:
+                return set()
+        return matched
@@ -0,0 +1,92 @@
+import math
+import threading
+from typing import Callable, Optional, Sequence
+
+from loguru import logger
+
+# IVF 每个聚类中心建议的最少训练样本数（少于此数 faiss 会告警）
+MIN_POINTS_PER_CENTROID = 39
+
+def suggested_nlist(num_vectors: int) -> int:
+    """按语料规模选择聚类中心数：约 4*sqrt(n)，且每个中心至少有足够的训练样本"""
+    nlist = int(4 * math.sqrt(max(num_vectors, 1)))
+    return max(1, min(nlist, num_vectors // MIN_POINTS_PER_CENTROID))
+
+def imbalance_factor(list_sizes: Sequence[int]) -> float:
+    """
+    倒排表的不均衡因子（与 faiss 的定义一致）
+
+    nlist * sum(size^2) / sum(size)^2，各列表一样大时为 1，
+    越大说明检索时越容易落到超长的列表上。
+    """
+    total = sum(list_sizes)
+    if not total:
+        return 1.0
+    return len(list_sizes) * sum(size * size for size in list_sizes) / (total * total)
+
+def retrain_reason(
+    nlist: int,
+    num_vectors: int,
+    list_sizes: Optional[Sequence[int]] = None,
+    target_nlist: Optional[int] = None,
+    max_imbalance: float = 3.0,
+    max_nlist_drift: float = 2.0
+) -> Optional[str]:
+    """
+    判断 IVF 索引是否需要重新训练
+
+    Args:
+        nlist: 当前聚类中心数
+        num_vectors: 当前向量数
+        list_sizes: 各倒排表的长度，无法获取时为 None
+        target_nlist: 期望的聚类中心数，None 时按语料规模选择
+        max_imbalance: 允许的最大不均衡因子
+        max_nlist_drift: 当前与期望聚类中心数之比允许的最大偏离倍数
+
+    Returns:
+        Optional[str]: 需要重训的原因，不需要时为 None
+    """
+    if list_sizes is not None:
+        factor = imbalance_factor(list_sizes)
+        if factor > max_imbalance:
+            return f"倒排表不均衡因子 {factor:.2f} 超过 {max_imbalance}"
+    target = target_nlist or suggested_nlist(num_vectors)
+    drift = max(target / nlist, nlist / target)
+    if drift >= max_nlist_drift:
+        return f"聚类中心数 {nlist} 与语料规模 {num_vectors} 不匹配（建议 {target}）"
+    return None
+
+class PeriodicTask:
+    """在后台线程中按固定间隔执行任务，任务异常只记录日志"""
+
+    def __init__(self, name: str, interval: float, fn: Callable[[], object]):
+        """
+        Args:
+            name: 线程名
+            interval: 执行间隔（秒）
+            fn: 要执行的任务
+        """
+        self.name = name
+        self.interval = interval
+        self.fn = fn
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """启动后台线程"""
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.fn()
+            except Exception as e:
+                logger.error(f"后台任务 {self.name} 执行失败: {e}")
+
+    def stop(self) -> None:
+        """停止并等待当前一次执行结束"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
@@ -0,0 +1,128 @@
+import asyncio
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from loguru import logger
+from pymilvus import connections
+
+class MilvusConnectionPool:
+    """
+    Milvus 连接池
+
+    pymilvus 的调用都是阻塞的，直接在协程里调用会卡住事件循环。
+    连接池建立固定数量的命名连接，并配一个同样大小的专用线程池：
+    每个线程固定使用其中一个连接，阻塞调用都提交到线程池执行。
+    并发调用数受线程池大小限制，超出的调用排队等待，不会占用事件循环。
+    """
+
+    def __init__(self, host: str, port: int, size: int = 4, name: str = "milvus"):
+        """
+        建立连接并启动线程池
+
+        Args:
+            host: Milvus 地址
+            port: Milvus 端口
+            size: 连接数，也是线程池大小
+            name: 连接名前缀，连接名为 "{name}-{i}"
+        """
+        self.size = max(1, size)
+        self.aliases: List[str] = [f"{name}-{i}" for i in range(self.size)]
+        for alias in self.aliases:
+            connections.connect(alias=alias, host=host, port=port)
+
+        self._local = threading.local()
+        self._alias_ids = itertools.count()
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.size,
+            thread_name_prefix=name,
+            initializer=self._bind_alias
+        )
+        self._lock = threading.Lock()
+        self._closed = False
+        self._inflight = 0
+        self._completed = 0
+        self._failed = 0
+        self._timeouts = 0
+        self._cancelled = 0
+        self._total_latency = 0.0
+
+    def _bind_alias(self) -> None:
+        """线程池初始化：给每个线程分配一个连接"""
+        self._local.alias = self.aliases[next(self._alias_ids) % self.size]
+
+    @property
+    def alias(self) -> str:
+        """当前线程使用的连接名，线程池外的线程（如后台维护）使用第一个连接"""
+        return getattr(self._local, "alias", self.aliases[0])
+
+    async def run(self, fn: Callable[..., Any], *args, timeout: Optional[float] = None, **kwargs) -> Any:
+        """
+        在线程池中执行阻塞调用
+
+        超时或调用方被取消时，尚未开始的调用不再执行；已经开始的调用无法中断，
+        调用方应同时把 timeout 传给 pymilvus，让请求在服务端超时。
+
+        Args:
+            fn: 阻塞函数
+            timeout: 等待的最长时间（秒），None 表示不限
+
+        Raises:
+            asyncio.TimeoutError: 当超时时
+        """
+        if self._closed:
+            raise RuntimeError("Milvus连接池已关闭")
+        future = self._executor.submit(fn, *args, **kwargs)
+        with self._lock:
+            self._inflight += 1
+        start = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                self._timeouts += 1
+            logger.warning(f"Milvus调用超时（{timeout}s）: {getattr(fn, '__name__', fn)}")
+            raise
+        except asyncio.CancelledError:
+            with self._lock:
+                self._cancelled += 1
+            raise
+        except Exception:
+            with self._lock:
+                self._failed += 1
+            raise
+        else:
+            # 完成数和平均延迟只统计成功的调用
+            with self._lock:
+                self._completed += 1
+                self._total_latency += time.perf_counter() - start
+        finally:
+            with self._lock:
+                self._inflight -= 1
+        return result
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取连接池统计信息"""
+        with self._lock:
+            completed = self._completed
+            return {
+                "connections": self.size,
+                "inflight": self._inflight,
+                "queue_depth": max(self._inflight - self.size, 0),
+                "completed": completed,
+                "failed": self._failed,
+                "timeouts": self._timeouts,
+                "cancelled": self._cancelled,
+                "avg_latency_ms": self._total_latency * 1000 / completed if completed else 0.0
+            }
+
+    def close(self) -> None:
+        """等待执行中的调用结束，取消排队的调用并断开所有连接"""
+        if self._closed:
+            return
+        self._closed = True
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        for alias in self.aliases:
+            connections.disconnect(alias)
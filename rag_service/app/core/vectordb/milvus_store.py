@@ -1,124 +1,855 @@
+import asyncio
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
 from typing import List, Dict, Any, Optional
 import numpy as np
+from loguru import logger
 from pymilvus import (
-    connections,
     Collection,
     CollectionSchema,
     FieldSchema,
     DataType,
+    MilvusException,
     utility
 )
 
 from rag_service.config.settings import settings
+from rag_service.app.core.llm.base import BaseLLMService
 from rag_service.app.core.vectordb.base import BaseVectorDB
+from rag_service.app.core.vectordb.filters import MetadataFilter
+from rag_service.app.core.vectordb.maintenance import (
+    MIN_POINTS_PER_CENTROID,
+    PeriodicTask,
+    retrain_reason,
+    suggested_nlist
+)
+from rag_service.app.core.vectordb.milvus_pool import MilvusConnectionPool
+from rag_service.app.core.vectordb.search_params import SearchParams
+
+# 客户端生成ID的起始时间（2024-01-01 UTC，毫秒）
+_ID_EPOCH_MS = 1704067200000
+
+# 单次 search 调用允许的最大查询数（Milvus 默认的 nq 上限）
+_MAX_NQ = 16384
+
+# 检索耗时滑动平均的权重
+_COST_SMOOTHING = 0.2
+
+# 未指定命名空间时使用 Milvus 的默认分区，旧部署的数据都在其中
+DEFAULT_PARTITION = "_default"
+_PARTITION_NAME = re.compile(r"[A-Za-z0-9_]{1,64}")
+
+def partition_name(namespace: Optional[str]) -> str:
+    """命名空间对应的分区名，不符合 Milvus 命名规则的命名空间使用其哈希"""
+    if namespace is None:
+        return DEFAULT_PARTITION
+    if _PARTITION_NAME.fullmatch(namespace):
+        return f"ns_{namespace}"
+    return f"nsh_{hashlib.blake2b(namespace.encode('utf-8'), digest_size=16).hexdigest()}"
+
+def _not_loaded(error: MilvusException) -> bool:
+    """错误是否因为集合或分区未加载"""
+    return error.code == 101 or "not loaded" in str(error).lower()
 
 class MilvusStore(BaseVectorDB):
-    def __init__(self, embeddings):
+    """
+    Milvus 向量存储
+
+    collection_name 是指向实际集合的别名。IVF 索引的聚类中心数随语料增长会变得不合适，
+    后台维护任务按 INDEX_MAINTENANCE_INTERVAL 检查，需要时新建一个影子集合，
+    复制数据并建好索引后切换别名，检索始终走别名，不会中断。
+    多个进程共用一个集合时，同一时间只有持有维护锁（别名 {collection_name}_maintenance）的进程重建。
+
+    所有 pymilvus 调用都经 MilvusConnectionPool 在专用线程池中执行，不阻塞事件循环，
+    每次调用的超时默认为 MILVUS_TIMEOUT，可按调用传入 timeout 覆盖。
+    
+    每个命名空间（租户）一个分区，写入和检索只涉及 namespace 对应的分区，未指定时为默认分区。
+    分区在首次检索时加载，最多同时加载 MILVUS_LOADED_PARTITIONS 个，超出时释放最久未访问的分区。
+    加载状态在服务端对所有进程生效，各进程按各自的访问顺序释放，检索时分区已被其他进程释放的，
+    重新加载后重试一次。
+    Milvus 对单个集合的分区数有上限（rootCoord.maxPartitionNum，默认 1024）。
+    """
+    
+    supports_namespaces = True
+    
+    def __init__(self, embeddings: BaseLLMService, shard: Optional[int] = None):
+        """
+        Args:
+            embeddings: 嵌入服务
+            shard: 分片编号，作为 ShardedStore 的分片时每个分片使用各自的集合
+        """
         self.embeddings = embeddings
-        self.collection_name = "rag_documents"
-        self.dimension = 1536  # OpenAI embeddings维度
-        self._connect()
+        self.collection_name = "rag_documents" if shard is None else f"rag_documents_shard_{shard}"
+        # 向量维度以嵌入模型为准，未知时沿用 OpenAI embeddings 维度
+        self.dimension = embeddings.get_model_info().get("dimension", 1536)
+        # 重建期间写入同时进入影子集合，切换别名时与写入互斥
+        self._lock = threading.RLock()
+        self._shadow: Optional[Collection] = None
+        self._shadow_deleted: List[int] = []
+        self._id_ms = 0
+        self._id_seq = 0
+        # 写缓冲（按列保存）与已插入但尚未 flush 的行数
+        self._reset_buffer()
+        self._unflushed_rows = 0
+        self._stats = {"inserted_rows": 0, "insert_batches": 0, "flushes": 0}
+        # 每个连接各自持有 Collection 对象，切换别名后清空重建
+        self._collections: Dict[str, Collection] = {}
+        # 已确认存在的分区（调用方需持有 _lock）
+        self._partitions: set = set()
+        # 已加载的分区按访问顺序排列，正在检索的分区不释放
+        self._loaded: "OrderedDict[str, None]" = OrderedDict()
+        self._partition_users: Counter = Counter()
+        self._load_lock = threading.Lock()
+        # 段信息由后台刷新，get_stats 返回最近一次的结果
+        self._segment_stats: Dict[str, Any] = {}
+        self._segment_refresh: Optional[asyncio.Task] = None
+        # 每个查询每单位 nprobe 的平均检索耗时（毫秒），用于按耗时预算确定 nprobe
+        self._search_cost: Optional[float] = None
+        self.pool = MilvusConnectionPool(
+            settings.MILVUS_HOST,
+            settings.MILVUS_PORT,
+            size=settings.MILVUS_POOL_SIZE,
+            name=f"rag-{self.collection_name}"
+        )
         self._init_collection()
+        self._flusher: Optional[PeriodicTask] = None
+        if self._buffered:
+            self._flusher = PeriodicTask("milvus-flush", settings.MILVUS_FLUSH_INTERVAL, self._commit)
+            self._flusher.start()
+        self._maintenance: Optional[PeriodicTask] = None
+        if settings.INDEX_MAINTENANCE_INTERVAL > 0:
+            self._maintenance = PeriodicTask("milvus-maintenance", settings.INDEX_MAINTENANCE_INTERVAL, self.maintain)
+            self._maintenance.start()
     
-    def _connect(self):
-        """连接到Milvus服务器"""
-        connections.connect(
-            host=settings.MILVUS_HOST,
-            port=settings.MILVUS_PORT
-        )
+    @property
+    def _buffered(self) -> bool:
+        """是否开启写缓冲"""
+        return settings.MILVUS_WRITE_BUFFER_ROWS > 0
+    
+    @property
+    def alias(self) -> str:
+        """当前线程使用的连接名"""
+        return self.pool.alias
+    
+    @property
+    def collection(self) -> Collection:
+        """当前线程所用连接上的集合（按 collection_name 别名访问）"""
+        collection = self._collections.get(self.alias)
+        if collection is None:
+            collection = self._collections[self.alias] = Collection(self.collection_name, using=self.alias)
+        return collection
     
     def _init_collection(self):
-        """初始化集合"""
-        if utility.has_collection(self.collection_name):
-            self.collection = Collection(self.collection_name)
+        """初始化集合：新部署创建实际集合并用 collection_name 作为别名"""
+        if utility.has_collection(self.collection_name, using=self.alias):
             return
         
+        # 开启写缓冲时由客户端生成ID，插入前就能返回
+        physical = self._create_collection(settings.MILVUS_IVF_NLIST, auto_id=not self._buffered)
+        utility.create_alias(physical.name, self.collection_name, using=self.alias)
+    
+    def _create_collection(self, nlist: int, auto_id: bool) -> Collection:
+        """创建一个带 IVF_FLAT 索引的实际集合，名称带时间戳"""
         fields = [
-            FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=True),
+            FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=auto_id),
             FieldSchema(name="text", dtype=DataType.VARCHAR, max_length=65535),
             FieldSchema(name="embedding", dtype=DataType.FLOAT_VECTOR, dim=self.dimension),
             FieldSchema(name="metadata", dtype=DataType.JSON)
         ]
         
         schema = CollectionSchema(fields=fields, description="RAG documents collection")
-        self.collection = Collection(name=self.collection_name, schema=schema)
+        collection = Collection(name=f"{self.collection_name}_{time.time_ns()}", schema=schema, using=self.alias)
         
         # 创建索引
         index_params = {
             "metric_type": "L2",
             "index_type": "IVF_FLAT",
-            "params": {"nlist": 1024}
+            "params": {"nlist": nlist}
         }
-        self.collection.create_index(field_name="embedding", index_params=index_params)
+        collection.create_index(field_name="embedding", index_params=index_params)
+        return collection
+    
+    def _physical_name(self) -> str:
+        """别名当前指向的实际集合名"""
+        return self.collection.describe()["collection_name"]
     
-    async def add_texts(
+    def _uses_alias(self) -> bool:
+        """collection_name 是否为别名（旧部署中可能是实际集合）"""
+        return self._physical_name() != self.collection_name
+    
+    def _current_nlist(self) -> int:
+        """当前向量索引的聚类中心数"""
+        index = self.collection.index(index_name="")
+        return int(index.params.get("params", {}).get("nlist", settings.MILVUS_IVF_NLIST))
+    
+    def _generate_ids(self, n: int) -> List[int]:
+        """
+        为非 auto_id 的集合生成 64 位ID
+        
+        毫秒时间戳（41 位）| 进程号（10 位）| 序号（12 位），同一毫秒内序号用完时借用下一毫秒。
+        """
+        ids = []
+        worker = os.getpid() & 0x3FF
+        with self._lock:
+            for _ in range(n):
+                now = int(time.time() * 1000)
+                if now > self._id_ms:
+                    self._id_ms, self._id_seq = now, 0
+                elif self._id_seq < 0xFFF:
+                    self._id_seq += 1
+                else:
+                    self._id_ms, self._id_seq = self._id_ms + 1, 0
+                ids.append((self._id_ms - _ID_EPOCH_MS) << 22 | worker << 12 | self._id_seq)
+        return ids
+    
+    def _swap_in(self, shadow: Collection, drop_old: bool = True) -> str:
+        """
+        把别名切换到影子集合（调用方需持有锁）
+
+        Args:
+            shadow: 新集合
+            drop_old: 是否立即删除旧集合
+
+        Returns:
+            str: 旧集合名
+        """
+        old_name = self._physical_name()
+        if self._uses_alias():
+            utility.alter_alias(shadow.name, self.collection_name, using=self.alias)
+        else:
+            # 旧部署的 collection_name 是实际集合，删除后才能建同名别名，期间检索会短暂失败
+            utility.drop_collection(old_name, using=self.alias)
+            utility.create_alias(shadow.name, self.collection_name, using=self.alias)
+        # 新集合的 schema 可能不同（如 auto_id），各连接重新获取
+        self._collections.clear()
+        self._partitions.clear()
+        if drop_old and old_name != self.collection_name:
+            utility.drop_collection(old_name, using=self.alias)
+        return old_name
+    
+    @property
+    def _maintenance_alias(self) -> str:
+        return f"{self.collection_name}_maintenance"
+    
+    def _lock_maintenance(self, shadow: Collection) -> bool:
+        """
+        获取跨进程的维护锁：创建指向影子集合的别名，别名已存在时说明其他进程正在重建
+        
+        影子集合名带创建时间，持有者崩溃后锁超过 MILVUS_MAINTENANCE_LOCK_TTL 视为失效，
+        连同遗留的影子集合一起清理后重新获取。
+        """
+        lock = self._maintenance_alias
+        try:
+            utility.create_alias(shadow.name, lock, using=self.alias)
+            return True
+        except MilvusException:
+            pass
+        try:
+            holder = Collection(lock, using=self.alias).describe()["collection_name"]
+        except MilvusException:
+            # 锁刚被释放，下个维护周期再试
+            return False
+        try:
+            started = int(holder.rsplit("_", 1)[-1]) / 1e9
+        except ValueError:
+            started = 0.0
+        if time.time() - started < settings.MILVUS_MAINTENANCE_LOCK_TTL:
+            logger.info(f"Milvus 集合 {self.collection_name} 正在由其他进程重建（{holder}），跳过")
+            return False
+        logger.warning(f"Milvus 维护锁已过期，清理遗留的影子集合 {holder}")
+        utility.drop_alias(lock, using=self.alias)
+        if holder != self._physical_name():
+            utility.drop_collection(holder, using=self.alias)
+        try:
+            utility.create_alias(shadow.name, lock, using=self.alias)
+            return True
+        except MilvusException:
+            return False
+    
+    def maintain(self, force: bool = False) -> bool:
+        """
+        检查聚类中心数是否与语料规模匹配，需要时重建到影子集合并切换别名
+        
+        Milvus 不提供倒排表长度，这里只按行数判断聚类中心数是否偏离；
+        行数不足以训练 MILVUS_IVF_NLIST 个聚类中心时不重建（小段由 Milvus 直接暴力检索）。
+        
+        本进程在复制期间的写入和删除同时作用于影子集合。其他进程照常写旧集合，
+        复制完成后按主键比对旧集合，补上新增的行、删掉已删除的行；切换别名后
+        再等一个调用超时（MILVUS_TIMEOUT），让切换前发出的写入结束，比对一次后才删除旧集合。
+        
+        Args:
+            force: 不检查直接重建
+        
+        Returns:
+            bool: 是否切换了集合
+        """
+        # num_entities 只统计已 flush 的行
+        self._commit()
+        num_rows = self.collection.num_entities
+        if not force and num_rows < MIN_POINTS_PER_CENTROID * settings.MILVUS_IVF_NLIST:
+            return False
+        nlist = self._current_nlist()
+        reason = "手动触发" if force else retrain_reason(
+            nlist,
+            num_rows,
+            max_nlist_drift=settings.IVF_MAX_NLIST_DRIFT
+        )
+        if reason is None:
+            return False
+        target_nlist = suggested_nlist(num_rows)
+        
+        # 影子集合由客户端指定主键，旧数据保留原来的ID
+        shadow = self._create_collection(target_nlist, auto_id=False)
+        if not self._lock_maintenance(shadow):
+            utility.drop_collection(shadow.name, using=self.alias)
+            return False
+        logger.info(f"重建 Milvus 集合（{reason}）: nlist {nlist} -> {target_nlist}, {num_rows} 行")
+        old = Collection(self._physical_name(), using=self.alias)
+        swapped = False
+        try:
+            with self._lock:
+                self._shadow = shadow
+                self._shadow_deleted = []
+            copied: Dict[str, set] = {}
+            for partition in old.partitions:
+                self._acquire_partition(partition.name)
+                try:
+                    copied[partition.name] = self._copy_partition(old, partition.name, shadow)
+                finally:
+                    self._release_partition(partition.name)
+            self._catch_up(old, shadow, copied)
+            shadow.flush()
+            utility.wait_for_index_building_complete(shadow.name, using=self.alias)
+            with self._load_lock:
+                hot = list(self._loaded)
+            if hot:
+                shadow.load(partition_names=hot)
+            
+            with self._lock, self._load_lock:
+                # 复制过程中可能把刚删除的行又写了进去
+                if self._shadow_deleted:
+                    shadow.delete(self._id_expr(self._shadow_deleted))
+                # 切换后已加载的分区保持可检索
+                missing = [name for name in self._loaded if name not in hot]
+                if missing:
+                    shadow.load(partition_names=missing)
+                self._swap_in(shadow, drop_old=False)
+                self._shadow = None
+                swapped = True
+            logger.info(f"Milvus 别名 {self.collection_name} 已切换到 {shadow.name}")
+            
+            # 旧部署的 collection_name 是实际集合，切换时已经删除
+            if old.name != self.collection_name:
+                time.sleep(settings.MILVUS_TIMEOUT or 0)
+                self._catch_up(old, shadow, copied)
+                utility.drop_collection(old.name, using=self.alias)
+        except Exception:
+            with self._lock:
+                self._shadow = None
+            if not swapped:
+                utility.drop_alias(self._maintenance_alias, using=self.alias)
+                utility.drop_collection(shadow.name, using=self.alias)
+            raise
+        finally:
+            if swapped:
+                utility.drop_alias(self._maintenance_alias, using=self.alias)
+        return True
+    
+    def _copy_partition(self, source: Collection, name: str, shadow: Collection, expr: str = "id >= 0") -> set:
+        """
+        把 source 一个分区中满足 expr 的行复制到影子集合的同名分区（调用方需保证分区已加载）
+        
+        Returns:
+            set: 复制的行的主键
+        """
+        with self._lock:
+            if not shadow.has_partition(name):
+                shadow.create_partition(name)
+        copied = set()
+        iterator = source.query_iterator(
+            batch_size=1000,
+            expr=expr,
+            output_fields=["id", "text", "embedding", "metadata"],
+            partition_names=[name],
+            consistency_level="Strong"
+        )
+        while True:
+            rows = iterator.next()
+            if not rows:
+                break
+            # upsert：复制期间同时写入的行不会重复
+            shadow.upsert([
+                [row["id"] for row in rows],
+                [row["text"] for row in rows],
+                np.asarray([row["embedding"] for row in rows], dtype=np.float32),
+                [row["metadata"] for row in rows]
+            ], partition_name=name)
+            copied.update(row["id"] for row in rows)
+        iterator.close()
+        return copied
+    
+    def _catch_up(self, old: Collection, shadow: Collection, copied: Dict[str, set]) -> None:
+        """
+        按主键比对旧集合与已复制的行，补上其他进程在复制期间写入的行，
+        删掉期间被删除的行；copied 更新为旧集合当前的主键
+        """
+        added = removed = 0
+        for partition in old.partitions:
+            name = partition.name
+            with self._load_lock:
+                loaded = name in self._loaded
+            old.load(partition_names=[name])
+            try:
+                current = set()
+                iterator = old.query_iterator(
+                    batch_size=10000,
+                    expr="id >= 0",
+                    output_fields=["id"],
+                    partition_names=[name],
+                    consistency_level="Strong"
+                )
+                while True:
+                    rows = iterator.next()
+                    if not rows:
+                        break
+                    current.update(row["id"] for row in rows)
+                iterator.close()
+                done = copied.get(name, set())
+                new_ids = sorted(current - done)
+                for start in range(0, len(new_ids), 1000):
+                    self._copy_partition(old, name, shadow, self._id_expr(new_ids[start:start + 1000]))
+                gone = sorted(done - current)
+                if gone:
+                    shadow.delete(self._id_expr(gone))
+                copied[name] = current
+                added += len(new_ids)
+                removed += len(gone)
+            finally:
+                if not loaded:
+                    old.partition(name).release()
+        if added or removed:
+            logger.info(f"Milvus 重建补齐其他进程的写入: 新增 {added} 行, 删除 {removed} 行")
+    
+    def _ensure_partition(self, name: str) -> None:
+        """按需创建分区（调用方需持有锁），重建期间影子集合同步创建"""
+        if name not in self._partitions:
+            if not self.collection.has_partition(name):
+                self.collection.create_partition(name)
+                logger.info(f"Milvus 集合 {self.collection_name} 新建分区 {name}")
+            self._partitions.add(name)
+        if self._shadow is not None and not self._shadow.has_partition(name):
+            self._shadow.create_partition(name)
+    
+    def _acquire_partition(self, name: str, timeout: Optional[float] = None) -> bool:
+        """
+        标记分区正在使用，未加载时加载，并按最近访问释放多余的分区
+        
+        Returns:
+            bool: 分区是否存在；返回 True 时调用方用完后需调用 _release_partition
+        """
+        with self._load_lock:
+            self._partition_users[name] += 1
+            if name in self._loaded:
+                self._loaded.move_to_end(name)
+                return True
+        try:
+            # 加载耗时较长，不持有锁；同一分区被并发加载时 Milvus 只加载一次
+            partition = self.collection.partition(name)
+            if partition is None:
+                self._release_partition(name)
+                return False
+            partition.load(timeout=timeout)
+        except Exception:
+            self._release_partition(name)
+            raise
+        with self._load_lock:
+            self._loaded[name] = None
+            self._loaded.move_to_end(name)
+            self._evict_partitions()
+        return True
+    
+    def _release_partition(self, name: str) -> None:
+        with self._load_lock:
+            self._partition_users[name] -= 1
+            if self._partition_users[name] <= 0:
+                del self._partition_users[name]
+                # 使用期间超出上限而没能释放的分区，最后一个使用者结束时释放
+                if len(self._loaded) > settings.MILVUS_LOADED_PARTITIONS:
+                    self._evict_partitions()
+    
+    def _evict_partitions(self) -> None:
+        """释放最久未访问、且没有检索在用的分区（调用方需持有 _load_lock）"""
+        for name in list(self._loaded):
+            if len(self._loaded) <= settings.MILVUS_LOADED_PARTITIONS:
+                break
+            if self._partition_users[name]:
+                continue
+            partition = self.collection.partition(name)
+            try:
+                if partition is not None:
+                    partition.release()
+            except MilvusException as e:
+                logger.warning(f"释放 Milvus 分区 {name} 失败: {e}")
+            del self._loaded[name]
+            logger.debug(f"Milvus 分区 {name} 已释放")
+    
+    @staticmethod
+    def _id_expr(ids: List[int]) -> str:
+        return f"id in [{', '.join(str(int(i)) for i in ids)}]"
+    
+    def _insert_rows(
         self,
+        ids: Optional[List[int]],
         texts: List[str],
+        vectors: np.ndarray,
+        metadatas: List[Dict[str, Any]],
+        partition: str = DEFAULT_PARTITION,
+        timeout: Optional[float] = None
+    ) -> List[int]:
+        """按列插入一批记录到分区（调用方需持有锁），重建期间同时写入影子集合"""
+        self._ensure_partition(partition)
+        if ids is None:
+            result = self.collection.insert([texts, vectors, metadatas], partition_name=partition, timeout=timeout)
+            ids = list(result.primary_keys)
+        else:
+            self.collection.insert([ids, texts, vectors, metadatas], partition_name=partition, timeout=timeout)
+        if self._shadow is not None:
+            self._shadow.upsert([ids, texts, vectors, metadatas], partition_name=partition)
+        self._unflushed_rows += len(ids)
+        self._stats["inserted_rows"] += len(ids)
+        self._stats["insert_batches"] += 1
+        return ids
+    
+    def _drain(self) -> None:
+        """把写缓冲中的记录按分区合成批次插入（调用方需持有锁）"""
+        if not self._buffer_ids:
+            return
+        vectors = np.concatenate(self._buffer_vectors)
+        groups: Dict[str, List[int]] = {}
+        for i, partition in enumerate(self._buffer_partitions):
+            groups.setdefault(partition, []).append(i)
+        for partition, rows in groups.items():
+            self._insert_rows(
+                [self._buffer_ids[i] for i in rows],
+                [self._buffer_texts[i] for i in rows],
+                vectors[rows],
+                [self._buffer_metadatas[i] for i in rows],
+                partition
+            )
+        self._reset_buffer()
+    
+    def _reset_buffer(self) -> None:
+        self._buffer_ids: List[int] = []
+        self._buffer_texts: List[str] = []
+        self._buffer_vectors: List[np.ndarray] = []
+        self._buffer_metadatas: List[Dict[str, Any]] = []
+        self._buffer_partitions: List[str] = []
+    
+    def _flush(self) -> None:
+        """封存已插入的数据（调用方需持有锁）"""
+        if not self._unflushed_rows:
+            return
+        self.collection.flush()
+        self._unflushed_rows = 0
+        self._stats["flushes"] += 1
+    
+    def _commit(self) -> None:
+        with self._lock:
+            self._drain()
+            self._flush()
+    
+    async def commit(self) -> None:
+        """插入写缓冲中的全部记录并 flush"""
+        await self.pool.run(self._commit)
+    
+    @staticmethod
+    def _timeout(kwargs: Dict[str, Any]) -> Optional[float]:
+        """调用的超时时间：kwargs 中的 timeout，未指定时为 MILVUS_TIMEOUT"""
+        return kwargs.get("timeout", settings.MILVUS_TIMEOUT)
+    
+    async def add_vectors(
+        self,
+        texts: List[str],
+        vectors: np.ndarray,
         metadatas: Optional[List[Dict[str, Any]]] = None,
         **kwargs
     ) -> List[str]:
-        """添加文本到向量数据库"""
-        if not metadatas:
-            metadatas = [{"source": f"doc_{i}"} for i in range(len(texts))]
+        """
+        添加已计算好嵌入的文本
         
-        # 获取文本的嵌入向量
-        embeddings = await self.embeddings.aembed_documents(texts)
+        未开启写缓冲时每次调用都插入并 flush。开启后记录先进入写缓冲，
+        攒够 MILVUS_WRITE_BUFFER_ROWS 行再合成一批插入，已插入的行攒够 MILVUS_FLUSH_ROWS
+        或超过 MILVUS_FLUSH_INTERVAL 秒才 flush，也可以调用 commit() 立即落盘。
+        缓冲中的记录在插入前检索不到。
         
-        # 准备数据
-        entities = [
-            {"text": text, "embedding": embedding, "metadata": metadata}
-            for text, embedding, metadata in zip(texts, embeddings, metadatas)
-        ]
-        
-        # 插入数据
-        self.collection.insert(entities)
-        self.collection.flush()
+        记录写入 namespace（通过 kwargs 传入）对应的分区，分区不存在时创建。
+        超时只表示不再等待，已经开始的插入仍可能成功。
+        """
+        if not metadatas:
+            metadatas = [{"source": f"doc_{i}"} for i in range(len(texts))]
         
-        return [str(i) for i in range(len(texts))]
+        # 按列插入，向量列直接传入 float32 数组
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        timeout = self._timeout(kwargs)
+        partition = partition_name(kwargs.get("namespace"))
+        primary_keys = await self.pool.run(
+            self._add_rows, texts, vectors, metadatas, partition, timeout, timeout=timeout
+        )
+        return [str(pk) for pk in primary_keys]
     
-    async def similarity_search(
+    def _add_rows(
         self,
-        query: str,
+        texts: List[str],
+        vectors: np.ndarray,
+        metadatas: List[Dict[str, Any]],
+        partition: str,
+        timeout: Optional[float]
+    ) -> List[int]:
+        """写入或缓冲一批记录，在连接池线程中执行"""
+        with self._lock:
+            auto_id = self.collection.schema.auto_id
+            if settings.MILVUS_WRITE_BUFFER_ROWS <= 0:
+                primary_keys = self._insert_rows(
+                    None if auto_id else self._generate_ids(len(texts)), texts, vectors, metadatas, partition, timeout
+                )
+                self._flush()
+            elif auto_id:
+                # 服务端生成ID时插入后才知道ID，只能逐次插入，但仍然省掉 flush
+                primary_keys = self._insert_rows(None, texts, vectors, metadatas, partition, timeout)
+            else:
+                primary_keys = self._generate_ids(len(texts))
+                self._buffer_ids.extend(primary_keys)
+                self._buffer_texts.extend(texts)
+                self._buffer_vectors.append(vectors)
+                self._buffer_metadatas.extend(metadatas)
+                self._buffer_partitions.extend([partition] * len(texts))
+                if len(self._buffer_ids) >= settings.MILVUS_WRITE_BUFFER_ROWS:
+                    self._drain()
+            if self._unflushed_rows >= settings.MILVUS_FLUSH_ROWS:
+                self._flush()
+        return primary_keys
+    
+    async def search_vectors(
+        self,
+        vectors: np.ndarray,
         k: int = 4,
         **kwargs
-    ) -> List[Dict[str, Any]]:
-        """相似度搜索"""
-        # 获取查询文本的嵌入向量
-        query_embedding = await self.embeddings.aembed_documents([query])
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        按查询向量搜索
         
+        params.nprobe 默认为 MILVUS_NPROBE；集合使用 IVF_FLAT 索引，params.ef 不起作用。
+        params.latency_budget_ms 与 FAISS 一样只用于降低 nprobe，不会中断检索，超时仍为 timeout。
+        filter（MetadataFilter）编译为 metadata JSON 字段上的布尔表达式，由 Milvus 在检索时过滤。
+        只检索 namespace 对应的分区，命名空间还没有数据时返回空结果。
+        
+        Raises:
+            asyncio.TimeoutError: 超过 timeout（默认 MILVUS_TIMEOUT）仍未返回时
+        """
+        params: SearchParams = kwargs.get("params") or SearchParams()
+        timeout = self._timeout(kwargs)
+        nprobe = self._search_effort(params, len(vectors))
+        metadata_filter: Optional[MetadataFilter] = kwargs.get("filter")
+        expr = metadata_filter.to_milvus_expr() if metadata_filter is not None else ""
+        partition = partition_name(kwargs.get("namespace"))
+        return await self.pool.run(
+            self._search, vectors, k, nprobe, expr or None, partition, timeout, timeout=timeout
+        )
+    
+    def _search_effort(self, params: SearchParams, num_queries: int) -> int:
+        """
+        确定本次检索的 nprobe
+
+        未指定时为 MILVUS_NPROBE。指定了耗时预算时，按历史上每单位 nprobe 的耗时
+        估算预算内能承受的最大值，不低于 1。
+        """
+        nprobe = params.nprobe or settings.MILVUS_NPROBE
+        cost = self._search_cost
+        if params.latency_budget_ms is not None and cost:
+            nprobe = max(1, min(nprobe, int(params.latency_budget_ms / (cost * num_queries))))
+        return nprobe
+
+    def _record_search_cost(self, nprobe: int, num_queries: int, seconds: float) -> None:
+        """更新每单位 nprobe 的平均检索耗时"""
+        sample = seconds * 1000 / (num_queries * max(nprobe, 1))
+        cost = self._search_cost
+        self._search_cost = sample if cost is None else cost + _COST_SMOOTHING * (sample - cost)
+
+    def _search(
+        self,
+        vectors: np.ndarray,
+        k: int,
+        nprobe: int,
+        expr: Optional[str],
+        partition: str,
+        timeout: Optional[float]
+    ) -> List[List[Dict[str, Any]]]:
+        """执行搜索，在连接池线程中执行；查询数超过 Milvus 的 nq 上限时分批"""
+        if not self._acquire_partition(partition, timeout):
+            return [[] for _ in vectors]
+        try:
+            try:
+                return self._search_partition(vectors, k, nprobe, expr, partition, timeout)
+            except MilvusException as e:
+                if not _not_loaded(e):
+                    raise
+                # 其他进程按自己的访问顺序释放了该分区
+                logger.info(f"Milvus 分区 {partition} 已被释放，重新加载后重试")
+                self.collection.partition(partition).load(timeout=timeout)
+                return self._search_partition(vectors, k, nprobe, expr, partition, timeout)
+        finally:
+            self._release_partition(partition)
+    
+    def _search_partition(
+        self,
+        vectors: np.ndarray,
+        k: int,
+        nprobe: int,
+        expr: Optional[str],
+        partition: str,
+        timeout: Optional[float]
+    ) -> List[List[Dict[str, Any]]]:
         # 搜索参数
         search_params = {
             "metric_type": "L2",
-            "params": {"nprobe": 10}
+            "params": {"nprobe": nprobe}
         }
         
-        # 执行搜索
-        results = self.collection.search(
-            data=query_embedding,
-            anns_field="embedding",
-            param=search_params,
-            limit=k,
-            output_fields=["text", "metadata"]
-        )
-        
-        # 格式化结果
-        docs = []
-        for hits in results:
-            for hit in hits:
-                docs.append({
-                    "text": hit.entity.get("text"),
-                    "metadata": hit.entity.get("metadata"),
-                    "score": hit.distance
-                })
-        
-        return docs
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        results = []
+        for start in range(0, len(vectors), _MAX_NQ):
+            # 执行搜索
+            began = time.perf_counter()
+            hits_per_query = self.collection.search(
+                data=vectors[start:start + _MAX_NQ],
+                anns_field="embedding",
+                param=search_params,
+                limit=k,
+                expr=expr,
+                partition_names=[partition],
+                output_fields=["text", "metadata"],
+                timeout=timeout
+            )
+            self._record_search_cost(nprobe, len(hits_per_query), time.perf_counter() - began)
+            
+            # 格式化结果
+            results.extend(
+                [
+                    {
+                        "id": str(hit.id),
+                        "text": hit.entity.get("text"),
+                        "metadata": hit.entity.get("metadata"),
+                        "score": hit.distance
+                    }
+                    for hit in hits
+                ]
+                for hits in hits_per_query
+            )
+        return results
     
-    async def delete(self, ids: List[str]) -> None:
+    async def delete(self, ids: List[str], **kwargs) -> None:
         """删除向量"""
-        expr = f'id in {ids}'
-        self.collection.delete(expr)
+        if not ids:
+            return
+        timeout = self._timeout(kwargs)
+        await self.pool.run(self._delete, [int(i) for i in ids], timeout, timeout=timeout)
+    
+    def _delete(self, int_ids: List[int], timeout: Optional[float]) -> None:
+        """删除记录（含写缓冲和影子集合中的），在连接池线程中执行"""
+        expr = self._id_expr(int_ids)
+        with self._lock:
+            self._discard_buffered(set(int_ids))
+            self.collection.delete(expr, timeout=timeout)
+            if self._shadow is not None:
+                self._shadow.delete(expr)
+                self._shadow_deleted.extend(int_ids)
+    
+    def _discard_buffered(self, ids: set) -> None:
+        """从写缓冲中去掉要删除的记录（调用方需持有锁）"""
+        if not ids.intersection(self._buffer_ids):
+            return
+        keep = [i for i, pk in enumerate(self._buffer_ids) if pk not in ids]
+        vectors = np.concatenate(self._buffer_vectors)[keep]
+        self._buffer_ids = [self._buffer_ids[i] for i in keep]
+        self._buffer_texts = [self._buffer_texts[i] for i in keep]
+        self._buffer_vectors = [vectors] if keep else []
+        self._buffer_metadatas = [self._buffer_metadatas[i] for i in keep]
+        self._buffer_partitions = [self._buffer_partitions[i] for i in keep]
     
     async def clear(self) -> None:
-        """清空数据库"""
-        utility.drop_collection(self.collection_name)
-        self._init_collection() 
\ No newline at end of file
+        """清空数据库：换上一个空集合"""
+        await self.pool.run(self._clear)
+    
+    def _clear(self) -> None:
+        with self._lock:
+            self._reset_buffer()
+            self._unflushed_rows = 0
+            empty = self._create_collection(settings.MILVUS_IVF_NLIST, auto_id=not self._buffered)
+            empty.load(partition_names=[DEFAULT_PARTITION])
+            with self._load_lock:
+                self._swap_in(empty)
+                self._loaded = OrderedDict.fromkeys([DEFAULT_PARTITION])
+    
+    async def warmup(self) -> None:
+        """将默认分区加载到内存，避免首次搜索时加载；其他命名空间的分区在首次检索时加载"""
+        await self.pool.run(self._warmup)
+    
+    def _warmup(self) -> None:
+        if self._acquire_partition(DEFAULT_PARTITION):
+            self._release_partition(DEFAULT_PARTITION)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        写入指标（缓冲/未 flush 的行数与已加载的段数）和连接池指标
+        
+        段信息要查询 Milvus，在事件循环中调用时经连接池在后台刷新，这里返回上一次刷新的结果。
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["pending_rows"] = len(self._buffer_ids)
+            stats["unflushed_rows"] = self._unflushed_rows
+        with self._load_lock:
+            stats["loaded_partitions"] = list(self._loaded)
+        stats["pool"] = self.pool.get_stats()
+        stats.update(self._segment_stats)
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        if loop is not None and (self._segment_refresh is None or self._segment_refresh.done()):
+            self._segment_refresh = loop.create_task(self._refresh_segment_stats())
+        return stats
+    
+    async def _refresh_segment_stats(self) -> None:
+        try:
+            self._segment_stats = await self.pool.run(self._segment_info, timeout=settings.MILVUS_TIMEOUT)
+        except Exception as e:
+            logger.warning(f"获取Milvus段信息失败: {e}")
+    
+    def _segment_info(self) -> Dict[str, Any]:
+        """已加载的段数与平均行数，在连接池线程中执行"""
+        segments = utility.get_query_segment_info(
+            self._physical_name(),
+            timeout=settings.MILVUS_TIMEOUT,
+            using=self.alias
+        )
+        rows = sum(segment.num_rows for segment in segments)
+        return {"segments": len(segments), "avg_segment_rows": rows / len(segments) if segments else 0.0}
+    
+    async def close(self) -> None:
+        """写入缓冲中的记录，停止后台任务并关闭连接池"""
+        if self._segment_refresh is not None and not self._segment_refresh.done():
+            await self._segment_refresh
+        self._segment_refresh = None
+        if self._flusher is not None:
+            self._flusher.stop()
+            self._flusher = None
+        await self.commit()
+        if self._maintenance is not None:
+            self._maintenance.stop()
+            self._maintenance = None
+        self.pool.close() 
\ No newline at end of file
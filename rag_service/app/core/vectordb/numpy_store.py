@@ -0,0 +1,538 @@
+import asyncio
+import json
+import os
+import shutil
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+
+from rag_service.config.settings import settings
+from rag_service.app.core.llm.base import BaseLLMService
+from rag_service.app.core.vectordb.base import BaseVectorDB
+from rag_service.app.core.vectordb.filters import MetadataFilter, MetadataIndex
+
+STORE_DTYPES = ("float32", "float16", "int8")
+
+# 存储目录中指向当前数据目录的文件
+CURRENT_FILE = "CURRENT"
+VECTORS_FILE = "vectors.f32"
+RECORDS_FILE = "records.jsonl"
+_GENERATION_PREFIX = "gen-"
+
+# 矩阵初始容量（行）与逐块计算距离时每块的行数
+_INITIAL_CAPACITY = 1024
+_SCAN_BLOCK_ROWS = 65536
+
+class GrowableMatrix:
+    """
+    按行追加的连续矩阵，容量不足时按倍数扩容
+
+    指定文件时矩阵以内存映射保存在文件中，文件只追加不修改，扩容时只在文件末尾补零，
+    已经映射的旧视图仍然有效，检索线程持有的引用不会失效。
+    """
+
+    def __init__(self, dimension: int, dtype: str, path: Optional[Path] = None, rows: int = 0):
+        """
+        Args:
+            dimension: 列数
+            dtype: 元素类型
+            path: 映射的文件，None 时保存在内存中
+            rows: 已有的有效行数，内存中的矩阵由调用方填充
+        """
+        self.dimension = dimension
+        self.dtype = np.dtype(dtype)
+        self.path = path
+        self.rows = rows
+        self._data: Optional[np.ndarray] = None
+        self._data = self._allocate(max(rows, _INITIAL_CAPACITY))
+
+    def _allocate(self, capacity: int) -> np.ndarray:
+        if self.path is None:
+            data = np.zeros((capacity, self.dimension), dtype=self.dtype)
+            if self._data is not None:
+                data[:self.rows] = self._data[:self.rows]
+            return data
+        nbytes = capacity * self.dimension * self.dtype.itemsize
+        with open(self.path, "ab") as f:
+            if f.tell() < nbytes:
+                f.truncate(nbytes)
+        return np.memmap(self.path, dtype=self.dtype, mode="r+", shape=(capacity, self.dimension))
+
+    @property
+    def capacity(self) -> int:
+        return len(self._data)
+
+    @property
+    def view(self) -> np.ndarray:
+        """有效行的视图"""
+        return self._data[:self.rows]
+
+    def append(self, values: np.ndarray) -> int:
+        """追加若干行，返回第一行的行号"""
+        start = self.rows
+        if start + len(values) > self.capacity:
+            capacity = self.capacity
+            while capacity < start + len(values):
+                capacity *= 2
+            self._data = self._allocate(capacity)
+        self._data[start:start + len(values)] = values
+        self.rows = start + len(values)
+        return start
+
+    def flush(self) -> None:
+        if isinstance(self._data, np.memmap):
+            self._data.flush()
+
+def quantize_int8(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    按行对称量化为 int8：x ≈ scale * q，scale = max|x| / 127
+
+    按行量化不依赖全局取值范围，新写入的向量不会被截断。
+    """
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+@dataclass(frozen=True)
+class _SearchView:
+    """持锁取得的检索所需数组与文档表，压缩或清空替换矩阵后仍指向取快照时的数据"""
+    vectors: np.ndarray
+    codes: Optional[np.ndarray]
+    scales: Optional[np.ndarray]
+    norms: np.ndarray
+    row_ids: np.ndarray
+    docstore: Dict[int, Tuple[str, Dict[str, Any]]]
+
+def _write_file(path: Path, data: bytes) -> None:
+    """写入并落盘"""
+    with open(path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+class NumpyStore(BaseVectorDB):
+    """
+    基于 NumPy 矩阵的精确检索向量存储，不依赖任何向量库
+
+    原始 float32 向量按行追加在内存映射文件中；检索矩阵按 NUMPY_STORE_DTYPE 保存：
+    - float32：直接检索映射文件，不另占内存
+    - float16 / int8：在内存中保存压缩后的副本，先用它粗排出 k * NUMPY_RESCORE_FACTOR 个候选，
+      再从映射文件读取候选的 float32 向量精确重排
+
+    距离为 L2 平方，用 ||q||² - 2 q·x + ||x||² 计算，其中 q·x 是一次 BLAS 矩阵乘，
+    top-k 用 argpartition 选出。可作为其他近似索引的召回基准。
+
+    记录（ID、行号、文本、元数据）与删除以 JSON 行追加到日志文件，启动时重放。
+    删除只在内存中标记，已删除行超过 NUMPY_MAX_DELETED_RATIO 时重写一份紧凑的数据目录并切换 CURRENT。
+    """
+
+    def __init__(self, embeddings: BaseLLMService, shard: Optional[int] = None):
+        """
+        Args:
+            embeddings: 嵌入服务
+            shard: 分片编号，作为 ShardedStore 的分片时数据保存在 NUMPY_STORE_DIR/shard-<编号>
+        """
+        self.embeddings = embeddings
+        # 向量维度以嵌入模型为准，未知时沿用 OpenAI embeddings 维度
+        self.dimension = embeddings.get_model_info().get("dimension", 1536)
+        if settings.NUMPY_STORE_DTYPE not in STORE_DTYPES:
+            raise ValueError(f"未知的向量存储类型: {settings.NUMPY_STORE_DTYPE}")
+        self.dtype = settings.NUMPY_STORE_DTYPE
+        self.directory = Path(settings.NUMPY_STORE_DIR) if settings.NUMPY_STORE_DIR else None
+        if self.directory is not None and shard is not None:
+            self.directory = self.directory / f"shard-{shard}"
+        # 写入互斥；检索只在取快照时持锁
+        self._lock = threading.RLock()
+        self._log = None
+        self._open(self._current_generation())
+
+    def _current_generation(self) -> Optional[Path]:
+        """当前数据目录，不持久化时返回 None"""
+        if self.directory is None:
+            return None
+        self.directory.mkdir(parents=True, exist_ok=True)
+        try:
+            name = (self.directory / CURRENT_FILE).read_text(encoding="utf-8").strip()
+        except FileNotFoundError:
+            return self._new_generation()
+        return self.directory / name
+
+    def _new_generation(self) -> Path:
+        """创建一个空的数据目录并让 CURRENT 指向它"""
+        name = f"{_GENERATION_PREFIX}{time.time_ns():020d}"
+        (self.directory / name).mkdir()
+        self._switch_generation(name)
+        return self.directory / name
+
+    def _switch_generation(self, name: str) -> None:
+        pointer = self.directory / f"{CURRENT_FILE}.{os.getpid()}.tmp"
+        _write_file(pointer, name.encode("utf-8"))
+        os.replace(pointer, self.directory / CURRENT_FILE)
+
+    def _open(self, generation: Optional[Path]) -> None:
+        """打开数据目录：重放记录日志，映射向量文件并重建检索矩阵"""
+        self.generation = generation
+        self.docstore: Dict[int, Tuple[str, Dict[str, Any]]] = {}
+        self._rows: Dict[int, int] = {}
+        self._metadata_index = MetadataIndex()
+        self._next_id = 0
+        rows = 0
+        if generation is not None:
+            rows = self._replay(generation / RECORDS_FILE)
+            self._log = open(generation / RECORDS_FILE, "a", encoding="utf-8")
+        self.vectors = GrowableMatrix(
+            self.dimension, "float32", generation / VECTORS_FILE if generation is not None else None, rows=rows
+        )
+        # 每行对应的记录ID，已删除的行为 -1
+        self._row_ids = GrowableMatrix(1, "int64", rows=rows)
+        self._row_ids.view[:] = -1
+        for record_id, row in self._rows.items():
+            self._row_ids.view[row] = record_id
+        self._norms = GrowableMatrix(1, "float32", rows=rows)
+        self._codes: Optional[GrowableMatrix] = None
+        self._scales: Optional[GrowableMatrix] = None
+        if rows:
+            self._norms.view[:, 0] = np.einsum("ij,ij->i", self.vectors.view, self.vectors.view)
+        if self.dtype != "float32":
+            self._codes = GrowableMatrix(self.dimension, self.dtype, rows=rows)
+            self._scales = GrowableMatrix(1, "float32", rows=rows)
+            if rows:
+                codes, scales = self._encode(self.vectors.view)
+                self._codes.view[:] = codes
+                self._scales.view[:, 0] = scales
+        if rows:
+            logger.info(f"NumPy 向量存储已加载: {generation} ({len(self.docstore)} 条记录, {rows} 行)")
+
+    def _replay(self, path: Path) -> int:
+        """重放记录日志，返回向量文件中的有效行数"""
+        rows = 0
+        if not path.exists():
+            return rows
+        valid_bytes = 0
+        with open(path, "rb") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    entry = None
+                if entry is None or not line.endswith(b"\n"):
+                    # 最后一行可能在写入时中断，截掉后再继续追加
+                    logger.warning(f"截掉不完整的记录日志行: {path}")
+                    break
+                valid_bytes += len(line)
+                if entry["op"] == "add":
+                    record_id, row = entry["id"], entry["row"]
+                    self._drop_record(record_id)
+                    self.docstore[record_id] = (entry["text"], entry["metadata"])
+                    self._metadata_index.add(record_id, entry["metadata"])
+                    self._rows[record_id] = row
+                    rows = max(rows, row + 1)
+                    self._next_id = max(self._next_id, record_id + 1)
+                elif entry["op"] == "delete":
+                    for record_id in entry["ids"]:
+                        self._drop_record(record_id)
+                elif entry["op"] == "next_id":
+                    self._next_id = max(self._next_id, entry["value"])
+        if valid_bytes < path.stat().st_size:
+            os.truncate(path, valid_bytes)
+        return rows
+
+    def _drop_record(self, record_id: int) -> Optional[int]:
+        """从文档表与倒排索引中移除记录，返回其所在行，不存在时返回 None"""
+        record = self.docstore.pop(record_id, None)
+        if record is None:
+            return None
+        self._metadata_index.remove(record_id, record[1])
+        return self._rows.pop(record_id)
+
+    def _forget(self, record_id: int) -> bool:
+        """移除记录并把所在行标记为已删除（调用方需持有锁），返回记录是否存在"""
+        row = self._drop_record(record_id)
+        if row is None:
+            return False
+        self._row_ids.view[row] = -1
+        return True
+
+    def _encode(self, vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """按存储类型压缩向量，返回 (编码, 每行缩放系数)"""
+        if self.dtype == "int8":
+            return quantize_int8(vectors)
+        return vectors.astype(np.float16), np.ones(len(vectors), dtype=np.float32)
+
+    def _append_log(self, entries: List[Dict[str, Any]]) -> None:
+        if self._log is None:
+            return
+        self._log.write("".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in entries))
+        self._log.flush()
+
+    async def add_vectors(
+        self,
+        texts: List[str],
+        vectors: np.ndarray,
+        metadatas: Optional[List[Dict[str, Any]]] = None,
+        ids: Optional[List[str]] = None,
+        **kwargs
+    ) -> List[str]:
+        """
+        添加已计算好嵌入的文本，ID 已存在时覆盖旧记录
+
+        向量先写入映射文件并落盘，再追加记录日志，中断时日志中不会出现没有向量的记录。
+        """
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if vectors.shape != (len(texts), self.dimension):
+            raise ValueError(f"向量形状 {vectors.shape} 与文本数 {len(texts)}、维度 {self.dimension} 不匹配")
+        if not texts:
+            return []
+        if not metadatas:
+            metadatas = [{"source": f"doc_{i}"} for i in range(len(texts))]
+
+        with self._lock:
+            if ids is None:
+                int_ids = list(range(self._next_id, self._next_id + len(texts)))
+            else:
+                int_ids = [int(i) for i in ids]
+                if len(int_ids) != len(texts) or len(set(int_ids)) != len(int_ids) or min(int_ids) < 0:
+                    raise ValueError(f"记录ID必须是不重复的非负整数，且与文本数一致: {ids}")
+            self._next_id = max(self._next_id, max(int_ids) + 1)
+
+            start = self.vectors.append(vectors)
+            self.vectors.flush()
+            self._norms.append(np.einsum("ij,ij->i", vectors, vectors)[:, None])
+            if self._codes is not None:
+                codes, scales = self._encode(vectors)
+                self._codes.append(codes)
+                self._scales.append(scales[:, None])
+
+            entries = []
+            for offset, (record_id, text, metadata) in enumerate(zip(int_ids, texts, metadatas)):
+                self._forget(record_id)
+                self.docstore[record_id] = (text, metadata)
+                self._metadata_index.add(record_id, metadata)
+                self._rows[record_id] = start + offset
+                entries.append(
+                    {"op": "add", "id": record_id, "row": start + offset, "text": text, "metadata": metadata}
+                )
+            # 行号与记录ID一一对应，最后再发布，检索线程不会看到没有记录的行
+            self._row_ids.append(np.asarray(int_ids, dtype=np.int64)[:, None])
+            self._append_log(entries)
+            self._maybe_compact()
+        return [str(i) for i in int_ids]
+
+    def _view(self) -> _SearchView:
+        """
+        当前数据的快照（调用方需持有锁）
+
+        压缩与清空会整体替换矩阵和行号，检索在快照上计算并解析结果，
+        不会把旧行号对到新矩阵上；之后删除的行仍可能在快照中标记为 -1。
+        """
+        num_rows = self._row_ids.rows
+        return _SearchView(
+            vectors=self.vectors.view[:num_rows],
+            codes=self._codes.view[:num_rows] if self._codes is not None else None,
+            scales=self._scales.view[:num_rows, 0] if self._scales is not None else None,
+            norms=self._norms.view[:num_rows, 0],
+            row_ids=self._row_ids.view[:num_rows, 0],
+            docstore=self.docstore
+        )
+
+    @staticmethod
+    def _scan(
+        view: _SearchView,
+        queries: np.ndarray,
+        rows: Optional[np.ndarray],
+        limit: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        用检索矩阵计算距离，返回每个查询距离最小的 limit 行（行号，距离）
+
+        压缩的矩阵逐块转为 float32 再做矩阵乘，临时内存不超过一块。
+        """
+        matrix = view.codes if view.codes is not None else view.vectors
+        scales, norms = view.scales, view.norms
+        alive = view.row_ids >= 0
+        if rows is not None:
+            matrix, norms, alive = matrix[rows], norms[rows], alive[rows]
+            scales = scales[rows] if scales is not None else None
+
+        query_norms = np.einsum("ij,ij->i", queries, queries)[:, None]
+        distances = np.empty((len(queries), len(matrix)), dtype=np.float32)
+        for start in range(0, len(matrix), _SCAN_BLOCK_ROWS):
+            block = np.asarray(matrix[start:start + _SCAN_BLOCK_ROWS], dtype=np.float32)
+            products = queries @ block.T
+            if scales is not None:
+                products *= scales[start:start + _SCAN_BLOCK_ROWS]
+            distances[:, start:start + len(block)] = query_norms - 2 * products + norms[start:start + len(block)]
+        distances[:, ~alive] = np.inf
+
+        limit = min(limit, len(matrix))
+        top = np.argpartition(distances, limit - 1, axis=1)[:, :limit]
+        top_distances = np.take_along_axis(distances, top, axis=1)
+        order = top_distances.argsort(axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        top_distances = np.take_along_axis(top_distances, order, axis=1)
+        if rows is not None:
+            top = rows[top]
+        return top, top_distances
+
+    @staticmethod
+    def _rescore(view: _SearchView, queries: np.ndarray, top: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """从映射文件读取候选的原始向量精确计算距离，保留前 k 个"""
+        candidates = view.vectors[top.ravel()].reshape(*top.shape, view.vectors.shape[1])
+        distances = ((candidates - queries[:, None, :]) ** 2).sum(axis=2)
+        distances[view.row_ids[top] < 0] = np.inf
+        order = distances.argsort(axis=1)[:, :k]
+        return np.take_along_axis(top, order, axis=1), np.take_along_axis(distances, order, axis=1)
+
+    def _search(
+        self,
+        view: _SearchView,
+        queries: np.ndarray,
+        rows: Optional[np.ndarray],
+        k: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """检索并在需要时重排，返回每个查询的 (行号, 距离)"""
+        if view.codes is None:
+            return self._scan(view, queries, rows, k)
+        top, _ = self._scan(view, queries, rows, k * settings.NUMPY_RESCORE_FACTOR)
+        return self._rescore(view, queries, top, k)
+
+    async def search_vectors(
+        self,
+        vectors: np.ndarray,
+        k: int = 4,
+        **kwargs
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        精确检索，params 中的 nprobe / ef 不起作用
+
+        压缩存储时先取 k * NUMPY_RESCORE_FACTOR 个候选再用 float32 重排。
+        filter（MetadataFilter）先从倒排索引得到候选行，只对这些行计算距离。
+        """
+        queries = np.ascontiguousarray(vectors, dtype=np.float32)
+        rows = None
+        metadata_filter: Optional[MetadataFilter] = kwargs.get("filter")
+        with self._lock:
+            matched = self._metadata_index.select(metadata_filter) if metadata_filter is not None else None
+            if matched is not None:
+                rows = np.array(sorted(self._rows[i] for i in matched), dtype=np.int64)
+            view = self._view()
+        if not view.docstore or (rows is not None and not len(rows)):
+            return [[] for _ in range(len(queries))]
+
+        # 矩阵乘与排序在线程中执行（BLAS 释放 GIL），不阻塞事件循环
+        top, distances = await asyncio.to_thread(self._search, view, queries, rows, k)
+
+        results = []
+        for row_top, row_distances in zip(top, distances):
+            docs = []
+            for row, distance in zip(row_top, row_distances):
+                record_id = int(view.row_ids[row])
+                record = view.docstore.get(record_id)
+                if not np.isfinite(distance) or record is None:
+                    continue
+                text, metadata = record
+                docs.append({
+                    "id": str(record_id),
+                    "text": text,
+                    "metadata": metadata,
+                    "score": float(max(distance, 0.0))
+                })
+            results.append(docs)
+        return results
+
+    async def delete(self, ids: List[str]) -> None:
+        if not ids:
+            return
+        with self._lock:
+            deleted = [int(i) for i in ids if self._forget(int(i))]
+            if deleted:
+                self._append_log([{"op": "delete", "ids": deleted}])
+                self._maybe_compact()
+
+    def _maybe_compact(self) -> None:
+        """已删除的行过多时重写紧凑的数据（调用方需持有锁）"""
+        total = self._row_ids.rows
+        if total < _INITIAL_CAPACITY or len(self.docstore) >= total * (1 - settings.NUMPY_MAX_DELETED_RATIO):
+            return
+        self.compact()
+
+    def compact(self) -> None:
+        """
+        只保留有效记录，重写向量文件与记录日志
+
+        持久化时写入新的数据目录，完成后切换 CURRENT 再删除旧目录，中断时仍使用旧数据。
+        """
+        with self._lock:
+            record_ids = sorted(self._rows)
+            vectors = self.vectors.view[[self._rows[i] for i in record_ids]].copy()
+            records = [(i, *self.docstore[i]) for i in record_ids]
+            old_generation = self.generation
+            generation = None
+            if self.directory is not None:
+                name = f"{_GENERATION_PREFIX}{time.time_ns():020d}"
+                generation = self.directory / name
+                generation.mkdir()
+                _write_file(generation / VECTORS_FILE, vectors.tobytes())
+                entries = [
+                    {"op": "add", "id": i, "row": row, "text": text, "metadata": metadata}
+                    for row, (i, text, metadata) in enumerate(records)
+                ]
+                _write_file(
+                    generation / RECORDS_FILE,
+                    "".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in entries).encode("utf-8")
+                )
+                self._switch_generation(name)
+                self._log.close()
+            next_id = self._next_id
+            self._open(generation)
+            self._restore_next_id(next_id)
+            if generation is None:
+                # 内存模式直接写入压缩后的矩阵
+                for i, text, metadata in records:
+                    self.docstore[i] = (text, metadata)
+                self._load_rows(record_ids, vectors)
+            if old_generation is not None:
+                shutil.rmtree(old_generation, ignore_errors=True)
+            logger.info(f"NumPy 向量存储已压缩: {len(record_ids)} 条记录")
+
+    def _restore_next_id(self, next_id: int) -> None:
+        """换数据目录后保留ID计数并记入日志，清空或压缩后也不复用旧 ID（调用方需持有锁）"""
+        self._next_id = max(self._next_id, next_id)
+        self._append_log([{"op": "next_id", "value": self._next_id}])
+
+    def _load_rows(self, record_ids: List[int], vectors: np.ndarray) -> None:
+        """内存模式下把记录按顺序写回矩阵（调用方需持有锁）"""
+        self.vectors.append(vectors)
+        self._norms.append(np.einsum("ij,ij->i", vectors, vectors)[:, None])
+        if self._codes is not None:
+            codes, scales = self._encode(vectors)
+            self._codes.append(codes)
+            self._scales.append(scales[:, None])
+        for row, record_id in enumerate(record_ids):
+            self._rows[record_id] = row
+            self._metadata_index.add(record_id, self.docstore[record_id][1])
+        self._row_ids.append(np.asarray(record_ids, dtype=np.int64)[:, None])
+
+    async def clear(self) -> None:
+        with self._lock:
+            old_generation = self.generation
+            next_id = self._next_id
+            if self._log is not None:
+                self._log.close()
+            self._open(self._new_generation() if self.directory is not None else None)
+            self._restore_next_id(next_id)
+            if old_generation is not None:
+                shutil.rmtree(old_generation, ignore_errors=True)
+
+    async def close(self) -> None:
+        with self._lock:
+            self.vectors.flush()
+            if self._log is not None:
+                self._log.close()
+                self._log = None
@@ -0,0 +1,122 @@
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+@dataclass
+class _Entry:
+    key: str                          # 检索参数与过滤条件，只有相同时才能复用
+    k: int                            # 缓存结果的条数，可以满足不超过它的 k
+    results: List[Dict[str, Any]]
+    expires_at: float
+
+class QueryCache:
+    """
+    语义检索结果缓存
+
+    以查询向量为键：新查询与某个已缓存查询的余弦距离不超过 max_distance，
+    且检索参数相同、缓存的结果条数不少于 k 时，直接返回缓存的结果。
+    已缓存的查询向量归一化后保存在一个定长矩阵中，查找时做一次矩阵向量乘（精确的扁平索引），
+    条目按 LRU 淘汰，并在 ttl 秒后过期。
+
+    存储内容变化时调用 invalidate 清空缓存。写入前取得的 generation 与当前不一致时，
+    说明检索期间存储发生了变化，put 会丢弃该结果。
+    """
+
+    def __init__(self, dimension: int, max_distance: float = 0.05, ttl: Optional[float] = 300.0, size: int = 1024):
+        """
+        Args:
+            dimension: 查询向量维度
+            max_distance: 视为同一查询的最大余弦距离（1 - 余弦相似度）
+            ttl: 条目有效期（秒），None 表示不过期
+            size: 最多缓存的查询数
+        """
+        self.dimension = dimension
+        self.max_distance = max_distance
+        self.ttl = ttl
+        self.size = max(1, size)
+        self._vectors = np.zeros((self.size, dimension), dtype=np.float32)
+        # 槽位 -> 条目，按最近使用排序
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._free = list(range(self.size - 1, -1, -1))
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    @staticmethod
+    def _normalize(vector: np.ndarray) -> Optional[np.ndarray]:
+        norm = float(np.linalg.norm(vector))
+        return np.asarray(vector, dtype=np.float32) / norm if norm > 0 else None
+
+    def _evict(self, slot: int) -> None:
+        del self._entries[slot]
+        self._vectors[slot] = 0
+        self._free.append(slot)
+
+    def get(self, vector: np.ndarray, key: str, k: int) -> Optional[List[Dict[str, Any]]]:
+        """查找足够相近的已缓存查询，返回其前 k 条结果的副本，没有时返回 None"""
+        query = self._normalize(vector)
+        with self._lock:
+            if query is None or not self._entries:
+                self._stats["misses"] += 1
+                return None
+            similarities = self._vectors @ query
+            now = time.monotonic()
+            candidates = np.flatnonzero(similarities >= 1.0 - self.max_distance)
+            for slot in candidates[np.argsort(-similarities[candidates])]:
+                entry = self._entries.get(int(slot))
+                if entry is None:
+                    continue
+                if entry.expires_at <= now:
+                    self._evict(int(slot))
+                    continue
+                if entry.key == key and entry.k >= k:
+                    self._entries.move_to_end(int(slot))
+                    self._stats["hits"] += 1
+                    return [dict(doc) for doc in entry.results[:k]]
+            self._stats["misses"] += 1
+            return None
+
+    def put(self, vector: np.ndarray, key: str, k: int, results: List[Dict[str, Any]], generation: int) -> None:
+        """
+        缓存一个查询的结果
+
+        Args:
+            generation: 检索开始前的 generation，已失效时不缓存
+        """
+        query = self._normalize(vector)
+        with self._lock:
+            if query is None or generation != self._generation:
+                return
+            if not self._free:
+                self._evict(next(iter(self._entries)))
+                self._stats["evictions"] += 1
+            slot = self._free.pop()
+            self._vectors[slot] = query
+            expires_at = time.monotonic() + self.ttl if self.ttl is not None else float("inf")
+            self._entries[slot] = _Entry(key, k, [dict(doc) for doc in results], expires_at)
+
+    def invalidate(self) -> None:
+        """清空缓存，并使进行中的检索结果不再写入"""
+        with self._lock:
+            self._generation += 1
+            if self._entries:
+                self._stats["invalidations"] += 1
+            self._entries.clear()
+            self._vectors[:] = 0
+            self._free = list(range(self.size - 1, -1, -1))
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
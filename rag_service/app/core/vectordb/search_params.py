@@ -0,0 +1,44 @@
+from dataclasses import dataclass, replace
+from typing import Optional
+
+from rag_service.config.settings import settings
+
+@dataclass(frozen=True)
+class SearchParams:
+    """
+    单次检索的近似搜索参数，未指定的字段使用后端的默认配置
+
+    各后端按自己的索引解释：IVF 类索引使用 nprobe，HNSW 使用 ef，精确索引忽略两者；
+    latency_budget_ms 是检索的耗时预算，FAISS / Milvus 按观测到的检索耗时降低 nprobe / ef，不会中断检索；
+    ShardedStore 把它作为等待各分片的截止时间。
+    """
+    nprobe: Optional[int] = None              # IVF 检索时访问的聚类数
+    ef: Optional[int] = None                  # HNSW 检索时的候选集大小
+    latency_budget_ms: Optional[float] = None # 耗时预算（毫秒）
+
+def resolve_search_params(
+    preset: Optional[str] = None,
+    nprobe: Optional[int] = None,
+    ef: Optional[int] = None,
+    latency_budget_ms: Optional[float] = None
+) -> SearchParams:
+    """
+    按预设和单独指定的值确定检索参数，单独指定的值优先
+
+    Args:
+        preset: settings.SEARCH_PRESETS 中的预设名，None 时使用 settings.SEARCH_DEFAULT_PRESET
+        nprobe: IVF 检索时访问的聚类数
+        ef: HNSW 检索时的候选集大小
+        latency_budget_ms: 耗时预算（毫秒）
+
+    Raises:
+        ValueError: 当预设未知时
+    """
+    preset = preset or settings.SEARCH_DEFAULT_PRESET
+    params = SearchParams()
+    if preset is not None:
+        if preset not in settings.SEARCH_PRESETS:
+            raise ValueError(f"未知的检索预设: {preset}")
+        params = SearchParams(**settings.SEARCH_PRESETS[preset])
+    overrides = {"nprobe": nprobe, "ef": ef, "latency_budget_ms": latency_budget_ms}
+    return replace(params, **{name: value for name, value in overrides.items() if value is not None})
@@ -0,0 +1,170 @@
+import asyncio
+import hashlib
+import heapq
+import itertools
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+
+from rag_service.config.settings import settings
+from rag_service.app.core.llm.base import BaseLLMService
+from rag_service.app.core.vectordb.base import BaseVectorDB, SearchResults
+
+# 对外的记录ID为 "<分片>:<分片内ID>"
+_ID_SEPARATOR = ":"
+
+def shard_of(key: str, num_shards: int) -> int:
+    """按稳定哈希（与进程无关）把键分配到分片"""
+    digest = hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % num_shards
+
+class ShardedStore(BaseVectorDB):
+    """
+    分片向量存储
+
+    按哈希把记录分到 N 个底层存储（同一类型的 FAISS / NumPy / Milvus 分片），
+    同一文档（元数据 doc_id 或 source）的块落在同一分片，没有这两个字段时按文本哈希。
+    检索并发地发给所有分片，每个分片返回各自的 top-k，再用堆归并出全局 top-k。
+
+    分片超过截止时间（SearchParams.latency_budget_ms，默认 VECTOR_DB_SHARD_TIMEOUT）或出错时
+    不等待它，用其余分片的结果返回，并在 SearchResults.partial 中标记。
+    """
+
+    def __init__(self, embeddings: BaseLLMService, shards: List[BaseVectorDB]):
+        """
+        Args:
+            embeddings: 嵌入服务
+            shards: 底层存储，顺序决定分片编号，重启后必须保持一致
+        """
+        if not shards:
+            raise ValueError("分片数必须大于0")
+        self.embeddings = embeddings
+        self.shards = shards
+        self.supports_namespaces = all(shard.supports_namespaces for shard in shards)
+
+    def _route(self, text: str, metadata: Optional[Dict[str, Any]]) -> int:
+        metadata = metadata or {}
+        key = metadata.get("doc_id", metadata.get("source"))
+        return shard_of(str(key) if key is not None else text, len(self.shards))
+
+    def _split_id(self, record_id: str) -> Tuple[int, str]:
+        """把对外的记录ID拆为 (分片编号, 分片内ID)"""
+        shard, separator, local_id = str(record_id).partition(_ID_SEPARATOR)
+        if not separator or not shard.isdigit() or int(shard) >= len(self.shards):
+            raise ValueError(f"分片记录ID格式应为 '分片:ID': {record_id}")
+        return int(shard), local_id
+
+    async def add_vectors(
+        self,
+        texts: List[str],
+        vectors: np.ndarray,
+        metadatas: Optional[List[Dict[str, Any]]] = None,
+        **kwargs
+    ) -> List[str]:
+        """
+        按哈希分组后并发写入各分片，返回的ID与输入顺序一致
+
+        指定 ids（"分片:ID"，按ID覆盖写入）时记录写入ID所在的分片，
+        各分片只收到自己的那部分ID（去掉分片前缀）。
+        """
+        record_ids = kwargs.pop("ids", None)
+        local_ids: List[Optional[str]] = [None] * len(texts)
+        groups: Dict[int, List[int]] = defaultdict(list)
+        for i, text in enumerate(texts):
+            if record_ids is not None:
+                shard, local_ids[i] = self._split_id(record_ids[i])
+            else:
+                shard = self._route(text, metadatas[i] if metadatas else None)
+            groups[shard].append(i)
+
+        async def add_to_shard(shard: int, rows: List[int]) -> Tuple[List[int], List[str]]:
+            shard_kwargs = dict(kwargs)
+            if record_ids is not None:
+                shard_kwargs["ids"] = [local_ids[i] for i in rows]
+            ids = await self.shards[shard].add_vectors(
+                [texts[i] for i in rows],
+                vectors[rows],
+                [metadatas[i] for i in rows] if metadatas else None,
+                **shard_kwargs
+            )
+            return rows, [f"{shard}{_ID_SEPARATOR}{local_id}" for local_id in ids]
+
+        ids: List[Optional[str]] = [None] * len(texts)
+        for rows, shard_ids in await asyncio.gather(*(add_to_shard(shard, rows) for shard, rows in groups.items())):
+            for i, record_id in zip(rows, shard_ids):
+                ids[i] = record_id
+        return ids
+
+    async def search_vectors(
+        self,
+        vectors: np.ndarray,
+        k: int = 4,
+        **kwargs
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        并发检索所有分片并归并 top-k
+
+        Returns:
+            List[SearchResults]: 每个查询的结果，有分片缺席时 partial 为 True
+
+        Raises:
+            当所有分片都超时或失败时，抛出第一个分片的异常
+        """
+        params = kwargs.get("params")
+        deadline = settings.VECTOR_DB_SHARD_TIMEOUT
+        if params is not None and params.latency_budget_ms is not None:
+            deadline = params.latency_budget_ms / 1000
+
+        async def search_shard(shard: BaseVectorDB) -> List[List[Dict[str, Any]]]:
+            return await asyncio.wait_for(shard.search_vectors(vectors, k=k, **kwargs), deadline)
+
+        outcomes = await asyncio.gather(*(search_shard(shard) for shard in self.shards), return_exceptions=True)
+        answered, missing = [], []
+        for shard, outcome in enumerate(outcomes):
+            if isinstance(outcome, BaseException):
+                missing.append(shard)
+                reason = "超时" if isinstance(outcome, asyncio.TimeoutError) else f"失败: {outcome}"
+                logger.warning(f"向量分片 {shard} 检索{reason}")
+            else:
+                answered.append((shard, outcome))
+        if not answered:
+            raise outcomes[0]
+
+        results = []
+        for query in range(len(vectors)):
+            # 各分片的结果已按距离升序，逐个归并即可得到全局 top-k
+            streams = [
+                [dict(doc, id=f"{shard}{_ID_SEPARATOR}{doc['id']}") for doc in per_query[query]]
+                for shard, per_query in answered
+            ]
+            merged = heapq.merge(*streams, key=lambda doc: doc["score"])
+            results.append(SearchResults(itertools.islice(merged, k), partial=bool(missing), missing_shards=missing))
+        return results
+
+    async def delete(self, ids: List[str]) -> None:
+        groups: Dict[int, List[str]] = defaultdict(list)
+        for record_id in ids:
+            shard, local_id = self._split_id(record_id)
+            groups[shard].append(local_id)
+        await asyncio.gather(*(self.shards[shard].delete(local_ids) for shard, local_ids in groups.items()))
+
+    async def clear(self) -> None:
+        await asyncio.gather(*(shard.clear() for shard in self.shards))
+
+    async def commit(self) -> None:
+        await asyncio.gather(*(shard.commit() for shard in self.shards))
+
+    async def warmup(self) -> None:
+        await asyncio.gather(*(shard.warmup() for shard in self.shards))
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"shards": [shard.get_stats() for shard in self.shards]}
+
+    async def close(self) -> None:
+        """关闭所有分片，单个分片失败不影响其余分片"""
+        outcomes = await asyncio.gather(*(shard.close() for shard in self.shards), return_exceptions=True)
+        for shard, outcome in enumerate(outcomes):
+            if isinstance(outcome, BaseException):
+                logger.error(f"关闭向量分片 {shard} 失败: {outcome}")
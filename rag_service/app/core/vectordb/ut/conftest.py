@@ -0,0 +1,36 @@
+import pytest
+from typing import Any, Dict, List
+
+from rag_service.app.core.llm.base import BaseLLMService
+
+def pytest_configure(config):
+    """注册自定义标记"""
+    config.addinivalue_line("markers", "faiss: FAISS向量存储测试")
+    config.addinivalue_line("markers", "numpy: NumPy向量存储测试")
+    config.addinivalue_line("markers", "milvus: Milvus向量存储测试（使用内存中的假服务端）")
+    config.addinivalue_line("markers", "shard: 分片向量存储测试")
+    config.addinivalue_line("markers", "query_cache: 语义检索缓存测试")
+    config.addinivalue_line("markers", "search_params: 检索参数测试")
+
+class FixedEmbeddingService(BaseLLMService):
+    """只提供维度信息的假嵌入服务，向量由测试直接给出"""
+
+    def __init__(self, dimension: int):
+        self.dimension = dimension
+
+    async def generate(self, prompt: str, **kwargs) -> str:
+        return ""
+
+    async def generate_with_history(self, messages: List[Dict[str, str]], **kwargs) -> str:
+        return ""
+
+    async def get_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return [[float(len(text))] + [0.0] * (self.dimension - 1) for text in texts]
+
+    def get_model_info(self) -> Dict[str, Any]:
+        return {"provider": "fake", "model": "fake", "dimension": self.dimension}
+
+@pytest.fixture
+def embeddings(request) -> FixedEmbeddingService:
+    """维度为测试模块中 DIMENSION 的假嵌入服务"""
+    return FixedEmbeddingService(request.module.DIMENSION)
@@ -0,0 +1,88 @@
+import asyncio
+import time
+import pytest
+import numpy as np
+
+from rag_service.config.settings import settings
+from rag_service.app.core.vectordb.cached_store import CachedVectorDB
+from rag_service.app.core.vectordb.filters import MetadataFilter
+from rag_service.app.core.vectordb.numpy_store import NumpyStore
+from rag_service.app.core.vectordb.query_cache import QueryCache
+
+DIMENSION = 16
+
+class CountingStore(NumpyStore):
+    """记录实际检索的查询数"""
+
+    searched = 0
+
+    async def search_vectors(self, vectors, k=4, **kwargs):
+        self.searched += len(vectors)
+        return await super().search_vectors(vectors, k=k, **kwargs)
+
+def random_vectors(n: int, seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).standard_normal((n, DIMENSION)).astype(np.float32)
+
+@pytest.fixture
+def cached(monkeypatch, embeddings):
+    monkeypatch.setattr(settings, "NUMPY_STORE_DIR", None)
+    return CachedVectorDB(CountingStore(embeddings), max_distance=0.01)
+
+@pytest.mark.query_cache
+def test_similar_queries_hit_cache(cached):
+    """测试相近的查询复用结果，参数不同或 k 更大时重新检索"""
+    vectors = random_vectors(200)
+    asyncio.run(cached.add_vectors([f"t{i}" for i in range(200)], vectors, [{"group": i % 2} for i in range(200)]))
+    query = random_vectors(1, seed=1)
+    paraphrase = query + 0.01 * random_vectors(1, seed=2)
+
+    first = asyncio.run(cached.search_vectors(query, k=5))
+    assert asyncio.run(cached.search_vectors(paraphrase, k=3))[0] == first[0][:3]
+    assert cached.store.searched == 1
+
+    asyncio.run(cached.search_vectors(paraphrase, k=8))
+    asyncio.run(cached.search_vectors(query, k=5, filter=MetadataFilter.from_dict({"group": 1})))
+    asyncio.run(cached.search_vectors(random_vectors(1, seed=3), k=5))
+    assert cached.store.searched == 4
+    assert cached.get_stats()["query_cache"]["hits"] == 1
+
+@pytest.mark.query_cache
+def test_writes_invalidate_cache(cached):
+    """测试写入、删除、清空后不再返回旧结果"""
+    vectors = random_vectors(50)
+    ids = asyncio.run(cached.add_vectors([f"t{i}" for i in range(50)], vectors))
+    query = vectors[:1]
+    assert asyncio.run(cached.search_vectors(query, k=1))[0][0]["id"] == ids[0]
+
+    asyncio.run(cached.delete([ids[0]]))
+    assert asyncio.run(cached.search_vectors(query, k=1))[0][0]["id"] != ids[0]
+
+    new_ids = asyncio.run(cached.add_vectors(["again"], vectors[:1]))
+    assert asyncio.run(cached.search_vectors(query, k=1))[0][0]["id"] == new_ids[0]
+
+    asyncio.run(cached.clear())
+    assert asyncio.run(cached.search_vectors(query, k=1)) == [[]]
+    assert cached.store.searched == 4
+
+@pytest.mark.query_cache
+def test_query_cache_eviction(monkeypatch):
+    """测试 LRU 淘汰、过期和检索期间失效的结果不被缓存"""
+    cache = QueryCache(DIMENSION, max_distance=0.01, ttl=10.0, size=2)
+    vectors = random_vectors(3)
+    for i in range(2):
+        cache.put(vectors[i], "", 1, [{"id": str(i)}], cache.generation)
+    assert cache.get(vectors[0], "", 1) == [{"id": "0"}]
+    cache.put(vectors[2], "", 1, [{"id": "2"}], cache.generation)
+    assert cache.get(vectors[1], "", 1) is None
+    assert cache.get(vectors[0], "", 1) is not None
+
+    generation = cache.generation
+    cache.invalidate()
+    cache.put(vectors[1], "", 1, [{"id": "1"}], generation)
+    assert cache.get(vectors[1], "", 1) is None
+
+    cache.put(vectors[1], "", 1, [{"id": "1"}], cache.generation)
+    now = time.monotonic()
+    monkeypatch.setattr("rag_service.app.core.vectordb.query_cache.time.monotonic", lambda: now + 11)
+    assert cache.get(vectors[1], "", 1) is None
+    assert cache.get_stats()["entries"] == 0
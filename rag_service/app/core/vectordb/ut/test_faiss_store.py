@@ -0,0 +1,543 @@
+import asyncio
+import os
+import threading
+import time
+import pytest
+import numpy as np
+
+from rag_service.config.settings import settings
+from rag_service.app.core.vectordb.faiss_store import FAISSStore
+
+DIMENSION = 4
+
+def one_hot(*positions: int) -> np.ndarray:
+    return np.eye(DIMENSION, dtype=np.float32)[list(positions)]
+
+@pytest.fixture
+def store(monkeypatch, embeddings):
+    """只保存在内存中的存储"""
+    monkeypatch.setattr(settings, "FAISS_INDEX_DIR", None)
+    monkeypatch.setattr(settings, "INDEX_MAINTENANCE_INTERVAL", 0)
+    return FAISSStore(embeddings)
+
+@pytest.fixture
+def index_dir(tmp_path, monkeypatch):
+    """启用快照目录，关闭后台定期快照"""
+    monkeypatch.setattr(settings, "FAISS_INDEX_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "FAISS_SNAPSHOT_INTERVAL", 0)
+    monkeypatch.setattr(settings, "INDEX_MAINTENANCE_INTERVAL", 0)
+    return tmp_path
+
+@pytest.mark.faiss
+def test_ids_are_stable_and_searchable(store):
+    """测试返回的ID可用于检索，且后续写入不会改变已有ID"""
+    first = asyncio.run(store.add_vectors(["a", "b"], one_hot(0, 1)))
+    second = asyncio.run(store.add_vectors(["c"], one_hot(2)))
+    assert first == ["0", "1"]
+    assert second == ["2"]
+
+    results = asyncio.run(store.search_vectors(one_hot(1, 2), k=1))
+    assert [(docs[0]["id"], docs[0]["text"]) for docs in results] == [("1", "b"), ("2", "c")]
+    assert results[0][0]["score"] == pytest.approx(0.0)
+
+@pytest.mark.faiss
+def test_delete_removes_vectors(store):
+    """测试删除会从索引和文档表中真正移除记录"""
+    ids = asyncio.run(store.add_vectors(["a", "b", "c"], one_hot(0, 1, 2)))
+    asyncio.run(store.delete([ids[1], "999"]))
+    assert store.index.ntotal == 2
+    assert set(store.docstore) == {0, 2}
+
+    results = asyncio.run(store.search_vectors(one_hot(1), k=3))
+    assert {doc["id"] for doc in results[0]} == {"0", "2"}
+
+    # 删除后新分配的ID不会复用
+    assert asyncio.run(store.add_vectors(["d"], one_hot(3))) == ["3"]
+
+@pytest.mark.faiss
+def test_upsert_by_id(store):
+    """测试用已有ID写入时覆盖旧记录"""
+    asyncio.run(store.add_vectors(["a", "b"], one_hot(0, 1)))
+    ids = asyncio.run(store.add_vectors(["b2", "x"], one_hot(2, 3), metadatas=[{"v": 2}, {"v": 9}], ids=["1", "42"]))
+    assert ids == ["1", "42"]
+    assert store.index.ntotal == 3
+    assert store.docstore[1] == ("b2", {"v": 2})
+
+    results = asyncio.run(store.search_vectors(one_hot(2), k=1))
+    assert results[0][0]["id"] == "1"
+    # 显式ID之后自动分配的ID从更大的值开始
+    assert asyncio.run(store.add_vectors(["y"], one_hot(0))) == ["43"]
+
+@pytest.mark.faiss
+def test_invalid_input(store):
+    """测试非法ID与形状不匹配的向量被拒绝"""
+    with pytest.raises(ValueError):
+        asyncio.run(store.add_vectors(["a"], one_hot(0), ids=["abc"]))
+    with pytest.raises(ValueError):
+        asyncio.run(store.add_vectors(["a", "b"], one_hot(0, 1), ids=["5", "5"]))
+    with pytest.raises(ValueError):
+        asyncio.run(store.add_vectors(["a"], np.ones((1, DIMENSION + 1), dtype=np.float32)))
+
+@pytest.mark.faiss
+def test_clear(store):
+    """测试清空后检索为空"""
+    asyncio.run(store.add_vectors(["a"], one_hot(0)))
+    asyncio.run(store.clear())
+    assert asyncio.run(store.search_vectors(one_hot(0), k=1)) == [[]]
+    assert store.docstore == {}
+
+class ProbeIndex:
+    """包装 faiss 索引，检索时停顿一下并记录是否有写入与之重叠"""
+
+    def __init__(self, index):
+        self.index = index
+        self.searching = threading.Event()
+        self.active = False
+        self.overlaps = 0
+
+    def __getattr__(self, name):
+        return getattr(self.index, name)
+
+    def search(self, *args, **kwargs):
+        self.active = True
+        self.searching.set()
+        time.sleep(0.05)
+        try:
+            return self.index.search(*args, **kwargs)
+        finally:
+            self.active = False
+
+    def add_with_ids(self, *args):
+        self.overlaps += self.active
+        self.index.add_with_ids(*args)
+
+    def remove_ids(self, *args):
+        self.overlaps += self.active
+        return self.index.remove_ids(*args)
+
+@pytest.mark.faiss
+def test_write_waits_for_search(store):
+    """测试检索线程执行期间的写入与删除等检索结束后才修改索引"""
+    asyncio.run(store.add_vectors(["a", "b"], one_hot(0, 1)))
+    probe = ProbeIndex(store.index)
+    store.index = probe
+
+    async def search_while_writing():
+        search = asyncio.create_task(store.search_vectors(one_hot(1), k=1))
+        await asyncio.to_thread(probe.searching.wait)
+        await store.add_vectors(["c"], one_hot(2))
+        await store.delete(["0"])
+        return await search
+
+    results = asyncio.run(search_while_writing())
+    assert results[0][0]["text"] == "b"
+    assert probe.overlaps == 0
+    assert sorted(store.docstore) == [1, 2]
+
+@pytest.mark.faiss
+def test_snapshot_roundtrip_with_mmap(index_dir, embeddings):
+    """测试关闭时保存快照，重启后以内存映射方式加载并可继续写入"""
+    store = FAISSStore(embeddings)
+    ids = asyncio.run(store.add_vectors(["a", "b"], one_hot(0, 1), metadatas=[{"n": 1}, {"n": 2}]))
+    asyncio.run(store.close())
+    assert not store.dirty
+
+    reloaded = FAISSStore(embeddings)
+    assert reloaded._mapped_path is not None
+    assert reloaded.docstore == {0: ("a", {"n": 1}), 1: ("b", {"n": 2})}
+    results = asyncio.run(reloaded.search_vectors(one_hot(1), k=1))
+    assert results[0][0]["id"] == ids[1]
+
+    # 映射的索引只读，写入前自动载入内存，ID 继续递增
+    asyncio.run(reloaded.delete([ids[0]]))
+    assert reloaded._mapped_path is None
+    assert asyncio.run(reloaded.add_vectors(["c"], one_hot(2))) == ["2"]
+    assert reloaded.index.ntotal == 2
+
+@pytest.mark.faiss
+def test_snapshot_is_atomic(index_dir, embeddings):
+    """测试未完成的快照不会被加载，旧快照按数量清理"""
+    keep = settings.FAISS_SNAPSHOT_KEEP
+    store = FAISSStore(embeddings)
+    for i in range(keep + 2):
+        asyncio.run(store.add_vectors([f"t{i}"], one_hot(i % DIMENSION)))
+        latest = store.save()
+
+    # 模拟写到一半中断的快照
+    (index_dir / "snapshot-99999999999999999999-1.tmp").mkdir()
+    snapshots = sorted(path.name for path in index_dir.glob("snapshot-*") if not path.name.endswith(".tmp"))
+    assert len(snapshots) == keep
+    assert (index_dir / "CURRENT").read_text() == latest.name
+
+    reloaded = FAISSStore(embeddings)
+    assert len(reloaded.docstore) == keep + 2
+
+@pytest.mark.faiss
+def test_background_snapshot(index_dir, monkeypatch, embeddings):
+    """测试后台线程定期保存有变化的数据"""
+    monkeypatch.setattr(settings, "FAISS_SNAPSHOT_INTERVAL", 0.05)
+    store = FAISSStore(embeddings)
+    asyncio.run(store.add_vectors(["a"], one_hot(0)))
+    for _ in range(100):
+        if not store.dirty:
+            break
+        time.sleep(0.05)
+    assert not store.dirty
+    assert (index_dir / "CURRENT").exists()
+    asyncio.run(store.close())
+
+@pytest.mark.faiss
+def test_dimension_mismatch_rejected(index_dir, embeddings):
+    """测试快照维度与嵌入模型不一致时拒绝加载"""
+    store = FAISSStore(embeddings)
+    asyncio.run(store.add_vectors(["a"], one_hot(0)))
+    store.save()
+
+    with pytest.raises(ValueError, match="维度"):
+        FAISSStore(type(embeddings)(DIMENSION * 2))
+
+@pytest.mark.faiss
+def test_snapshot_single_writer(index_dir, embeddings):
+    """测试共用快照目录时只有持有写入者锁的进程保存快照，关闭后锁被释放"""
+    writer = FAISSStore(embeddings)
+    asyncio.run(writer.add_vectors(["a"], one_hot(0)))
+    latest = writer.save()
+    assert (index_dir / "LOCK").read_text() == str(os.getpid())
+
+    reader = FAISSStore(embeddings)
+    assert [text for text, _ in reader.docstore.values()] == ["a"]
+    asyncio.run(reader.add_vectors(["b"], one_hot(1)))
+    with pytest.raises(RuntimeError):
+        reader.save()
+    asyncio.run(reader.close())
+    assert (index_dir / "CURRENT").read_text() == latest.name
+
+    asyncio.run(writer.close())
+    successor = FAISSStore(embeddings)
+    asyncio.run(successor.add_vectors(["c"], one_hot(2)))
+    assert successor.save().name != latest.name
+    asyncio.run(successor.close())
+
+def random_vectors(n: int, seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).random((n, DIMENSION), dtype=np.float32)
+
+@pytest.mark.faiss
+def test_hnsw_delete_and_upsert(store, monkeypatch):
+    """测试 HNSW 删除的记录在检索时被过滤，删除过多或复用ID时重建"""
+    monkeypatch.setattr(settings, "FAISS_INDEX_TYPE", "hnsw")
+    monkeypatch.setattr(settings, "FAISS_HNSW_MAX_DELETED_RATIO", 0.5)
+    asyncio.run(store.clear())
+    vectors = random_vectors(20)
+    ids = asyncio.run(store.add_vectors([f"t{i}" for i in range(20)], vectors))
+    assert store.spec.kind == "hnsw"
+
+    asyncio.run(store.delete(ids[:3]))
+    assert store.index.ntotal == 20
+    results = asyncio.run(store.search_vectors(vectors[:3], k=1))
+    assert all(docs[0]["id"] not in ids[:3] for docs in results)
+
+    # 复用已删除的ID：重建后写入，图中不再有旧向量
+    asyncio.run(store.add_vectors(["new"], vectors[10:11], ids=[ids[0]]))
+    assert store.index.ntotal == 18
+    assert not store._tombstones
+    assert asyncio.run(store.search_vectors(vectors[10:11], k=2))[0][0]["id"] in {ids[0], ids[10]}
+
+    # 删除过多时在后台重建，commit 等待重建完成
+    asyncio.run(store.delete(ids[3:13]))
+    asyncio.run(store.commit())
+    assert store.index.ntotal == len(store.docstore) == 8
+
+@pytest.mark.faiss
+@pytest.mark.parametrize("index_type", ["ivf_flat", "ivf_pq"])
+def test_ivf_trained_when_enough_vectors(store, monkeypatch, index_type):
+    """测试 IVF 索引在向量足够训练前使用 Flat，之后采样训练并保留全部记录"""
+    monkeypatch.setattr(settings, "FAISS_INDEX_TYPE", index_type)
+    monkeypatch.setattr(settings, "FAISS_IVF_NLIST", 4)
+    monkeypatch.setattr(settings, "FAISS_PQ_NBITS", 4)
+    monkeypatch.setattr(settings, "FAISS_TRAIN_SAMPLE_SIZE", 300)
+    asyncio.run(store.clear())
+    vectors = random_vectors(700)
+
+    asyncio.run(store.add_vectors([f"t{i}" for i in range(100)], vectors[:100]))
+    assert store.spec.kind == "flat"
+    asyncio.run(store.add_vectors([f"t{i}" for i in range(100, 700)], vectors[100:]))
+    asyncio.run(store.commit())
+    assert store.spec.kind == index_type
+    assert store.spec.nlist == 4
+    assert store.index.ntotal == 700
+
+    results = asyncio.run(store.search_vectors(vectors[:5], k=1))
+    if index_type == "ivf_flat":
+        assert [docs[0]["id"] for docs in results] == ["0", "1", "2", "3", "4"]
+    asyncio.run(store.delete(["0", "1"]))
+    assert store.index.ntotal == 698
+
+@pytest.mark.faiss
+def test_rebuild_runs_in_background(store, monkeypatch):
+    """测试写入触发的训练不阻塞写入与检索，期间使用旧索引，完成后原子替换"""
+    from rag_service.app.core.vectordb import faiss_store
+
+    monkeypatch.setattr(settings, "FAISS_INDEX_TYPE", "ivf_flat")
+    monkeypatch.setattr(settings, "FAISS_IVF_NLIST", 4)
+    asyncio.run(store.clear())
+    vectors = random_vectors(300)
+    training = threading.Event()
+    release = threading.Event()
+
+    def slow_build(*args, **kwargs):
+        training.set()
+        release.wait(timeout=10)
+        return original_build(*args, **kwargs)
+
+    original_build = faiss_store.build_index
+    monkeypatch.setattr(faiss_store, "build_index", slow_build)
+    asyncio.run(store.add_vectors([f"t{i}" for i in range(200)], vectors[:200]))
+    assert training.wait(timeout=10)
+    # 训练期间写入、删除与检索照常使用 Flat 索引
+    assert store.spec.kind == "flat"
+    asyncio.run(store.add_vectors([f"t{i}" for i in range(200, 300)], vectors[200:]))
+    asyncio.run(store.delete(["0"]))
+    assert asyncio.run(store.search_vectors(vectors[5:6], k=1))[0][0]["id"] == "5"
+
+    release.set()
+    asyncio.run(store.commit())
+    assert store.spec.kind == "ivf_flat"
+    assert store.index.ntotal == len(store.docstore) == 299
+    assert store._rebuild_thread is None
+
+@pytest.mark.faiss
+def test_auto_index_grows_with_corpus(store, monkeypatch):
+    """测试 auto 模式随语料增长从 Flat 切换到 HNSW"""
+    monkeypatch.setattr(settings, "FAISS_INDEX_TYPE", "auto")
+    monkeypatch.setattr(settings, "FAISS_AUTO_EXACT_MAX", 50)
+    asyncio.run(store.clear())
+    vectors = random_vectors(80)
+    asyncio.run(store.add_vectors([f"t{i}" for i in range(50)], vectors[:50]))
+    assert store.spec.kind == "flat"
+    asyncio.run(store.add_vectors([f"t{i}" for i in range(30)], vectors[50:]))
+    asyncio.run(store.commit())
+    assert store.spec.kind == "hnsw"
+    assert store.index.ntotal == 80
+
+@pytest.mark.faiss
+def test_auto_spec_respects_memory_budget():
+    """测试 auto 模式按内存预算选择索引与 PQ 编码大小"""
+    from rag_service.app.core.vectordb.faiss_index import resolve_spec
+    n, d = 1_000_000, 768
+    assert resolve_spec("auto", 5000, d, memory_budget=1 << 40).kind == "flat"
+    assert resolve_spec("auto", n, d, memory_budget=1 << 40).kind == "hnsw"
+    assert resolve_spec("auto", n, d, memory_budget=n * d * 4).kind == "ivf_flat"
+    spec = resolve_spec("auto", n, d, memory_budget=64 * n)
+    assert spec.kind == "ivf_pq"
+    assert d % spec.pq_m == 0 and spec.pq_m * spec.pq_nbits // 8 <= 64
+    with pytest.raises(ValueError):
+        resolve_spec("lsh", n, d, memory_budget=0)
+
+@pytest.mark.faiss
+def test_hnsw_snapshot_keeps_deletions(index_dir, monkeypatch, embeddings):
+    """测试 HNSW 的删除标记随快照保存"""
+    monkeypatch.setattr(settings, "FAISS_INDEX_TYPE", "hnsw")
+    store = FAISSStore(embeddings)
+    vectors = random_vectors(10)
+    ids = asyncio.run(store.add_vectors([f"t{i}" for i in range(10)], vectors))
+    asyncio.run(store.delete([ids[0]]))
+    asyncio.run(store.close())
+
+    reloaded = FAISSStore(embeddings)
+    assert reloaded.spec.kind == "hnsw"
+    assert reloaded._tombstones == {0}
+    assert asyncio.run(reloaded.search_vectors(vectors[:1], k=1))[0][0]["id"] != ids[0]
+
+@pytest.mark.faiss
+def test_retrain_skewed_ivf_in_shadow(store, monkeypatch):
+    """测试倒排表失衡时在影子索引上重训，期间的写入与删除不会丢失"""
+    from rag_service.app.core.vectordb import faiss_store
+    from rag_service.app.core.vectordb.faiss_index import ivf_list_sizes
+    from rag_service.app.core.vectordb.maintenance import imbalance_factor
+
+    monkeypatch.setattr(settings, "FAISS_INDEX_TYPE", "ivf_flat")
+    monkeypatch.setattr(settings, "FAISS_IVF_NLIST", 8)
+    asyncio.run(store.clear())
+    asyncio.run(store.add_vectors([f"t{i}" for i in range(400)], random_vectors(400)))
+    asyncio.run(store.commit())
+    assert store.spec.kind == "ivf_flat"
+    assert not store.maintain()
+
+    # 新数据集中在一小块区域，全部落进少数几个列表
+    crowded = (random_vectors(3000, seed=1) * 0.01).astype(np.float32)
+    asyncio.run(store.add_vectors([f"c{i}" for i in range(3000)], crowded))
+    assert imbalance_factor(ivf_list_sizes(store.index)) > settings.IVF_MAX_IMBALANCE
+
+    def build_with_concurrent_writes(*args, **kwargs):
+        # 模拟重训期间到达的写入与删除
+        asyncio.run(store.add_vectors(["late"], one_hot(3), ids=["100000"]))
+        asyncio.run(store.delete(["0"]))
+        return original_build(*args, **kwargs)
+
+    original_build = faiss_store.build_index
+    monkeypatch.setattr(faiss_store, "build_index", build_with_concurrent_writes)
+    old_index = store.index
+    assert store.maintain()
+
+    assert store.index is not old_index
+    assert store.index.ntotal == len(store.docstore) == 3400
+    assert imbalance_factor(ivf_list_sizes(store.index)) < imbalance_factor(ivf_list_sizes(old_index))
+    assert asyncio.run(store.search_vectors(one_hot(3), k=1))[0][0]["id"] == "100000"
+    assert store._shadow_log is None
+
+@pytest.mark.faiss
+def test_ivf_pq_not_retrained_from_lossy_codes(store, monkeypatch):
+    """测试 IVF-PQ 不用有损重建的向量重训，重复维护不会降低召回"""
+    monkeypatch.setattr(settings, "FAISS_INDEX_TYPE", "ivf_pq")
+    monkeypatch.setattr(settings, "FAISS_IVF_NLIST", 8)
+    monkeypatch.setattr(settings, "FAISS_PQ_NBITS", 4)
+    asyncio.run(store.clear())
+    vectors = random_vectors(1000)
+    asyncio.run(store.add_vectors([f"t{i}" for i in range(1000)], vectors))
+    asyncio.run(store.commit())
+    assert store.spec.kind == "ivf_pq"
+
+    index = store.index
+    before = asyncio.run(store.search_vectors(vectors[:50], k=1))
+    for _ in range(3):
+        assert not store.maintain(force=True)
+    assert store.index is index
+    assert asyncio.run(store.search_vectors(vectors[:50], k=1)) == before
+
+@pytest.mark.faiss
+def test_retrain_discarded_when_index_replaced(store, monkeypatch):
+    """测试重训期间索引被清空时放弃影子索引"""
+    from rag_service.app.core.vectordb import faiss_store
+
+    monkeypatch.setattr(settings, "FAISS_INDEX_TYPE", "ivf_flat")
+    monkeypatch.setattr(settings, "FAISS_IVF_NLIST", 4)
+    asyncio.run(store.clear())
+    asyncio.run(store.add_vectors([f"t{i}" for i in range(200)], random_vectors(200)))
+    asyncio.run(store.commit())
+
+    def build_then_clear(*args, **kwargs):
+        asyncio.run(store.clear())
+        return original_build(*args, **kwargs)
+
+    original_build = faiss_store.build_index
+    monkeypatch.setattr(faiss_store, "build_index", build_then_clear)
+    assert not store.maintain(force=True)
+    assert store.index.ntotal == 0
+
+@pytest.mark.faiss
+def test_retrain_reason():
+    """测试重训判断：列表失衡或聚类中心数偏离语料规模"""
+    from rag_service.app.core.vectordb.maintenance import imbalance_factor, retrain_reason
+    assert imbalance_factor([10, 10, 10, 10]) == pytest.approx(1.0)
+    assert imbalance_factor([40, 0, 0, 0]) == pytest.approx(4.0)
+    assert retrain_reason(1024, 65536, list_sizes=[64] * 1024) is None
+    assert "不均衡" in retrain_reason(4, 1000, list_sizes=[997, 1, 1, 1])
+    assert "聚类中心数" in retrain_reason(1024, 10_000)
+    assert retrain_reason(1024, 10_000, target_nlist=1024) is None
+
+@pytest.mark.faiss
+def test_search_params_per_query(store, monkeypatch):
+    """测试按查询指定 nprobe，以及耗时预算按历史耗时降低 nprobe"""
+    from rag_service.app.core.vectordb.search_params import SearchParams
+    monkeypatch.setattr(settings, "FAISS_INDEX_TYPE", "ivf_flat")
+    monkeypatch.setattr(settings, "FAISS_IVF_NLIST", 8)
+    monkeypatch.setattr(settings, "FAISS_IVF_NPROBE", 1)
+    asyncio.run(store.clear())
+    vectors = random_vectors(800)
+    asyncio.run(store.add_vectors([f"t{i}" for i in range(800)], vectors))
+    asyncio.run(store.commit())
+    assert store.spec.kind == "ivf_flat"
+
+    # 访问全部聚类时与精确检索一致
+    queries = random_vectors(20, seed=1)
+    exact = ((queries[:, None, :] - vectors[None, :, :]) ** 2).sum(-1).argsort(1)[:, :5]
+    results = asyncio.run(store.search_vectors(queries, k=5, params=SearchParams(nprobe=8)))
+    assert [[int(doc["id"]) for doc in docs] for docs in results] == exact.tolist()
+
+    assert store._search_effort(store.spec, SearchParams(nprobe=8), 5, 1) == (64, 8)
+    store._search_cost["ivf_flat"] = 1.0
+    assert store._search_effort(store.spec, SearchParams(nprobe=8, latency_budget_ms=3), 5, 1)[1] == 3
+    assert store._search_effort(store.spec, SearchParams(nprobe=8, latency_budget_ms=0.1), 5, 1)[1] == 1
+
+@pytest.mark.faiss
+def test_similarity_search_batch(store):
+    """测试批量检索只嵌入一次、只检索一次，结果与逐个检索一致"""
+    vectors = np.array([[1, 0, 0, 0], [3, 0, 0, 0], [6, 0, 0, 0]], dtype=np.float32)
+    asyncio.run(store.add_vectors(["a", "bbb", "cccccc"], vectors))
+    embed_calls, search_calls = [], []
+    get_embeddings_array = store.embeddings.get_embeddings_array
+    search_vectors = store.search_vectors
+
+    async def counting_embed(texts):
+        embed_calls.append(texts)
+        return await get_embeddings_array(texts)
+
+    async def counting_search(vectors, k=4, **kwargs):
+        search_calls.append(len(vectors))
+        return await search_vectors(vectors, k=k, **kwargs)
+
+    store.embeddings.get_embeddings_array = counting_embed
+    store.search_vectors = counting_search
+    queries = ["xx", "yyyyy", "z"]
+    results = asyncio.run(store.similarity_search_batch(queries, k=1))
+    assert embed_calls == [queries] and search_calls == [3]
+    assert [docs[0]["text"] for docs in results] == ["a", "cccccc", "a"]
+    assert results[1] == asyncio.run(store.similarity_search("yyyyy", k=1))
+    assert asyncio.run(store.similarity_search_batch([], k=1)) == []
+
+@pytest.mark.faiss
+@pytest.mark.parametrize("index_type", ["flat", "hnsw"])
+def test_metadata_filter(store, monkeypatch, index_type):
+    """测试元数据过滤在检索内部生效，精确候选与 IDSelector 两条路径结果一致，且排除已删除记录"""
+    from rag_service.app.core.vectordb.filters import MetadataFilter
+    monkeypatch.setattr(settings, "FAISS_INDEX_TYPE", index_type)
+    asyncio.run(store.clear())
+    vectors = random_vectors(200)
+    metadatas = [{"lang": "zh" if i % 2 else "en", "year": 2000 + i % 30, "tags": ["x"]} for i in range(200)]
+    ids = asyncio.run(store.add_vectors([f"t{i}" for i in range(200)], vectors, metadatas))
+    asyncio.run(store.delete(ids[1:3]))
+
+    metadata_filter = MetadataFilter.from_dict({"lang": {"in": ["zh"]}, "year": {"gte": 2010, "lt": 2020}})
+    expected = [i for i in range(200) if i not in (1, 2) and metadata_filter.matches(metadatas[i])]
+    exact = ((vectors[:3, None, :] - vectors[None, expected, :]) ** 2).sum(-1).argsort(1)[:, :5]
+    for exact_max in (10_000, 0):
+        monkeypatch.setattr(settings, "FAISS_FILTER_EXACT_MAX", exact_max)
+        results = asyncio.run(store.search_vectors(vectors[:3], k=5, filter=metadata_filter))
+        assert [[int(doc["id"]) for doc in docs] for docs in results] == [[expected[j] for j in row] for row in exact]
+
+    assert asyncio.run(store.search_vectors(vectors[:1], k=5, filter=MetadataFilter.from_dict({"lang": "fr"}))) == [[]]
+    assert len(asyncio.run(store.search_vectors(vectors[:1], k=5, filter=MetadataFilter()))[0]) == 5
+
+@pytest.mark.faiss
+def test_metadata_filter_model():
+    """测试过滤条件的解析、匹配与 Milvus 表达式"""
+    from rag_service.app.core.vectordb.filters import MetadataFilter, MetadataIndex
+    metadata_filter = MetadataFilter.from_dict(
+        {"source": "a\"b", "lang": {"in": ["zh", "en"]}, "year": {"gte": 2020, "lt": 2024}}
+    )
+    assert metadata_filter.to_milvus_expr() == (
+        '(metadata["source"] == "a\\"b") and (metadata["lang"] in ["zh", "en"]) '
+        'and (metadata["year"] >= 2020) and (metadata["year"] < 2024)'
+    )
+    assert metadata_filter.matches({"source": "a\"b", "lang": "zh", "year": 2021})
+    assert not metadata_filter.matches({"source": "a\"b", "lang": "zh", "year": "2021"})
+    assert not MetadataFilter.from_dict({"flag": 1}).matches({"flag": True})
+
+    index = MetadataIndex()
+    index.add(1, {"year": 2021, "flag": True})
+    index.add(2, {"year": 2025})
+    assert index.select(MetadataFilter.from_dict({"year": {"gt": 2020}})) == {1, 2}
+    assert index.select(MetadataFilter.from_dict({"flag": True, "year": {"lt": 2030}})) == {1}
+    index.remove(1, {"year": 2021, "flag": True})
+    assert index.select(MetadataFilter.from_dict({"flag": True})) == set()
+    assert index.select(MetadataFilter.from_dict({"year": {"exists": True}})) == {2}
+    assert index.select(MetadataFilter.from_dict({"year": {"exists": False}})) == set()
+    index.add(3, {"lang": "zh"})
+    assert index.select(MetadataFilter.from_dict({"year": {"exists": False}})) == {3}
+    # 要求没有任何记录带有的键不存在时不限制记录
+    assert index.select(MetadataFilter.from_dict({"flag": {"exists": False}})) is None
+    assert MetadataFilter.from_dict({"year": {"exists": False}}).matches({"lang": "zh"})
+    assert MetadataFilter.from_dict({"year": {"exists": False}}).to_milvus_expr() == '(not (exists metadata["year"]))'
+    for bad in ({"year": {"like": 1}}, {"lang": {"in": "zh"}}, {"tags": ["x"]}, {"year": {}}, {"year": {"exists": 1}}):
+        with pytest.raises(ValueError):
+            MetadataFilter.from_dict(bad)
@@ -0,0 +1,93 @@
+import asyncio
+import threading
+import pytest
+from types import SimpleNamespace
+
+from rag_service.app.core.vectordb import milvus_pool
+from rag_service.app.core.vectordb.milvus_pool import MilvusConnectionPool
+
+@pytest.fixture
+def pool(monkeypatch):
+    """不连接真实服务端的连接池"""
+    monkeypatch.setattr(
+        milvus_pool, "connections", SimpleNamespace(connect=lambda **kwargs: None, disconnect=lambda alias: None)
+    )
+    pool = MilvusConnectionPool("localhost", 19530, size=1, name="test")
+    yield pool
+    pool.close()
+
+@pytest.mark.milvus
+def test_calls_run_on_bound_connection(pool):
+    """测试调用在线程池中执行，并使用线程绑定的连接"""
+    assert asyncio.run(pool.run(lambda: pool.alias)) == "test-0"
+    stats = pool.get_stats()
+    assert (stats["completed"], stats["failed"], stats["inflight"]) == (1, 0, 0)
+
+@pytest.mark.milvus
+def test_timeout_not_counted_as_completed(pool):
+    """测试超时抛出 TimeoutError，只计入超时数，不计入完成数和平均延迟"""
+    release = threading.Event()
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(pool.run(release.wait, timeout=0.05))
+    release.set()
+    stats = pool.get_stats()
+    assert (stats["timeouts"], stats["completed"], stats["avg_latency_ms"]) == (1, 0, 0.0)
+    assert stats["inflight"] == 0
+
+@pytest.mark.milvus
+def test_failure_not_counted_as_completed(pool):
+    """测试失败的调用只计入失败数"""
+    def fail():
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        asyncio.run(pool.run(fail))
+    asyncio.run(pool.run(lambda: None))
+    stats = pool.get_stats()
+    assert (stats["failed"], stats["completed"]) == (1, 1)
+
+@pytest.mark.milvus
+def test_cancel_skips_queued_call(pool):
+    """测试调用方被取消时计入取消数，排队中的调用不再执行"""
+    release = threading.Event()
+    ran = []
+
+    async def main():
+        busy = asyncio.create_task(pool.run(release.wait))
+        queued = asyncio.create_task(pool.run(ran.append, 1))
+        await asyncio.sleep(0.05)
+        queued.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await queued
+        release.set()
+        await busy
+
+    asyncio.run(main())
+    stats = pool.get_stats()
+    assert ran == []
+    assert (stats["cancelled"], stats["completed"], stats["inflight"]) == (1, 1, 0)
+
+@pytest.mark.milvus
+def test_queue_depth_counts_waiting_calls(pool):
+    """测试超出连接数的调用计入排队深度，结束后归零"""
+    release = threading.Event()
+
+    async def main():
+        tasks = [asyncio.create_task(pool.run(release.wait)) for _ in range(3)]
+        await asyncio.sleep(0.05)
+        during = pool.get_stats()
+        release.set()
+        await asyncio.gather(*tasks)
+        return during
+
+    during = asyncio.run(main())
+    assert (during["inflight"], during["queue_depth"]) == (3, 2)
+    after = pool.get_stats()
+    assert (after["inflight"], after["queue_depth"], after["completed"]) == (0, 0, 3)
+
+@pytest.mark.milvus
+def test_closed_pool_rejects_calls(pool):
+    """测试关闭后的连接池拒绝新的调用"""
+    pool.close()
+    with pytest.raises(RuntimeError):
+        asyncio.run(pool.run(lambda: None))
@@ -0,0 +1,542 @@
+import asyncio
+import re
+import threading
+import time
+import pytest
+import numpy as np
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+from pymilvus import MilvusException
+
+from rag_service.config.settings import settings
+from rag_service.app.core.vectordb import milvus_pool, milvus_store
+from rag_service.app.core.vectordb.milvus_store import MilvusStore
+from rag_service.app.core.vectordb.search_params import SearchParams
+
+DIMENSION = 4
+
+def _expr_ids(expr: Optional[str]) -> Optional[set]:
+    """解析 "id in [...]"，其他表达式视为匹配全部"""
+    match = re.fullmatch(r"id in \[(.*)\]", expr or "")
+    if match is None:
+        return None
+    return {int(i) for i in match.group(1).split(",") if i.strip()}
+
+class FakeMilvus:
+    """
+    内存中的 Milvus 服务端，只实现 MilvusStore 用到的接口
+
+    别名在每次调用时解析（与服务端行为一致），未加载的分区不能查询和检索。
+    """
+
+    def __init__(self):
+        self.collections: Dict[str, SimpleNamespace] = {}
+        self.aliases: Dict[str, str] = {}
+        self.calls: List[tuple] = []
+        self._next_id = 1
+        self.utility = SimpleNamespace(
+            has_collection=lambda name, using="default", **kwargs: name in self.collections or name in self.aliases,
+            create_alias=self.create_alias,
+            alter_alias=self.alter_alias,
+            drop_alias=self.drop_alias,
+            drop_collection=self.drop_collection,
+            wait_for_index_building_complete=lambda name, using="default", **kwargs: True,
+            get_query_segment_info=self.get_query_segment_info
+        )
+
+    def Collection(self, name: str, schema=None, using: str = "default", **kwargs) -> "FakeCollection":
+        if name not in self.collections and name not in self.aliases:
+            if schema is None:
+                raise MilvusException(message=f"collection not found[{name}]")
+            self.collections[name] = SimpleNamespace(
+                name=name, schema=schema, index={}, partitions={"_default": {}}, loaded=set()
+            )
+        return FakeCollection(self, name)
+
+    def resolve(self, name: str) -> SimpleNamespace:
+        data = self.collections.get(self.aliases.get(name, name))
+        if data is None:
+            raise MilvusException(message=f"collection not found[{name}]")
+        return data
+
+    def create_alias(self, collection_name: str, alias: str, using: str = "default", **kwargs) -> None:
+        if alias in self.aliases or alias in self.collections:
+            raise MilvusException(message=f"alias {alias} already exists")
+        self.aliases[alias] = collection_name
+
+    def alter_alias(self, collection_name: str, alias: str, using: str = "default", **kwargs) -> None:
+        if alias not in self.aliases:
+            raise MilvusException(message=f"alias {alias} not found")
+        self.aliases[alias] = collection_name
+
+    def drop_alias(self, alias: str, using: str = "default", **kwargs) -> None:
+        self.aliases.pop(alias, None)
+
+    def drop_collection(self, name: str, using: str = "default", **kwargs) -> None:
+        if name in self.aliases.values():
+            raise MilvusException(message=f"collection {name} still has aliases")
+        self.collections.pop(name, None)
+
+    def get_query_segment_info(self, name: str, timeout=None, using: str = "default", **kwargs) -> list:
+        data = self.resolve(name)
+        return [SimpleNamespace(num_rows=len(rows)) for rows in data.partitions.values() if rows]
+
+    def physical(self, alias: str = "rag_documents") -> str:
+        return self.aliases[alias]
+
+    def rows(self, alias: str = "rag_documents", partition: str = "_default") -> Dict[int, dict]:
+        return self.resolve(alias).partitions[partition]
+
+class FakePartition:
+    def __init__(self, collection: "FakeCollection", name: str):
+        self.collection = collection
+        self.name = name
+
+    def load(self, timeout=None, **kwargs) -> None:
+        self.collection.server.calls.append(("load", self.name))
+        self.collection._data.loaded.add(self.name)
+
+    def release(self, timeout=None, **kwargs) -> None:
+        self.collection.server.calls.append(("release", self.name))
+        self.collection._data.loaded.discard(self.name)
+
+class FakeCollection:
+    def __init__(self, server: FakeMilvus, name: str):
+        self.server = server
+        self.name = name
+
+    @property
+    def _data(self) -> SimpleNamespace:
+        return self.server.resolve(self.name)
+
+    @property
+    def schema(self):
+        return self._data.schema
+
+    @property
+    def num_entities(self) -> int:
+        return sum(len(rows) for rows in self._data.partitions.values())
+
+    @property
+    def partitions(self) -> List[FakePartition]:
+        return [FakePartition(self, name) for name in self._data.partitions]
+
+    def describe(self) -> Dict[str, Any]:
+        return {"collection_name": self._data.name}
+
+    def create_index(self, field_name: str, index_params: Dict[str, Any], **kwargs) -> None:
+        self._data.index = index_params
+
+    def index(self, index_name: str = "", **kwargs):
+        return SimpleNamespace(params=self._data.index)
+
+    def has_partition(self, name: str, **kwargs) -> bool:
+        return name in self._data.partitions
+
+    def create_partition(self, name: str, **kwargs) -> None:
+        self._data.partitions.setdefault(name, {})
+
+    def partition(self, name: str, **kwargs) -> Optional[FakePartition]:
+        return FakePartition(self, name) if name in self._data.partitions else None
+
+    def load(self, partition_names: Optional[List[str]] = None, **kwargs) -> None:
+        self._data.loaded.update(partition_names or self._data.partitions)
+
+    def flush(self, **kwargs) -> None:
+        self.server.calls.append(("flush", self._data.name))
+
+    def _partition_rows(self, name: str, loaded: bool = False) -> Dict[int, dict]:
+        data = self._data
+        if name not in data.partitions:
+            raise MilvusException(message=f"partition not found[{name}]")
+        if loaded and name not in data.loaded:
+            raise MilvusException(message=f"partition not loaded[{name}]")
+        return data.partitions[name]
+
+    def _write(self, data: list, partition_name: str) -> List[int]:
+        if self.schema.auto_id:
+            texts, vectors, metadatas = data
+            ids = list(range(self.server._next_id, self.server._next_id + len(texts)))
+            self.server._next_id += len(texts)
+        else:
+            ids, texts, vectors, metadatas = data
+        rows = self._partition_rows(partition_name)
+        for pk, text, vector, metadata in zip(ids, texts, vectors, metadatas):
+            rows[int(pk)] = {"id": int(pk), "text": text, "embedding": list(vector), "metadata": metadata}
+        return list(ids)
+
+    def insert(self, data: list, partition_name: str = "_default", timeout=None, **kwargs):
+        self.server.calls.append(("insert", self._data.name, partition_name, len(data[0])))
+        return SimpleNamespace(primary_keys=self._write(data, partition_name))
+
+    def upsert(self, data: list, partition_name: str = "_default", timeout=None, **kwargs):
+        return SimpleNamespace(primary_keys=self._write(data, partition_name))
+
+    def delete(self, expr: str, timeout=None, **kwargs) -> None:
+        ids = _expr_ids(expr)
+        for rows in self._data.partitions.values():
+            for pk in ids:
+                rows.pop(pk, None)
+
+    def query_iterator(
+        self, batch_size: int, expr: str, output_fields: List[str], partition_names: List[str], **kwargs
+    ):
+        ids = _expr_ids(expr)
+        rows = [
+            {field: row[field] for field in output_fields}
+            for name in partition_names
+            for pk, row in sorted(self._partition_rows(name, loaded=True).items())
+            if ids is None or pk in ids
+        ]
+        batches = iter([rows[i:i + batch_size] for i in range(0, len(rows), batch_size)])
+        return SimpleNamespace(next=lambda: next(batches, []), close=lambda: None)
+
+    def search(self, data, anns_field, param, limit, expr=None, partition_names=None, output_fields=None, timeout=None):
+        self.server.calls.append(("search", tuple(partition_names), len(data), param["params"]["nprobe"], timeout))
+        rows = [row for name in partition_names for row in self._partition_rows(name, loaded=True).values()]
+        results = []
+        for query in np.asarray(data, dtype=np.float32):
+            scored = sorted(
+                (float(np.sum((np.asarray(row["embedding"]) - query) ** 2)), row) for row in rows
+            ) if rows else []
+            results.append([
+                SimpleNamespace(
+                    id=row["id"], distance=distance, entity={"text": row["text"], "metadata": row["metadata"]}
+                )
+                for distance, row in scored[:limit]
+            ])
+        return results
+
+@pytest.fixture
+def milvus(monkeypatch):
+    """替换 pymilvus 的假服务端，关闭后台维护"""
+    server = FakeMilvus()
+    monkeypatch.setattr(milvus_store, "Collection", server.Collection)
+    monkeypatch.setattr(milvus_store, "utility", server.utility)
+    monkeypatch.setattr(
+        milvus_pool, "connections", SimpleNamespace(connect=lambda **kwargs: None, disconnect=lambda alias: None)
+    )
+    monkeypatch.setattr(settings, "INDEX_MAINTENANCE_INTERVAL", 0)
+    monkeypatch.setattr(settings, "MILVUS_TIMEOUT", None)
+    return server
+
+@pytest.fixture
+def store(milvus, embeddings):
+    store = MilvusStore(embeddings)
+    yield store
+    asyncio.run(store.close())
+
+def random_vectors(n: int, seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).random((n, DIMENSION), dtype=np.float32)
+
+@pytest.mark.milvus
+def test_maintain_skips_small_collection(store, milvus):
+    """测试行数不足以训练 MILVUS_IVF_NLIST 个聚类中心时不重建"""
+    asyncio.run(store.add_vectors([f"t{i}" for i in range(100)], random_vectors(100)))
+    physical = milvus.physical()
+    assert not store.maintain()
+    assert milvus.physical() == physical
+
+@pytest.mark.milvus
+def test_maintain_rebuilds_and_keeps_ids(store, milvus, monkeypatch):
+    """测试重建后别名切到新集合，ID 不变，旧集合和维护锁都被删除"""
+    monkeypatch.setattr(settings, "MILVUS_IVF_NLIST", 1)
+    ids = asyncio.run(store.add_vectors([f"t{i}" for i in range(100)], random_vectors(100)))
+    old = milvus.physical()
+
+    assert store.maintain()
+    assert milvus.physical() != old
+    assert old not in milvus.collections
+    assert "rag_documents_maintenance" not in milvus.aliases
+    assert sorted(milvus.rows()) == sorted(int(i) for i in ids)
+    assert milvus.resolve("rag_documents").index["params"]["nlist"] == 2
+
+    # 新集合由客户端生成ID
+    new_ids = asyncio.run(store.add_vectors(["x"], random_vectors(1, seed=1)))
+    assert int(new_ids[0]) in milvus.rows()
+
+@pytest.mark.milvus
+def test_maintain_catches_up_other_process_writes(store, milvus, monkeypatch):
+    """测试其他进程在复制期间和切换前写入旧集合的行被补到新集合，删除的行不会复活"""
+    ids = asyncio.run(store.add_vectors([f"t{i}" for i in range(10)], random_vectors(10)))
+    old = milvus.Collection(milvus.physical())
+    vectors = random_vectors(2, seed=2)
+    copy_partition = store._copy_partition
+    catch_up = store._catch_up
+    passes = []
+    late = []
+
+    def copy_then_write(*args, **kwargs):
+        copied = copy_partition(*args, **kwargs)
+        if not passes:
+            passes.append("copy")
+            # 其他进程在复制期间写入和删除
+            late.extend(old.insert([["late"], vectors[:1], [{}]], partition_name="_default").primary_keys)
+            old.delete(f"id in [{ids[0]}]")
+        return copied
+
+    def write_then_catch_up(*args, **kwargs):
+        passes.append("catch_up")
+        if passes.count("catch_up") == 2:
+            # 切换前已发出的写入在切换后才落到旧集合
+            late.extend(old.insert([["later"], vectors[1:], [{}]], partition_name="_default").primary_keys)
+        return catch_up(*args, **kwargs)
+
+    monkeypatch.setattr(store, "_copy_partition", copy_then_write)
+    monkeypatch.setattr(store, "_catch_up", write_then_catch_up)
+    assert store.maintain(force=True)
+
+    rows = milvus.rows()
+    assert len(late) == 2 and set(late) <= set(rows)
+    assert int(ids[0]) not in rows
+    assert len(rows) == 11
+
+@pytest.mark.milvus
+def test_maintain_replays_deletes_into_shadow(store, milvus, monkeypatch):
+    """测试维护期间本进程的删除在切换前重放到影子集合，复制晚于删除写入的行不会复活"""
+    ids = asyncio.run(store.add_vectors([f"t{i}" for i in range(10)], random_vectors(10)))
+    copy_partition = store._copy_partition
+
+    def copy_racing_delete(source, name, shadow, *args, **kwargs):
+        copied = copy_partition(source, name, shadow, *args, **kwargs)
+        row = dict(milvus.rows(shadow.name, name)[int(ids[0])])
+        asyncio.run(store.delete([ids[0]]))
+        # 复制读到的旧行在删除之后才写入影子集合
+        shadow.upsert([[row["id"]], [row["text"]], [row["embedding"]], [row["metadata"]]], partition_name=name)
+        return copied
+
+    monkeypatch.setattr(store, "_copy_partition", copy_racing_delete)
+    # 只验证删除重放，不依赖切换前后的补写
+    monkeypatch.setattr(store, "_catch_up", lambda old, shadow, copied: None)
+    assert store.maintain(force=True)
+    assert int(ids[0]) not in milvus.rows()
+    assert len(milvus.rows()) == 9
+
+@pytest.mark.milvus
+def test_maintain_waits_for_other_process_lock(store, milvus):
+    """测试其他进程持有维护锁时不重建，锁过期后接手并清理遗留的影子集合"""
+    asyncio.run(store.add_vectors(["a"], random_vectors(1)))
+    physical = milvus.physical()
+    holder = milvus.Collection(f"rag_documents_{time.time_ns()}", schema=milvus.resolve(physical).schema)
+    milvus.create_alias(holder.name, "rag_documents_maintenance")
+    collections = set(milvus.collections)
+
+    assert not store.maintain(force=True)
+    assert milvus.physical() == physical
+    assert set(milvus.collections) == collections
+
+    # 持有者崩溃，锁过期
+    milvus.collections["rag_documents_1"] = milvus.collections.pop(holder.name)
+    milvus.collections["rag_documents_1"].name = "rag_documents_1"
+    milvus.aliases["rag_documents_maintenance"] = "rag_documents_1"
+    assert store.maintain(force=True)
+    assert "rag_documents_1" not in milvus.collections
+    assert "rag_documents_maintenance" not in milvus.aliases
+    assert set(milvus.collections) == {milvus.physical()}
+
+@pytest.fixture
+def buffered_store(milvus, monkeypatch, embeddings):
+    """开启写缓冲的存储，后台 flush 间隔足够长，由测试控制"""
+    monkeypatch.setattr(settings, "MILVUS_WRITE_BUFFER_ROWS", 5)
+    monkeypatch.setattr(settings, "MILVUS_FLUSH_ROWS", 8)
+    monkeypatch.setattr(settings, "MILVUS_FLUSH_INTERVAL", 3600.0)
+    store = MilvusStore(embeddings)
+    yield store
+    asyncio.run(store.close())
+
+def inserts(milvus: FakeMilvus) -> List[tuple]:
+    return [call[2:] for call in milvus.calls if call[0] == "insert"]
+
+@pytest.mark.milvus
+def test_buffer_drains_by_size(buffered_store, milvus):
+    """测试写缓冲攒够 MILVUS_WRITE_BUFFER_ROWS 行才按分区合成批次插入"""
+    first = asyncio.run(buffered_store.add_vectors(["a", "b", "c"], random_vectors(3)))
+    assert inserts(milvus) == []
+    assert buffered_store.get_stats()["pending_rows"] == 3
+
+    second = asyncio.run(buffered_store.add_vectors(["d", "e"], random_vectors(2, seed=1), namespace="t1"))
+    assert inserts(milvus) == [("_default", 3), ("ns_t1", 2)]
+    assert sorted(milvus.rows()) == sorted(int(i) for i in first)
+    assert sorted(milvus.rows(partition="ns_t1")) == sorted(int(i) for i in second)
+    # 未攒够 MILVUS_FLUSH_ROWS，不 flush
+    assert not [call for call in milvus.calls if call[0] == "flush"]
+    stats = buffered_store.get_stats()
+    assert (stats["pending_rows"], stats["unflushed_rows"], stats["insert_batches"]) == (0, 5, 2)
+
+@pytest.mark.milvus
+def test_buffer_flushes_by_rows(buffered_store, milvus):
+    """测试已插入的行攒够 MILVUS_FLUSH_ROWS 时 flush"""
+    for seed in range(2):
+        asyncio.run(buffered_store.add_vectors([f"t{i}" for i in range(5)], random_vectors(5, seed=seed)))
+    assert [call[0] for call in milvus.calls if call[0] in ("insert", "flush")] == ["insert", "insert", "flush"]
+    assert buffered_store.get_stats()["unflushed_rows"] == 0
+
+@pytest.mark.milvus
+def test_commit_drains_and_flushes(buffered_store, milvus):
+    """测试 commit 插入缓冲中的全部记录并 flush"""
+    ids = asyncio.run(buffered_store.add_vectors(["a", "b"], random_vectors(2)))
+    asyncio.run(buffered_store.commit())
+    assert sorted(milvus.rows()) == sorted(int(i) for i in ids)
+    assert buffered_store.get_stats()["flushes"] == 1
+
+    # 没有新写入时不重复 flush
+    asyncio.run(buffered_store.commit())
+    assert buffered_store.get_stats()["flushes"] == 1
+
+@pytest.mark.milvus
+def test_buffer_flushed_by_interval(milvus, monkeypatch, embeddings):
+    """测试后台任务每 MILVUS_FLUSH_INTERVAL 秒插入并 flush 一次"""
+    monkeypatch.setattr(settings, "MILVUS_WRITE_BUFFER_ROWS", 100)
+    monkeypatch.setattr(settings, "MILVUS_FLUSH_INTERVAL", 0.05)
+    store = MilvusStore(embeddings)
+    try:
+        ids = asyncio.run(store.add_vectors(["a"], random_vectors(1)))
+        deadline = time.monotonic() + 5
+        while not store.get_stats()["flushes"] and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert list(milvus.rows()) == [int(ids[0])]
+        assert store.get_stats()["flushes"] == 1
+    finally:
+        asyncio.run(store.close())
+
+@pytest.mark.milvus
+def test_delete_discards_buffered_rows(buffered_store, milvus):
+    """测试删除还在写缓冲中的记录时直接从缓冲中去掉，剩余行的向量不错位"""
+    vectors = random_vectors(3)
+    ids = asyncio.run(buffered_store.add_vectors(["a", "b", "c"], vectors, metadatas=[{"i": 0}, {"i": 1}, {"i": 2}]))
+    asyncio.run(buffered_store.delete([ids[1]]))
+    asyncio.run(buffered_store.commit())
+
+    rows = milvus.rows()
+    assert sorted(rows) == sorted([int(ids[0]), int(ids[2])])
+    for i in (0, 2):
+        row = rows[int(ids[i])]
+        assert row["metadata"] == {"i": i}
+        np.testing.assert_allclose(row["embedding"], vectors[i])
+
+    # 全部删除后缓冲为空
+    more = asyncio.run(buffered_store.add_vectors(["d"], random_vectors(1)))
+    asyncio.run(buffered_store.delete(more))
+    assert buffered_store.get_stats()["pending_rows"] == 0
+
+@pytest.mark.milvus
+def test_generated_ids_unique_and_increasing(buffered_store, monkeypatch):
+    """测试同一毫秒内序号用完时借用下一毫秒，生成的ID严格递增"""
+    monkeypatch.setattr(milvus_store, "time", SimpleNamespace(time=lambda: 1800000000.0))
+    ids = buffered_store._generate_ids(5000)
+    assert ids == sorted(set(ids))
+    assert ids[4096] >> 22 == (ids[0] >> 22) + 1
+
+@pytest.mark.milvus
+def test_segment_stats_refreshed_through_pool(store, milvus, monkeypatch):
+    """测试段信息经连接池在后台查询，不在事件循环中阻塞调用"""
+    asyncio.run(store.add_vectors(["a", "b"], random_vectors(2)))
+    threads = []
+    get_query_segment_info = milvus.utility.get_query_segment_info
+
+    def record_thread(*args, **kwargs):
+        threads.append(threading.current_thread().name)
+        return get_query_segment_info(*args, **kwargs)
+
+    monkeypatch.setattr(milvus.utility, "get_query_segment_info", record_thread)
+
+    async def stats_twice():
+        first = store.get_stats()
+        await store._segment_refresh
+        return first, store.get_stats()
+
+    first, second = asyncio.run(stats_twice())
+    assert "segments" not in first
+    assert (second["segments"], second["avg_segment_rows"]) == (1, 2.0)
+    assert threads and all(name.startswith("rag-rag_documents") for name in threads)
+
+def add_to_namespaces(store: MilvusStore, *namespaces: str) -> None:
+    for i, namespace in enumerate(namespaces):
+        asyncio.run(store.add_vectors([namespace], random_vectors(1, seed=i), namespace=namespace))
+
+def search(store: MilvusStore, namespace: str) -> List[Dict[str, Any]]:
+    return asyncio.run(store.search_vectors(random_vectors(1), k=1, namespace=namespace))[0]
+
+@pytest.mark.milvus
+def test_partitions_evicted_least_recently_used(store, milvus, monkeypatch):
+    """测试超过 MILVUS_LOADED_PARTITIONS 时释放最久未访问的分区"""
+    monkeypatch.setattr(settings, "MILVUS_LOADED_PARTITIONS", 2)
+    add_to_namespaces(store, "a", "b", "c")
+    for namespace in ("a", "b", "a", "c"):
+        assert search(store, namespace)[0]["text"] == namespace
+
+    assert list(store._loaded) == ["ns_a", "ns_c"]
+    assert milvus.resolve("rag_documents").loaded == {"ns_a", "ns_c"}
+    assert [call for call in milvus.calls if call[0] == "release"] == [("release", "ns_b")]
+
+    # 没有数据的命名空间不加载
+    assert search(store, "empty") == []
+    assert list(store._loaded) == ["ns_a", "ns_c"]
+
+@pytest.mark.milvus
+def test_partition_in_use_not_evicted(store, milvus, monkeypatch):
+    """测试正在检索的分区不会被释放"""
+    monkeypatch.setattr(settings, "MILVUS_LOADED_PARTITIONS", 1)
+    add_to_namespaces(store, "a", "b")
+    assert store._acquire_partition("ns_a")
+    try:
+        search(store, "b")
+        assert "ns_a" in milvus.resolve("rag_documents").loaded
+    finally:
+        store._release_partition("ns_a")
+
+    search(store, "b")
+    assert list(store._loaded) == ["ns_b"]
+    assert milvus.resolve("rag_documents").loaded == {"ns_b"}
+
+@pytest.mark.milvus
+def test_search_reloads_partition_released_elsewhere(store, milvus):
+    """测试分区被其他进程释放后，检索重新加载并重试"""
+    add_to_namespaces(store, "a")
+    search(store, "a")
+    milvus.resolve("rag_documents").loaded.discard("ns_a")
+
+    assert search(store, "a")[0]["text"] == "a"
+    assert "ns_a" in milvus.resolve("rag_documents").loaded
+
+@pytest.mark.milvus
+def test_eviction_tolerates_release_failure(store, milvus, monkeypatch):
+    """测试释放分区失败时只记录日志，不影响检索"""
+    monkeypatch.setattr(settings, "MILVUS_LOADED_PARTITIONS", 1)
+    add_to_namespaces(store, "a", "b")
+    search(store, "a")
+
+    def fail(self, timeout=None, **kwargs):
+        raise MilvusException(message="partition not found[ns_a]")
+
+    monkeypatch.setattr(FakePartition, "release", fail)
+    assert search(store, "b")[0]["text"] == "b"
+    assert list(store._loaded) == ["ns_b"]
+
+def search_calls(milvus: FakeMilvus) -> List[tuple]:
+    return [call[2:] for call in milvus.calls if call[0] == "search"]
+
+@pytest.mark.milvus
+def test_latency_budget_lowers_nprobe(store, milvus, monkeypatch):
+    """测试耗时预算按观测到的检索耗时降低 nprobe，调用超时仍为 MILVUS_TIMEOUT"""
+    monkeypatch.setattr(settings, "MILVUS_TIMEOUT", 5)
+    asyncio.run(store.add_vectors(["a"], random_vectors(1)))
+    budget = SearchParams(nprobe=8, latency_budget_ms=3)
+    # 还没有观测到耗时时不降低
+    asyncio.run(store.search_vectors(random_vectors(1), k=1, params=budget))
+    assert store._search_cost is not None
+    store._search_cost = 1.0
+    asyncio.run(store.search_vectors(random_vectors(1), k=1, params=budget))
+    asyncio.run(store.search_vectors(random_vectors(2), k=1, params=SearchParams(nprobe=8, latency_budget_ms=0.1)))
+    assert search_calls(milvus) == [(1, 8, 5), (1, 3, 5), (2, 1, 5)]
+
+@pytest.mark.milvus
+def test_search_splits_queries_over_max_nq(store, milvus, monkeypatch):
+    """测试查询数超过 nq 上限时分批检索，结果与查询一一对应"""
+    monkeypatch.setattr(milvus_store, "_MAX_NQ", 2)
+    vectors = random_vectors(5)
+    ids = asyncio.run(store.add_vectors([f"t{i}" for i in range(5)], vectors))
+    results = asyncio.run(store.search_vectors(vectors, k=1))
+    assert [docs[0]["id"] for docs in results] == ids
+    assert [call[0] for call in search_calls(milvus)] == [2, 2, 1]
@@ -0,0 +1,179 @@
+import asyncio
+import pytest
+import numpy as np
+from typing import List
+
+from rag_service.config.settings import settings
+from rag_service.app.core.vectordb.filters import MetadataFilter
+from rag_service.app.core.vectordb.numpy_store import NumpyStore, RECORDS_FILE, quantize_int8
+
+DIMENSION = 16
+
+def random_vectors(n: int, seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).standard_normal((n, DIMENSION)).astype(np.float32)
+
+def exact_top_k(queries: np.ndarray, vectors: np.ndarray, ids: List[int], k: int) -> List[List[int]]:
+    distances = ((queries[:, None, :] - vectors[None, :, :]) ** 2).sum(-1)
+    return [[ids[j] for j in row] for row in distances.argsort(1)[:, :k]]
+
+def result_ids(results) -> List[List[int]]:
+    return [[int(doc["id"]) for doc in docs] for docs in results]
+
+@pytest.fixture
+def memory_store(monkeypatch, embeddings):
+    monkeypatch.setattr(settings, "NUMPY_STORE_DIR", None)
+    return NumpyStore(embeddings)
+
+@pytest.fixture
+def store_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "NUMPY_STORE_DIR", str(tmp_path))
+    return tmp_path
+
+@pytest.mark.numpy
+@pytest.mark.parametrize("dtype", ["float32", "float16", "int8"])
+def test_exact_search_with_quantization(monkeypatch, dtype, embeddings):
+    """测试各存储类型的检索结果与暴力计算一致（压缩存储经 float32 重排）"""
+    monkeypatch.setattr(settings, "NUMPY_STORE_DIR", None)
+    monkeypatch.setattr(settings, "NUMPY_STORE_DTYPE", dtype)
+    store = NumpyStore(embeddings)
+    vectors = random_vectors(3000)
+    # 分多次写入，覆盖扩容
+    ids = []
+    for start in range(0, 3000, 700):
+        texts = [f"t{i}" for i in range(start, min(start + 700, 3000))]
+        ids += asyncio.run(store.add_vectors(texts, vectors[start:start + 700]))
+    assert ids == [str(i) for i in range(3000)]
+
+    queries = random_vectors(20, seed=1)
+    expected = exact_top_k(queries, vectors, list(range(3000)), 10)
+    results = asyncio.run(store.search_vectors(queries, k=10))
+    if dtype == "float32":
+        assert result_ids(results) == expected
+    else:
+        recall = np.mean([len(set(got) & set(want)) / 10 for got, want in zip(result_ids(results), expected)])
+        assert recall >= 0.95
+    # 分数是精确的 L2 平方距离
+    top = int(results[0][0]["id"])
+    assert results[0][0]["score"] == pytest.approx(float(((queries[0] - vectors[top]) ** 2).sum()), rel=1e-4)
+
+@pytest.mark.numpy
+def test_quantize_int8():
+    """测试按行量化的误差在一个量化步长以内"""
+    vectors = random_vectors(100) * np.arange(1, 101, dtype=np.float32)[:, None]
+    codes, scales = quantize_int8(vectors)
+    assert codes.dtype == np.int8
+    assert np.all(np.abs(codes * scales[:, None] - vectors) <= scales[:, None] / 2 + 1e-6)
+
+@pytest.mark.numpy
+def test_delete_upsert_and_filter(memory_store):
+    """测试删除、按ID覆盖与元数据过滤"""
+    vectors = random_vectors(50)
+    metadatas = [{"group": i % 5} for i in range(50)]
+    asyncio.run(memory_store.add_vectors([f"t{i}" for i in range(50)], vectors, metadatas))
+    asyncio.run(memory_store.delete(["0", "1", "404"]))
+    results = asyncio.run(memory_store.search_vectors(vectors[:2], k=1))
+    assert result_ids(results)[0] != [0] and result_ids(results)[1] != [1]
+
+    asyncio.run(memory_store.add_vectors(["new"], vectors[10:11] + 100, [{"group": 9}], ids=["10"]))
+    results = asyncio.run(memory_store.search_vectors(vectors[10:11] + 100, k=1))
+    assert results[0][0]["id"] == "10" and results[0][0]["text"] == "new"
+
+    metadata_filter = MetadataFilter.from_dict({"group": 3})
+    results = asyncio.run(memory_store.search_vectors(vectors[:3], k=4, filter=metadata_filter))
+    expected_ids = [i for i in range(2, 50) if i != 10 and i % 5 == 3]
+    assert result_ids(results) == exact_top_k(vectors[:3], vectors[expected_ids], expected_ids, 4)
+    missing = MetadataFilter.from_dict({"group": 7})
+    assert asyncio.run(memory_store.search_vectors(vectors[:1], k=4, filter=missing)) == [[]]
+
+@pytest.mark.numpy
+def test_persistence_and_truncated_log(store_dir, embeddings):
+    """测试重启后重放日志恢复数据，中断写入的最后一行被截掉"""
+    store = NumpyStore(embeddings)
+    vectors = random_vectors(30)
+    asyncio.run(store.add_vectors([f"t{i}" for i in range(30)], vectors, [{"i": i} for i in range(30)]))
+    asyncio.run(store.delete(["3"]))
+    expected = result_ids(asyncio.run(store.search_vectors(vectors[:5], k=3)))
+    asyncio.run(store.close())
+    with open(store.generation / RECORDS_FILE, "a", encoding="utf-8") as f:
+        f.write('{"op": "add", "id": 99, "ro')
+
+    reopened = NumpyStore(embeddings)
+    assert len(reopened.docstore) == 29 and 3 not in reopened.docstore
+    assert result_ids(asyncio.run(reopened.search_vectors(vectors[:5], k=3))) == expected
+    assert asyncio.run(reopened.add_vectors(["next"], vectors[:1])) == ["30"]
+    asyncio.run(reopened.close())
+    assert len(NumpyStore(embeddings).docstore) == 30
+
+@pytest.mark.numpy
+def test_compaction(store_dir, monkeypatch, embeddings):
+    """测试删除过半后压缩为新的数据目录，检索结果与ID保持不变"""
+    monkeypatch.setattr(settings, "NUMPY_STORE_DTYPE", "int8")
+    store = NumpyStore(embeddings)
+    vectors = random_vectors(2000)
+    asyncio.run(store.add_vectors([f"t{i}" for i in range(2000)], vectors))
+    old_generation = store.generation
+    asyncio.run(store.delete([str(i) for i in range(0, 2000, 2)] + [str(i) for i in range(1, 400, 2)]))
+    assert store.generation != old_generation and not old_generation.exists()
+    assert store.vectors.rows == len(store.docstore) == 800
+
+    alive = list(range(401, 2000, 2))
+    queries = random_vectors(5, seed=2)
+    assert result_ids(asyncio.run(store.search_vectors(queries, k=5))) == exact_top_k(queries, vectors[alive], alive, 5)
+    asyncio.run(store.close())
+    reopened = NumpyStore(embeddings)
+    expected = exact_top_k(queries, vectors[alive], alive, 5)
+    assert result_ids(asyncio.run(reopened.search_vectors(queries, k=5))) == expected
+    assert asyncio.run(reopened.add_vectors(["next"], vectors[:1])) == ["2000"]
+
+@pytest.mark.numpy
+def test_compaction_during_search(memory_store, monkeypatch):
+    """测试检索线程算完距离后发生压缩，结果仍按检索开始时的行号解析"""
+    vectors = random_vectors(40)
+    asyncio.run(memory_store.add_vectors([f"t{i}" for i in range(40)], vectors))
+    asyncio.run(memory_store.delete([str(i) for i in range(0, 40, 2)]))
+
+    search = memory_store._search
+
+    def search_then_compact(*args):
+        result = search(*args)
+        memory_store.compact()
+        return result
+
+    monkeypatch.setattr(memory_store, "_search", search_then_compact)
+    alive = list(range(1, 40, 2))
+    results = asyncio.run(memory_store.search_vectors(vectors[alive], k=1))
+    assert result_ids(results) == [[i] for i in alive]
+    assert [docs[0]["text"] for docs in results] == [f"t{i}" for i in alive]
+    assert memory_store.vectors.rows == 20
+
+@pytest.mark.numpy
+def test_clear(store_dir, embeddings):
+    """测试清空后不复用旧ID，重启后仍为空"""
+    store = NumpyStore(embeddings)
+    asyncio.run(store.add_vectors(["a", "b"], random_vectors(2)))
+    asyncio.run(store.clear())
+    asyncio.run(store.close())
+    store = NumpyStore(embeddings)
+    assert asyncio.run(store.search_vectors(random_vectors(1), k=2)) == [[]]
+    assert asyncio.run(store.add_vectors(["c"], random_vectors(1))) == ["2"]
+    asyncio.run(store.close())
+    assert list(NumpyStore(embeddings).docstore) == [2]
+
+@pytest.mark.numpy
+def test_namespace_as_metadata_filter(memory_store):
+    """测试不原生支持命名空间的存储按元数据中的 namespace 过滤"""
+    texts = [f"text {i}" for i in range(20)]
+    metadatas = [{"namespace": "a" if i % 2 else "b", "n": i} for i in range(20)]
+    asyncio.run(memory_store.add_vectors(texts, random_vectors(20), metadatas))
+
+    docs = asyncio.run(memory_store.similarity_search("query", k=20, namespace="a"))
+    assert len(docs) == 10 and all(doc["metadata"]["namespace"] == "a" for doc in docs)
+    docs = asyncio.run(memory_store.similarity_search(
+        "query", k=20, filter=MetadataFilter.from_dict({"n": {"lt": 10}}), namespace="b"
+    ))
+    assert sorted(doc["metadata"]["n"] for doc in docs) == [0, 2, 4, 6, 8]
+    # 未指定命名空间时只检索默认命名空间（元数据没有 namespace 的记录），与 Milvus 一致
+    assert asyncio.run(memory_store.similarity_search("query", k=20)) == []
+    asyncio.run(memory_store.add_vectors(["default"], random_vectors(1), [{"n": 20}]))
+    docs = asyncio.run(memory_store.similarity_search("query", k=20))
+    assert [doc["metadata"] for doc in docs] == [{"n": 20}]
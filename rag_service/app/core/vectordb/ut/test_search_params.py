@@ -0,0 +1,17 @@
+import pytest
+
+from rag_service.config.settings import settings
+from rag_service.app.core.vectordb.search_params import SearchParams, resolve_search_params
+
+@pytest.mark.search_params
+def test_resolve_search_params(monkeypatch):
+    """测试预设与单独指定的检索参数合并"""
+    assert resolve_search_params() == SearchParams()
+    assert resolve_search_params("fast") == SearchParams(nprobe=4, ef=32)
+    assert resolve_search_params("accurate", nprobe=8, latency_budget_ms=50) == (
+        SearchParams(nprobe=8, ef=256, latency_budget_ms=50)
+    )
+    monkeypatch.setattr(settings, "SEARCH_DEFAULT_PRESET", "balanced")
+    assert resolve_search_params().nprobe == 16
+    with pytest.raises(ValueError):
+        resolve_search_params("turbo")
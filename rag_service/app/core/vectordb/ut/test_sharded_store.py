@@ -0,0 +1,110 @@
+import asyncio
+import pytest
+import numpy as np
+
+from rag_service.config.settings import settings
+from rag_service.app.core.vectordb.base import BaseVectorDB
+from rag_service.app.core.vectordb.faiss_store import FAISSStore
+from rag_service.app.core.vectordb.numpy_store import NumpyStore
+from rag_service.app.core.vectordb.search_params import SearchParams
+from rag_service.app.core.vectordb.sharded_store import ShardedStore
+
+DIMENSION = 16
+
+class SlowStore(BaseVectorDB):
+    """检索超过截止时间的假分片"""
+
+    async def add_vectors(self, texts, vectors, metadatas=None, **kwargs):
+        return [str(i) for i in range(len(texts))]
+
+    async def search_vectors(self, vectors, k=4, **kwargs):
+        await asyncio.sleep(5)
+        return [[] for _ in vectors]
+
+    async def delete(self, ids):
+        pass
+
+    async def clear(self):
+        pass
+
+def random_vectors(n: int, seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).standard_normal((n, DIMENSION)).astype(np.float32)
+
+@pytest.fixture
+def embeddings(embeddings, monkeypatch):
+    monkeypatch.setattr(settings, "NUMPY_STORE_DIR", None)
+    return embeddings
+
+@pytest.mark.shard
+def test_merge_matches_single_store(embeddings):
+    """测试分片检索归并后的 top-k 与单个存储一致，同一文档的块落在同一分片"""
+    vectors = random_vectors(500)
+    texts = [f"t{i}" for i in range(500)]
+    metadatas = [{"doc_id": f"doc{i // 5}"} for i in range(500)]
+    single = NumpyStore(embeddings)
+    sharded = ShardedStore(embeddings, [NumpyStore(embeddings, shard=i) for i in range(4)])
+    asyncio.run(single.add_vectors(texts, vectors, metadatas))
+    ids = asyncio.run(sharded.add_vectors(texts, vectors, metadatas))
+
+    assert sum(len(shard.docstore) for shard in sharded.shards) == 500
+    assert all(shard.docstore for shard in sharded.shards)
+    assert len({ids[i].split(":")[0] for i in range(5)}) == 1
+
+    queries = random_vectors(8, seed=1)
+    expected = asyncio.run(single.search_vectors(queries, k=10))
+    results = asyncio.run(sharded.search_vectors(queries, k=10))
+    for want, got in zip(expected, results):
+        assert not got.partial
+        assert [doc["text"] for doc in got] == [doc["text"] for doc in want]
+        assert [doc["score"] for doc in got] == pytest.approx([doc["score"] for doc in want], rel=1e-5)
+        assert all(ids[texts.index(doc["text"])] == doc["id"] for doc in got)
+
+@pytest.mark.shard
+def test_delete_routes_to_shard(embeddings):
+    """测试按分片ID删除"""
+    vectors = random_vectors(100)
+    sharded = ShardedStore(embeddings, [NumpyStore(embeddings, shard=i) for i in range(3)])
+    ids = asyncio.run(sharded.add_vectors([f"t{i}" for i in range(100)], vectors))
+    asyncio.run(sharded.delete(ids[:10]))
+
+    results = asyncio.run(sharded.search_vectors(vectors[:10], k=1))
+    assert all(docs[0]["id"] not in ids[:10] for docs in results)
+    assert sum(len(shard.docstore) for shard in sharded.shards) == 90
+
+    with pytest.raises(ValueError):
+        asyncio.run(sharded.delete(["7"]))
+
+@pytest.mark.shard
+def test_upsert_ids_routed_to_their_shard(embeddings, monkeypatch):
+    """测试按ID覆盖写入时每个分片只收到自己的ID（不带分片前缀），记录不会在其他分片重复"""
+    monkeypatch.setattr(settings, "FAISS_INDEX_DIR", None)
+    monkeypatch.setattr(settings, "INDEX_MAINTENANCE_INTERVAL", 0)
+    sharded = ShardedStore(embeddings, [FAISSStore(embeddings, shard=i) for i in range(3)])
+    vectors = random_vectors(30)
+    ids = asyncio.run(sharded.add_vectors([f"t{i}" for i in range(30)], vectors))
+
+    chosen = ids[:6]
+    updated = asyncio.run(sharded.add_vectors(
+        [f"new{i}" for i in range(6)], vectors[:6], [{"v": i} for i in range(6)], ids=chosen
+    ))
+    assert updated == chosen
+    assert sum(len(shard.docstore) for shard in sharded.shards) == 30
+    for i, record_id in enumerate(chosen):
+        shard, local_id = record_id.split(":")
+        assert sharded.shards[int(shard)].docstore[int(local_id)] == (f"new{i}", {"v": i})
+
+@pytest.mark.shard
+def test_slow_shard_returns_partial(embeddings):
+    """测试超过截止时间的分片被跳过，结果标记为不完整"""
+    vectors = random_vectors(20)
+    sharded = ShardedStore(embeddings, [NumpyStore(embeddings, shard=0), SlowStore()])
+    asyncio.run(sharded.shards[0].add_vectors([f"t{i}" for i in range(20)], vectors))
+
+    results = asyncio.run(sharded.search_vectors(vectors[:2], k=3, params=SearchParams(latency_budget_ms=50)))
+    assert all(docs.partial and docs.missing_shards == [1] for docs in results)
+    assert [len(docs) for docs in results] == [3, 3]
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(ShardedStore(embeddings, [SlowStore()]).search_vectors(
+            vectors[:1], k=3, params=SearchParams(latency_budget_ms=50)
+        ))
@@ -1,12 +1,28 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from rag_service.app.api.endpoints import router
+from rag_service.app.core.services import ServiceContainer
 from rag_service.config.settings import settings
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """应用生命周期：启动时构建并预热服务，关闭时释放资源"""
+    services = ServiceContainer.build()
+    if settings.WARMUP_ON_STARTUP:
+        await services.warmup()
+    app.state.services = services
+    try:
+        yield
+    finally:
+        app.state.services = None
+        await services.shutdown()
+
 app = FastAPI(
     title=settings.PROJECT_NAME,
-    openapi_url=f"{settings.API_V1_STR}/openapi.json"
+    openapi_url=f"{settings.API_V1_STR}/openapi.json",
+    lifespan=lifespan
 )
 
 # 配置CORS
@@ -0,0 +1,73 @@
+"""
+比较不同嵌入推理后端在 CPU 上的吞吐
+
+用法:
+    python -m rag_service.benchmarks.bench_embedding_backends --model bert-base-uncased --batch-size 32
+"""
+import argparse
+import tempfile
+import time
+from typing import List
+
+import numpy as np
+
+from rag_service.config.settings import settings
+from rag_service.app.core.llm.onnx_service import ONNXEncoder
+from rag_service.app.core.llm.transformer_service import TransformerEncoder, configure_torch_threads
+
+SAMPLE = (
+    "Retrieval augmented generation combines a retriever over a document store "
+    "with a generator that conditions on the retrieved passages. "
+)
+
+def make_texts(count: int, max_words: int) -> List[str]:
+    """生成长度不一的测试文本"""
+    rng = np.random.default_rng(0)
+    words = SAMPLE.split()
+    return [
+        " ".join(words[j % len(words)] for j in range(int(rng.integers(4, max_words))))
+        for _ in range(count)
+    ]
+
+def bench(encoder: TransformerEncoder, texts: List[str], batch_size: int, repeats: int) -> float:
+    """返回每秒编码的文本数"""
+    encoder.encode(texts[:batch_size])  # 预热
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for i in range(0, len(texts), batch_size):
+            encoder.encode(texts[i:i + batch_size])
+    return len(texts) * repeats / (time.perf_counter() - start)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=settings.EMBEDDING_MODEL)
+    parser.add_argument("--texts", type=int, default=256)
+    parser.add_argument("--max-words", type=int, default=128)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--onnx-dir", default=None, help="ONNX 导出目录，默认使用临时目录")
+    args = parser.parse_args()
+
+    configure_torch_threads(args.threads)
+    texts = make_texts(args.texts, args.max_words)
+    onnx_dir = args.onnx_dir or tempfile.mkdtemp(prefix="onnx_bench_")
+
+    torch_encoder = TransformerEncoder(args.model)
+    backends = {
+        "torch fp32": torch_encoder,
+        "onnx fp32": ONNXEncoder(args.model, onnx_dir=onnx_dir, quantize=False, num_threads=args.threads),
+        "onnx int8": ONNXEncoder(args.model, onnx_dir=onnx_dir, quantize=True, num_threads=args.threads),
+    }
+
+    reference = torch_encoder.encode(texts[:args.batch_size])
+    baseline = None
+    print(f"{'backend':<12} {'texts/s':>10} {'speedup':>8} {'min cos':>8}")
+    for name, encoder in backends.items():
+        throughput = bench(encoder, texts, args.batch_size, args.repeats)
+        baseline = baseline or throughput
+        cosine = np.sum(encoder.encode(texts[:args.batch_size]) * reference, axis=1).min()
+        print(f"{name:<12} {throughput:>10.1f} {throughput / baseline:>7.2f}x {cosine:>8.4f}")
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import Any, Dict, List, Optional
 from pydantic_settings import BaseSettings
 from pydantic import Field
 
@@ -17,17 +17,92 @@ class Settings(BaseSettings):
     OPENAI_API_MODEL: str = "gpt-3.5-turbo"
     
     # Vector DB Settings
-    VECTOR_DB_TYPE: str = "faiss"  # 或 "milvus"
+    VECTOR_DB_TYPE: str = "faiss"  # faiss / milvus / numpy（精确检索，不依赖向量库）
+    VECTOR_DB_SHARDS: int = 1  # 分片数，大于1时按哈希把数据分到多个同类型的存储，检索时并发查询后归并
+    VECTOR_DB_SHARD_TIMEOUT: float = 1.0  # 单个分片检索的截止时间（秒），超时的分片被跳过，结果标记为不完整
+    # 语义检索缓存：相近的查询复用检索结果，写入、删除、清空时失效。失效只在本进程内生效，
+    # 只有单个写入进程时才安全（多个 worker、共用 Milvus 的其他服务写入时，最长 QUERY_CACHE_TTL 内返回旧结果）
+    QUERY_CACHE_ENABLED: bool = False
+    QUERY_CACHE_MAX_DISTANCE: float = 0.05  # 视为同一查询的最大余弦距离
+    QUERY_CACHE_TTL: Optional[float] = 300.0  # 缓存有效期（秒），None 表示不过期
+    QUERY_CACHE_SIZE: int = 1024  # 最多缓存的查询数
     MILVUS_HOST: str = "localhost"
     MILVUS_PORT: int = 19530
+    MILVUS_POOL_SIZE: int = 4  # Milvus 连接数，也是执行阻塞调用的线程数
+    MILVUS_TIMEOUT: Optional[float] = 10.0  # 每次 Milvus 调用的默认超时（秒），None 表示不限
+    MILVUS_NPROBE: int = 10  # IVF 检索时默认访问的聚类数
+    MILVUS_LOADED_PARTITIONS: int = 16  # 同时加载到内存的分区（命名空间）数，超出时释放最久未访问的分区
+    MILVUS_IVF_NLIST: int = 1024  # 新建集合时 IVF_FLAT 的聚类中心数，后台维护会按语料规模调整
+    MILVUS_WRITE_BUFFER_ROWS: int = 0  # 写缓冲攒够多少行合成一批插入，0 表示每次调用都插入并 flush
+    MILVUS_FLUSH_ROWS: int = 100000  # 写缓冲模式下已插入的行攒够多少行 flush 一次
+    MILVUS_FLUSH_INTERVAL: float = 10.0  # 写缓冲模式下最长多久插入并 flush 一次（秒）
+    MILVUS_MAINTENANCE_LOCK_TTL: float = 3600.0  # 跨进程重建锁的有效期（秒），持有者崩溃后超过该时间其他进程可以接手
+    FAISS_INDEX_DIR: Optional[str] = "data/faiss"  # FAISS 快照目录，None 表示只保存在内存中
+    FAISS_MMAP: bool = True  # 以内存映射方式加载快照，多个 worker 共享页面
+    FAISS_SNAPSHOT_INTERVAL: float = 300.0  # 后台快照间隔（秒），0 表示只在关闭时保存
+    FAISS_SNAPSHOT_KEEP: int = 2  # 保留的快照个数
+    FAISS_INDEX_TYPE: str = "flat"  # 索引类型: flat / hnsw / ivf_flat / ivf_pq / auto（按语料规模与内存预算选择）
+    FAISS_HNSW_M: int = 32  # HNSW 每个节点的邻居数
+    FAISS_HNSW_EF_CONSTRUCTION: int = 200  # HNSW 构建时的候选集大小
+    FAISS_HNSW_EF_SEARCH: int = 64  # HNSW 检索时的候选集大小
+    FAISS_HNSW_MAX_DELETED_RATIO: float = 0.2  # HNSW 标记删除的比例超过该值时重建
+    FAISS_IVF_NLIST: Optional[int] = None  # IVF 聚类中心数，None 表示按语料规模选择
+    FAISS_IVF_NPROBE: int = 16  # IVF 检索时访问的聚类数
+    FAISS_PQ_M: Optional[int] = None  # PQ 子空间数，None 表示按维度选择
+    FAISS_PQ_NBITS: int = 8  # 每个 PQ 子空间的编码位数
+    FAISS_TRAIN_SAMPLE_SIZE: int = 100000  # IVF 训练时最多采样的向量数
+    FAISS_AUTO_EXACT_MAX: int = 10000  # auto 模式下使用精确检索的最大向量数
+    FAISS_MEMORY_BUDGET_MB: int = 1024  # auto 模式下索引的内存预算
+    FAISS_FILTER_EXACT_MAX: int = 2048  # 元数据过滤后的候选数不超过该值时直接精确计算距离
+    NUMPY_STORE_DIR: Optional[str] = "data/numpy"  # NumPy 向量存储目录，None 表示只保存在内存中
+    NUMPY_STORE_DTYPE: str = "float32"  # 检索矩阵的元素类型: float32 / float16 / int8（压缩后用 float32 重排）
+    NUMPY_RESCORE_FACTOR: int = 4  # 压缩存储时粗排候选数为 k 的多少倍
+    NUMPY_MAX_DELETED_RATIO: float = 0.5  # 已删除的行超过该比例时压缩数据
+    INDEX_MAINTENANCE_INTERVAL: float = 600.0  # IVF 索引后台维护检查间隔（秒），0 表示关闭
+    IVF_MAX_IMBALANCE: float = 3.0  # 倒排表不均衡因子超过该值时重训
+    IVF_MAX_NLIST_DRIFT: float = 2.0  # 聚类中心数与语料规模建议值相差该倍数时重训
     
     # Embedding Settings
     EMBEDDING_MODEL: str = "bert-base-uncased"  # 使用 BERT 基础模型
+    EMBEDDING_BACKEND: str = "torch"  # 嵌入推理后端: torch / onnx
+    ONNX_MODEL_DIR: str = "data/onnx"  # 导出的 ONNX 模型目录
+    ONNX_QUANTIZE: bool = True  # 是否使用动态 int8 量化
+    ONNX_INTRA_OP_THREADS: Optional[int] = None  # ONNX Runtime 算子内线程数
+    EMBEDDING_BATCHING_ENABLED: bool = True  # 合并并发的嵌入请求
+    EMBEDDING_MAX_BATCH_SIZE: int = 32  # 单个合并批次的最大文本数
+    EMBEDDING_MAX_WAIT_MS: float = 5.0  # 等待凑批的最长时间（毫秒）
+    EMBEDDING_EXECUTOR: str = "thread"  # 推理执行方式: inline / thread / process / pool（共享权重的多进程工作池）
+    EMBEDDING_EXECUTOR_WORKERS: int = 1  # 推理线程数或进程数
+    EMBEDDING_POOL_START_METHOD: str = "spawn"  # 工作池进程启动方式: spawn / fork（fork 启动快，但父进程不能已运行过 torch 并行计算）
+    EMBEDDING_BUCKET_MAX_TOKENS: int = 8192  # 批量编码时每个长度桶填充后的 token 预算
+    EMBEDDING_CACHE_ENABLED: bool = True  # 按文本内容缓存嵌入向量
+    EMBEDDING_CACHE_DIR: Optional[str] = "data/embedding_cache"  # 磁盘缓存目录，None 表示只用内存
+    EMBEDDING_CACHE_MEMORY_SIZE: int = 10000  # 内存 LRU 的最大条数
+    EMBEDDING_CACHE_MAX_DISK_ROWS: int = 1000000  # 磁盘缓存的最大条数，写满后覆盖最早写入的向量，0 表示不限制
+    
+    # Runtime Settings
+    TORCH_NUM_THREADS: Optional[int] = None  # 算子内线程数，None 表示使用 torch 默认值
+    TORCH_NUM_INTEROP_THREADS: Optional[int] = None  # 算子间线程数，进程内只能设置一次
+    WARMUP_ON_STARTUP: bool = True  # 启动时用空推理预热模型
     
     # RAG Settings
-    CHUNK_SIZE: int = 1000
-    CHUNK_OVERLAP: int = 200
+    CHUNK_SIZE: int = 256  # 使用嵌入模型分词器时单位为 token，否则为字符
+    CHUNK_OVERLAP: int = 32
+    DEDUP_ENABLED: bool = True  # 入库前检测（近似）重复块，重复块关联到已有向量，不再嵌入和写入
+    DEDUP_THRESHOLD: float = 0.9  # 视为重复的最小 Jaccard 相似度（字符 5-gram 的 MinHash 估计）
+    DEDUP_INDEX_PATH: Optional[str] = "data/dedup/index.jsonl"  # 已存储块的签名日志，None 表示只保存在内存中
+    # 重复块共用已有记录的元数据，只在这些元数据字段都相同的块之间去重；None 表示除块位置外的全部元数据，
+    # 设为 [] 时跨文档去重，但按其他字段过滤时匹配不到被关联的块
+    DEDUP_SCOPE_KEYS: Optional[List[str]] = None
+    DOCUMENT_MANIFEST_PATH: Optional[str] = "data/manifest/documents.jsonl"  # 按文档增量同步的文档清单，None 表示只保存在内存中
     TOP_K_RESULTS: int = 4
+    # 检索参数预设，未列出的参数使用各后端的默认配置（FAISS_IVF_NPROBE / FAISS_HNSW_EF_SEARCH / MILVUS_NPROBE）
+    SEARCH_PRESETS: Dict[str, Dict[str, Any]] = Field(default_factory=lambda: {
+        "fast": {"nprobe": 4, "ef": 32},
+        "balanced": {"nprobe": 16, "ef": 64},
+        "accurate": {"nprobe": 64, "ef": 256}
+    })
+    SEARCH_DEFAULT_PRESET: Optional[str] = None  # 请求未指定预设时使用的预设，None 表示使用后端默认配置
     
     # Retry Settings
     MAX_RETRIES: int = 3